@@ -0,0 +1,216 @@
+"""
+Benchmarks of the diff pipeline stages, over the test data corpus.
+
+With a scale factor N > 1, inputs are scaled up synthetically: texts are repeated N times,
+and GFx workspaces contain N copies of each script.
+"""
+
+from collections.abc import Callable
+import functools
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+from corpus import encode_swd, swd_offset_tag, swd_script_tag
+from harness import benchmark
+from kcd_gfx_toolbox import swd
+from kcd_gfx_toolbox.avm1.pcode_alignment import build_pcode_alignment_maps
+from kcd_gfx_toolbox.avm1.pcode_normalization import iter_blocks, normalize_block, normalize_file
+from kcd_gfx_toolbox.avm1.pcode_parsing import PcodeBlock, PcodeLine, iter_pcode_lines, parse_pcode_file, tokenize_line
+from kcd_gfx_toolbox.diff.core import align_hunk_pairs, cut_text_hunk_with_context, diff_texts
+from kcd_gfx_toolbox.diff.gfx import GfxDiffSet, diff_normalized_script_trees, refine_block_diffs
+from kcd_gfx_toolbox.diff.rendering import (
+    DiffFilter,
+    DiffSortOrder,
+    prepare_diffset_actionscript_render,
+    prepare_diffset_pcode_render,
+)
+from kcd_gfx_toolbox.workspace import Workspace
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "tests" / "data"
+
+# Generated inputs live as long as the process.
+_tmp_dir = tempfile.TemporaryDirectory(prefix="kcd-gfx-bench-")
+
+
+def _read_lines(rel_path: str) -> list[str]:
+    return (DATA_DIR / rel_path).read_text(encoding="utf-8").splitlines()
+
+
+@functools.cache
+def _raw_pcode_lines(version: int, scale: int) -> list[str]:
+    return _read_lines(f"pcode/StashManager_v{version}.pcode") * scale
+
+
+@functools.cache
+def _raw_pcode_file(version: int, scale: int) -> Path:
+    file = Path(_tmp_dir.name) / f"StashManager_v{version}_x{scale}.pcode"
+    file.write_text("\n".join(_raw_pcode_lines(version, scale)) + "\n", encoding="utf-8")
+    return file
+
+
+@functools.cache
+def _raw_pcode_blocks(version: int, scale: int) -> list[PcodeBlock]:
+    return list(iter_blocks(iter_pcode_lines(_raw_pcode_lines(version, scale))))
+
+
+@functools.cache
+def _normalized_parsed_pcode_lines(version: int, scale: int) -> list[PcodeLine]:
+    blocks = [normalize_block(block) for block in _raw_pcode_blocks(version, 1)]
+    return [line for block in blocks for line in block.lines] * scale
+
+
+@functools.cache
+def _normalized_pcode_lines(version: int, scale: int) -> list[str]:
+    return [line.render() for line in _normalized_parsed_pcode_lines(version, scale)]
+
+
+def _write_workspace(base_dir: Path, version: int, scale: int) -> Workspace:
+    """
+    Write a workspace as extracted by ffdec, with `scale` copies of the StashManager script and SWD files that
+    map p-code lines to ActionScript lines proportionally.
+    """
+    workspace = Workspace(base_dir)
+    scripts_dir = workspace.extraction_path("scripts/__Packages")
+    scripts_dir.mkdir(parents=True)
+    pcode_text = (DATA_DIR / f"pcode/StashManager_v{version}.pcode").read_text(encoding="utf-8")
+    actionscript_text = (DATA_DIR / f"actionscript2/StashManager_v{version}.as").read_text(encoding="utf-8")
+    pcode_line_count = len(pcode_text.splitlines())
+    actionscript_line_count = len(actionscript_text.splitlines())
+    pcode_tags: list[bytes] = []
+    actionscript_tags: list[bytes] = []
+
+    for module in range(scale):
+        name = f"__Packages/StashManager{module}"
+        (scripts_dir / f"StashManager{module}.pcode").write_text(pcode_text, encoding="utf-8")
+        (scripts_dir / f"StashManager{module}.as").write_text(actionscript_text, encoding="utf-8")
+        pcode_tags.append(swd_script_tag(module, f"#PCODE {name}", pcode_text))
+        actionscript_tags.append(swd_script_tag(module, name, actionscript_text))
+
+        for line in range(1, pcode_line_count + 1):
+            offset = line * 4
+            pcode_tags.append(swd_offset_tag(module, line, offset))
+            actionscript_line = 1 + (line - 1) * actionscript_line_count // pcode_line_count
+            actionscript_tags.append(swd_offset_tag(module, actionscript_line, offset))
+
+    workspace.extraction_path("debug_pcode.swd").write_bytes(encode_swd(pcode_tags))
+    workspace.extraction_path("debug_actionscript.swd").write_bytes(encode_swd(actionscript_tags))
+    return workspace
+
+
+def _normalize_workspace(workspace: Workspace) -> dict[Path, list[PcodeBlock]]:
+    blocks: dict[Path, list[PcodeBlock]] = {}
+
+    for raw_file in sorted(workspace.extraction_path("scripts").rglob("*.pcode")):
+        script_path = raw_file.relative_to(workspace.extraction_path("scripts")).with_suffix("")
+        blocks[script_path] = normalize_file(raw_file, workspace.normalization_path(script_path)).blocks
+
+    return blocks
+
+
+@functools.cache
+def _diffed_workspaces(
+    scale: int,
+) -> tuple[Workspace, dict[Path, list[PcodeBlock]], Workspace, dict[Path, list[PcodeBlock]], GfxDiffSet]:
+    base_dir = Path(_tmp_dir.name) / f"workspaces_x{scale}"
+    workspace_a = _write_workspace(base_dir / "a", 1, scale)
+    workspace_b = _write_workspace(base_dir / "b", 2, scale)
+    blocks_a = _normalize_workspace(workspace_a)
+    blocks_b = _normalize_workspace(workspace_b)
+    diffset = diff_normalized_script_trees(
+        set(blocks_a), set(blocks_b), workspace_a.normalization_dir(), workspace_b.normalization_dir()
+    )
+    refine_block_diffs(diffset, blocks_a, blocks_b)
+    return workspace_a, blocks_a, workspace_b, blocks_b, diffset
+
+
+def _import_in_fresh_interpreter(module: str) -> Callable[[], object]:
+    return lambda: subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+
+
+@benchmark("import_entry_point", group="startup")
+def bench_import_entry_point(scale: int) -> Callable[[], object]:
+    return _import_in_fresh_interpreter("kcd_gfx_toolbox.__main__")
+
+
+@benchmark("import_cli", group="startup")
+def bench_import_cli(scale: int) -> Callable[[], object]:
+    return _import_in_fresh_interpreter("kcd_gfx_toolbox.cli")
+
+
+@benchmark("tokenize_line", group="parsing")
+def bench_tokenize_line(scale: int) -> Callable[[], object]:
+    lines = _raw_pcode_lines(1, scale)
+    return lambda: [tokenize_line(line) for line in lines]
+
+
+@benchmark("parse_pcode_file", group="parsing")
+def bench_parse_pcode_file(scale: int) -> Callable[[], object]:
+    file = _raw_pcode_file(1, scale)
+    return lambda: parse_pcode_file(file)
+
+
+@benchmark("parse_swd_file", group="parsing")
+def bench_parse_swd_file(scale: int) -> Callable[[], object]:
+    workspace_a = _diffed_workspaces(scale)[0]
+    file = workspace_a.find_debug_pcode_swd_file()
+
+    def run():
+        swd._parsed_swd_files.clear()  # Measure parsing, not the in-memory cache.
+        return swd.parse_swd_file(file)
+
+    return run
+
+
+@benchmark("normalize_block", group="normalization")
+def bench_normalize_block(scale: int) -> Callable[[], object]:
+    blocks = _raw_pcode_blocks(1, scale)
+    return lambda: [normalize_block(block) for block in blocks]
+
+
+@benchmark("diff_texts", group="diff")
+def bench_diff_texts(scale: int) -> Callable[[], object]:
+    lines_a = _normalized_pcode_lines(1, scale)
+    lines_b = _normalized_pcode_lines(2, scale)
+    return lambda: diff_texts(lines_a, lines_b)
+
+
+@benchmark("align_hunk_pairs", group="diff")
+def bench_align_hunk_pairs(scale: int) -> Callable[[], object]:
+    lines_a = _normalized_pcode_lines(1, scale)
+    lines_b = _normalized_pcode_lines(2, scale)
+    spans = diff_texts(lines_a, lines_b).spans
+    hunks_a = [cut_text_hunk_with_context(lines_a, span.a) for span in spans]
+    hunks_b = [cut_text_hunk_with_context(lines_b, span.b) for span in spans]
+    return lambda: align_hunk_pairs(hunks_a, hunks_b)
+
+
+@benchmark("build_pcode_alignment_maps", group="diff")
+def bench_build_pcode_alignment_maps(scale: int) -> Callable[[], object]:
+    lines_a = _normalized_parsed_pcode_lines(1, scale)
+    lines_b = _normalized_parsed_pcode_lines(2, scale)
+    return lambda: build_pcode_alignment_maps(lines_a, lines_b)
+
+
+@benchmark("prepare_diffset_pcode_render", group="rendering")
+def bench_prepare_diffset_pcode_render(scale: int) -> Callable[[], object]:
+    _, blocks_a, _, blocks_b, diffset = _diffed_workspaces(scale)
+
+    def run():
+        diffset.clear_aligned_block_diffs()  # Measure the alignment, not the diffs kept by the refinement.
+        return prepare_diffset_pcode_render(diffset, blocks_a, blocks_b, DiffSortOrder.CHANGES_DESC, DiffFilter())
+
+    return run
+
+
+@benchmark("prepare_diffset_actionscript_render", group="rendering")
+def bench_prepare_diffset_actionscript_render(scale: int) -> Callable[[], object]:
+    workspace_a, blocks_a, workspace_b, blocks_b, diffset = _diffed_workspaces(scale)
+
+    def run():
+        swd._parsed_swd_files.clear()  # A full render preparation starts with parsing the SWD files.
+        return prepare_diffset_actionscript_render(
+            diffset, workspace_a, blocks_a, workspace_b, blocks_b, DiffSortOrder.CHANGES_DESC, DiffFilter()
+        )
+
+    return run
@@ -0,0 +1,132 @@
+"""
+Benchmarks of the diff pipeline stages over synthetic corpora, whose size grows linearly with the scale factor.
+
+By default, the corpus holds N scripts of the default shape (see CorpusParams) at scale N. With the "statements"
+growth, it holds the default number of scripts, with methods N times longer.
+"""
+
+from collections.abc import Callable
+from dataclasses import dataclass
+import functools
+from pathlib import Path
+import tempfile
+from corpus import CorpusParams, write_corpus
+from harness import benchmark
+from kcd_gfx_toolbox import swd
+from kcd_gfx_toolbox.avm1.pcode_parsing import PcodeBlock
+from kcd_gfx_toolbox.diff.core import TextHunk, align_hunk_pairs, cut_text_hunk_with_context, diff_texts
+from kcd_gfx_toolbox.diff.gfx import GfxDiffSet, diff_normalized_script_trees, refine_block_diffs
+from kcd_gfx_toolbox.diff.rendering import DiffFilter, DiffSortOrder, prepare_diffset_actionscript_render
+from kcd_gfx_toolbox.workspace import Workspace
+
+# Generated corpora live as long as the process.
+_tmp_dir = tempfile.TemporaryDirectory(prefix="kcd-gfx-bench-corpus-")
+
+
+@dataclass(frozen=True)
+class ScaledCorpus:
+    workspace_a: Workspace
+    normalized_script_blocks_a: dict[Path, list[PcodeBlock]]
+    workspace_b: Workspace
+    normalized_script_blocks_b: dict[Path, list[PcodeBlock]]
+
+    def line_count(self) -> int:
+        """Return the number of normalized p-code lines of side A, as a measure of the input size."""
+        return sum(len(block.lines) for blocks in self.normalized_script_blocks_a.values() for block in blocks)
+
+
+"""How the corpus grows with the scale factor: number of scripts, or length of methods."""
+GROWTH_DIMENSIONS: dict[str, Callable[[int], CorpusParams]] = {
+    "scripts": lambda scale: CorpusParams(scripts=scale),
+    "statements": lambda scale: CorpusParams(statements_per_method=CorpusParams.statements_per_method * scale),
+}
+
+growth = "scripts"
+
+
+def scaled_corpus(scale: int) -> ScaledCorpus:
+    return _scaled_corpus(growth, scale)
+
+
+@functools.cache
+def _scaled_corpus(growth_dimension: str, scale: int) -> ScaledCorpus:
+    (workspace_a, blocks_a), (workspace_b, blocks_b) = write_corpus(
+        Path(_tmp_dir.name) / f"{growth_dimension}_x{scale}", GROWTH_DIMENSIONS[growth_dimension](scale)
+    )
+    return ScaledCorpus(workspace_a, blocks_a, workspace_b, blocks_b)
+
+
+def _scaled_diffset(scale: int) -> GfxDiffSet:
+    return _scaled_diffset_for_growth(growth, scale)
+
+
+@functools.cache
+def _scaled_diffset_for_growth(growth_dimension: str, scale: int) -> GfxDiffSet:
+    corpus = _scaled_corpus(growth_dimension, scale)
+    dir_a = corpus.workspace_a.normalization_dir()
+    dir_b = corpus.workspace_b.normalization_dir()
+    diffset = diff_normalized_script_trees(
+        set(corpus.normalized_script_blocks_a), set(corpus.normalized_script_blocks_b), dir_a, dir_b
+    )
+    refine_block_diffs(diffset, corpus.normalized_script_blocks_a, corpus.normalized_script_blocks_b)
+    return diffset
+
+
+@benchmark("scaling/diff_normalized_script_trees", group="scaling")
+def bench_diff_normalized_script_trees(scale: int) -> Callable[[], object]:
+    corpus = scaled_corpus(scale)
+    scripts_a = set(corpus.normalized_script_blocks_a)
+    scripts_b = set(corpus.normalized_script_blocks_b)
+    dir_a = corpus.workspace_a.normalization_dir()
+    dir_b = corpus.workspace_b.normalization_dir()
+    return lambda: diff_normalized_script_trees(scripts_a, scripts_b, dir_a, dir_b)
+
+
+@benchmark("scaling/align_hunk_pairs", group="scaling")
+def bench_align_hunk_pairs(scale: int) -> Callable[[], object]:
+    corpus = scaled_corpus(scale)
+    hunk_lists: list[tuple[list[TextHunk], list[TextHunk]]] = []
+
+    # Hunks of every modified block, as cut for rendering.
+    for script_path, blocks_a in corpus.normalized_script_blocks_a.items():
+        blocks_b = {block.name: block for block in corpus.normalized_script_blocks_b[script_path]}
+
+        for block_a in blocks_a:
+            block_b = blocks_b.get(block_a.name)
+
+            if block_b is None:
+                continue
+
+            lines_a = [line.render() for line in block_a.lines]
+            lines_b = [line.render() for line in block_b.lines]
+            spans = diff_texts(lines_a, lines_b).spans
+
+            if spans:
+                hunk_lists.append(
+                    (
+                        [cut_text_hunk_with_context(lines_a, span.a) for span in spans],
+                        [cut_text_hunk_with_context(lines_b, span.b) for span in spans],
+                    )
+                )
+
+    return lambda: [align_hunk_pairs(hunks_a, hunks_b) for hunks_a, hunks_b in hunk_lists]
+
+
+@benchmark("scaling/prepare_diffset_actionscript_render", group="scaling")
+def bench_prepare_diffset_actionscript_render(scale: int) -> Callable[[], object]:
+    corpus = scaled_corpus(scale)
+    diffset = _scaled_diffset(scale)
+
+    def run():
+        swd._parsed_swd_files.clear()  # A full render preparation starts with parsing the SWD files.
+        return prepare_diffset_actionscript_render(
+            diffset,
+            corpus.workspace_a,
+            corpus.normalized_script_blocks_a,
+            corpus.workspace_b,
+            corpus.normalized_script_blocks_b,
+            DiffSortOrder.CHANGES_DESC,
+            DiffFilter(),
+        )
+
+    return run
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+Generator of synthetic GFx workspaces, to measure how the pipeline scales with input size.
+
+A corpus is a pair of workspaces (v1 and v2) laid out as extracted by ffdec and normalized by the toolbox: raw p-code
+and ActionScript scripts, SWD debug files mapping one to the other, and normalized block trees. Scripts look like
+compiled ActionScript 2 classes: a constructor and methods made of assignments, calls and nested conditionals.
+v2 is derived from v1 by mutating a controlled share of statements, shifting labels and permuting registers.
+
+Usage: uv run python benchmarks/corpus.py OUTPUT_DIR [--scripts N] [--methods N] [--statements N] ...
+"""
+
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+import random
+import struct
+from typing import Annotated
+import typer
+from kcd_gfx_toolbox.avm1.pcode_normalization import normalize_file
+from kcd_gfx_toolbox.avm1.pcode_parsing import PcodeBlock
+from kcd_gfx_toolbox.utils import console, print_error
+from kcd_gfx_toolbox.workspace import Workspace
+
+MEMBER_NAMES = (
+    "m_Slots", "m_Count", "m_Weight", "m_Price", "m_Category", "m_Selected", "m_Visible", "m_Owner", "m_Items",
+    "m_Filter", "m_Sort", "m_Page", "m_Limit", "m_Cursor", "m_Enabled", "m_Label",
+)  # fmt: skip
+
+METHOD_NAMES = (
+    "Refresh", "Update", "Clear", "Select", "Remove", "Insert", "Toggle", "Show", "Hide", "Apply", "Reset", "Sort",
+    "Filter", "Open", "Close", "Move",
+)  # fmt: skip
+
+STRING_VALUES = ("count", "weight", "price", "condition", "name", "type", "id", "slot", "money", "health")
+
+
+@dataclass(frozen=True)
+class CorpusParams:
+    """
+    Shape of a generated corpus. Rates are probabilities in [0, 1].
+    """
+
+    scripts: int = 4
+    methods_per_script: int = 16
+    statements_per_method: int = 24
+    # Maximum depth of nested conditionals in method bodies.
+    nesting_depth: int = 2
+    # Share of methods whose labels are shifted in v2 even though their code is unchanged.
+    label_churn: float = 0.2
+    # Share of methods whose local registers are permuted in v2.
+    register_churn: float = 0.2
+    # Share of statements that are modified, deleted, or followed by an inserted statement in v2.
+    mutation_rate: float = 0.05
+    seed: int = 0
+
+
+@dataclass(frozen=True)
+class Statement:
+    kind: str  # "set", "call", "store", "if"
+    register: int
+    member: str
+    value: str
+    local: int = 0
+    body: tuple["Statement", ...] = ()
+    else_body: tuple["Statement", ...] = ()
+
+
+@dataclass(frozen=True)
+class Method:
+    name: str
+    params: int
+    locals: int
+    body: tuple[Statement, ...]
+    label_shift: int = 0
+    register_map: dict[int, int] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class GeneratedScript:
+    """
+    A script rendered as p-code and ActionScript, with the bytecode offsets shared by both (as found in SWD files).
+    """
+
+    path: str
+    pcode: str
+    actionscript: str
+    pcode_line_offsets: list[tuple[int, int]]  # (1-based p-code line, offset)
+    actionscript_line_offsets: list[tuple[int, int]]  # (1-based ActionScript line, offset)
+
+
+def encode_swd(tags: list[bytes]) -> bytes:
+    return b"FWD\x0a" + b"".join(tags)
+
+
+def swd_script_tag(module: int, name: str, text: str) -> bytes:
+    return struct.pack("<III", 0, module, 0) + name.encode("utf-8") + b"\x00" + text.encode("utf-8") + b"\x00"
+
+
+def swd_offset_tag(module: int, line: int, offset: int) -> bytes:
+    return struct.pack("<IIII", 1, module, line, offset)
+
+
+def _random_value(rng: random.Random) -> str:
+    if rng.random() < 0.5:
+        return str(rng.randrange(0, 1000))
+    return f'"{rng.choice(STRING_VALUES)}"'
+
+
+def _random_statement(rng: random.Random, method: Method, depth: int, max_depth: int) -> Statement:
+    register = rng.randrange(1, method.params + 2)
+    member = rng.choice(MEMBER_NAMES)
+    value = _random_value(rng)
+    roll = rng.random()
+
+    if depth < max_depth and roll < 0.2:
+        body = tuple(_random_statement(rng, method, depth + 1, max_depth) for _ in range(rng.randrange(1, 5)))
+        else_body = ()
+
+        if rng.random() < 0.4:
+            else_body = tuple(_random_statement(rng, method, depth + 1, max_depth) for _ in range(rng.randrange(1, 4)))
+
+        return Statement("if", register, member, value, body=body, else_body=else_body)
+
+    if roll < 0.5:
+        return Statement("set", register, member, value)
+
+    if roll < 0.8:
+        return Statement("call", register, rng.choice(METHOD_NAMES), value)
+
+    local = rng.randrange(method.params + 2, method.params + 2 + method.locals)
+    return Statement("store", register, member, value, local=local)
+
+
+def _generate_methods(params: CorpusParams, rng: random.Random) -> list[Method]:
+    methods: list[Method] = []
+
+    for i in range(params.methods_per_script):
+        method = Method(
+            name=f"{METHOD_NAMES[i % len(METHOD_NAMES)]}{i // len(METHOD_NAMES) or ''}",
+            params=rng.randrange(0, 4),
+            locals=rng.randrange(1, 5),
+            body=(),
+        )
+        body = tuple(
+            _random_statement(rng, method, 0, params.nesting_depth) for _ in range(params.statements_per_method)
+        )
+        methods.append(replace(method, body=body))
+
+    return methods
+
+
+def _mutate_statements(
+    statements: tuple[Statement, ...], params: CorpusParams, rng: random.Random, method: Method, depth: int
+) -> tuple[Statement, ...]:
+    mutated: list[Statement] = []
+
+    for statement in statements:
+        if statement.kind == "if":
+            statement = replace(
+                statement,
+                body=_mutate_statements(statement.body, params, rng, method, depth + 1),
+                else_body=_mutate_statements(statement.else_body, params, rng, method, depth + 1),
+            )
+
+        if rng.random() >= params.mutation_rate:
+            mutated.append(statement)
+            continue
+
+        roll = rng.random()
+
+        if roll < 0.4:  # Modify
+            mutated.append(replace(statement, value=_random_value(rng), member=rng.choice(MEMBER_NAMES)))
+        elif roll < 0.7:  # Insert
+            mutated.append(statement)
+            mutated.append(_random_statement(rng, method, depth, params.nesting_depth))
+        # Otherwise, delete.
+
+    return tuple(mutated)
+
+
+def _mutate_methods(methods: list[Method], params: CorpusParams, rng: random.Random) -> list[Method]:
+    mutated: list[Method] = []
+
+    for method in methods:
+        method = replace(method, body=_mutate_statements(method.body, params, rng, method, 0))
+
+        if rng.random() < params.label_churn:
+            method = replace(method, label_shift=rng.randrange(1, 16) * 0x10)
+
+        if rng.random() < params.register_churn:
+            local_registers = list(range(method.params + 2, method.params + 2 + method.locals))
+            shuffled = local_registers[:]
+            rng.shuffle(shuffled)
+            method = replace(method, register_map=dict(zip(local_registers, shuffled)))
+
+        mutated.append(method)
+
+    return mutated
+
+
+class _ScriptWriter:
+    """
+    Render methods as p-code and ActionScript lines, keeping track of bytecode offsets.
+    """
+
+    def __init__(self):
+        self.pcode_lines: list[str] = []
+        self.actionscript_lines: list[str] = []
+        self.pcode_line_offsets: list[tuple[int, int]] = []
+        self.actionscript_line_offsets: list[tuple[int, int]] = []
+        self.offset = 0
+        self.pending_labels: list[str] = []
+        self.constants: set[str] = set()
+
+    def label(self) -> str:
+        return f"loc{self.offset:04x}"
+
+    def instruction(self, text: str):
+        if self.pending_labels:
+            # Consecutive labels at the same offset are the same label.
+            text = f"{self.pending_labels[0]}:{text}"
+            self.pending_labels = []
+
+        self.pcode_lines.append(text)
+        self.pcode_line_offsets.append((len(self.pcode_lines), self.offset))
+        self.offset += 1 + len(text) % 5 + 2
+
+    def push(self, value: str):
+        if value.startswith('"'):
+            self.constants.add(value)
+        self.instruction(f"Push {value}")
+
+    def source(self, text: str, indent: int):
+        self.actionscript_lines.append("   " * indent + text)
+        self.actionscript_line_offsets.append((len(self.actionscript_lines), self.offset))
+
+    def statements(self, statements: tuple[Statement, ...], method: Method, indent: int):
+        for statement in statements:
+            self.statement(statement, method, indent)
+
+    def statement(self, st: Statement, method: Method, indent: int):
+        register = f"register{st.register}"
+
+        if st.kind == "set":
+            self.source(f"this.{st.member} = {st.value};", indent)
+            self.push(register)
+            self.push(f'"{st.member}"')
+            self.push(st.value)
+            self.instruction("SetMember")
+        elif st.kind == "call":
+            self.source(f"this.{st.member}({st.value});", indent)
+            self.push(st.value)
+            self.push("1")
+            self.push(register)
+            self.push(f'"{st.member}"')
+            self.instruction("CallMethod")
+            self.instruction("Pop")
+        elif st.kind == "store":
+            local = method.register_map.get(st.local, st.local)
+            self.source(f"var local{st.local} = this.{st.member};", indent)
+            self.push(register)
+            self.push(f'"{st.member}"')
+            self.instruction("GetMember")
+            self.instruction(f"StoreRegister {local}")
+            self.instruction("Pop")
+        elif st.kind == "if":
+            self.source(f"if (this.{st.member}) {{", indent)
+            self.push(register)
+            self.push(f'"{st.member}"')
+            self.instruction("GetMember")
+            self.instruction("Not")
+            # Jump targets are only known once the branches are written: patch them afterwards.
+            if_line = len(self.pcode_lines)
+            self.instruction("If ?")
+            self.statements(st.body, method, indent + 1)
+            jump_line = None
+
+            if st.else_body:
+                self.source("} else {", indent)
+                jump_line = len(self.pcode_lines)
+                self.instruction("Jump ?")
+
+            self.pcode_lines[if_line] = self.pcode_lines[if_line].replace("?", self.label())
+            self.pending_labels.append(self.label())
+
+            if st.else_body:
+                self.statements(st.else_body, method, indent + 1)
+                assert jump_line is not None
+                self.pcode_lines[jump_line] = self.pcode_lines[jump_line].replace("?", self.label())
+                self.pending_labels.append(self.label())
+
+            self.source("}", indent)
+
+    def method(self, method: Method, indent: int):
+        self.offset += method.label_shift
+        params = [f"arg{i}" for i in range(method.params)]
+        register_params = "".join(f', {i + 2}, "{name}"' for i, name in enumerate(params))
+        register_count = method.params + method.locals + 2
+
+        self.source(f"function {method.name}({', '.join(params)}) {{", indent)
+        self.push("register2")
+        self.push(f'"{method.name}"')
+        self.instruction(
+            f'DefineFunction2 "", {method.params}, {register_count}, false, false, true, false, true, false, '
+            f"false, true, false{register_params} {{"
+        )
+        self.statements(method.body, method, indent + 1)
+        self.source("return undefined;", indent + 1)
+        self.push("undefined")
+        self.instruction("Return")
+        self.pcode_lines.append("}")
+        self.source("}", indent)
+        self.instruction("SetMember")
+
+
+def _render_script(path: str, class_name: str, methods: list[Method]) -> GeneratedScript:
+    writer = _ScriptWriter()
+
+    writer.source(f"class {class_name}", 0)
+    writer.source("{", 0)
+    writer.push('"_global"')
+    writer.instruction("GetVariable")
+    writer.push(f'"{class_name}"')
+    writer.instruction('DefineFunction2 "", 0, 2, false, false, true, false, true, false, false, true, false {')
+    writer.pcode_lines.append("}")
+    writer.instruction("StoreRegister 1")
+    writer.instruction("SetMember")
+    writer.push("register1")
+    writer.push('"prototype"')
+    writer.instruction("GetMember")
+    writer.instruction("StoreRegister 2")
+    writer.instruction("Pop")
+
+    for method in methods:
+        writer.method(method, 1)
+
+    writer.source("}", 0)
+    writer.push("1")
+    writer.instruction("Pop")
+
+    # The constant pool comes first in the script, but its content is only known now.
+    # Offsets are left as is: they only need to be consistent between p-code and ActionScript.
+    constant_pool = "ConstantPool " + ", ".join(sorted(writer.constants))
+    pcode_lines = [constant_pool, *writer.pcode_lines]
+    pcode_line_offsets = [(line + 1, offset) for line, offset in writer.pcode_line_offsets]
+
+    return GeneratedScript(
+        path=path,
+        pcode="\n".join(pcode_lines) + "\n",
+        actionscript="\n".join(writer.actionscript_lines) + "\n",
+        pcode_line_offsets=pcode_line_offsets,
+        actionscript_line_offsets=writer.actionscript_line_offsets,
+    )
+
+
+def generate_scripts(params: CorpusParams) -> tuple[list[GeneratedScript], list[GeneratedScript]]:
+    """
+    Generate the v1 and v2 versions of all the scripts of a corpus. Generation is deterministic for given params.
+    """
+    scripts_v1: list[GeneratedScript] = []
+    scripts_v2: list[GeneratedScript] = []
+
+    for index in range(params.scripts):
+        class_name = f"Synthetic{index}"
+        path = f"__Packages/{class_name}"
+        methods_v1 = _generate_methods(params, random.Random(f"{params.seed}:{index}:v1"))
+        methods_v2 = _mutate_methods(methods_v1, params, random.Random(f"{params.seed}:{index}:v2"))
+        scripts_v1.append(_render_script(path, class_name, methods_v1))
+        scripts_v2.append(_render_script(path, class_name, methods_v2))
+
+    return scripts_v1, scripts_v2
+
+
+def write_workspace(base_dir: Path, scripts: list[GeneratedScript]) -> tuple[Workspace, dict[Path, list[PcodeBlock]]]:
+    """
+    Write generated scripts as an extracted and normalized workspace. Return it with the normalized blocks.
+    """
+    workspace = Workspace(base_dir)
+    pcode_tags: list[bytes] = []
+    actionscript_tags: list[bytes] = []
+    normalized_script_blocks: dict[Path, list[PcodeBlock]] = {}
+
+    for module, script in enumerate(scripts):
+        raw_file = workspace.extraction_path(Path("scripts") / f"{script.path}.pcode")
+        raw_file.parent.mkdir(parents=True, exist_ok=True)
+        raw_file.write_text(script.pcode, encoding="utf-8")
+        raw_file.with_suffix(".as").write_text(script.actionscript, encoding="utf-8")
+
+        pcode_tags.append(swd_script_tag(module, f"#PCODE {script.path}", script.pcode))
+        pcode_tags.extend(swd_offset_tag(module, line, offset) for line, offset in script.pcode_line_offsets)
+        actionscript_tags.append(swd_script_tag(module, script.path, script.actionscript))
+        actionscript_tags.extend(
+            swd_offset_tag(module, line, offset) for line, offset in script.actionscript_line_offsets
+        )
+
+        normalized_script_blocks[Path(script.path)] = normalize_file(
+            raw_file, workspace.normalization_path(script.path)
+        ).blocks
+
+    workspace.extraction_path("debug_pcode.swd").write_bytes(encode_swd(pcode_tags))
+    workspace.extraction_path("debug_actionscript.swd").write_bytes(encode_swd(actionscript_tags))
+    return workspace, normalized_script_blocks
+
+
+def write_corpus(
+    output_dir: Path, params: CorpusParams
+) -> tuple[tuple[Workspace, dict[Path, list[PcodeBlock]]], tuple[Workspace, dict[Path, list[PcodeBlock]]]]:
+    """
+    Generate a corpus and write its v1 and v2 workspaces in the output directory.
+    """
+    scripts_v1, scripts_v2 = generate_scripts(params)
+    return write_workspace(output_dir / "v1", scripts_v1), write_workspace(output_dir / "v2", scripts_v2)
+
+
+def main(
+    output_dir: Annotated[Path, typer.Argument(help="Directory where the v1 and v2 workspaces are written.")],
+    scripts: Annotated[int, typer.Option("--scripts", min=1, help="Number of scripts.")] = CorpusParams.scripts,
+    methods: Annotated[
+        int, typer.Option("--methods", min=1, help="Number of methods per script.")
+    ] = CorpusParams.methods_per_script,
+    statements: Annotated[
+        int, typer.Option("--statements", min=1, help="Number of top-level statements per method.")
+    ] = CorpusParams.statements_per_method,
+    nesting_depth: Annotated[
+        int, typer.Option("--nesting-depth", min=0, help="Maximum depth of nested conditionals.")
+    ] = CorpusParams.nesting_depth,
+    label_churn: Annotated[
+        float, typer.Option("--label-churn", min=0, max=1, help="Share of methods with shifted labels in v2.")
+    ] = CorpusParams.label_churn,
+    register_churn: Annotated[
+        float, typer.Option("--register-churn", min=0, max=1, help="Share of methods with permuted registers in v2.")
+    ] = CorpusParams.register_churn,
+    mutation_rate: Annotated[
+        float, typer.Option("--mutation-rate", min=0, max=1, help="Share of statements mutated in v2.")
+    ] = CorpusParams.mutation_rate,
+    seed: Annotated[int, typer.Option("--seed", help="Seed of the random generator.")] = CorpusParams.seed,
+):
+    """
+    Generate a synthetic corpus of v1 and v2 workspaces.
+    """
+    if output_dir.exists() and any(output_dir.iterdir()):
+        print_error(f"Output directory {output_dir} is not empty.")
+        raise typer.Exit(code=1)
+
+    params = CorpusParams(
+        scripts=scripts,
+        methods_per_script=methods,
+        statements_per_method=statements,
+        nesting_depth=nesting_depth,
+        label_churn=label_churn,
+        register_churn=register_churn,
+        mutation_rate=mutation_rate,
+        seed=seed,
+    )
+
+    (workspace_v1, _), (workspace_v2, _) = write_corpus(output_dir, params)
+    console.print(f"v1: {workspace_v1.base_path}", highlight=False)
+    console.print(f"v2: {workspace_v2.base_path}", highlight=False)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,173 @@
+"""
+Minimal benchmark harness: registration, timing, JSON results and comparison between runs.
+"""
+
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+"""Minimum duration of a timed round. Fast functions are called several times per round to reach it."""
+MIN_ROUND_SECONDS = 0.05
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    """
+    A named benchmark. Its setup function prepares inputs (not timed) for a given input scale factor,
+    and returns the function to time.
+    """
+
+    name: str
+    group: str
+    setup: Callable[[int], Callable[[], object]]
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    """
+    Timings of a benchmark, in seconds per call.
+    """
+
+    name: str
+    group: str
+    rounds: int
+    calls_per_round: int
+    min: float
+    median: float
+    mean: float
+    stdev: float
+
+
+@dataclass(frozen=True)
+class BenchmarkComparison:
+    """
+    Median timings of a benchmark in a baseline run and in the current run.
+    """
+
+    name: str
+    baseline: float | None
+    current: float | None
+
+    def ratio(self) -> float | None:
+        if self.baseline is None or self.current is None or self.baseline == 0:
+            return None
+        return self.current / self.baseline
+
+
+_registry: list[Benchmark] = []
+
+
+def benchmark(name: str, group: str):
+    """
+    Register a benchmark setup function under a name.
+    """
+
+    def decorator(setup: Callable[[int], Callable[[], object]]) -> Callable[[int], Callable[[], object]]:
+        _registry.append(Benchmark(name=name, group=group, setup=setup))
+        return setup
+
+    return decorator
+
+
+def get_benchmarks(patterns: list[str] | None = None) -> list[Benchmark]:
+    """
+    Return registered benchmarks, optionally only those whose name contains one of the patterns.
+    """
+    if not patterns:
+        return list(_registry)
+
+    return [b for b in _registry if any(pattern.lower() in b.name.lower() for pattern in patterns)]
+
+
+def _calibrate(func: Callable[[], object]) -> int:
+    """
+    Find how many calls are needed for a round to last at least MIN_ROUND_SECONDS.
+    """
+    calls = 1
+
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        elapsed = time.perf_counter() - start
+
+        if elapsed >= MIN_ROUND_SECONDS:
+            return calls
+
+        # Aim slightly above the minimum duration, and at least double to converge quickly.
+        calls = max(calls * 2, int(calls * MIN_ROUND_SECONDS * 1.2 / max(elapsed, 1e-9)))
+
+
+def run_benchmark(bench: Benchmark, rounds: int, scale: int) -> BenchmarkResult:
+    """
+    Time a benchmark over several rounds. The calibration run also serves as a warm-up.
+    """
+    func = bench.setup(scale)
+    calls = _calibrate(func)
+    timings: list[float] = []
+
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        timings.append((time.perf_counter() - start) / calls)
+
+    return BenchmarkResult(
+        name=bench.name,
+        group=bench.group,
+        rounds=rounds,
+        calls_per_round=calls,
+        min=min(timings),
+        median=statistics.median(timings),
+        mean=statistics.fmean(timings),
+        stdev=statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    )
+
+
+def _git_revision(repo_dir: Path) -> str | None:
+    try:
+        completed = subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=repo_dir, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return completed.stdout.strip()
+
+
+def save_results(file: Path, results: list[BenchmarkResult], repo_dir: Path, params: dict[str, object]):
+    """
+    Write benchmark results as JSON, along with the context of the run.
+    """
+    document = {
+        "revision": _git_revision(repo_dir),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "params": params,
+        "benchmarks": [asdict(result) for result in results],
+    }
+
+    file.parent.mkdir(parents=True, exist_ok=True)
+    file.write_text(json.dumps(document, indent=4) + "\n", encoding="utf-8")
+
+
+def load_results(file: Path) -> dict:
+    return json.loads(file.read_text(encoding="utf-8"))
+
+
+def compare_results(baseline: dict, current: dict) -> list[BenchmarkComparison]:
+    """
+    Pair the median timings of two runs by benchmark name.
+    """
+    baseline_medians = {b["name"]: b["median"] for b in baseline["benchmarks"]}
+    current_medians = {b["name"]: b["median"] for b in current["benchmarks"]}
+    names = list(current_medians) + [name for name in baseline_medians if name not in current_medians]
+
+    return [BenchmarkComparison(name, baseline_medians.get(name), current_medians.get(name)) for name in names]
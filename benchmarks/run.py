@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Run the benchmarks, store their results as JSON, and optionally compare them with a previous run.
+
+Usage: uv run python benchmarks/run.py [--scale N] [--filter NAME] [--compare results/previous.json]
+"""
+
+from pathlib import Path
+import time
+from typing import Annotated
+from rich import box
+from rich.table import Table
+import typer
+
+import bench_pipeline  # noqa: F401  (registers the benchmarks)
+import bench_scaling  # noqa: F401
+from harness import compare_results, get_benchmarks, load_results, run_benchmark, save_results
+from kcd_gfx_toolbox.utils import console, print_error
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+
+
+def _format_duration(seconds: float | None) -> str:
+    if seconds is None:
+        return "-"
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} µs"
+
+
+def main(
+    scale: Annotated[
+        int, typer.Option("--scale", min=1, help="Scale factor of the inputs. 1 runs on the test data as is.")
+    ] = 1,
+    rounds: Annotated[int, typer.Option("--rounds", min=1, help="Number of timed rounds per benchmark.")] = 5,
+    patterns: Annotated[
+        list[str] | None,
+        typer.Option("--filter", "-k", help="Only run benchmarks whose name contains this value. Can be repeated."),
+    ] = None,
+    output_file: Annotated[
+        Path | None,
+        typer.Option("--output", "-o", help="Where to write the JSON results. Defaults to benchmarks/results/."),
+    ] = None,
+    baseline_file: Annotated[
+        Path | None,
+        typer.Option("--compare", help="JSON results of a previous run to compare against."),
+    ] = None,
+    threshold: Annotated[
+        float,
+        typer.Option("--threshold", min=0, help="Relative slowdown reported as a regression when comparing."),
+    ] = 0.1,
+):
+    """
+    Run the benchmarks of the toolbox pipeline.
+    """
+    benchmarks = get_benchmarks(patterns)
+
+    if not benchmarks:
+        print_error("No benchmark matches the provided filters.")
+        raise typer.Exit(code=1)
+
+    baseline = None
+
+    if baseline_file is not None:
+        try:
+            baseline = load_results(baseline_file)
+        except (OSError, ValueError) as e:
+            print_error(f"Cannot read baseline results: {e}")
+            raise typer.Exit(code=1)
+
+        if baseline["params"].get("scale") != scale:
+            print_error(f"Baseline results were measured with --scale {baseline['params'].get('scale')}.")
+            raise typer.Exit(code=1)
+
+    results = []
+
+    with console.status("") as status:
+        for bench in benchmarks:
+            status.update(f"Running {bench.name}…")
+            results.append(run_benchmark(bench, rounds, scale))
+
+    result_table = Table(box=box.SIMPLE, show_edge=False, pad_edge=False, header_style=None)
+    result_table.add_column("Benchmark", no_wrap=True)
+    result_table.add_column("Group")
+    result_table.add_column("Median", justify="right", no_wrap=True)
+    result_table.add_column("Min", justify="right", no_wrap=True)
+    result_table.add_column("Std. dev.", justify="right", no_wrap=True)
+    result_table.add_column("Calls × rounds", justify="right", no_wrap=True)
+
+    for result in results:
+        result_table.add_row(
+            result.name,
+            result.group,
+            _format_duration(result.median),
+            _format_duration(result.min),
+            _format_duration(result.stdev),
+            f"{result.calls_per_round} × {result.rounds}",
+        )
+
+    console.print(result_table)
+
+    if output_file is None:
+        output_file = BENCHMARKS_DIR / "results" / f"{time.strftime('%Y%m%d-%H%M%S')}-x{scale}.json"
+
+    save_results(output_file, results, BENCHMARKS_DIR.parent, {"scale": scale, "rounds": rounds})
+    console.line()
+    console.print(f"Results written to {output_file}", highlight=False)
+
+    if baseline is None:
+        return
+
+    comparisons = compare_results(baseline, load_results(output_file))
+    regressions = 0
+
+    comparison_table = Table(box=box.SIMPLE, show_edge=False, pad_edge=False, header_style=None)
+    comparison_table.add_column("Benchmark", no_wrap=True)
+    comparison_table.add_column("Baseline", justify="right", no_wrap=True)
+    comparison_table.add_column("Current", justify="right", no_wrap=True)
+    comparison_table.add_column("Change", justify="right", no_wrap=True)
+
+    for comparison in comparisons:
+        ratio = comparison.ratio()
+
+        if ratio is None:
+            change = "-"
+        elif ratio > 1 + threshold:
+            regressions += 1
+            change = f"[red]+{(ratio - 1) * 100:.1f}%[/red]"
+        elif ratio < 1 - threshold:
+            change = f"[green]{(ratio - 1) * 100:.1f}%[/green]"
+        else:
+            change = f"{(ratio - 1) * 100:+.1f}%"
+
+        comparison_table.add_row(
+            comparison.name,
+            _format_duration(comparison.baseline),
+            _format_duration(comparison.current),
+            change,
+        )
+
+    console.line()
+    console.print(f"Compared with {baseline_file} (revision {baseline.get('revision')}):", highlight=False)
+    console.line()
+    console.print(comparison_table)
+
+    if regressions:
+        console.line()
+        print_error(f"{regressions} benchmarks are more than {threshold:.0%} slower than the baseline.")
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Run the scaling benchmarks over corpora of increasing size, and chart their runtime against input size.
+
+Usage: uv run python benchmarks/scaling.py [--scales 1,2,4,8,16] [--grow scripts|statements]
+"""
+
+from dataclasses import replace
+from pathlib import Path
+import time
+from typing import Annotated
+import click
+from rich import box
+from rich.markup import escape
+from rich.table import Table
+import typer
+
+import bench_scaling
+from harness import BenchmarkResult, get_benchmarks, run_benchmark, save_results
+from kcd_gfx_toolbox.utils import console, print_error
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+
+"""Width of the longest bar of the chart, in characters."""
+CHART_WIDTH = 40
+
+
+def parse_scales(value: str) -> list[int]:
+    try:
+        scales = sorted({int(item) for item in value.split(",") if item.strip()})
+    except ValueError:
+        raise typer.BadParameter("Scales must be a comma-separated list of integers.")
+
+    if not scales or scales[0] < 1:
+        raise typer.BadParameter("Scales must be positive integers.")
+
+    return scales
+
+
+def main(
+    scales_value: Annotated[
+        str, typer.Option("--scales", help="Comma-separated scale factors. Scale N generates N scripts.")
+    ] = "1,2,4,8",
+    growth: Annotated[
+        str,
+        typer.Option(
+            "--grow",
+            click_type=click.Choice(list(bench_scaling.GROWTH_DIMENSIONS)),
+            help="Grow the number of scripts, or the length of their methods (and so of the diffed blocks).",
+        ),
+    ] = "scripts",
+    rounds: Annotated[int, typer.Option("--rounds", min=1, help="Number of timed rounds per benchmark.")] = 3,
+    output_file: Annotated[
+        Path | None,
+        typer.Option("--output", "-o", help="Where to write the JSON results. Defaults to benchmarks/results/."),
+    ] = None,
+):
+    """
+    Measure how the diff pipeline stages scale with the size of the compared scripts.
+    """
+    scales = parse_scales(scales_value)
+    bench_scaling.growth = growth
+    benchmarks = [b for b in get_benchmarks() if b.group == "scaling"]
+
+    if not benchmarks:
+        print_error("No scaling benchmark is registered.")
+        raise typer.Exit(code=1)
+
+    results: list[BenchmarkResult] = []
+    line_counts: dict[int, int] = {}
+    timings: dict[str, dict[int, float]] = {b.name: {} for b in benchmarks}
+
+    with console.status("") as status:
+        for scale in scales:
+            status.update(f"Generating corpus ×{scale}…")
+            line_counts[scale] = bench_scaling.scaled_corpus(scale).line_count()
+
+            for bench in benchmarks:
+                status.update(f"Running {bench.name} ×{scale}…")
+                result = run_benchmark(bench, rounds, scale)
+                timings[bench.name][scale] = result.median
+                results.append(replace(result, name=f"{bench.name}@x{scale}"))
+
+    for name, timings_by_scale in timings.items():
+        slowest = max(timings_by_scale.values())
+
+        chart_table = Table(box=box.SIMPLE, show_edge=False, pad_edge=False, header_style=None)
+        chart_table.add_column("Scale", justify="right", no_wrap=True)
+        chart_table.add_column("Lines", justify="right", no_wrap=True)
+        chart_table.add_column("Median", justify="right", no_wrap=True)
+        chart_table.add_column("µs / line", justify="right", no_wrap=True)
+        chart_table.add_column("", no_wrap=True)
+
+        for scale, seconds in timings_by_scale.items():
+            bar = "█" * max(1, round(CHART_WIDTH * seconds / slowest))
+            chart_table.add_row(
+                f"×{scale}",
+                f"{line_counts[scale]:,}",
+                f"{seconds * 1e3:.2f} ms",
+                f"{seconds * 1e6 / line_counts[scale]:.2f}",
+                f"[cyan]{bar}[/cyan]",
+            )
+
+        console.line()
+        console.print(f"[bold]{escape(name)}[/bold]")
+        console.line()
+        console.print(chart_table)
+
+    if output_file is None:
+        output_file = BENCHMARKS_DIR / "results" / f"scaling-{growth}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+
+    params = {
+        "growth": growth,
+        "scales": scales,
+        "rounds": rounds,
+        "lines": {str(scale): count for scale, count in line_counts.items()},
+    }
+    save_results(output_file, results, BENCHMARKS_DIR.parent, params)
+    console.line()
+    console.print(f"Results written to {output_file}", highlight=False)
+
+
+if __name__ == "__main__":
+    typer.run(main)
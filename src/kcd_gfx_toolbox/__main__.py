@@ -0,0 +1,23 @@
+import sys
+from .daemon import forward_to_daemon
+
+
+def main():
+    """
+    Entry point of the `kcd-gfx` command.
+
+    Commands are executed by the daemon when it is running (see `kcd-gfx serve`), so that the heavy CLI modules
+    are only imported when they are needed.
+    """
+    exit_code = forward_to_daemon(sys.argv[1:])
+
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+    from .cli import app
+
+    app()
+
+
+if __name__ == "__main__":
+    main()
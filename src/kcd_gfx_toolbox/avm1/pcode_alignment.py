@@ -1,98 +1,36 @@
 from collections import Counter, defaultdict
+from collections.abc import Iterator, Sequence
 import difflib
-from .pcode_parsing import tokenize_line
-from .pcode_utils import (
-    LABEL_REFERENCED_LINE_RE,
-    PUSH_REGISTER_RE,
-    REGISTER_REFERENCE_RE,
-    STORE_REGISTER_RE,
-    extract_label_from_line,
-    strip_label,
-)
-
-
-def neutralize_labels_in_line(line: str) -> str:
-    """
-    Replace label prefix and target label references with `<LABEL>`, when present.
-    """
-    normalized_line = ""
-    labelless_line, label_prefix = extract_label_from_line(line)
-
-    if label_prefix is not None:
-        normalized_line += "<LABEL>: "
-
-    if match := LABEL_REFERENCED_LINE_RE.match(labelless_line):
-        normalized_line += match.group("opcode") + " <LABEL>"
-    else:
-        normalized_line += labelless_line
+from typing import NamedTuple, TypeGuard
+from .. import instrumentation
+from .pcode_cfg import find_basic_block_starts
+from .pcode_parsing import PcodeInstruction, PcodeLine, PcodeOperand
 
-    return normalized_line
 
-
-def extract_jump_target_label_from_line(line: str) -> str | None:
-    """
-    Extract the target label of a If/Jump instruction line if any.
+def select_reciprocal_correspondences(votes: dict[str, Counter[str]]) -> dict[str, str]:
     """
-    if match := LABEL_REFERENCED_LINE_RE.match(strip_label(line).strip()):
-        return match.group("label")
-
-    return None
-
+    Select one-to-one correspondences from votes, given as occurrences of correspondence from names in text 2
+    (labels or registers) to names in text 1.
 
-def build_label_alignment_map(text1_lines: list[str], text2_lines: list[str]) -> dict[str, str]:
+    A name in text 2 is mapped to the name in text 1 with the most votes, if there is one clear winner and if the
+    name in text 2 is reciprocally the clear winner for that name in text 1.
     """
-    Build a mapping from labels in text 2 to their corresponding labels in text 1.
-
-    The mapping is built by diffing the two texts with labels neutralized (label definitions
-    and jump targets are replaced with a constant) to maximize alignment on other structures.
-    The best one-to-one correspondences between (initially neutralized) labels from both texts are kept.
-    """
-    normalized_text1_lines = [neutralize_labels_in_line(line) for line in text1_lines]
-    normalized_text2_lines = [neutralize_labels_in_line(line) for line in text2_lines]
-
-    # Diff is computed on an aggressively normalized corpus to maximize comparability of texts.
-    seqmatch = difflib.SequenceMatcher(None, normalized_text1_lines, normalized_text2_lines, autojunk=False)
-
-    # "Votes" here simply means "occurrences of label correspondence".
-    votes: defaultdict[str, Counter[str]] = defaultdict(Counter[str])
-
-    # For all structurally equal parts, we collect the label correspondences between original texts.
-    for tag, i1, i2, j1, j2 in seqmatch.get_opcodes():
-        if tag != "equal":
-            continue
-
-        for k in range(i2 - i1):
-            line_k_in_text1 = text1_lines[i1 + k]
-            line_k_in_text2 = text2_lines[j1 + k]
-
-            _, label_in_text1 = extract_label_from_line(line_k_in_text1)
-            _, label_in_text2 = extract_label_from_line(line_k_in_text2)
-
-            if label_in_text1 and label_in_text2:
-                votes[label_in_text2][label_in_text1] += 1
-
-            target_label_in_text1 = extract_jump_target_label_from_line(line_k_in_text1)
-            target_label_in_text2 = extract_jump_target_label_from_line(line_k_in_text2)
-
-            if target_label_in_text1 and target_label_in_text2:
-                votes[target_label_in_text2][target_label_in_text1] += 1
-
     if not votes:
         return {}
 
-    # Pre-compute the inverted index of label correspondences, from text 1 to text 2.
+    # Pre-compute the inverted index of correspondences, from text 1 to text 2.
     inverted_votes: defaultdict[str, Counter[str]] = defaultdict(Counter[str])
-    for label_in_text2, votes_for_labels_in_text1 in votes.items():
-        for label_in_text1, count in votes_for_labels_in_text1.items():
-            inverted_votes[label_in_text1][label_in_text2] = count
+    for name_in_text2, votes_for_names_in_text1 in votes.items():
+        for name_in_text1, count in votes_for_names_in_text1.items():
+            inverted_votes[name_in_text1][name_in_text2] = count
 
     # Keep only reciprocal unique correspondences.
-    label_correspondences: list[tuple[int, str, str]] = []
+    correspondences: dict[str, str] = {}
 
-    for label_in_text2, votes_for_labels_in_text1 in votes.items():
-        best_score = max(votes_for_labels_in_text1.values())
+    for name_in_text2, votes_for_names_in_text1 in votes.items():
+        best_score = max(votes_for_names_in_text1.values())
         best_matches_from_text1 = sorted(
-            label for label, score in votes_for_labels_in_text1.items() if score == best_score
+            name for name, score in votes_for_names_in_text1.items() if score == best_score
         )
 
         if len(best_matches_from_text1) != 1:
@@ -101,231 +39,220 @@ def build_label_alignment_map(text1_lines: list[str], text2_lines: list[str]) ->
 
         best_match_from_text1 = best_matches_from_text1[0]
 
-        # Check that `label_in_text2` is reciprocally the best correspondence for `best_match_from_text1`.
+        # Check that `name_in_text2` is reciprocally the best correspondence for `best_match_from_text1`.
         votes_for_best_match = inverted_votes[best_match_from_text1]
         best_score_for_best_match = max(votes_for_best_match.values())
 
         best_matches_of_best_match = sorted(
-            label for label, score in votes_for_best_match.items() if score == best_score_for_best_match and score > 0
+            name for name, score in votes_for_best_match.items() if score == best_score_for_best_match and score > 0
         )
 
-        if len(best_matches_of_best_match) != 1 or best_matches_of_best_match[0] != label_in_text2:
+        if len(best_matches_of_best_match) != 1 or best_matches_of_best_match[0] != name_in_text2:
             # If there is not one clear winner, or it is not reciprocal, we don't match either.
             continue
 
-        label_correspondences.append((best_score, label_in_text2, best_match_from_text1))
+        correspondences[name_in_text2] = best_match_from_text1
 
-    # By construction, label_correspondences contains only unique pairs, and no labels are shared by multiple pairs.
-    return {label_in_text2: label_in_text1 for _, label_in_text2, label_in_text1 in label_correspondences}
+    # By construction, correspondences contains only unique pairs, and no names are shared by multiple pairs.
+    return correspondences
 
 
-def remap_labels_in_line(line: str, label_map: dict[str, str]) -> str:
+class ScannedLine(NamedTuple):
     """
-    Replace labels (prefixes and jump targets) in a line according to the given label map.
+    Label and register operands of a p-code line, and the line with all of them neutralized: labels are replaced with
+    `<LABEL>`, pushed registers with `registerN` and stored registers with `StoreRegister N`.
     """
-    labelless_line, label_prefix = extract_label_from_line(line)
-
-    new_label_prefix = label_map.get(label_prefix, label_prefix) if label_prefix is not None else None
-
-    if match := LABEL_REFERENCED_LINE_RE.match(labelless_line.strip()):
-        old_target = match.group("label")
-        new_target = label_map.get(old_target)
-        if new_target is not None:
-            return (
-                f"{new_label_prefix + ':' if new_label_prefix is not None else ''}{match.group('opcode')} {new_target}"
-            )
-
-    if new_label_prefix is not None and new_label_prefix != label_prefix:
-        return new_label_prefix + ":" + labelless_line
 
-    return line
+    neutralized: str
+    label: str | None
+    target_label: str | None
+    registers: list[str]
 
 
-def align_labels_in_text(text_lines: list[str], anchor_lines: list[str]) -> list[str]:
+def _iter_equal_line_ranges(lines1: Sequence[str], lines2: Sequence[str]) -> Iterator[tuple[int, int, int]]:
     """
-    Rewrite labels (prefixes + jump targets) in `text_lines` to align/compare better with `anchor_lines`.
+    Yield the `(i, j, size)` ranges of equal lines found by diffing two lists of lines.
     """
-    label_map = build_label_alignment_map(anchor_lines, text_lines)
+    instrumentation.count("SequenceMatcher calls")
+    seqmatch = difflib.SequenceMatcher(None, lines1, lines2, autojunk=False)
+    yield from (block for block in seqmatch.get_matching_blocks() if block.size > 0)
 
-    if not label_map:
-        return text_lines
 
-    aligned_lines: list[str] = []
-
-    for line in text_lines:
-        aligned_lines.append(remap_labels_in_line(line, label_map))
-
-    return aligned_lines
-
-
-def neutralize_registers_in_line(line: str) -> str:
+def _iter_equal_line_ranges_by_basic_blocks(
+    lines1: Sequence[str], starts1: Sequence[int], lines2: Sequence[str], starts2: Sequence[int]
+) -> Iterator[tuple[int, int, int]]:
     """
-    Replace register references with `registerN` and `StoreRegister N`.
+    Like `_iter_equal_line_ranges`, but pair identical basic blocks first, then only diff the lines of the basic blocks
+    left between them.
     """
-    labelless_line, label_prefix = extract_label_from_line(line)
-
-    if PUSH_REGISTER_RE.match(labelless_line):
-        tokens = tokenize_line(labelless_line)
-        register_tokens = [tok for tok in tokens if REGISTER_REFERENCE_RE.fullmatch(tok[1])]
-        for pos, reg_tok in reversed(register_tokens):
-            labelless_line = labelless_line[:pos] + "registerN" + labelless_line[pos + len(reg_tok) :]
-        return f"{label_prefix + ':' if label_prefix else ''}{labelless_line}"
-
-    if STORE_REGISTER_RE.match(labelless_line):
-        labelless_line = STORE_REGISTER_RE.sub(
-            lambda m: m.string[: m.start("regindex")] + "N" + m.string[m.end("regindex") :], labelless_line
-        )
-        return f"{label_prefix + ':' if label_prefix else ''}{labelless_line}"
+    bounds1 = [*starts1, len(lines1)]
+    bounds2 = [*starts2, len(lines2)]
+    keys1 = [tuple(lines1[start:end]) for start, end in zip(bounds1, bounds1[1:])]
+    keys2 = [tuple(lines2[start:end]) for start, end in zip(bounds2, bounds2[1:])]
 
-    return line
+    instrumentation.count("SequenceMatcher calls")
+    seqmatch = difflib.SequenceMatcher(None, keys1, keys2, autojunk=False)
+    i_prev = j_prev = 0
 
+    # The last matching block is a dummy one, marking the end of both basic block lists.
+    for i, j, size in seqmatch.get_matching_blocks():
+        if i > i_prev or j > j_prev:
+            i1, i2, j1, j2 = bounds1[i_prev], bounds1[i], bounds2[j_prev], bounds2[j]
 
-def extract_registers_from_line(line: str) -> list[str]:
-    """
-    Extract all register references from a `Push` or `StoreRegister` line if any.
-    """
-    line = strip_label(line)
+            for gap_i, gap_j, gap_size in _iter_equal_line_ranges(lines1[i1:i2], lines2[j1:j2]):
+                yield (i1 + gap_i, j1 + gap_j, gap_size)
 
-    if PUSH_REGISTER_RE.match(line):
-        tokens = tokenize_line(line)
-        return [tok[1] for tok in tokens if REGISTER_REFERENCE_RE.fullmatch(tok[1])]
+        if size > 0:
+            yield (bounds1[i], bounds2[j], bounds1[i + size] - bounds1[i])
 
-    if match := STORE_REGISTER_RE.match(line):
-        return ["register" + match.group("regindex")]
+        i_prev, j_prev = i + size, j + size
 
-    return []
 
+def _build_alignment_maps_from_scanned_lines(
+    scanned_lines1: list[ScannedLine],
+    scanned_lines2: list[ScannedLine],
+    basic_block_starts: tuple[Sequence[int], Sequence[int]] | None = None,
+) -> tuple[dict[str, str], dict[str, str]]:
+    # Diff is computed on an aggressively normalized corpus to maximize comparability of texts.
+    neutralized_lines1 = [line.neutralized for line in scanned_lines1]
+    neutralized_lines2 = [line.neutralized for line in scanned_lines2]
 
-def build_register_alignment_map(text1_lines: list[str], text2_lines: list[str]) -> dict[str, str]:
-    """
-    Build a mapping from registers in text 2 to their corresponding registers in text 1.
+    if basic_block_starts is None:
+        equal_ranges = _iter_equal_line_ranges(neutralized_lines1, neutralized_lines2)
+    else:
+        equal_ranges = _iter_equal_line_ranges_by_basic_blocks(
+            neutralized_lines1, basic_block_starts[0], neutralized_lines2, basic_block_starts[1]
+        )
 
-    The mapping is inferred from structurally equal spans after registers are neutralized.
-    Only reciprocal unique correspondences are kept.
-    """
-    normalized_text1_lines = [neutralize_registers_in_line(line) for line in text1_lines]
-    normalized_text2_lines = [neutralize_registers_in_line(line) for line in text2_lines]
+    label_votes: defaultdict[str, Counter[str]] = defaultdict(Counter[str])
+    register_votes: defaultdict[str, Counter[str]] = defaultdict(Counter[str])
 
-    # Diff is computed on an aggressively normalized corpus to maximize comparability of texts.
-    seqmatch = difflib.SequenceMatcher(None, normalized_text1_lines, normalized_text2_lines, autojunk=False)
+    for i, j, size in equal_ranges:
+        for line1, line2 in zip(scanned_lines1[i : i + size], scanned_lines2[j : j + size]):
+            if line1.label and line2.label:
+                label_votes[line2.label][line1.label] += 1
 
-    # "Votes" here simply means "occurrences of register correspondence".
-    votes: defaultdict[str, Counter[str]] = defaultdict(Counter[str])
+            if line1.target_label and line2.target_label:
+                label_votes[line2.target_label][line1.target_label] += 1
 
-    # For all structurally equal parts, we collect the register correspondences between original texts.
-    for tag, i1, i2, j1, j2 in seqmatch.get_opcodes():
-        if tag != "equal":
-            continue
+            for reg1 in line1.registers:
+                for reg2 in line2.registers:
+                    register_votes[reg2][reg1] += 1
 
-        for k in range(i2 - i1):
-            registers_in_text1 = extract_registers_from_line(text1_lines[i1 + k])
-            registers_in_text2 = extract_registers_from_line(text2_lines[j1 + k])
+    return select_reciprocal_correspondences(label_votes), select_reciprocal_correspondences(register_votes)
 
-            if registers_in_text1 and registers_in_text2:
-                for reg1 in registers_in_text1:
-                    for reg2 in registers_in_text2:
-                        votes[reg2][reg1] += 1
 
-    if not votes:
-        return {}
+def _render_without_label(line: PcodeLine) -> str:
+    if line.label is None:
+        return line.render()
 
-    # Pre-compute the inverted index of register correspondences, from text 1 to text 2.
-    inverted_votes: defaultdict[str, Counter[str]] = defaultdict(Counter[str])
-    for register_in_text2, votes_for_registers_in_text1 in votes.items():
-        for register_in_text1, count in votes_for_registers_in_text1.items():
-            inverted_votes[register_in_text1][register_in_text2] = count
+    return line.render().removeprefix(line.label + ":")
 
-    # Keep only reciprocal unique correspondences.
-    register_correspondences: list[tuple[int, str, str]] = []
 
-    for register_in_text2, votes_for_registers_in_text1 in votes.items():
-        best_score = max(votes_for_registers_in_text1.values())
-        best_matches_from_text1 = sorted(
-            register for register, score in votes_for_registers_in_text1.items() if score == best_score
-        )
+def _is_jump_instruction(line: PcodeLine) -> TypeGuard[PcodeInstruction]:
+    return (
+        isinstance(line, PcodeInstruction)
+        and line.opcode in ("If", "Jump")
+        and len(line.operands) == 1
+        and line.operands[0].type == "label"
+    )
 
-        if len(best_matches_from_text1) != 1:
-            # If there is not one clear winner, we don't match.
-            continue
 
-        best_match_from_text1 = best_matches_from_text1[0]
+def scan_pcode_line_operands(line: PcodeLine) -> ScannedLine:
+    """
+    Read the label prefix, the jump target label and the register references of a parsed line from its operands.
+    """
+    neutralized_prefix = "<LABEL>: " if line.label is not None else ""
 
-        # Check that `register_in_text2` is reciprocally the best correspondence for `best_match_from_text1`.
-        votes_for_best_match = inverted_votes[best_match_from_text1]
-        best_score_for_best_match = max(votes_for_best_match.values())
+    if isinstance(line, PcodeInstruction):
+        if _is_jump_instruction(line):
+            return ScannedLine(
+                f"{neutralized_prefix}{line.opcode} <LABEL>", line.label, str(line.operands[0].value), []
+            )
 
-        best_matches_of_best_match = sorted(
-            register
-            for register, score in votes_for_best_match.items()
-            if score == best_score_for_best_match and score > 0
-        )
+        if line.opcode == "Push":
+            registers = [operand.render() for operand in line.operands if operand.type == "register"]
 
-        if len(best_matches_of_best_match) != 1 or best_matches_of_best_match[0] != register_in_text2:
-            # If there is not one clear winner, or it is not reciprocal, we don't match either.
-            continue
+            if registers:
+                neutralized_operands = ", ".join(
+                    "registerN" if operand.type == "register" else operand.render() for operand in line.operands
+                )
+                return ScannedLine(f"{neutralized_prefix}Push {neutralized_operands}", line.label, None, registers)
 
-        register_correspondences.append((best_score, register_in_text2, best_match_from_text1))
+        elif line.opcode == "StoreRegister" and len(line.operands) == 1 and line.operands[0].type == "numeric":
+            return ScannedLine(
+                f"{neutralized_prefix}StoreRegister N", line.label, None, [f"register{line.operands[0].value}"]
+            )
 
-    # By construction, register_correspondences contains only unique pairs, and no registers are shared by multiple pairs.
-    return {
-        register_in_text2: register_in_text1 for _, register_in_text2, register_in_text1 in register_correspondences
-    }
+    return ScannedLine(neutralized_prefix + _render_without_label(line), line.label, None, [])
 
 
-def remap_registers_in_line(line: str, register_map: dict[str, str]) -> str:
+def build_pcode_alignment_maps(
+    lines1: Sequence[PcodeLine], lines2: Sequence[PcodeLine], by_basic_blocks: bool = False
+) -> tuple[dict[str, str], dict[str, str]]:
     """
-    Replace register references in a line according to the given register map.
+    Build the mappings from labels and from registers in p-code lines 2 to their corresponding ones in p-code
+    lines 1.
+
+    Both lists are diffed once with labels and registers neutralized, to maximize alignment on other structures. In
+    the structurally equal parts, each pair of labels or registers found at the same place is a vote for their
+    correspondence, and the best one-to-one correspondences are kept (see `select_reciprocal_correspondences`).
+
+    With `by_basic_blocks`, identical basic blocks (see `pcode_cfg`) are paired before lines are diffed, which is much
+    cheaper on long blocks with few changes.
     """
-    labelless_line, label_prefix = extract_label_from_line(line)
+    return _build_alignment_maps_from_scanned_lines(
+        [scan_pcode_line_operands(line) for line in lines1],
+        [scan_pcode_line_operands(line) for line in lines2],
+        (find_basic_block_starts(lines1), find_basic_block_starts(lines2)) if by_basic_blocks else None,
+    )
 
-    if match := PUSH_REGISTER_RE.match(labelless_line):
-        old_registers = extract_registers_from_line(labelless_line)
-        new_registers = [register_map[reg] for reg in old_registers if reg in register_map]
 
-        if not new_registers:
-            return line
+def _remap_register_operand(operand: PcodeOperand, register_map: dict[str, str]) -> PcodeOperand:
+    if (new_register := register_map.get(operand.render())) is not None:
+        return PcodeOperand.register(int(new_register.removeprefix("register")))
 
-        tokens = tokenize_line(labelless_line)
-        replacements: list[tuple[tuple[int, str], str]] = [
-            (tok, register_map[tok[1]])
-            for tok in tokens
-            if REGISTER_REFERENCE_RE.fullmatch(tok[1]) and tok[1] in register_map
-        ]
+    return operand
 
-        for (pos, original), replacement in reversed(replacements):
-            labelless_line = labelless_line[:pos] + replacement + labelless_line[pos + len(original) :]
 
-        return f"{label_prefix + ':' if label_prefix else ''}{labelless_line}"
+def remap_pcode_line(line: PcodeLine, label_map: dict[str, str], register_map: dict[str, str]) -> PcodeLine:
+    """
+    Replace labels (prefixes and jump targets) and register references in a parsed line according to the given maps.
+    """
+    changes: dict = {}
 
-    if match := STORE_REGISTER_RE.match(labelless_line):
-        old_register = "register" + match.group("regindex")
-        if old_register not in register_map:
-            return line
+    if line.label is not None and (new_label := label_map.get(line.label)) is not None:
+        changes["label"] = new_label
 
-        new_register = register_map[old_register]
-        new_regindex = new_register.replace("register", "")
+    if _is_jump_instruction(line):
+        if (new_target := label_map.get(str(line.operands[0].value))) is not None:
+            changes["operands"] = [PcodeOperand.label(new_target)]
 
-        labelless_line = STORE_REGISTER_RE.sub(
-            lambda m: m.string[: m.start("regindex")] + new_regindex + m.string[m.end("regindex") :], labelless_line
-        )
+    elif isinstance(line, PcodeInstruction) and line.opcode == "Push":
+        if any(operand.type == "register" and operand.render() in register_map for operand in line.operands):
+            changes["operands"] = [
+                _remap_register_operand(operand, register_map) if operand.type == "register" else operand
+                for operand in line.operands
+            ]
 
-        return f"{label_prefix + ':' if label_prefix else ''}{labelless_line}"
+    elif isinstance(line, PcodeInstruction) and line.opcode == "StoreRegister":
+        if len(line.operands) == 1 and line.operands[0].type == "numeric":
+            if (new_register := register_map.get(f"register{line.operands[0].value}")) is not None:
+                changes["operands"] = [PcodeOperand(type="numeric", value=new_register.removeprefix("register"))]
 
-    return line
+    return line.replace(**changes) if changes else line
 
 
-def align_registers_in_text(text_lines: list[str], anchor_lines: list[str]) -> list[str]:
+def align_pcode_lines(
+    lines: Sequence[PcodeLine], anchor_lines: Sequence[PcodeLine], by_basic_blocks: bool = False
+) -> list[PcodeLine]:
     """
-    Rewrite register references in `text_lines` to align/compare better with `anchor_lines`.
+    Rewrite labels and register references in p-code `lines` to align/compare better with `anchor_lines`.
+    Operands are read and replaced directly on the parsed lines.
     """
-    register_map = build_register_alignment_map(anchor_lines, text_lines)
-
-    if not register_map:
-        return text_lines
-
-    aligned_lines: list[str] = []
+    label_map, register_map = build_pcode_alignment_maps(anchor_lines, lines, by_basic_blocks)
 
-    for line in text_lines:
-        aligned_lines.append(remap_registers_in_line(line, register_map))
+    if not label_map and not register_map:
+        return list(lines)
 
-    return aligned_lines
+    return [remap_pcode_line(line, label_map, register_map) for line in lines]
@@ -0,0 +1,37 @@
+"""
+Basic blocks of the control-flow graph of p-code blocks.
+
+A block is split into basic blocks: runs of lines that are only entered at their first line and only left after their
+last one. A basic block starts at every labelled line, and ends after `If`, `Jump` and `Return` instructions and at
+function boundaries (function definition headers and closing braces). The edges between basic blocks are not built:
+comparing blocks only needs basic blocks and their hashes.
+"""
+
+from collections.abc import Sequence
+import hashlib
+from .pcode_parsing import OpcodeClass, PcodeLine, classify_opcodes
+
+"""Opcode classes of the lines after which a basic block ends."""
+BASIC_BLOCK_TERMINATORS = frozenset(
+    {OpcodeClass.JUMP, OpcodeClass.RETURN, OpcodeClass.FUNCTION_DEFINITION, OpcodeClass.CLOSING_BRACE}
+)
+
+
+def hash_pcode_lines(rendered_lines: Sequence[str]) -> bytes:
+    return hashlib.blake2b("\n".join(rendered_lines).encode(), digest_size=16).digest()
+
+
+def find_basic_block_starts(lines: Sequence[PcodeLine], classes: Sequence[int] | None = None) -> list[int]:
+    """
+    Return the index of the first line of each basic block.
+    """
+    if classes is None:
+        classes = classify_opcodes(lines)
+
+    starts = []
+
+    for i, line in enumerate(lines):
+        if i == 0 or line.label is not None or classes[i - 1] in BASIC_BLOCK_TERMINATORS:
+            starts.append(i)
+
+    return starts
@@ -1,19 +1,26 @@
+from __future__ import annotations
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
 import json
 from pathlib import Path
 from dataclasses import dataclass
 import re
-from .pcode_utils import REGISTER_REFERENCE_RE
 from .pcode_parsing import (
+    OpcodeClass,
     PcodeBlock,
     PcodeBlankLineWithLabel,
     PcodeInstruction,
     PcodeLine,
     PcodeOperand,
     PcodeStructural,
+    classify_opcodes,
     is_pcode_instruction,
+    iter_opcode_class_indexes,
+    iter_pcode_file,
     merge_pcode_lines_sources,
-    parse_pcode_file,
 )
+from .peephole import InstructionPattern, OperandPattern, PeepholeRule, PeepholeRuleSet
+from kcd_gfx_toolbox.instrumentation import count, traced
 from kcd_gfx_toolbox.utils import safe_filename
 
 
@@ -42,8 +49,7 @@ def find_function_name_and_start_line(
         if (
             line.opcode == "Push"
             and len(line.operands) == 2
-            and line.operands[0].type == "symbol"
-            and REGISTER_REFERENCE_RE.fullmatch(str(line.operands[0].value))
+            and line.operands[0].type == "register"
             and line.operands[1].type == "string"
         ):
             return (i, line.operands[1].value)
@@ -56,32 +62,40 @@ def find_function_name_and_start_line(
                 is_pcode_instruction(prev)
                 and prev.opcode == "Push"
                 and len(prev.operands) == 1
-                and prev.operands[0].type == "symbol"
-                and REGISTER_REFERENCE_RE.fullmatch(str(prev.operands[0].value))
+                and prev.operands[0].type == "register"
             ):
                 return (i - 1, line.operands[0].value)
 
     return None
 
 
-def find_function_end_line(lines: list[PcodeLine], define_function_idx: int) -> int:
+def _get_opcode_classes(lines: list[PcodeLine], classes: array[int] | None) -> array[int]:
+    if classes is None:
+        return classify_opcodes(lines)
+
+    assert len(classes) == len(lines), "The opcode class table does not match the lines."
+    return classes
+
+
+def find_function_end_line(lines: list[PcodeLine], define_function_idx: int, classes: array[int] | None = None) -> int:
     """
     Find the index of the line closing the function that starts at `define_function_idx`.
     Use brace-depth tracking to avoid stopping at nested function boundaries.
     Fall back to last line if no closing brace was found.
     """
+    classes = _get_opcode_classes(lines, classes)
     depth = 0
     opening_seen = False
 
-    for i in range(define_function_idx, len(lines)):
-        line = lines[i]
+    for i in range(define_function_idx, len(classes)):
+        opcode_class = classes[i]
 
-        if is_pcode_instruction(line) and line.opcode in ["DefineFunction", "DefineFunction2"]:
+        if opcode_class == OpcodeClass.FUNCTION_DEFINITION:
             opening_seen = True
             depth += 1
             continue
 
-        if isinstance(line, PcodeStructural) and line.value == "}":
+        if opcode_class == OpcodeClass.CLOSING_BRACE:
             depth -= 1
 
         # `opening_seen == True` means that we have entered the function body.
@@ -92,86 +106,110 @@ def find_function_end_line(lines: list[PcodeLine], define_function_idx: int) ->
     return len(lines) - 1  # Fallback; should never happen with well-formed p-code.
 
 
-def split_into_blocks(pcode_file: PcodeBlock) -> list[PcodeBlock]:
+def iter_blocks(pcode_lines: Iterable[PcodeLine]) -> Iterator[PcodeBlock]:
     """
-    Splits a p-code text into a sequence of blocks:
+    Split a stream of p-code lines into a sequence of blocks:
     - Function blocks:
         - If the `DefineFunction`/`DefineFunction2` header has a non-empty name, that name is used and
           the block starts on the header line.
         - Otherwise, block name is inferred by scanning previous lines for member-binding patterns.
         - A trailing `SetMember` is included when present.
     - Top-level gap blocks between or around function blocks (for example, class property initialization).
+
+    Lines are consumed incrementally: each block is yielded as soon as its last line has been read.
+    Only the lines of the block being built are held in memory.
     """
-    blocks: list[PcodeBlock] = []
     name_occurrences: dict[str, int] = {}
 
-    def add_block(name: str, a: int, b: int):
+    def make_block(name: str, lines: list[PcodeLine]) -> PcodeBlock:
         occurrences = name_occurrences.get(name.lower(), 0)
         name_occurrences[name.lower()] = occurrences + 1
         if occurrences > 0:
             name = f"{name}_{occurrences + 1}"
-        blocks.append(PcodeBlock(lines=pcode_file.lines[a:b], name=name))
+        return PcodeBlock(lines=lines, name=name)
+
+    stream = iter(pcode_lines)
+    gap: list[PcodeLine] = []  # lines read since the end of the previous function block
+    pushed_back: PcodeLine | None = None  # line read ahead of a function block, but not part of it
+
+    while True:
+        if pushed_back is not None:
+            current, pushed_back = pushed_back, None
+        elif (current := next(stream, None)) is None:
+            break
 
-    i = 0
-    next_gap_start = 0
+        # Anything that is not a function definition instruction belongs to the current top-level gap.
+        if not is_pcode_instruction(current) or not current.is_function_definition():
+            gap.append(current)
+            continue
 
-    while i < len(pcode_file.lines):
-        current = pcode_file.lines[i]
+        assert current.operands[0] is not None
+        assert current.operands[0].type == "string"
+        declared_name = current.operands[0].value
 
-        # If we find a function definition instruction.
-        if is_pcode_instruction(current) and current.opcode in ["DefineFunction", "DefineFunction2"]:
-            assert current.operands[0] is not None
-            assert current.operands[0].type == "string"
-            declared_name = current.operands[0].value
+        if declared_name:
+            # The function definition header contains the function name.
+            start, func_name = len(gap), declared_name
+        else:
+            # No name is declared in the header, we need to look back at previous lines.
+            # The lookback is constrained to the current gap: lines already consumed by the previous
+            # function block cannot be included in this block, so their name would be stale.
+            func_info = find_function_name_and_start_line(gap, len(gap))
 
-            if declared_name:
-                # The function definition header contains the function name.
-                start, func_name = i, declared_name
+            if func_info is not None:
+                start, func_name = func_info
             else:
-                # No name is declared in the header, we need to look back at previous lines.
-                func_info = find_function_name_and_start_line(pcode_file.lines, i)
+                start, func_name = len(gap), "__anonymous"
 
-                # Keep the name found from lookback only if we can include those lookback lines in this block.
-                # Otherwise, avoid carrying a stale name from already-consumed lines. Prevent overlapping.
-                if func_info is not None and func_info[0] >= next_gap_start:
-                    start, func_name = func_info
-                else:
-                    start, func_name = i, "__anonymous"
+        # We need to register the "gap" that we passed between this function block and the previous one, if any.
+        if start > 0:
+            yield make_block("__toplevel", gap[:start])
 
-            # We need to register the "gap" that we passed between this function block and the previous one, if any.
-            if next_gap_start < start:
-                add_block("__toplevel", next_gap_start, start)
+        function_lines = gap[start:]
+        function_lines.append(current)
+        gap = []
 
-            # Find the end of the function body.
-            end = find_function_end_line(pcode_file.lines, i)
+        # Read the function body until its closing brace, using brace-depth tracking to avoid stopping
+        # at nested function boundaries. Stop at the end of the stream if no closing brace is found.
+        depth = 1
 
-            # Include trailing SetMember if present on the next line.
-            if (
-                (end + 1) < len(pcode_file.lines)
-                and is_pcode_instruction(pcode_file.lines[end + 1])
-                and pcode_file.lines[end + 1].opcode == "SetMember"
-            ):
-                end += 1
+        for line in stream:
+            function_lines.append(line)
 
-            block_name = safe_filename(func_name)
+            if is_pcode_instruction(line) and line.is_function_definition():
+                depth += 1
+                continue
 
-            if not block_name:
-                block_name = "__anonymous"
+            if isinstance(line, PcodeStructural) and line.value == "}":
+                depth -= 1
 
-            add_block(block_name, start, end + 1)
+            if depth <= 0:
+                break
 
-            # Jump straight to the next line after the function block.
-            i = end + 1
-            next_gap_start = i
-            continue
+        # Include trailing SetMember if present on the next line.
+        if (next_line := next(stream, None)) is not None:
+            if is_pcode_instruction(next_line) and next_line.opcode == "SetMember":
+                function_lines.append(next_line)
+            else:
+                pushed_back = next_line
+
+        block_name = safe_filename(func_name)
+
+        if not block_name:
+            block_name = "__anonymous"
 
-        i += 1
+        yield make_block(block_name, function_lines)
 
     # Finally we need to register the gap that might exist between the last function and the end of the file.
-    if next_gap_start < len(pcode_file.lines):
-        add_block("__toplevel", next_gap_start, len(pcode_file.lines))
+    if gap:
+        yield make_block("__toplevel", gap)
 
-    return blocks
+
+def split_into_blocks(pcode_file: PcodeBlock) -> list[PcodeBlock]:
+    """
+    Split a p-code text into a sequence of blocks. See `iter_blocks` for the splitting rules.
+    """
+    return list(iter_blocks(pcode_file.lines))
 
 
 def canonicalize_push_lines(lines: list[PcodeLine]) -> list[PcodeLine]:
@@ -238,7 +276,9 @@ def canonicalize_numeric_literals(lines: list[PcodeLine]) -> list[PcodeLine]:
     return canonicalized_lines
 
 
-def canonicalize_function_definition_headers(lines: list[PcodeLine]) -> list[PcodeLine]:
+def canonicalize_function_definition_headers(
+    lines: list[PcodeLine], classes: array[int] | None = None
+) -> list[PcodeLine]:
     """
     Canonicalize function definition header lines.
     Example:
@@ -246,20 +286,20 @@ def canonicalize_function_definition_headers(lines: list[PcodeLine]) -> list[Pco
     =>
         `DefineFunction "<name>", 2, "<arg1>", "<arg2>" {`
     """
-    canonicalized_lines: list[PcodeLine] = []
-
-    for line in lines:
-        if not is_pcode_instruction(line) or not line.is_function_definition():
-            canonicalized_lines.append(line)
-            continue
+    canonicalized_lines = lines.copy()
 
+    for i in iter_opcode_class_indexes(_get_opcode_classes(lines, classes), OpcodeClass.FUNCTION_DEFINITION):
+        line = lines[i]
+        assert is_pcode_instruction(line)
         new_operands = line.operands[:2] + [op for op in line.operands[2:] if op.type == "string"]
-        canonicalized_lines.append(line.replace(opcode="DefineFunction", operands=new_operands))
+        canonicalized_lines[i] = line.replace(opcode="DefineFunction", operands=new_operands)
 
     return canonicalized_lines
 
 
-def canonicalize_register_references_in_function_block(lines: list[PcodeLine]) -> list[PcodeLine]:
+def canonicalize_register_references_in_function_block(
+    lines: list[PcodeLine], classes: array[int] | None = None
+) -> list[PcodeLine]:
     """
     Canonicalize register references (`registerN` and `StoreRegister N`) by reindexing them
     by "first write" order per function scope.
@@ -286,11 +326,10 @@ def canonicalize_register_references_in_function_block(lines: list[PcodeLine]) -
         Pop
         Push register3, register2
     """
+    classes = _get_opcode_classes(lines, classes)
+
     # Find the function definition header line.
-    define_function_index = next(
-        (i for i, line in enumerate(lines) if is_pcode_instruction(line) and line.is_function_definition()),
-        None,
-    )
+    define_function_index = next(iter_opcode_class_indexes(classes, OpcodeClass.FUNCTION_DEFINITION), None)
 
     # If this block is not a function block, we skip this process.
     if define_function_index is None:
@@ -317,20 +356,18 @@ def canonicalize_register_references_in_function_block(lines: list[PcodeLine]) -
         canonicalized_operands: list[PcodeOperand] = []
 
         for operand in line.operands:
-            if operand.type != "symbol" or not REGISTER_REFERENCE_RE.fullmatch(str(operand.value)):
+            if operand.type != "register":
                 canonicalized_operands.append(operand)
                 continue
 
-            reg_match = REGISTER_REFERENCE_RE.match(str(operand.value))
-            assert reg_match is not None
-            canon_index = scope.canonicalize_register_index(reg_match.group("regindex"))
-            canonicalized_operands.append(PcodeOperand(type="symbol", value=f"register{canon_index}"))
+            canon_index = scope.canonicalize_register_index(str(operand.value))
+            canonicalized_operands.append(PcodeOperand.register(canon_index))
 
         return line.replace(operands=canonicalized_operands)
 
     def _canonicalize_function_scope(define_idx: int) -> int:
         """Canonicalize all lines in a function scope and call itself recursively when encountering a nested function"""
-        end_idx = find_function_end_line(canonicalized_lines, define_idx)
+        end_idx = find_function_end_line(canonicalized_lines, define_idx, classes)
         scope = RegisterScope()
 
         # First pass: scan `StoreRegister N` instructions and pre-assign canonical indices
@@ -338,19 +375,17 @@ def canonicalize_register_references_in_function_block(lines: list[PcodeLine]) -
         i = define_idx + 1
 
         while i <= end_idx:
-            current = canonicalized_lines[i]
-
-            if not is_pcode_instruction(current):
-                i += 1
-                continue
+            opcode_class = classes[i]
 
             # Skip nested function bodies. They will be canonicalized recursively later.
-            if current.is_function_definition():
-                nested_end_idx = find_function_end_line(canonicalized_lines, i)
+            if opcode_class == OpcodeClass.FUNCTION_DEFINITION:
+                nested_end_idx = find_function_end_line(canonicalized_lines, i, classes)
                 i = nested_end_idx + 1
                 continue
 
-            if current.opcode == "StoreRegister":
+            if opcode_class == OpcodeClass.STORE_REGISTER:
+                current = canonicalized_lines[i]
+                assert is_pcode_instruction(current)
                 scope.canonicalize_register_index(str(current.operands[0].value))
 
             i += 1
@@ -360,18 +395,18 @@ def canonicalize_register_references_in_function_block(lines: list[PcodeLine]) -
         i = define_idx + 1
 
         while i <= end_idx:
-            current = canonicalized_lines[i]
+            opcode_class = classes[i]
 
-            if not is_pcode_instruction(current):
-                i += 1
-                continue
-
-            if current.is_function_definition():
+            if opcode_class == OpcodeClass.FUNCTION_DEFINITION:
                 nested_end_idx = _canonicalize_function_scope(i)
                 i = nested_end_idx + 1
                 continue
 
-            canonicalized_lines[i] = _canonicalize_line(canonicalized_lines[i], scope)
+            if opcode_class >= OpcodeClass.INSTRUCTION:
+                current = canonicalized_lines[i]
+                assert is_pcode_instruction(current)
+                canonicalized_lines[i] = _canonicalize_line(current, scope)
+
             i += 1
 
         return end_idx
@@ -381,68 +416,158 @@ def canonicalize_register_references_in_function_block(lines: list[PcodeLine]) -
     return canonicalized_lines
 
 
+def _follows_line_other_than_not(previous_line: PcodeLine | None) -> bool:
+    return previous_line is not None and not (is_pcode_instruction(previous_line) and previous_line.opcode == "Not")
+
+
+def _rewrite_not_not_if(lines: Sequence[PcodeInstruction]) -> list[PcodeLine]:
+    return [lines[2]]
+
+
+def _rewrite_increment_decrement(lines: Sequence[PcodeInstruction]) -> list[PcodeLine]:
+    opcode = "Increment" if lines[2].opcode in ["Add", "Add2"] else "Decrement"
+    crement_pcode = PcodeInstruction(
+        source_lines=merge_pcode_lines_sources(lines[1], lines[2]), opcode=opcode, operands=[]
+    )
+    return [lines[0], crement_pcode, lines[3]]
+
+
+def _rewrite_register_increment_decrement(lines: Sequence[PcodeInstruction]) -> list[PcodeLine] | None:
+    if str(lines[0].operands[0].value) != lines[3].operands[0].value:
+        return None  # Not the same register.
+
+    return _rewrite_increment_decrement(lines)
+
+
+def _rewrite_string_concatenation(lines: Sequence[PcodeInstruction]) -> list[PcodeLine]:
+    concatenated = str(lines[0].operands[0].value) + str(lines[1].operands[0].value)
+    return [
+        PcodeInstruction(
+            source_lines=merge_pcode_lines_sources(*lines),
+            opcode="Push",
+            operands=[PcodeOperand(type="string", value=concatenated)],
+            label=lines[0].label,
+        )
+    ]
+
+
+_NOT = InstructionPattern(opcodes=("Not",), operands=None, labelled=False)
+_PUSH_STRING = InstructionPattern(opcodes=("Push",), operands=(OperandPattern(type="string"),))
+_PUSH_1 = InstructionPattern(opcodes=("Push",), operands=(OperandPattern(type="numeric", value="1"),), labelled=False)
+_ADD_OR_SUBTRACT = InstructionPattern(opcodes=("Add", "Add2", "Subtract"), operands=None, labelled=False)
+
+"""
+`Not Not If ...` can be simplified to just `If ...`. It must follow another line, which is not a `Not` itself.
+`Not` lines cannot have labels for this to apply!
+"""
+NOT_NOT_IF_RULES = [
+    PeepholeRule(
+        name="not-not-if",
+        pattern=(_NOT, _NOT, InstructionPattern(opcodes=("If",), operands=None)),
+        rewrite=_rewrite_not_not_if,
+        preceded_by=_follows_line_other_than_not,
+    ),
+]
+
+"""
+Increment and decrement patterns, rewritten with an `Increment` or `Decrement` instruction.
+The `Push "name"` preceding the `GetMember` and `GetVariable` patterns is left unchanged.
+"""
+INCREMENT_DECREMENT_RULES = [
+    PeepholeRule(
+        name="register-increment",
+        pattern=(
+            InstructionPattern(opcodes=("Push",), operands=(OperandPattern(type="register"),)),
+            _PUSH_1,
+            _ADD_OR_SUBTRACT,
+            InstructionPattern(opcodes=("StoreRegister",), operands=(OperandPattern(type="numeric"),)),
+        ),
+        rewrite=_rewrite_register_increment_decrement,
+    ),
+    PeepholeRule(
+        name="register-increment-return",
+        pattern=(
+            InstructionPattern(opcodes=("Push",), operands=(OperandPattern(type="register"),)),
+            _PUSH_1,
+            _ADD_OR_SUBTRACT,
+            InstructionPattern(opcodes=("Return",)),
+        ),
+        rewrite=_rewrite_increment_decrement,
+    ),
+    PeepholeRule(
+        name="member-increment",
+        pattern=(
+            InstructionPattern(opcodes=("GetMember",)),
+            _PUSH_1,
+            _ADD_OR_SUBTRACT,
+            InstructionPattern(opcodes=("SetMember", "Return")),
+        ),
+        rewrite=_rewrite_increment_decrement,
+        preceded_by=_PUSH_STRING.matches,
+    ),
+    PeepholeRule(
+        name="variable-increment",
+        pattern=(
+            InstructionPattern(opcodes=("GetVariable",)),
+            _PUSH_1,
+            _ADD_OR_SUBTRACT,
+            InstructionPattern(opcodes=("SetVariable", "Return")),
+        ),
+        rewrite=_rewrite_increment_decrement,
+        preceded_by=_PUSH_STRING.matches,
+    ),
+]
+
+"""Concatenation of two pushed strings, folded into a single `Push`."""
+STRING_CONCATENATION_RULES = [
+    PeepholeRule(
+        name="string-concatenation",
+        pattern=(
+            _PUSH_STRING,
+            InstructionPattern(opcodes=("Push",), operands=(OperandPattern(type="string"),), labelled=False),
+            InstructionPattern(opcodes=("StringAdd",), labelled=False),
+        ),
+        rewrite=_rewrite_string_concatenation,
+    ),
+]
+
+"""All the peephole rules of the normalization, applied together in a single scan."""
+NORMALIZATION_RULE_SET = PeepholeRuleSet([*NOT_NOT_IF_RULES, *INCREMENT_DECREMENT_RULES, *STRING_CONCATENATION_RULES])
+
+_NOT_NOT_IF_RULE_SET = PeepholeRuleSet(NOT_NOT_IF_RULES)
+_INCREMENT_DECREMENT_RULE_SET = PeepholeRuleSet(INCREMENT_DECREMENT_RULES)
+_STRING_CONCATENATION_RULE_SET = PeepholeRuleSet(STRING_CONCATENATION_RULES)
+
+
 def normalize_not_not_if_patterns(lines: list[PcodeLine]) -> list[PcodeLine]:
     """
     Normalize another decompilation oddity. `Not Not If ...` can be simplified to just `If ...`.
     """
-    canonicalized_lines: list[PcodeLine] = []
-    i = 0
-
-    while i < len(lines):
-        current_line = lines[i]
-        next1_line = lines[i + 1] if i + 1 < len(lines) else None
-        next2_line = lines[i + 2] if i + 2 < len(lines) else None
-        next3_line = lines[i + 3] if i + 3 < len(lines) else None
-
-        # With the following condition we want to match this kind of sequence:
-        #   Equals2
-        #   Not
-        #   Not
-        #   If loc3588
-        # and simplify in:
-        #   Equals2
-        #   If loc3588
-        # `Not` lines cannot have labels for this to apply!
-        if (
-            (not is_pcode_instruction(current_line) or current_line.opcode != "Not")
-            and is_pcode_instruction(next1_line)
-            and next1_line.opcode == "Not"
-            and next1_line.label is None
-            and is_pcode_instruction(next2_line)
-            and next2_line.opcode == "Not"
-            and next2_line.label is None
-            and is_pcode_instruction(next3_line)
-            and next3_line.opcode == "If"
-        ):
-            canonicalized_lines.append(current_line)
-            canonicalized_lines.append(next3_line)
-            i += 4
-            continue
+    return _NOT_NOT_IF_RULE_SET.apply(lines)
 
-        canonicalized_lines.append(current_line)
-        i += 1  # Nothing special, go on next line.
 
-    return canonicalized_lines
-
-
-def list_label_references(lines: list[PcodeLine]) -> set[str]:
+def list_label_references(lines: list[PcodeLine], classes: array[int] | None = None) -> set[str]:
     """
     Return a set of all label references (not definitions/prefixes) found in lines.
     """
     referenced_labels: set[str] = set()
 
-    for line in lines:
-        if is_pcode_instruction(line) and line.opcode in ["If", "Jump"] and line.operands:
+    for i in iter_opcode_class_indexes(_get_opcode_classes(lines, classes), OpcodeClass.JUMP):
+        line = lines[i]
+        assert is_pcode_instruction(line)
+
+        if line.operands and line.operands[0].type == "label":
             referenced_labels.add(str(line.operands[0].value).lower())
 
     return referenced_labels
 
 
-def strip_unreferenced_label_definitions(lines: list[PcodeLine]) -> list[PcodeLine]:
+def strip_unreferenced_label_definitions(lines: list[PcodeLine], classes: array[int] | None = None) -> list[PcodeLine]:
     """
     Remove label prefixes (definitions) when the label is never referenced within the same block.
+    Blank lines holding such a label are dropped, so the opcode class table must be rebuilt if the line count changed.
     """
-    referenced_labels = list_label_references(lines)
+    referenced_labels = list_label_references(lines, classes)
     cleaned_lines: list[PcodeLine] = []
 
     for line in lines:
@@ -458,7 +583,7 @@ def strip_unreferenced_label_definitions(lines: list[PcodeLine]) -> list[PcodeLi
     return cleaned_lines
 
 
-def canonicalize_labels(lines: list[PcodeLine]) -> list[PcodeLine]:
+def canonicalize_labels(lines: list[PcodeLine], classes: array[int] | None = None) -> list[PcodeLine]:
     """
     Canonicalize labels by renaming them by order of appearance.
     Example: `L0`, `L1`, `L2` etc.
@@ -474,21 +599,25 @@ def canonicalize_labels(lines: list[PcodeLine]) -> list[PcodeLine]:
             label_next_idx += 1
         return label_map[key]
 
+    classes = _get_opcode_classes(lines, classes)
     canonicalized_lines: list[PcodeLine] = []
 
-    for line in lines:
+    for line, opcode_class in zip(lines, classes):
         canon_line = line.replace()
 
         if line.label is not None:
             # If the line has a label prefix.
             canon_line = canon_line.replace(label=map_label(line.label))
 
-        if is_pcode_instruction(line) and line.opcode in ["If", "Jump"] and line.operands:
+        if (
+            opcode_class == OpcodeClass.JUMP
+            and is_pcode_instruction(line)
+            and line.operands
+            and line.operands[0].type == "label"
+        ):
             # If we match exactly `If <label>` or `Jump <label>`.
             new_target = map_label(str(line.operands[0].value))
-            canon_line = canon_line.replace(
-                operands=[PcodeOperand(type="symbol", value=str(new_target))] + line.operands[1:]
-            )
+            canon_line = canon_line.replace(operands=[PcodeOperand.label(new_target)] + line.operands[1:])
 
         canonicalized_lines.append(canon_line)
 
@@ -503,141 +632,19 @@ def canonicalize_increment_decrement_patterns(lines: list[PcodeLine]) -> list[Pc
     - `Push "name" / GetVariable / Push 1 / Add2|Subtract / SetVariable`
     - In each of the above patterns, `Return` can substitute the last instruction.
     """
+    return _INCREMENT_DECREMENT_RULE_SET.apply(lines)
 
-    def _line_is_push_register(line: PcodeLine) -> bool:
-        return bool(
-            is_pcode_instruction(line)
-            and line.opcode == "Push"
-            and len(line.operands) == 1
-            and line.operands[0].type == "symbol"
-            and REGISTER_REFERENCE_RE.fullmatch(str(line.operands[0].value))
-        )
-
-    def _line_is_push_1(line: PcodeLine) -> bool:
-        return bool(
-            is_pcode_instruction(line)
-            and line.opcode == "Push"
-            and len(line.operands) == 1
-            and line.operands[0].type == "numeric"
-            and line.operands[0].value == "1"
-        )
-
-    def _line_is_add(line: PcodeLine) -> bool:
-        return bool(is_pcode_instruction(line) and line.opcode in ["Add", "Add2"])
-
-    def _line_is_subtract(line: PcodeLine) -> bool:
-        return bool(is_pcode_instruction(line) and line.opcode == "Subtract")
-
-    def _line_is_store_register(line: PcodeLine) -> bool:
-        return bool(
-            is_pcode_instruction(line)
-            and line.opcode == "StoreRegister"
-            and len(line.operands) == 1
-            and line.operands[0].type == "numeric"
-        )
-
-    def _line_is_get_member(line: PcodeLine) -> bool:
-        return bool(is_pcode_instruction(line) and line.opcode == "GetMember" and not line.operands)
-
-    def _line_is_set_member(line: PcodeLine) -> bool:
-        return bool(is_pcode_instruction(line) and line.opcode == "SetMember" and not line.operands)
 
-    def _line_is_push_string(line: PcodeLine) -> bool:
-        return bool(
-            is_pcode_instruction(line)
-            and line.opcode == "Push"
-            and len(line.operands) == 1
-            and line.operands[0].type == "string"
-        )
-
-    def _line_is_get_variable(line: PcodeLine) -> bool:
-        return bool(is_pcode_instruction(line) and line.opcode == "GetVariable" and not line.operands)
-
-    def _line_is_set_variable(line: PcodeLine) -> bool:
-        return bool(is_pcode_instruction(line) and line.opcode == "SetVariable" and not line.operands)
-
-    def _line_is_return(line: PcodeLine) -> bool:
-        return bool(is_pcode_instruction(line) and line.opcode == "Return" and not line.operands)
-
-    canonicalized_lines: list[PcodeLine] = []
-
-    i = 0
-
-    while i < len(lines):
-        if (i + 4) > len(lines):
-            canonicalized_lines.append(lines[i])
-            i += 1
-            continue
-
-        hunk = lines[i : i + 4]  # current plus next 3 lines
-
-        # Pattern 1: Push registerN / Push 1 / Add2|Subtract / StoreRegister N
-        if (
-            _line_is_push_register(hunk[0])
-            and _line_is_push_1(hunk[1])
-            and (_line_is_add(hunk[2]) or _line_is_subtract(hunk[2]))
-            and (_line_is_store_register(hunk[3]) or _line_is_return(hunk[3]))
-            and hunk[1].label is None
-            and hunk[2].label is None
-        ):
-            register_1 = REGISTER_REFERENCE_RE.match(hunk[0].operands[0].value).group("regindex")
-            register_2 = hunk[3].operands[0].value if _line_is_store_register(hunk[3]) else None
-
-            if _line_is_return(hunk[3]) or register_1 == register_2:
-                opcode = "Increment" if hunk[2].opcode in ["Add", "Add2"] else "Decrement"
-                crement_pcode = PcodeInstruction(
-                    source_lines=merge_pcode_lines_sources(hunk[1], hunk[2]), opcode=opcode, operands=[]
-                )
-                canonicalized_lines.extend([hunk[0], crement_pcode, hunk[3]])
-                i += 4
-                continue
-
-        # Pattern 2: Push "name" / GetMember / Push 1 / Add2|Subtract / SetMember
-        # Pattern 3: Push "name" / GetVariable / Push 1 / Add2|Subtract / SetVariable
-        elif (
-            # Read previous line from canonicalized lines because it has already been processed.
-            len(canonicalized_lines) > 0
-            and _line_is_push_string(canonicalized_lines[-1])
-            and (
-                # Pair of (GetMember, SetMember|Return) OR pair of (GetVariable, SetVariable|Return).
-                _line_is_get_member(hunk[0])
-                and (_line_is_set_member(hunk[3]) or _line_is_return(hunk[3]))
-                or _line_is_get_variable(hunk[0])
-                and (_line_is_set_variable(hunk[3]) or _line_is_return(hunk[3]))
-            )
-            and _line_is_push_1(hunk[1])
-            and (_line_is_add(hunk[2]) or _line_is_subtract(hunk[2]))
-            and hunk[1].label is None
-            and hunk[2].label is None
-        ):
-            opcode = "Increment" if hunk[2].opcode in ["Add", "Add2"] else "Decrement"
-            crement_pcode = PcodeInstruction(
-                source_lines=merge_pcode_lines_sources(hunk[1], hunk[2]), opcode=opcode, operands=[]
-            )
-            canonicalized_lines.extend([hunk[0], crement_pcode, hunk[3]])
-            i += 4
-            continue
-
-        canonicalized_lines.append(lines[i])
-        i += 1
-
-    return canonicalized_lines
-
-
-def canonicalize_constant_pool(lines: list[PcodeLine]) -> list[PcodeLine]:
+def canonicalize_constant_pool(lines: list[PcodeLine], classes: array[int] | None = None) -> list[PcodeLine]:
     """
     Strip all operands from ConstantPool instructions.
     It is safe to do because ffdec copies constant names wherever they are used when exporting p-code text.
     Therefore in practice it never occurs that a change in the constant pool is the only change.
     """
-    canonicalized_lines: list[PcodeLine] = []
-
-    for line in lines:
-        if not is_pcode_instruction(line) or not line.opcode == "ConstantPool":
-            canonicalized_lines.append(line)
-            continue
+    canonicalized_lines = lines.copy()
 
-        canonicalized_lines.append(line.replace(operands=[PcodeOperand(type="string", value="")]))
+    for i in iter_opcode_class_indexes(_get_opcode_classes(lines, classes), OpcodeClass.CONSTANT_POOL):
+        canonicalized_lines[i] = lines[i].replace(operands=[PcodeOperand(type="string", value="")])
 
     return canonicalized_lines
 
@@ -650,55 +657,10 @@ def canonicalize_string_concatenation(lines: list[PcodeLine]) -> list[PcodeLine]
         Push "OnFastTravelPath"
         StringAdd
     """
+    return _STRING_CONCATENATION_RULE_SET.apply(lines)
 
-    def _line_is_push_string(line: PcodeLine) -> bool:
-        return bool(
-            is_pcode_instruction(line)
-            and line.opcode == "Push"
-            and len(line.operands) == 1
-            and line.operands[0].type == "string"
-        )
-
-    def _line_is_stringadd(line: PcodeLine) -> bool:
-        return bool(is_pcode_instruction(line) and line.opcode == "StringAdd" and not line.operands)
-
-    canonicalized_lines: list[PcodeLine] = []
-
-    i = 0
-
-    while i < len(lines):
-        if (i + 3) > len(lines):
-            canonicalized_lines.append(lines[i])
-            i += 1
-            continue
 
-        hunk = lines[i : i + 3]  # current plus next 2 lines
-
-        if (
-            not _line_is_push_string(hunk[0])
-            or not _line_is_push_string(hunk[1])
-            or not _line_is_stringadd(hunk[2])
-            or hunk[1].label is not None
-            or hunk[2].label is not None
-        ):
-            canonicalized_lines.append(lines[i])
-            i += 1
-            continue
-
-        concat_push = PcodeInstruction(
-            source_lines=merge_pcode_lines_sources(*hunk),
-            opcode="Push",
-            operands=[PcodeOperand(type="string", value=hunk[0].operands[0].value + hunk[1].operands[0].value)],
-            label=hunk[0].label,
-        )
-
-        canonicalized_lines.append(concat_push)
-        i += 3
-
-    return canonicalized_lines
-
-
-def canonicalize_geturl2(lines: list[PcodeLine]) -> list[PcodeLine]:
+def canonicalize_geturl2(lines: list[PcodeLine], classes: array[int] | None = None) -> list[PcodeLine]:
     """
     Set every GetURL2 3rd operand to 0.
     Example: `GetURL2 false, false, 1` -> `GetURL2 false, false, 0`.
@@ -706,22 +668,21 @@ def canonicalize_geturl2(lines: list[PcodeLine]) -> list[PcodeLine]:
     In KCD these patterns are often bound to FSCommand calls.
     The current code is probably too naive.
     """
-    canonicalized_lines: list[PcodeLine] = []
+    canonicalized_lines = lines.copy()
+
+    for i in iter_opcode_class_indexes(_get_opcode_classes(lines, classes), OpcodeClass.GET_URL2):
+        line = lines[i]
+        assert is_pcode_instruction(line)
 
-    for line in lines:
         # TODO: Verify that GetURL2 is always bound to a FSCommand call.
         if (
-            is_pcode_instruction(line)
-            and line.opcode == "GetURL2"
-            and len(line.operands) == 3
+            len(line.operands) == 3
             and line.operands[0].type == "boolean"
             and line.operands[1].type == "boolean"
             and line.operands[2].type == "numeric"
         ):
             new_operands = line.operands[:2] + [PcodeOperand(type="numeric", value="0")]
-            canonicalized_lines.append(line.replace(operands=new_operands))
-        else:
-            canonicalized_lines.append(line)
+            canonicalized_lines[i] = line.replace(operands=new_operands)
 
     return canonicalized_lines
 
@@ -732,16 +693,21 @@ def normalize_block(block: PcodeBlock) -> PcodeBlock:
     """
     lines = block.lines
     lines = canonicalize_push_lines(lines)
+
+    # The opcode classes are computed once and shared by the passes that keep the line count unchanged.
+    classes = classify_opcodes(lines)
     lines = canonicalize_numeric_literals(lines)
-    lines = canonicalize_function_definition_headers(lines)
-    lines = canonicalize_register_references_in_function_block(lines)
-    lines = strip_unreferenced_label_definitions(lines)
-    lines = canonicalize_labels(lines)
-    lines = normalize_not_not_if_patterns(lines)
-    lines = canonicalize_increment_decrement_patterns(lines)
-    lines = canonicalize_constant_pool(lines)
-    lines = canonicalize_string_concatenation(lines)
-    lines = canonicalize_geturl2(lines)
+    lines = canonicalize_function_definition_headers(lines, classes)
+    lines = canonicalize_register_references_in_function_block(lines, classes)
+    lines = canonicalize_constant_pool(lines, classes)
+    lines = canonicalize_geturl2(lines, classes)
+    lines = strip_unreferenced_label_definitions(lines, classes)
+
+    if len(lines) != len(classes):
+        classes = classify_opcodes(lines)
+
+    lines = canonicalize_labels(lines, classes)
+    lines = NORMALIZATION_RULE_SET.apply(lines)
 
     return PcodeBlock(lines=lines, name=block.name)
 
@@ -755,19 +721,22 @@ class NormalizationResult:
     toplevel_blocks: int
 
 
+@traced("normalize_file")
 def normalize_file(input_file: Path, output_dir: Path, write_source_maps: bool = True) -> NormalizationResult:
     """
     Split a p-code file into multiple normalized blocks and write them in the output directory.
     """
-    pcode_file = parse_pcode_file(input_file)
-    blocks = [normalize_block(block) for block in split_into_blocks(pcode_file)]
-
     output_dir.mkdir(parents=True, exist_ok=True)
+    count("scripts normalized")
 
+    blocks: list[PcodeBlock] = []
     named_count = anon_count = gap_count = 0
     block_order: list[str] = []
 
-    for block in blocks:
+    # Blocks are normalized and written as soon as they are split from the input stream.
+    for raw_block in iter_blocks(iter_pcode_file(input_file)):
+        block = normalize_block(raw_block)
+        blocks.append(block)
         assert block.name is not None
         block_file = output_dir / f"{block.name}.pcode"
         block_file.write_text(block.render() + "\n", encoding="utf-8")
@@ -795,3 +764,33 @@ def normalize_file(input_file: Path, output_dir: Path, write_source_maps: bool =
         anonymous_blocks=anon_count,
         toplevel_blocks=gap_count,
     )
+
+
+def normalization_is_up_to_date(input_file: Path, output_dir: Path, with_source_maps: bool = True) -> bool:
+    """
+    Check whether the output directory holds normalized blocks that are newer than the input p-code file.
+
+    The block list is read from `order.txt`, which `normalize_file` writes last. It is intended as a fast,
+    cheap check: block contents are not validated.
+    """
+    order_file = output_dir / "order.txt"
+
+    try:
+        if order_file.stat().st_mtime_ns < input_file.stat().st_mtime_ns:
+            return False
+
+        block_names = [name for name in order_file.read_text(encoding="utf-8").splitlines() if name.strip()]
+    except (FileNotFoundError, UnicodeDecodeError):
+        return False
+
+    if not block_names:
+        return False
+
+    for name in block_names:
+        if not (output_dir / f"{name}.pcode").is_file():
+            return False
+
+        if with_source_maps and not (output_dir / f"{name}.pcode.map").is_file():
+            return False
+
+    return True
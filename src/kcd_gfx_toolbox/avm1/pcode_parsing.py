@@ -1,16 +1,26 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
 from dataclasses import dataclass, field, replace
+from enum import IntEnum
+import os
 from pathlib import Path
 import re
 from typing import Literal, Self, TypeGuard
-from .pcode_utils import extract_label_from_line
+from ..instrumentation import count
+from .pcode_utils import REGISTER_REFERENCE_RE, extract_label_from_line
 
 
 @dataclass(frozen=True, kw_only=True)
 class PcodeOperand:
-    type: Literal["symbol", "string", "numeric", "boolean"]
-    value: str | bool
+    """
+    An instruction operand. Register references (`registerN`) are typed "register", with the register index as an int
+    value. The targets of `If` and `Jump` instructions are typed "label".
+    """
+
+    type: Literal["symbol", "string", "numeric", "boolean", "register", "label"]
+    value: str | bool | int
 
     def render(self) -> str:
         if self.type == "string":
@@ -21,8 +31,19 @@ class PcodeOperand:
             assert isinstance(self.value, bool)
             return "true" if self.value else "false"
 
+        if self.type == "register":
+            return f"register{self.value}"
+
         return str(self.value)
 
+    @classmethod
+    def register(cls, index: int) -> PcodeOperand:
+        return cls(type="register", value=index)
+
+    @classmethod
+    def label(cls, name: str) -> PcodeOperand:
+        return cls(type="label", value=name)
+
 
 @dataclass(frozen=True, kw_only=True)
 class PcodeLine(ABC):
@@ -156,11 +177,34 @@ def tokenize_line(line: str) -> list[tuple[int, str]]:
     return tokens
 
 
-def parse_pcode_lines(lines: list[str]) -> PcodeBlock:
-    pcode_lines: list[PcodeLine] = []
+def _parse_register_index(token: str) -> int | None:
+    """
+    Return the index of a register reference token (`registerN`), if it renders back the same.
+    """
+    if match := REGISTER_REFERENCE_RE.fullmatch(token):
+        regindex = match.group("regindex")
+
+        if str(int(regindex)) == regindex:
+            return int(regindex)
+
+    return None
+
+
+def iter_pcode_lines(lines: Iterable[str | bytes]) -> Iterator[PcodeLine]:
+    """
+    Parse p-code text lines one at a time and yield a PcodeLine object for each non-blank line.
+
+    Any line iterator can be consumed: a list of strings, a text file object, or the lines of a memory map.
+    Trailing line terminators are ignored and bytes are decoded as UTF-8.
+    """
     numeric_literal_re = re.compile(r"\-?\d+(\.\d+)?\b")
 
     for i, line in enumerate(lines):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+
+        line = line.rstrip("\r\n")
+
         if line.strip() == "":
             # Ignore blank lines
             continue
@@ -168,24 +212,30 @@ def parse_pcode_lines(lines: list[str]) -> PcodeBlock:
         labelless_line, label_def = extract_label_from_line(line)
 
         if label_def and labelless_line.strip() == "":
-            pcode_lines.append(PcodeBlankLineWithLabel(source_lines=[i], label=label_def))
+            yield PcodeBlankLineWithLabel(source_lines=[i], label=label_def)
             continue
 
         if labelless_line.strip() == "}":
             # Very specific case of a non-instruction line: the function block delimiter '}'.
-            pcode_lines.append(PcodeStructural(source_lines=[i], value="}", label=label_def))
+            yield PcodeStructural(source_lines=[i], value="}", label=label_def)
             continue
 
         tokens = tokenize_line(labelless_line)
         opcode = tokens.pop(0)[1]
         operands = []
+        is_jump = opcode in ["If", "Jump"]
 
         for _, token in tokens:
             if token in [",", "{"]:
                 # Ignore purely syntactic tokens.
                 continue
 
-            if token.startswith('"'):
+            if is_jump and not operands and not token.startswith('"'):
+                type = "label"
+            elif (register_index := _parse_register_index(token)) is not None:
+                type = "register"
+                token = register_index
+            elif token.startswith('"'):
                 assert token.endswith('"')
                 assert len(token) >= 2
                 type = "string"
@@ -200,9 +250,11 @@ def parse_pcode_lines(lines: list[str]) -> PcodeBlock:
 
             operands.append(PcodeOperand(type=type, value=token))
 
-        pcode_lines.append(PcodeInstruction(source_lines=[i], opcode=opcode, operands=operands, label=label_def))
+        yield PcodeInstruction(source_lines=[i], opcode=opcode, operands=operands, label=label_def)
 
-    return PcodeBlock(lines=pcode_lines)
+
+def parse_pcode_lines(lines: Iterable[str | bytes]) -> PcodeBlock:
+    return PcodeBlock(lines=list(iter_pcode_lines(lines)))
 
 
 def parse_pcode_text(text: str) -> PcodeBlock:
@@ -210,18 +262,85 @@ def parse_pcode_text(text: str) -> PcodeBlock:
     return parse_pcode_lines(lines)
 
 
+def iter_pcode_file(input_file: Path) -> Iterator[PcodeLine]:
+    """
+    Stream a p-code text file and yield parsed lines as they are read.
+
+    The file is read in universal newlines mode, so line endings are normalized on the fly
+    without ever holding the whole text in memory.
+    """
+    with input_file.open(encoding="utf-8", errors="replace", newline=None) as f:
+        count("bytes read", os.fstat(f.fileno()).st_size)
+        yield from iter_pcode_lines(f)
+
+
 def parse_pcode_file(input_file: Path) -> PcodeBlock:
     """
     Read a text file, normalize line endings, and split into lines and parse them as p-code.
     """
-    text = input_file.read_text(encoding="utf-8", errors="replace")
-    return parse_pcode_text(text)
+    return PcodeBlock(lines=list(iter_pcode_file(input_file)))
 
 
 def is_pcode_instruction(pcode_line: PcodeLine | None) -> TypeGuard[PcodeInstruction]:
     return isinstance(pcode_line, PcodeInstruction)
 
 
+class OpcodeClass(IntEnum):
+    """
+    Category of a p-code line, as stored in the tables built by `classify_opcodes`.
+    """
+
+    NON_INSTRUCTION = 0
+    CLOSING_BRACE = 1
+    INSTRUCTION = 2
+    FUNCTION_DEFINITION = 3
+    JUMP = 4
+    STORE_REGISTER = 5
+    CONSTANT_POOL = 6
+    GET_URL2 = 7
+    RETURN = 8
+
+
+"""Classes of the opcodes that are not plain instructions."""
+OPCODE_CLASSES: dict[str, OpcodeClass] = {
+    "DefineFunction": OpcodeClass.FUNCTION_DEFINITION,
+    "DefineFunction2": OpcodeClass.FUNCTION_DEFINITION,
+    "If": OpcodeClass.JUMP,
+    "Jump": OpcodeClass.JUMP,
+    "StoreRegister": OpcodeClass.STORE_REGISTER,
+    "ConstantPool": OpcodeClass.CONSTANT_POOL,
+    "GetURL2": OpcodeClass.GET_URL2,
+    "Return": OpcodeClass.RETURN,
+}
+
+
+def classify_opcodes(lines: Sequence[PcodeLine]) -> array[int]:
+    """
+    Build a side table holding the OpcodeClass of each line, one byte per line.
+    """
+    classes = array("B", bytes(len(lines)))
+
+    for i, line in enumerate(lines):
+        if isinstance(line, PcodeInstruction):
+            classes[i] = OPCODE_CLASSES.get(line.opcode, OpcodeClass.INSTRUCTION)
+        elif isinstance(line, PcodeStructural) and line.value == "}":
+            classes[i] = OpcodeClass.CLOSING_BRACE
+
+    return classes
+
+
+def iter_opcode_class_indexes(classes: array[int], opcode_class: OpcodeClass) -> Iterator[int]:
+    """
+    Yield the indexes of the lines of the given class, found with byte searches in the table.
+    """
+    table = classes.tobytes()
+    i = table.find(opcode_class)
+
+    while i != -1:
+        yield i
+        i = table.find(opcode_class, i + 1)
+
+
 def merge_pcode_lines_sources(*lines: PcodeLine) -> list[int]:
     """
     Merge source lines from multiple PcodeLine objects, without duplicates, and sorted.
@@ -0,0 +1,157 @@
+"""
+A small peephole rewriting engine for p-code lines.
+
+Rules are declared as sequences of instruction patterns. A set of rules is compiled once into a trie keyed on opcodes,
+so that all the rules are applied in a single left-to-right scan: at each position, the opcodes of the following lines
+are walked down the trie to find the candidate rules, and only those are checked in full.
+"""
+
+from __future__ import annotations
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass, field
+from typing import Literal, TypeGuard
+
+from .pcode_parsing import PcodeInstruction, PcodeLine, is_pcode_instruction
+
+
+@dataclass(frozen=True, kw_only=True)
+class OperandPattern:
+    type: Literal["symbol", "string", "numeric", "boolean", "register", "label"]
+    value: str | bool | int | None = None
+    """Value the operand must have, or None to accept any value."""
+
+
+@dataclass(frozen=True, kw_only=True)
+class InstructionPattern:
+    """
+    Pattern matching a single p-code instruction.
+    """
+
+    opcodes: tuple[str, ...]
+    operands: tuple[OperandPattern, ...] | None = ()
+    """Patterns of the exact operands of the instruction, or None to accept any operands."""
+    labelled: bool = True
+    """Whether the instruction is allowed to carry a label."""
+
+    def matches(self, line: PcodeLine | None) -> TypeGuard[PcodeInstruction]:
+        if not is_pcode_instruction(line) or line.opcode not in self.opcodes:
+            return False
+
+        if not self.labelled and line.label is not None:
+            return False
+
+        if self.operands is None:
+            return True
+
+        return len(line.operands) == len(self.operands) and all(
+            operand.type == pattern.type and (pattern.value is None or operand.value == pattern.value)
+            for operand, pattern in zip(line.operands, self.operands)
+        )
+
+
+@dataclass(frozen=True, kw_only=True)
+class PeepholeRule:
+    """
+    Replace a sequence of instructions matching `pattern` with the lines returned by `rewrite`.
+    """
+
+    name: str
+    pattern: tuple[InstructionPattern, ...]
+    rewrite: Callable[[Sequence[PcodeInstruction]], list[PcodeLine] | None]
+    """Return the replacement lines of the matched instructions, or None to reject the match."""
+    preceded_by: Callable[[PcodeLine | None], bool] | None = None
+    """Predicate on the previous line already emitted by the scan (None at the start of the lines)."""
+
+
+@dataclass
+class _TrieNode:
+    children: dict[str, _TrieNode] = field(default_factory=dict)
+    rules: list[tuple[int, PeepholeRule]] = field(default_factory=list)
+    """Rules whose pattern ends at this node, with their declaration index."""
+
+
+class PeepholeRuleSet:
+    """
+    A set of peephole rules compiled into a trie keyed on opcodes.
+
+    When several rules match at the same position, the first declared one wins. Lines emitted by a rewrite are not
+    scanned again, but they are visible to the `preceded_by` predicate of the rules matching right after them.
+    """
+
+    def __init__(self, rules: Sequence[PeepholeRule]):
+        self.rules = list(rules)
+        self._root = _TrieNode()
+
+        for index, rule in enumerate(self.rules):
+            if not rule.pattern:
+                raise ValueError(f"Peephole rule {rule.name!r} has an empty pattern.")
+
+            nodes = [self._root]
+
+            for instruction_pattern in rule.pattern:
+                nodes = [
+                    node.children.setdefault(opcode, _TrieNode())
+                    for node in nodes
+                    for opcode in instruction_pattern.opcodes
+                ]
+
+            for node in nodes:
+                node.rules.append((index, rule))
+
+    def _find_candidates(self, lines: Sequence[PcodeLine], start: int) -> list[tuple[int, PeepholeRule]]:
+        """
+        Return the rules whose opcode sequence matches the lines from `start`, in declaration order.
+        """
+        candidates: list[tuple[int, PeepholeRule]] = []
+        node = self._root
+
+        for j in range(start, len(lines)):
+            line = lines[j]
+
+            if not is_pcode_instruction(line) or (child := node.children.get(line.opcode)) is None:
+                break
+
+            node = child
+            candidates.extend(node.rules)
+
+        return sorted(candidates, key=lambda candidate: candidate[0])
+
+    @staticmethod
+    def _match(rule: PeepholeRule, lines: Sequence[PcodeLine], start: int) -> list[PcodeInstruction] | None:
+        matched: list[PcodeInstruction] = []
+
+        for pattern, line in zip(rule.pattern, lines[start : start + len(rule.pattern)]):
+            if not pattern.matches(line):
+                return None
+
+            matched.append(line)
+
+        return matched if len(matched) == len(rule.pattern) else None
+
+    def apply(self, lines: Sequence[PcodeLine]) -> list[PcodeLine]:
+        rewritten_lines: list[PcodeLine] = []
+        i = 0
+
+        while i < len(lines):
+            for _, rule in self._find_candidates(lines, i):
+                if (matched := self._match(rule, lines, i)) is None:
+                    continue
+
+                if rule.preceded_by is not None and not rule.preceded_by(
+                    rewritten_lines[-1] if rewritten_lines else None
+                ):
+                    continue
+
+                replacement = rule.rewrite(matched)
+
+                if replacement is None:
+                    continue
+
+                rewritten_lines.extend(replacement)
+                i += len(matched)
+                break
+            else:
+                rewritten_lines.append(lines[i])
+                i += 1
+
+        return rewritten_lines
@@ -1,15 +1,103 @@
+"""
+Command line interface of the toolbox.
+
+Subcommand modules are only imported when their command is invoked, because most of them pull in heavy dependencies
+(the diff and rendering stack, Pygments lexers...). This keeps `kcd-gfx --help` and light commands fast to start.
+"""
+
+import importlib
 import typer
-from kcd_gfx_toolbox import cli_extract, cli_normalize, cli_diff, cli_sourcemap
+from typer.core import TyperCommand, TyperGroup
+from typer.main import get_command_from_info
+from typer.models import CommandInfo
+
+"""
+Subcommands: name -> (module defining a `command` function, help shown in the command list, no_args_is_help).
+The help must match the first paragraph of the command docstring.
+"""
+LAZY_COMMANDS: dict[str, tuple[str, str, bool]] = {
+    "extract": ("kcd_gfx_toolbox.cli_extract", "Extract scripts from a GFx file into a directory.", True),
+    "normalize": (
+        "kcd_gfx_toolbox.cli_normalize",
+        "Split p-code files into logical blocks and normalize each of them.",
+        True,
+    ),
+    "diff": (
+        "kcd_gfx_toolbox.cli_diff",
+        "Compare scripts between two GFx files to surface meaningful changes through normalization.",
+        True,
+    ),
+    "conflicts": (
+        "kcd_gfx_toolbox.cli_conflicts",
+        "Find the scripts and blocks of a baseline GFx file that are changed by more than one mod.",
+        True,
+    ),
+    "sourcemap": (
+        "kcd_gfx_toolbox.cli_sourcemap",
+        "Inspect the sourcemap for a GFx file (and a specific script and p-code block), showing the correspondence "
+        "between p-code lines and their decompiled ActionScript source lines.",
+        True,
+    ),
+    "serve": (
+        "kcd_gfx_toolbox.cli_serve",
+        "Run a daemon that keeps the toolbox loaded and its caches warm between commands.",
+        False,
+    ),
+}
+
+
+def load_command(name: str, rich_markup_mode: typer.core.MarkupMode = None) -> TyperCommand:
+    """
+    Import the module of a subcommand and build its Click command.
+    """
+    module_name, _, no_args_is_help = LAZY_COMMANDS[name]
+    module = importlib.import_module(module_name)
+    command_info = CommandInfo(name=name, callback=module.command, no_args_is_help=no_args_is_help)
+    command = get_command_from_info(
+        command_info, pretty_exceptions_short=app.pretty_exceptions_short, rich_markup_mode=rich_markup_mode
+    )
+    assert isinstance(command, TyperCommand)
+    return command
+
+
+class LazyCommand(TyperCommand):
+    """
+    Placeholder of a subcommand, listed in the help of the group without importing its module.
+    The actual command is loaded when a context is made for it, i.e. when it is invoked or completed.
+    """
+
+    def __init__(self, name: str, help: str, rich_markup_mode: typer.core.MarkupMode):
+        super().__init__(name=name, help=help, rich_markup_mode=rich_markup_mode)
+
+    def make_context(self, info_name, args, parent=None, **extra):
+        assert self.name is not None
+        command = load_command(self.name, self.rich_markup_mode)
+        return command.make_context(info_name, args, parent=parent, **extra)
+
+
+class LazyCommandGroup(TyperGroup):
+    """
+    Group of subcommands that are only loaded when needed (see LAZY_COMMANDS).
+    """
+
+    def list_commands(self, ctx) -> list[str]:
+        return list(LAZY_COMMANDS)
+
+    def get_command(self, ctx, cmd_name: str) -> TyperCommand | None:
+        if cmd_name not in LAZY_COMMANDS:
+            return None
+
+        return LazyCommand(cmd_name, LAZY_COMMANDS[cmd_name][1], self.rich_markup_mode)
+
+
+app = typer.Typer(cls=LazyCommandGroup, no_args_is_help=True)
 
-app = typer.Typer(
-    help="A toolbox for extracting, normalizing and diffing Scaleform GFx files (used by Kingdom Come: Deliverance).",
-    no_args_is_help=True,
-)
 
-app.command("extract", no_args_is_help=True)(cli_extract.command)
-app.command("normalize", no_args_is_help=True)(cli_normalize.command)
-app.command("diff", no_args_is_help=True)(cli_diff.command)
-app.command("sourcemap", no_args_is_help=True)(cli_sourcemap.command)
+@app.callback()
+def main():
+    """
+    A toolbox for extracting, normalizing and diffing Scaleform GFx files (used by Kingdom Come: Deliverance).
+    """
 
 
 if __name__ == "__main__":
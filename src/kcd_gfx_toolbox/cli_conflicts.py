@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+import os
+from pathlib import Path
+from typing import Annotated
+from rich import box
+from rich.markup import escape
+from rich.table import Table
+import typer
+
+from .avm1.pcode_parsing import PcodeBlock
+from .cli_diff import (
+    extract_gfx_files_in_parallel,
+    format_script_block_name,
+    format_script_path,
+    iter_diffsets_against_baseline,
+)
+from .diff.conflicts import ChangeType, ModConflict, find_mod_conflicts
+from .diff.gfx import GfxDiffSet
+from .extraction import resolve_ffdec
+from .utils import console, print_error
+from .workspace import Workspace, temp_workspace_name_for_file
+
+CHANGE_TYPE_STYLES = {
+    ChangeType.MODIFIED: "yellow",
+    ChangeType.DELETED: "red",
+    ChangeType.CREATED: "green",
+}
+
+
+def print_conflicts(conflicts: list[ModConflict], mod_names: dict[str, str]):
+    """
+    Print a table of conflicting scripts and blocks, with the changes of each mod.
+    """
+    conflict_table = Table(box=box.SIMPLE, show_edge=False, pad_edge=False, header_style=None)
+    conflict_table.add_column("GFx script / block", no_wrap=True, overflow="ellipsis")
+    conflict_table.add_column("Mod")
+    conflict_table.add_column("Change")
+    conflict_table.add_column("Lines changed", justify="right")
+
+    for conflict in conflicts:
+        conflict_table.add_section()
+
+        if conflict.block_name is None:
+            location = format_script_path(conflict.script_path)
+        else:
+            location = f"{format_script_path(conflict.script_path)} {format_script_block_name(conflict.block_name)}"
+
+        for i, change in enumerate(sorted(conflict.changes, key=lambda c: (c.mod, c.type))):
+            style = CHANGE_TYPE_STYLES[change.type]
+            conflict_table.add_row(
+                location if i == 0 else "",
+                escape(mod_names[change.mod]),
+                f"[italic][{style}]{change.type}[/{style}][/italic]",
+                str(change.lines_changed) if change.type == ChangeType.MODIFIED else "-",
+            )
+
+    console.print(conflict_table)
+
+
+def command(
+    baseline_file: Annotated[
+        Path, typer.Argument(help="The baseline file all mods are compared against (typically the vanilla game file).")
+    ],
+    mod_files: Annotated[list[Path], typer.Argument(help="The mod files to check for conflicts.")],
+    ffdec_path: Annotated[
+        Path | None,
+        typer.Option("--ffdec", help="Path to the ffdec binary. Only required if it is not in the system PATH."),
+    ] = None,
+    workspace_root_dir: Annotated[
+        Path | None,
+        typer.Option(
+            "--workspace-root",
+            help="Directory where intermediate files will be written. If omitted, a temporary directory is used.",
+        ),
+    ] = None,
+    use_extraction_cache: Annotated[
+        bool,
+        typer.Option(
+            "--cache-extraction/--no-extraction-cache",
+            help="Use extraction cache (default). Disable to force re-extraction.",
+        ),
+    ] = True,
+    use_normalization_cache: Annotated[
+        bool,
+        typer.Option(
+            "--cache-normalization/--no-normalization-cache",
+            help="Enable to reuse cached normalized blocks. Disable to force re-normalization.",
+        ),
+    ] = False,
+    jobs: Annotated[
+        int | None,
+        typer.Option("--jobs", "-j", min=1, help="Number of files to extract in parallel. Defaults to the CPU count."),
+    ] = None,
+):
+    """
+    Find the scripts and blocks of a baseline GFx file that are changed by more than one mod.
+    """
+    baseline_file = baseline_file.resolve()
+    mod_files = [file.resolve() for file in mod_files]
+
+    for file in [baseline_file, *mod_files]:
+        if not file.is_file():
+            print_error(f"Invalid input: {escape(str(file))} is not a file.")
+            raise typer.Exit(code=1)
+
+    if workspace_root_dir is not None:
+        workspace_root_dir = workspace_root_dir.resolve()
+
+        if not workspace_root_dir.is_dir():
+            print_error(f"Invalid input: {escape(str(workspace_root_dir))} does not exist or is not a directory.")
+            raise typer.Exit(code=1)
+
+    def _workspace_for_file(file: Path) -> Workspace:
+        if workspace_root_dir is not None:
+            return Workspace(workspace_root_dir / temp_workspace_name_for_file(file))
+        return Workspace.create_as_temporary_directory(file)
+
+    try:
+        ffdec_path = resolve_ffdec(ffdec_path)
+    except FileNotFoundError as e:
+        print_error(e)
+        raise typer.Exit(code=1)
+
+    console.print(f"[bold yellow]Baseline:[/bold yellow] {escape(str(baseline_file))}")
+    for mod_file in mod_files:
+        console.print(f"[bold yellow]Mod:[/bold yellow] {escape(str(mod_file))}")
+    console.print(f"[bold yellow]Using ffdec:[/bold yellow] {escape(str(ffdec_path))}")
+
+    # ================================================================
+    # Step 1: extract contents from all files.
+
+    console.line()
+    console.print("[cyan]» 1: Extraction of GFX scripts as p-code[/cyan]", highlight=False)
+    console.line()
+
+    workspace_baseline = _workspace_for_file(baseline_file)
+    mods = [(mod_file, _workspace_for_file(mod_file)) for mod_file in mod_files]
+
+    extract_gfx_files_in_parallel(
+        ffdec_path,
+        [(baseline_file, workspace_baseline), *mods],
+        use_extraction_cache,
+        jobs=min(jobs or os.cpu_count() or 1, len(mods) + 1),
+    )
+
+    # ================================================================
+    # Step 2: compute the block-level diffset of every mod against the baseline, once.
+
+    console.line()
+    console.print("[cyan]» 2: Comparison of each mod against the baseline[/cyan]", highlight=False)
+
+    normalized_script_blocks_baseline: dict[Path, list[PcodeBlock]] = {}
+    diffsets: dict[str, GfxDiffSet] = {}
+
+    for mod_file, _, _, diffset in iter_diffsets_against_baseline(
+        baseline_file, workspace_baseline, normalized_script_blocks_baseline, mods, use_normalization_cache
+    ):
+        if diffset is None:
+            console.print("[green]Identical to the baseline.[/green]")
+            continue
+
+        diffsets[str(mod_file)] = diffset
+
+    # ================================================================
+    # Step 3: find the changes shared by several mods.
+
+    console.line()
+    console.print("[cyan]» 3: Searching for conflicting changes[/cyan]", highlight=False)
+    console.line()
+
+    conflicts = find_mod_conflicts(diffsets)
+
+    if not conflicts:
+        console.print("[green]No script or block is changed by more than one mod.[/green]")
+        return
+
+    print_conflicts(conflicts, {str(mod_file): mod_file.name for mod_file in mod_files})
+
+    console.line()
+    console.print(
+        f"[yellow]{len(conflicts)} conflicts[/yellow] between "
+        f"{len({mod for conflict in conflicts for mod in conflict.mods()})} mods."
+    )
@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
 
 from __future__ import annotations
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 import json
+import os
+import sys
+import time
 from typing import Annotated, Literal, cast
 from click.core import ParameterSource
 import typer
@@ -9,36 +15,59 @@ import typer
 from .workspace import Workspace, temp_workspace_name_for_file
 from .avm1.pcode_parsing import PcodeBlock, PcodeLine, parse_pcode_file
 from .diff.gfx import (
+    BlockDiffAlgorithm,
     GfxDiffSet,
     GfxDiffTreeNode,
     GfxDiffTreeNodeType,
     GfxScript,
     GfxScriptBlock,
     diff_normalized_script_trees,
+    rediff_normalized_script_trees,
     refine_block_diffs,
 )
 from .diff.rendering import (
     DiffFilter,
     DiffLayout,
+    FilePatch,
     RenderableBlockDiff,
     DiffSortOrder,
     build_split_layout_for_hunk_pair,
     build_unified_layout_for_block_diff,
+    iter_file_patch_lines,
+    prepare_actionscript_patches,
     prepare_diffset_actionscript_render,
+    prepare_diffset_pcode_patches,
     prepare_diffset_pcode_render,
 )
+from .diff.serialization import DiffOutputFormat, iter_serialized_scripts, serialize_block_diff, serialize_summary
 from .extraction import (
     extract_gfx_contents,
     resolve_ffdec,
 )
-from .avm1.pcode_normalization import NormalizationResult, normalize_file
+from .avm1.pcode_normalization import NormalizationResult, normalization_is_up_to_date, normalize_file
 from .diff.core import (
     diff_file_trees_basic,
     hunks_are_equal,
 )
+from .instrumentation import (
+    disable_profiling,
+    enable_profiling,
+    get_counters,
+    span,
+    summarize_spans,
+    traced,
+    write_chrome_trace,
+)
+from .view.split_layout import STREAM_CHUNK_ROWS, SplitLayout
+from .view.unified_layout import UnifiedLayout
+from .view.wrapping import count_wrapped_lines
 from .utils import (
+    LRUCache,
     console,
     ensure_empty_dir,
+    file_signature,
+    get_temp_dir,
+    sha256_file,
     print_debug,
     print_error,
     print_warning,
@@ -46,6 +75,9 @@ from .utils import (
 from pathlib import Path
 import shutil
 import subprocess
+from rich.console import Group, RenderableType
+from rich.segment import Segment, Segments
+from rich.text import Text
 from rich.table import Table
 from rich import box
 from rich.rule import Rule
@@ -106,6 +138,7 @@ def format_script_block_name(name: str, rename: str | None = None) -> str:
     return text
 
 
+@traced("extraction")
 def extract_gfx_file(ffdec_path: Path, gfx_file: Path, workspace: Workspace, read_cache: bool):
     extraction_dir = workspace.extraction_dir()
     console.print(
@@ -186,6 +219,14 @@ def read_cached_normalized_script_blocks(workspace: Workspace, script_path: Path
     )
 
 
+"""Delay between two checks of the watched file, in watch mode."""
+WATCH_POLL_INTERVAL_SECONDS = 1.0
+
+# Normalization results of this process, keyed by raw p-code file signature and normalization directory.
+_normalization_results: LRUCache[tuple[tuple[str, int, int], Path], NormalizationResult] = LRUCache(maxsize=1024)
+
+
+@traced("normalization")
 def normalize_scripts(
     gfx_file: Path, workspace: Workspace, scripts: set[Path], read_cache: bool
 ) -> dict[Path, list[PcodeBlock]]:
@@ -208,6 +249,15 @@ def normalize_scripts(
         norm_stats = None
 
         if read_cache:
+            # Within a long-running process, a script normalized earlier can be reused as long as neither its raw
+            # p-code nor its normalized blocks on disk have changed since. This spares reading the blocks back.
+            memo_key = (file_signature(raw_script_path), normalized_script_dir)
+            norm_stats = _normalization_results.get(memo_key)
+
+            if norm_stats is not None and not normalization_is_up_to_date(raw_script_path, normalized_script_dir):
+                norm_stats = None
+
+        if read_cache and norm_stats is None:
             try:
                 norm_stats = read_cached_normalized_script_blocks(workspace, script_path)
             except FileNotFoundError:
@@ -223,6 +273,8 @@ def normalize_scripts(
                 print_error(e)
                 raise typer.Exit(code=1)
 
+            _normalization_results.put((file_signature(raw_script_path), normalized_script_dir), norm_stats)
+
         results.append((script_path, norm_stats))
         normalized_script_blocks[script_path] = norm_stats.blocks
 
@@ -347,8 +399,49 @@ def unfold_diff_tree_in_table(tree: GfxDiffTreeNode, table: Table, sort_order: D
         _render_node(child, is_last_child=is_last)
 
 
-def print_block_diff_in_unified_layout(block_diff: RenderableBlockDiff, debug_mode: bool) -> int:
-    """Print a given block diff in a unified layout."""
+def print_streamed(renderables: Iterable[RenderableType]):
+    """
+    Print renderables a few at a time, so that output starts right away and no more than a chunk is buffered.
+    """
+    chunk: list[RenderableType] = []
+
+    for renderable in renderables:
+        chunk.append(renderable)
+
+        if len(chunk) == STREAM_CHUNK_ROWS:
+            console.print(Group(*chunk))
+            chunk = []
+
+    if chunk:
+        console.print(Group(*chunk))
+
+
+def print_unified_layout_streamed(diff_view: UnifiedLayout) -> int:
+    """Print a unified layout line by line, and return its height."""
+    height = 0
+
+    def _lines() -> Iterator[Text]:
+        nonlocal height
+
+        for line in diff_view.iter_lines():
+            height += max(1, count_wrapped_lines(line, console, console.width))
+            yield line
+
+    print_streamed(_lines())
+    return height
+
+
+def print_split_layout_streamed(diff_view: SplitLayout) -> int:
+    """Print a split layout row by row, and return its height."""
+    print_streamed(Segments([*line, Segment.line()]) for line in diff_view.iter_lines(console, console.options))
+    return diff_view.get_last_render_height()
+
+
+def print_block_diff_in_unified_layout(block_diff: RenderableBlockDiff, debug_mode: bool, stream: bool = False) -> int:
+    """
+    Print a given block diff in a unified layout.
+    With `stream`, the diff is printed as it is rendered rather than all at once (for huge diffs).
+    """
     line_count = 0
     block = block_diff.block
 
@@ -374,14 +467,21 @@ def print_block_diff_in_unified_layout(block_diff: RenderableBlockDiff, debug_mo
         print_debug("This block has more than one hunk.")
 
     diff_view = build_unified_layout_for_block_diff(block_diff)
-    console.print(diff_view)
-    line_count += diff_view.get_last_render_height()
+
+    if stream:
+        line_count += print_unified_layout_streamed(diff_view)
+    else:
+        console.print(diff_view)
+        line_count += diff_view.get_last_render_height()
 
     return line_count
 
 
-def print_block_diff_in_split_layout(block_diff: RenderableBlockDiff, debug_mode: bool) -> int:
-    """Print a given block diff in a split layout (side-by-side)."""
+def print_block_diff_in_split_layout(block_diff: RenderableBlockDiff, debug_mode: bool, stream: bool = False) -> int:
+    """
+    Print a given block diff in a split layout (side-by-side).
+    With `stream`, each hunk pair is printed as it is rendered rather than all at once (for huge diffs).
+    """
     line_count = 0
     script = block_diff.script
     block = block_diff.block
@@ -414,14 +514,20 @@ def print_block_diff_in_split_layout(block_diff: RenderableBlockDiff, debug_mode
         diff_view = build_split_layout_for_hunk_pair(hunk_a, hunk_b, block_diff=block_diff)
 
         console.line()
-        console.print(diff_view)
+
+        if stream:
+            line_count += print_split_layout_streamed(diff_view)
+        else:
+            console.print(diff_view)
+            line_count += diff_view.get_last_render_height()
+
         console.line()
-        line_count += diff_view.get_last_render_height() + 2
+        line_count += 2
 
     return line_count
 
 
-def print_diff(
+def prepare_block_diffs(
     workspace_a: Workspace,
     normalized_script_blocks_a: dict[Path, list[PcodeBlock]],
     workspace_b: Workspace,
@@ -430,19 +536,16 @@ def print_diff(
     *,
     format: Literal["actionscript", "pcode"],
     sort_order: DiffSortOrder,
-    layout: DiffLayout,
     filters: DiffFilter,
-    max_lines: int | None = None,
-    debug_mode: bool = False,
-):
+    block_diff_algorithm: BlockDiffAlgorithm = BlockDiffAlgorithm.LINES,
+) -> list[RenderableBlockDiff]:
     """
-    Print line-by-line differences for each modified script block.
+    Sort, filter and slice the differing blocks into hunks, in the requested format.
+    Errors are reported as a warning, and no block diff is returned.
     """
-    line_count = 0
-
     try:
         if format == "actionscript":
-            renderables = prepare_diffset_actionscript_render(
+            return prepare_diffset_actionscript_render(
                 diffset,
                 workspace_a,
                 normalized_script_blocks_a,
@@ -452,13 +555,106 @@ def print_diff(
                 filters,
             )
         else:
-            renderables = prepare_diffset_pcode_render(
-                diffset, normalized_script_blocks_a, normalized_script_blocks_b, sort_order, filters
+            return prepare_diffset_pcode_render(
+                diffset,
+                normalized_script_blocks_a,
+                normalized_script_blocks_b,
+                sort_order,
+                filters,
+                block_diff_algorithm,
             )
     except (RuntimeError, FileNotFoundError) as e:
         print_warning(e)
-        return
+        return []
+
+
+def prepare_patches(
+    workspace_a: Workspace,
+    normalized_script_blocks_a: dict[Path, list[PcodeBlock]],
+    workspace_b: Workspace,
+    normalized_script_blocks_b: dict[Path, list[PcodeBlock]],
+    diffset: GfxDiffSet,
+    *,
+    format: Literal["actionscript", "pcode"],
+    sort_order: DiffSortOrder,
+    filters: DiffFilter,
+) -> list[FilePatch]:
+    """
+    Sort and filter the differing blocks, and gather their differences into the patches of the files they apply to.
+    Errors are reported as a warning, and no patch is returned.
+
+    In ActionScript, blocks that can't be resolved to ActionScript source are left out with a warning: their p-code
+    fallback would not apply to the script files.
+    """
+    if format == "pcode":
+        try:
+            return prepare_diffset_pcode_patches(
+                diffset, normalized_script_blocks_a, normalized_script_blocks_b, sort_order, filters
+            )
+        except RuntimeError as e:
+            print_warning(e)
+            return []
+
+    block_diffs = prepare_block_diffs(
+        workspace_a,
+        normalized_script_blocks_a,
+        workspace_b,
+        normalized_script_blocks_b,
+        diffset,
+        format=format,
+        sort_order=sort_order,
+        filters=filters,
+    )
+
+    for block_diff in block_diffs:
+        if block_diff.lang != "actionscript":
+            script_path = cast(Path, block_diff.script.side_b_path).as_posix()
+            block_name = block_diff.block.side_b_name or block_diff.block.side_a_name
+            print_warning(
+                f"Block {escape(str(block_name))} of script {escape(script_path)} could not be mapped to ActionScript "
+                "source, and is left out of the patch."
+            )
+
+    try:
+        return prepare_actionscript_patches(
+            [block_diff for block_diff in block_diffs if block_diff.lang == "actionscript"], workspace_a, workspace_b
+        )
+    except FileNotFoundError as e:
+        print_warning(e)
+        return []
+
 
+@traced("rendering")
+def print_diff(
+    workspace_a: Workspace,
+    normalized_script_blocks_a: dict[Path, list[PcodeBlock]],
+    workspace_b: Workspace,
+    normalized_script_blocks_b: dict[Path, list[PcodeBlock]],
+    diffset: GfxDiffSet,
+    *,
+    format: Literal["actionscript", "pcode"],
+    sort_order: DiffSortOrder,
+    layout: DiffLayout,
+    filters: DiffFilter,
+    block_diff_algorithm: BlockDiffAlgorithm = BlockDiffAlgorithm.LINES,
+    max_lines: int | None = None,
+    debug_mode: bool = False,
+):
+    """
+    Print line-by-line differences for each modified script block.
+    """
+    line_count = 0
+    renderables = prepare_block_diffs(
+        workspace_a,
+        normalized_script_blocks_a,
+        workspace_b,
+        normalized_script_blocks_b,
+        diffset,
+        format=format,
+        sort_order=sort_order,
+        filters=filters,
+        block_diff_algorithm=block_diff_algorithm,
+    )
     is_first_iteration = True
 
     for renderable in renderables:
@@ -479,12 +675,18 @@ def print_diff(
             console.line()
             line_count += 1
 
+        # Without a line cap, huge diffs can be printed: stream them rather than rendering each block at once.
         if layout == DiffLayout.UNIFIED:
-            line_count += print_block_diff_in_unified_layout(renderable, debug_mode=debug_mode)
+            line_count += print_block_diff_in_unified_layout(
+                renderable, debug_mode=debug_mode, stream=(max_lines is None)
+            )
         else:
-            line_count += print_block_diff_in_split_layout(renderable, debug_mode=debug_mode)
+            line_count += print_block_diff_in_split_layout(
+                renderable, debug_mode=debug_mode, stream=(max_lines is None)
+            )
 
 
+@traced("summary")
 def print_summary(diffset: GfxDiffSet, sort_order: DiffSortOrder):
     console.print(
         f"Summary: "
@@ -519,158 +721,398 @@ def print_summary(diffset: GfxDiffSet, sort_order: DiffSortOrder):
     console.print(diff_table)
 
 
-def command(
-    ctx: typer.Context,
-    file_a: Annotated[Path, typer.Argument(help="The left (A) file of the comparison.")],
-    file_b: Annotated[Path, typer.Argument(help="The right (B) file of the comparison.")],
-    ffdec_path: Annotated[
-        Path | None,
-        typer.Option("--ffdec", help="Path to the ffdec binary. Only required if it is not in the system PATH."),
-    ] = None,
-    workspace_root_dir: Annotated[
-        Path | None,
-        typer.Option(
-            "--workspace-root",
-            help="Directory where intermediate files will be written. If omitted, a temporary directory is used.",
-        ),
-    ] = None,
-    use_extraction_cache: Annotated[
-        bool,
-        typer.Option(
-            "--cache-extraction/--no-extraction-cache",
-            help="Use extraction cache (default). Disable to force re-extraction.",
-        ),
-    ] = True,
-    use_normalization_cache: Annotated[
-        bool,
-        typer.Option(
-            "--cache-normalization/--no-normalization-cache",
-            help="Enable to reuse cached normalized blocks. Disable to force re-normalization.",
-        ),
-    ] = False,
-    show_summary_only: Annotated[
-        bool, typer.Option("--summary-only", help="Only show a summary, not detailed file differences.")
-    ] = False,
-    hide_summary: Annotated[bool, typer.Option("--no-summary", help="Do not show the summary, only diffs.")] = False,
-    diff_format: Annotated[
-        Literal["actionscript", "pcode"], typer.Option("--format", help="Set the format for detailed diff.")
-    ] = "actionscript",
-    layout: Annotated[
-        DiffLayout, typer.Option("--layout", help="Set the view layout for detailed diff.")
-    ] = DiffLayout.SPLIT,
-    diff_max_lines: Annotated[
-        int,
-        typer.Option(
-            "--head",
-            min=1,
-            help="Show only the first N lines of diff (approximate). Option --full disables this limit.",
-        ),
-    ] = 512,
-    show_full_diff: Annotated[
-        bool, typer.Option("--full", help="Disable the diff output limit, show the full diff.")
-    ] = False,
-    sort_order: Annotated[
-        DiffSortOrder,
-        typer.Option(
-            "--sort",
-            help="Control sort order for diffs. 'natural' preserves the original order of blocks within each script. 'changes_desc' shows most modified blocks first, 'changes_asc' does the opposite.",
-        ),
-    ] = DiffSortOrder.CHANGES_DESC,
-    filters: Annotated[
-        str | None,
-        typer.Option(
-            "--filter",
-            help='Filter diff details to only display scripts and/or blocks whose name contains the given value. The matching is case-insensitive. Example: "script=inventory,block=character".',
-        ),
-    ] = None,
-    debug_mode: Annotated[bool, typer.Option("--debug", help="Enable debug mode.")] = False,
-):
+@dataclass(frozen=True)
+class DiffReportOptions:
+    """Options controlling how a diffset is reported on the console."""
+
+    format: Literal["actionscript", "pcode"]
+    sort_order: DiffSortOrder
+    layout: DiffLayout
+    filters: DiffFilter
+    max_lines: int | None
+    show_summary_only: bool
+    hide_summary: bool
+    debug_mode: bool
+    output_format: DiffOutputFormat = DiffOutputFormat.RICH
+    patch_dir: Path | None = None
+    block_diff_algorithm: BlockDiffAlgorithm = BlockDiffAlgorithm.LINES
+
+
+@dataclass
+class PairDiffState:
     """
-    Compare scripts between two GFx files to surface meaningful changes through normalization.
+    Everything loaded to compare two GFx files, kept by the watch mode to compare them again incrementally.
     """
-    if show_full_diff and ctx.get_parameter_source("diff_max_lines") is ParameterSource.COMMANDLINE:
-        raise typer.BadParameter("Options --head and --full are mutually exclusive.")
 
-    if show_summary_only and hide_summary:
-        raise typer.BadParameter("Options --summary-only and --no-summary are mutually exclusive.")
+    workspace_a: Workspace
+    normalized_script_blocks_a: dict[Path, list[PcodeBlock]]
+    workspace_b: Workspace
+    normalized_script_blocks_b: dict[Path, list[PcodeBlock]]
+    diffset: GfxDiffSet
 
-    file_a = file_a.resolve()
-    file_b = file_b.resolve()
 
-    if not file_a.is_file():
-        print_error(f"Invalid input: {escape(str(file_a))} is not a file.")
-        raise typer.Exit(code=1)
+@traced("file diff")
+def find_differing_scripts(workspace_a: Workspace, workspace_b: Workspace) -> tuple[set[Path], set[Path], set[Path]]:
+    """
+    Naively compare the extracted scripts of two workspaces.
 
-    if not file_b.is_file():
-        print_error(f"Invalid input: {escape(str(file_b))} is not a file.")
-        raise typer.Exit(code=1)
+    Return the sets of common scripts that differ, scripts only present on side A and scripts only present on side B,
+    as internal GFx script paths.
+    """
+    common, only_in_a, only_in_b = diff_file_trees_basic(
+        workspace_a.extraction_path("scripts"), workspace_b.extraction_path("scripts"), "**/*.pcode"
+    )
 
-    if workspace_root_dir is not None:
-        workspace_root_dir = workspace_root_dir.resolve()
+    return (
+        {p.with_suffix("") for p in common},
+        {p.with_suffix("") for p in only_in_a},
+        {p.with_suffix("") for p in only_in_b},
+    )
 
-        if not workspace_root_dir.is_dir():
-            print_error(f"Invalid input: {escape(str(workspace_root_dir))} does not exist or is not a directory.")
-            raise typer.Exit(code=1)
 
-        workspace_a = Workspace(workspace_root_dir / temp_workspace_name_for_file(file_a))
-        workspace_b = Workspace(workspace_root_dir / temp_workspace_name_for_file(file_b))
-    else:
-        workspace_a = Workspace.create_as_temporary_directory(file_a)
-        workspace_b = Workspace.create_as_temporary_directory(file_b)
+def compute_diffset(
+    workspace_a: Workspace,
+    normalized_script_blocks_a: dict[Path, list[PcodeBlock]],
+    a_side_scripts: set[Path],
+    workspace_b: Workspace,
+    normalized_script_blocks_b: dict[Path, list[PcodeBlock]],
+    b_side_scripts: set[Path],
+    previous_diffset: GfxDiffSet | None = None,
+    changed_b_side_scripts: set[Path] | None = None,
+    block_diff_algorithm: BlockDiffAlgorithm = BlockDiffAlgorithm.LINES,
+    filters: DiffFilter = DiffFilter(),
+) -> GfxDiffSet:
+    """
+    Compare the normalized scripts of two workspaces and refine the block diffs.
 
-    try:
-        ffdec_path = resolve_ffdec(ffdec_path)
-    except FileNotFoundError as e:
-        print_error(e)
-        raise typer.Exit(code=1)
+    If a previous diffset is given, only the scripts affected by `changed_b_side_scripts` are diffed again.
+    Block diffs not matching the block filter are dropped before refinement. Scripts are expected to be filtered
+    already, before their normalization.
+    """
+    rediffed_scripts = None
+
+    if previous_diffset is None:
+        diffset = diff_normalized_script_trees(
+            a_side_scripts,
+            b_side_scripts,
+            workspace_a.normalization_dir(),
+            workspace_b.normalization_dir(),
+        )
+    else:
+        diffset, rediffed_scripts = rediff_normalized_script_trees(
+            previous_diffset,
+            a_side_scripts,
+            b_side_scripts,
+            changed_b_side_scripts or set(),
+            workspace_a.normalization_dir(),
+            workspace_b.normalization_dir(),
+        )
 
-    try:
-        details_filters = parse_and_validate_details_filters(filters)
-    except ValueError as e:
-        print_error(e)
-        raise typer.Exit(code=1)
+    if filters.block is not None:
+        diffset.keep_blocks(filters.matches_block)
 
-    console.print(f"[bold yellow]File A:[/bold yellow] {escape(str(file_a))}")
-    console.print(f"[bold yellow]File B:[/bold yellow] {escape(str(file_b))}")
-    console.print(f"[bold yellow]Using ffdec:[/bold yellow] {escape(str(ffdec_path))}")
+    # Reassign original positions to script block diffs.
+    for script in diffset.get_differing_scripts():
+        if not script.is_paired():
+            continue
 
-    # ================================================================
-    # Step 1: extract contents from both files.
-    # For that we use "JPEXS Free Flash Decompiler" aka ffdec.
+        block_order_a = {b.name: i for i, b in enumerate(normalized_script_blocks_a[script.side_a_path])}
+        block_order_b = {b.name: i for i, b in enumerate(normalized_script_blocks_b[script.side_b_path])}
 
-    console.line()
-    console.print("[cyan]» 1: Extraction of GFX scripts as p-code[/cyan]", highlight=False)
-    console.line()
+        for block in diffset.paired_scripts_block_diffs[script].get_blocks():
+            if block.side_a_name is not None:  # side A has priority
+                block.position = block_order_a[block.side_a_name]
+            elif block.side_b_name is not None:
+                block.position = block_order_b[block.side_b_name]
 
-    extract_gfx_file(ffdec_path, file_a, workspace_a, use_extraction_cache)
-    extract_gfx_file(ffdec_path, file_b, workspace_b, use_extraction_cache)
+    # Refine the final difference score on block-level using more noise-reduction tweaks.
+    refine_block_diffs(
+        diffset,
+        normalized_script_blocks_a,
+        normalized_script_blocks_b,
+        scripts=rediffed_scripts,
+        algorithm=block_diff_algorithm,
+    )
 
-    # ================================================================
-    # Step 2: perform a naive diff between the two directory trees.
+    return diffset
 
-    console.line()
-    console.print("[cyan]» 2: Searching for file differences[/cyan]", highlight=False)
-    console.line()
 
-    common, only_in_a, only_in_b = diff_file_trees_basic(
-        workspace_a.extraction_path("scripts"), workspace_b.extraction_path("scripts"), "**/*.pcode"
-    )
+def report_diffset(
+    file_a: Path,
+    workspace_a: Workspace,
+    normalized_script_blocks_a: dict[Path, list[PcodeBlock]],
+    file_b: Path,
+    workspace_b: Workspace,
+    normalized_script_blocks_b: dict[Path, list[PcodeBlock]],
+    diffset: GfxDiffSet,
+    options: DiffReportOptions,
+):
+    """
+    Report a diffset in the output format requested by the options.
+    """
+    if options.output_format == DiffOutputFormat.RICH:
+        print_diffset_report(
+            workspace_a, normalized_script_blocks_a, workspace_b, normalized_script_blocks_b, diffset, options
+        )
+    else:
+        write_diffset_report(
+            file_a,
+            workspace_a,
+            normalized_script_blocks_a,
+            file_b,
+            workspace_b,
+            normalized_script_blocks_b,
+            diffset,
+            options,
+        )
 
-    common_path_scripts: set[Path] = {p.with_suffix("") for p in common}
-    unmatched_a_scripts: set[Path] = {p.with_suffix("") for p in only_in_a}
-    unmatched_b_scripts: set[Path] = {p.with_suffix("") for p in only_in_b}
 
-    if not common_path_scripts and not unmatched_a_scripts and not unmatched_b_scripts:
-        console.print("[green]Both files are identical.[/green]")
-        return
+def _write_json(value: dict):
+    sys.stdout.write(json.dumps(value) + "\n")
+    sys.stdout.flush()
 
-    if unmatched_a_scripts:
-        console.print(f"Scripts only present in {escape(str(file_a))}:")
-        for path in sorted(unmatched_a_scripts):
-            console.print(format_script_path(path))
-        console.print()
 
-    if unmatched_b_scripts:
+@traced("serialization")
+def write_diffset_report(
+    file_a: Path,
+    workspace_a: Workspace,
+    normalized_script_blocks_a: dict[Path, list[PcodeBlock]],
+    file_b: Path,
+    workspace_b: Workspace,
+    normalized_script_blocks_b: dict[Path, list[PcodeBlock]],
+    diffset: GfxDiffSet,
+    options: DiffReportOptions,
+):
+    """
+    Write a diffset to stdout as machine-readable records: the differing scripts and blocks, the hunks of each block
+    diff (unless only the summary is requested), and the summary.
+
+    In JSON, records are gathered in a single document. In NDJSON, each record is written on its own line as soon as it
+    is serialized, with a "type" field: "script", "block_diff" or "summary".
+    In patch format, only the differences are written, as patches of the files they apply to (see `prepare_patches`).
+    """
+    if options.output_format == DiffOutputFormat.PATCH:
+        patches: list[FilePatch] = []
+
+        if not options.show_summary_only and not diffset.is_empty():
+            patches = prepare_patches(
+                workspace_a,
+                normalized_script_blocks_a,
+                workspace_b,
+                normalized_script_blocks_b,
+                diffset,
+                format=options.format,
+                sort_order=options.sort_order,
+                filters=options.filters,
+            )
+
+        write_patches(patches, options.patch_dir)
+        return
+
+    files = {"file_a": str(file_a), "file_b": str(file_b)}
+    renderables: list[RenderableBlockDiff] = []
+
+    if not options.show_summary_only and not diffset.is_empty():
+        renderables = prepare_block_diffs(
+            workspace_a,
+            normalized_script_blocks_a,
+            workspace_b,
+            normalized_script_blocks_b,
+            diffset,
+            format=options.format,
+            sort_order=options.sort_order,
+            filters=options.filters,
+            block_diff_algorithm=options.block_diff_algorithm,
+        )
+
+    block_diffs = (serialize_block_diff(renderable) for renderable in renderables)
+
+    if options.output_format == DiffOutputFormat.NDJSON:
+        for script in iter_serialized_scripts(diffset):
+            _write_json({"type": "script", **files, **script})
+
+        for block_diff in block_diffs:
+            _write_json({"type": "block_diff", **files, **block_diff})
+
+        _write_json({"type": "summary", **files, **serialize_summary(diffset)})
+    else:
+        _write_json(
+            {
+                **files,
+                "summary": serialize_summary(diffset),
+                "scripts": list(iter_serialized_scripts(diffset)),
+                "block_diffs": list(block_diffs),
+            }
+        )
+
+
+@traced("serialization")
+def write_patches(patches: Iterable[FilePatch], patch_dir: Path | None = None):
+    """
+    Write file patches in unified format, to stdout or to one `.patch` file per script in a directory (named after the
+    script path on side B).
+
+    File paths in the patches are relative to the normalization directory in p-code, or to the extracted scripts
+    directory in ActionScript, so that they apply to side A with `git apply`.
+    """
+    if patch_dir is None:
+        for patch in patches:
+            sys.stdout.writelines(line + "\n" for line in iter_file_patch_lines(patch))
+
+        sys.stdout.flush()
+        return
+
+    patch_lines_by_file: dict[Path, list[str]] = {}
+
+    for patch in patches:
+        script_path = cast(Path, patch.script.side_b_path)
+        patch_file = patch_dir / f"{script_path.as_posix()}.patch"
+        patch_lines_by_file.setdefault(patch_file, []).extend(iter_file_patch_lines(patch))
+
+    for patch_file, lines in patch_lines_by_file.items():
+        patch_file.parent.mkdir(parents=True, exist_ok=True)
+        patch_file.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+
+    console.print(f"Wrote {len(patch_lines_by_file)} patch file(s) to {escape(str(patch_dir))}.")
+
+
+def print_diffset_report(
+    workspace_a: Workspace,
+    normalized_script_blocks_a: dict[Path, list[PcodeBlock]],
+    workspace_b: Workspace,
+    normalized_script_blocks_b: dict[Path, list[PcodeBlock]],
+    diffset: GfxDiffSet,
+    options: DiffReportOptions,
+):
+    """
+    Print the detailed differences and the summary of a diffset, as requested by the options.
+    """
+    if diffset.is_empty():
+        if options.filters:
+            console.print("[green]No differences in the scripts and blocks matching the filter.[/green]")
+        else:
+            console.print(
+                "[green]Normalized trees are identical. The difference might be decompilation noise only.[/green]"
+            )
+        return
+
+    if not options.show_summary_only:
+        print_diff(
+            workspace_a,
+            normalized_script_blocks_a,
+            workspace_b,
+            normalized_script_blocks_b,
+            diffset,
+            format=options.format,
+            sort_order=options.sort_order,
+            layout=options.layout,
+            filters=options.filters,
+            block_diff_algorithm=options.block_diff_algorithm,
+            max_lines=options.max_lines,
+            debug_mode=options.debug_mode,
+        )
+
+    if not options.hide_summary:
+        console.line()
+        print_summary(diffset, options.sort_order)
+
+
+def print_baseline_summary(baseline_file: Path, results: list[tuple[Path, GfxDiffSet]]):
+    """
+    Print a table summarizing the differences of each mod file against the baseline file.
+    """
+    console.print(f"Summary against baseline {escape(str(baseline_file))}:")
+
+    summary_table = Table(box=box.SIMPLE, show_edge=False, pad_edge=False, header_style=None)
+    summary_table.add_column("Mod file", no_wrap=True, overflow="ellipsis")
+    summary_table.add_column("Scripts modified", justify="right", style="yellow")
+    summary_table.add_column("deleted", justify="right", style="red")
+    summary_table.add_column("created", justify="right", style="green")
+    summary_table.add_column("Blocks modified", justify="right", style="yellow")
+    summary_table.add_column("deleted", justify="right", style="red")
+    summary_table.add_column("created", justify="right", style="green")
+    summary_table.add_column("Lines changed", justify="right")
+
+    summary_table.add_section()
+
+    for mod_file, diffset in results:
+        refined_line_count = sum(
+            sum(block.refined_changed for block in details.paired_blocks)
+            for details in diffset.paired_scripts_block_diffs.values()
+        )
+        summary_table.add_row(
+            f"[bright_cyan]{escape(mod_file.name)}[/bright_cyan]",
+            str(len(diffset.get_scripts_with_differing_blocks())),
+            str(len(diffset.unmatched_a_scripts)),
+            str(len(diffset.unmatched_b_scripts)),
+            str(diffset.get_modified_block_count()),
+            str(diffset.get_unmatched_block_side_a_count()),
+            str(diffset.get_unmatched_block_side_b_count()),
+            str(refined_line_count),
+        )
+
+    console.print(summary_table)
+
+
+def diff_pair(
+    ffdec_path: Path,
+    file_a: Path,
+    workspace_a: Workspace,
+    file_b: Path,
+    workspace_b: Workspace,
+    use_extraction_cache: bool,
+    use_normalization_cache: bool,
+    options: DiffReportOptions,
+) -> PairDiffState:
+    """
+    Compare two GFx files and report their differences.
+    """
+    console.print(f"[bold yellow]File A:[/bold yellow] {escape(str(file_a))}")
+    console.print(f"[bold yellow]File B:[/bold yellow] {escape(str(file_b))}")
+    console.print(f"[bold yellow]Using ffdec:[/bold yellow] {escape(str(ffdec_path))}")
+
+    # ================================================================
+    # Step 1: extract contents from both files.
+    # For that we use "JPEXS Free Flash Decompiler" aka ffdec.
+
+    console.line()
+    console.print("[cyan]» 1: Extraction of GFX scripts as p-code[/cyan]", highlight=False)
+    console.line()
+
+    extract_gfx_file(ffdec_path, file_a, workspace_a, use_extraction_cache)
+    extract_gfx_file(ffdec_path, file_b, workspace_b, use_extraction_cache)
+
+    # ================================================================
+    # Step 2: perform a naive diff between the two directory trees.
+
+    console.line()
+    console.print("[cyan]» 2: Searching for file differences[/cyan]", highlight=False)
+    console.line()
+
+    common_path_scripts, unmatched_a_scripts, unmatched_b_scripts = find_differing_scripts(workspace_a, workspace_b)
+
+    if not common_path_scripts and not unmatched_a_scripts and not unmatched_b_scripts:
+        console.print("[green]Both files are identical.[/green]")
+        state = PairDiffState(workspace_a, {}, workspace_b, {}, GfxDiffSet())
+
+        if options.output_format != DiffOutputFormat.RICH:
+            report_diffset(file_a, workspace_a, {}, file_b, workspace_b, {}, state.diffset, options)
+
+        return state
+
+    # Filtered out scripts are not normalized nor compared at all.
+    common_path_scripts, unmatched_a_scripts, unmatched_b_scripts = (
+        options.filters.filter_script_paths(scripts)
+        for scripts in (common_path_scripts, unmatched_a_scripts, unmatched_b_scripts)
+    )
+
+    if unmatched_a_scripts:
+        console.print(f"Scripts only present in {escape(str(file_a))}:")
+        for path in sorted(unmatched_a_scripts):
+            console.print(format_script_path(path))
+        console.print()
+
+    if unmatched_b_scripts:
         console.print(f"Scripts only present in {escape(str(file_b))}:")
         for path in sorted(unmatched_b_scripts):
             console.print(format_script_path(path))
@@ -707,51 +1149,675 @@ def command(
     console.print("[cyan]» 4: Comparison of normalized code[/cyan]", highlight=False)
     console.line()
 
-    diffset = diff_normalized_script_trees(
+    diffset = compute_diffset(
+        workspace_a,
+        normalized_script_blocks_a,
         common_path_scripts | unmatched_a_scripts,
+        workspace_b,
+        normalized_script_blocks_b,
         common_path_scripts | unmatched_b_scripts,
-        workspace_a.normalization_dir(),
-        workspace_b.normalization_dir(),
+        block_diff_algorithm=options.block_diff_algorithm,
+        filters=options.filters,
     )
 
-    # Reassign original positions to script block diffs.
-    for script in diffset.get_differing_scripts():
-        if not script.is_paired():
+    report_diffset(
+        file_a,
+        workspace_a,
+        normalized_script_blocks_a,
+        file_b,
+        workspace_b,
+        normalized_script_blocks_b,
+        diffset,
+        options,
+    )
+
+    return PairDiffState(workspace_a, normalized_script_blocks_a, workspace_b, normalized_script_blocks_b, diffset)
+
+
+def _wait_for_file_change(file: Path, signature: tuple[str, int, int] | None) -> tuple[str, int, int]:
+    """
+    Poll a file until its signature changes, then until it stops changing (e.g. while it is being written).
+    Return its new signature.
+    """
+    candidate = signature
+
+    while True:
+        time.sleep(WATCH_POLL_INTERVAL_SECONDS)
+
+        try:
+            current = file_signature(file)
+        except FileNotFoundError:  # Being rebuilt.
+            candidate = None
             continue
 
-        block_order_a = {b.name: i for i, b in enumerate(normalized_script_blocks_a[script.side_a_path])}
-        block_order_b = {b.name: i for i, b in enumerate(normalized_script_blocks_b[script.side_b_path])}
+        if current != signature and current == candidate:
+            return current
 
-        for block in diffset.paired_scripts_block_diffs[script].get_blocks():
-            if block.side_a_name is not None:  # side A has priority
-                block.position = block_order_a[block.side_a_name]
-            elif block.side_b_name is not None:
-                block.position = block_order_b[block.side_b_name]
+        candidate = current
 
-    # Refine the final difference score on block-level using more noise-reduction tweaks.
-    refine_block_diffs(diffset, workspace_a.normalization_dir(), workspace_b.normalization_dir())
 
-    if diffset.is_empty():
-        console.print(
-            "[green]Normalized trees are identical. The difference might be decompilation noise only.[/green]"
+def rediff_pair(
+    ffdec_path: Path,
+    file_a: Path,
+    file_b: Path,
+    state: PairDiffState,
+    raw_pcode_hashes_b: dict[Path, str],
+    workspace_b: Workspace,
+    use_extraction_cache: bool,
+    use_normalization_cache: bool,
+    options: DiffReportOptions,
+) -> tuple[PairDiffState, dict[Path, str]]:
+    """
+    Compare a new version of file B against the already loaded file A, and report their differences.
+
+    Only the side B scripts whose raw p-code changed since the previous comparison are normalized and diffed again.
+    Return the new state and the raw p-code hashes of side B scripts.
+    """
+    console.print(f"[bold yellow]File A:[/bold yellow] {escape(str(file_a))}")
+    console.print(f"[bold yellow]File B:[/bold yellow] {escape(str(file_b))} [dim](rebuilt)[/dim]")
+    console.line()
+
+    extract_gfx_file(ffdec_path, file_b, workspace_b, use_extraction_cache)
+    console.line()
+
+    common_path_scripts, unmatched_a_scripts, unmatched_b_scripts = find_differing_scripts(
+        state.workspace_a, workspace_b
+    )
+    a_side_scripts = common_path_scripts | unmatched_a_scripts
+    b_side_scripts = common_path_scripts | unmatched_b_scripts
+
+    if not a_side_scripts and not b_side_scripts:
+        console.print("[green]Both files are identical.[/green]")
+        state = PairDiffState(state.workspace_a, state.normalized_script_blocks_a, workspace_b, {}, GfxDiffSet())
+
+        if options.output_format != DiffOutputFormat.RICH:
+            report_diffset(file_a, state.workspace_a, {}, file_b, workspace_b, {}, state.diffset, options)
+
+        return state, {}
+
+    a_side_scripts = options.filters.filter_script_paths(a_side_scripts)
+    b_side_scripts = options.filters.filter_script_paths(b_side_scripts)
+    missing_a_side_scripts = a_side_scripts - state.normalized_script_blocks_a.keys()
+
+    if missing_a_side_scripts:
+        state.normalized_script_blocks_a |= normalize_scripts(
+            file_a, state.workspace_a, missing_a_side_scripts, use_normalization_cache
+        )
+        console.line()
+
+    hashes = {script: sha256_file(workspace_b.find_raw_pcode_file(script)) for script in b_side_scripts}
+    unchanged_b_side_scripts = {
+        script
+        for script in b_side_scripts
+        if script in state.normalized_script_blocks_b and raw_pcode_hashes_b.get(script) == hashes[script]
+    }
+    changed_b_side_scripts = b_side_scripts - unchanged_b_side_scripts
+    normalized_script_blocks_b = {
+        script: state.normalized_script_blocks_b[script] for script in unchanged_b_side_scripts
+    }
+
+    # Unchanged scripts keep their normalized blocks, which must also be present in the new workspace.
+    for script in unchanged_b_side_scripts:
+        previous_dir = state.workspace_b.normalization_path(script)
+        new_dir = workspace_b.normalization_path(script)
+
+        if new_dir != previous_dir:
+            shutil.rmtree(new_dir, ignore_errors=True)
+            shutil.copytree(previous_dir, new_dir)
+
+    if changed_b_side_scripts:
+        normalized_script_blocks_b |= normalize_scripts(
+            file_b, workspace_b, changed_b_side_scripts, use_normalization_cache
         )
+        console.line()
+
+    console.print(
+        f"{len(changed_b_side_scripts)} changed scripts normalized and diffed again, "
+        f"{len(unchanged_b_side_scripts)} unchanged scripts reused."
+    )
+    console.line()
+
+    diffset = compute_diffset(
+        state.workspace_a,
+        state.normalized_script_blocks_a,
+        a_side_scripts,
+        workspace_b,
+        normalized_script_blocks_b,
+        b_side_scripts,
+        previous_diffset=state.diffset,
+        changed_b_side_scripts=changed_b_side_scripts,
+        block_diff_algorithm=options.block_diff_algorithm,
+        filters=options.filters,
+    )
+
+    report_diffset(
+        file_a,
+        state.workspace_a,
+        state.normalized_script_blocks_a,
+        file_b,
+        workspace_b,
+        normalized_script_blocks_b,
+        diffset,
+        options,
+    )
+
+    return PairDiffState(
+        state.workspace_a, state.normalized_script_blocks_a, workspace_b, normalized_script_blocks_b, diffset
+    ), hashes
+
+
+def watch_pair(
+    ffdec_path: Path,
+    file_a: Path,
+    file_b: Path,
+    state: PairDiffState,
+    workspace_for_file: Callable[[Path], Workspace],
+    use_extraction_cache: bool,
+    use_normalization_cache: bool,
+    options: DiffReportOptions,
+):
+    """
+    Watch file B and compare it again against file A each time it changes, until interrupted.
+    """
+    raw_pcode_hashes_b = {
+        script: sha256_file(state.workspace_b.find_raw_pcode_file(script))
+        for script in state.normalized_script_blocks_b
+    }
+    signature = file_signature(file_b)
+
+    try:
+        while True:
+            console.line()
+            console.print(f"[dim]Watching {escape(str(file_b))} for changes. Press Ctrl+C to stop.[/dim]")
+
+            signature = _wait_for_file_change(file_b, signature)
+            console.clear()
+
+            try:
+                state, raw_pcode_hashes_b = rediff_pair(
+                    ffdec_path,
+                    file_a,
+                    file_b,
+                    state,
+                    raw_pcode_hashes_b,
+                    workspace_for_file(file_b),
+                    use_extraction_cache,
+                    use_normalization_cache,
+                    options,
+                )
+            except typer.Exit:
+                print_warning("Unable to compare the new version of file B. Waiting for the next change.")
+    except KeyboardInterrupt:
         return
 
-    if not show_summary_only:
-        print_diff(
-            workspace_a,
-            normalized_script_blocks_a,
-            workspace_b,
-            normalized_script_blocks_b,
+
+def extract_gfx_files_in_parallel(
+    ffdec_path: Path, gfx_files: list[tuple[Path, Workspace]], read_cache: bool, jobs: int
+):
+    """
+    Extract several GFx files into their workspaces. Extractions are independent ffdec processes, so they can run
+    in parallel.
+
+    A file given several times is extracted once: its workspace is the same each time, and concurrent extractions
+    would write into the same directory.
+    """
+    unique_gfx_files: dict[Path, Workspace] = {}
+
+    for gfx_file, workspace in gfx_files:
+        unique_gfx_files.setdefault(gfx_file.resolve(), workspace)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(extract_gfx_file, ffdec_path, gfx_file, workspace, read_cache)
+            for gfx_file, workspace in unique_gfx_files.items()
+        ]
+
+        for future in futures:
+            future.result()  # Re-raise extraction errors (typer.Exit).
+
+
+def iter_diffsets_against_baseline(
+    baseline_file: Path,
+    workspace_baseline: Workspace,
+    normalized_script_blocks_baseline: dict[Path, list[PcodeBlock]],
+    mod_files: list[tuple[Path, Workspace]],
+    use_normalization_cache: bool,
+    block_diff_algorithm: BlockDiffAlgorithm = BlockDiffAlgorithm.LINES,
+    filters: DiffFilter = DiffFilter(),
+) -> Iterator[tuple[Path, Workspace, dict[Path, list[PcodeBlock]], GfxDiffSet | None]]:
+    """
+    Compare already extracted mod files against a baseline file, one at a time.
+
+    Each baseline script is normalized at most once: `normalized_script_blocks_baseline` is filled in as
+    comparisons need more baseline scripts, and shared by all of them.
+    Only the scripts and blocks matching `filters` are normalized and compared.
+    Yield the mod file, its workspace, its normalized blocks and its diffset against the baseline. The diffset is
+    None when the extracted scripts are strictly identical.
+    """
+    for mod_file, workspace_mod in mod_files:
+        console.line()
+        console.print(
+            Rule(f"[bold cyan]{escape(str(mod_file))}[/bold cyan]", align="left", style="cyan"), highlight=False
+        )
+        console.line()
+
+        common_path_scripts, unmatched_baseline_scripts, unmatched_mod_scripts = find_differing_scripts(
+            workspace_baseline, workspace_mod
+        )
+        baseline_scripts = common_path_scripts | unmatched_baseline_scripts
+        mod_scripts = common_path_scripts | unmatched_mod_scripts
+
+        if not baseline_scripts and not mod_scripts:
+            yield mod_file, workspace_mod, {}, None
+            continue
+
+        baseline_scripts = filters.filter_script_paths(baseline_scripts)
+        mod_scripts = filters.filter_script_paths(mod_scripts)
+
+        # Only normalize the baseline scripts that no previous comparison needed.
+        missing_baseline_scripts = baseline_scripts - normalized_script_blocks_baseline.keys()
+
+        if missing_baseline_scripts:
+            normalized_script_blocks_baseline |= normalize_scripts(
+                baseline_file, workspace_baseline, missing_baseline_scripts, use_normalization_cache
+            )
+            console.line()
+
+        normalized_script_blocks_mod = normalize_scripts(mod_file, workspace_mod, mod_scripts, use_normalization_cache)
+        console.line()
+
+        diffset = compute_diffset(
+            workspace_baseline,
+            normalized_script_blocks_baseline,
+            baseline_scripts,
+            workspace_mod,
+            normalized_script_blocks_mod,
+            mod_scripts,
+            block_diff_algorithm=block_diff_algorithm,
+            filters=filters,
+        )
+
+        yield mod_file, workspace_mod, normalized_script_blocks_mod, diffset
+
+
+def diff_against_baseline(
+    ffdec_path: Path,
+    baseline_file: Path,
+    workspace_baseline: Workspace,
+    mod_files: list[tuple[Path, Workspace]],
+    use_extraction_cache: bool,
+    use_normalization_cache: bool,
+    options: DiffReportOptions,
+    jobs: int,
+):
+    """
+    Compare many mod files against a single baseline file and report their differences.
+
+    The baseline is extracted once, and each of its scripts is normalized at most once: normalized blocks are kept
+    in memory and shared by all the comparisons.
+    """
+    console.print(f"[bold yellow]Baseline:[/bold yellow] {escape(str(baseline_file))}")
+    for mod_file, _ in mod_files:
+        console.print(f"[bold yellow]Mod:[/bold yellow] {escape(str(mod_file))}")
+    console.print(f"[bold yellow]Using ffdec:[/bold yellow] {escape(str(ffdec_path))}")
+
+    # ================================================================
+    # Step 1: extract contents from all files.
+
+    console.line()
+    console.print("[cyan]» 1: Extraction of GFX scripts as p-code[/cyan]", highlight=False)
+    console.line()
+
+    extract_gfx_files_in_parallel(
+        ffdec_path, [(baseline_file, workspace_baseline), *mod_files], use_extraction_cache, jobs
+    )
+
+    # ================================================================
+    # Steps 2 to 4, for each mod file: naive diff, normalization and comparison against the baseline.
+
+    normalized_script_blocks_baseline: dict[Path, list[PcodeBlock]] = {}
+    results: list[tuple[Path, GfxDiffSet]] = []
+
+    for mod_file, workspace_mod, normalized_script_blocks_mod, diffset in iter_diffsets_against_baseline(
+        baseline_file,
+        workspace_baseline,
+        normalized_script_blocks_baseline,
+        mod_files,
+        use_normalization_cache,
+        options.block_diff_algorithm,
+        options.filters,
+    ):
+        if diffset is None:
+            console.print("[green]Identical to the baseline.[/green]")
+            results.append((mod_file, GfxDiffSet()))
+
+            if options.output_format != DiffOutputFormat.RICH:
+                report_diffset(
+                    baseline_file, workspace_baseline, {}, mod_file, workspace_mod, {}, GfxDiffSet(), options
+                )
+
+            continue
+
+        results.append((mod_file, diffset))
+
+        report_diffset(
+            baseline_file,
+            workspace_baseline,
+            normalized_script_blocks_baseline,
+            mod_file,
+            workspace_mod,
+            normalized_script_blocks_mod,
             diffset,
-            format=diff_format,
-            sort_order=sort_order,
-            layout=layout,
-            filters=details_filters,
-            max_lines=(None if show_full_diff else diff_max_lines),
-            debug_mode=debug_mode,
+            options,
         )
+        # Only the summary is left to print: don't keep the aligned lines of every mod file in memory.
+        diffset.clear_aligned_block_diffs()
+
+    if options.output_format == DiffOutputFormat.RICH:
+        console.line()
+        print_baseline_summary(baseline_file, results)
+
+
+def print_profile():
+    """
+    Print the time spent in each instrumented stage and the counters, and write the recorded Chrome trace file.
+    """
+    summaries = summarize_spans()
+    total_ns = sum(summary.self_ns for summary in summaries) or 1
+
+    console.line()
+    console.print("[cyan]» Profile[/cyan]", highlight=False)
+    console.line()
+
+    profile_table = Table(box=box.SIMPLE, show_edge=False, pad_edge=False, header_style=None)
+    profile_table.add_column("Stage")
+    profile_table.add_column("Calls", justify="right")
+    profile_table.add_column("Total (ms)", justify="right")
+    profile_table.add_column("Self (ms)", justify="right")
+    profile_table.add_column("Self (%)", justify="right")
+
+    for summary in summaries:
+        profile_table.add_row(
+            escape(summary.name),
+            str(summary.calls),
+            f"{summary.total_ns / 1e6:.1f}",
+            f"{summary.self_ns / 1e6:.1f}",
+            f"{100 * summary.self_ns / total_ns:.1f}",
+        )
+
+    console.print(profile_table)
 
-    if not hide_summary:
+    counters = get_counters()
+
+    if counters:
         console.line()
-        print_summary(diffset, sort_order)
+        counter_table = Table(box=box.SIMPLE, show_edge=False, pad_edge=False, header_style=None)
+        counter_table.add_column("Counter")
+        counter_table.add_column("Value", justify="right")
+
+        for name, value in sorted(counters.items()):
+            counter_table.add_row(escape(name), f"{value:,}")
+
+        console.print(counter_table)
+
+    trace_file = get_temp_dir() / "profiles" / f"diff-{time.strftime('%Y%m%d-%H%M%S')}.trace.json"
+    write_chrome_trace(trace_file)
+    console.line()
+    console.print(f"Trace written to {escape(str(trace_file))}", highlight=False)
+
+
+def command(
+    ctx: typer.Context,
+    files: Annotated[
+        list[Path],
+        typer.Argument(
+            help="The left (A) and right (B) files of the comparison. With --baseline, any number of files to compare against the baseline."
+        ),
+    ],
+    baseline_file: Annotated[
+        Path | None,
+        typer.Option(
+            "--baseline",
+            help="Compare every given file against this baseline file (typically the vanilla game file). The baseline is extracted and normalized only once.",
+        ),
+    ] = None,
+    ffdec_path: Annotated[
+        Path | None,
+        typer.Option("--ffdec", help="Path to the ffdec binary. Only required if it is not in the system PATH."),
+    ] = None,
+    workspace_root_dir: Annotated[
+        Path | None,
+        typer.Option(
+            "--workspace-root",
+            help="Directory where intermediate files will be written. If omitted, a temporary directory is used.",
+        ),
+    ] = None,
+    use_extraction_cache: Annotated[
+        bool,
+        typer.Option(
+            "--cache-extraction/--no-extraction-cache",
+            help="Use extraction cache (default). Disable to force re-extraction.",
+        ),
+    ] = True,
+    use_normalization_cache: Annotated[
+        bool,
+        typer.Option(
+            "--cache-normalization/--no-normalization-cache",
+            help="Enable to reuse cached normalized blocks. Disable to force re-normalization.",
+        ),
+    ] = False,
+    jobs: Annotated[
+        int | None,
+        typer.Option(
+            "--jobs",
+            "-j",
+            min=1,
+            help="Number of files to extract in parallel with --baseline. Defaults to the CPU count.",
+        ),
+    ] = None,
+    show_summary_only: Annotated[
+        bool, typer.Option("--summary-only", help="Only show a summary, not detailed file differences.")
+    ] = False,
+    hide_summary: Annotated[bool, typer.Option("--no-summary", help="Do not show the summary, only diffs.")] = False,
+    diff_format: Annotated[
+        Literal["actionscript", "pcode"], typer.Option("--format", help="Set the format for detailed diff.")
+    ] = "actionscript",
+    layout: Annotated[
+        DiffLayout, typer.Option("--layout", help="Set the view layout for detailed diff.")
+    ] = DiffLayout.SPLIT,
+    diff_max_lines: Annotated[
+        int,
+        typer.Option(
+            "--head",
+            min=1,
+            help="Show only the first N lines of diff (approximate). Option --full disables this limit.",
+        ),
+    ] = 512,
+    show_full_diff: Annotated[
+        bool, typer.Option("--full", help="Disable the diff output limit, show the full diff.")
+    ] = False,
+    sort_order: Annotated[
+        DiffSortOrder,
+        typer.Option(
+            "--sort",
+            help="Control sort order for diffs. 'natural' preserves the original order of blocks within each script. 'changes_desc' shows most modified blocks first, 'changes_asc' does the opposite.",
+        ),
+    ] = DiffSortOrder.CHANGES_DESC,
+    filters: Annotated[
+        str | None,
+        typer.Option(
+            "--filter",
+            help='Only compare and display scripts and/or blocks whose name contains the given value. Other scripts are not even normalized. The matching is case-insensitive. Example: "script=inventory,block=character".',
+        ),
+    ] = None,
+    watch: Annotated[
+        bool,
+        typer.Option(
+            "--watch",
+            help="Keep watching file B after the comparison, and compare it again each time it changes. Only the changed scripts are normalized and diffed again.",
+        ),
+    ] = False,
+    profile: Annotated[
+        bool,
+        typer.Option(
+            "--profile",
+            help="Measure the time spent in each stage of the pipeline. Print a breakdown at the end and write a Chrome trace file.",
+        ),
+    ] = False,
+    output_format: Annotated[
+        DiffOutputFormat,
+        typer.Option(
+            "--output-format",
+            help="Write the differences to stdout as a JSON document, NDJSON records or a plain-text patch (unified format) instead of rendering them, for other tools to consume. Other messages are written to stderr, and diffs are never capped.",
+        ),
+    ] = DiffOutputFormat.RICH,
+    patch_dir: Annotated[
+        Path | None,
+        typer.Option(
+            "--patch-dir",
+            file_okay=False,
+            help="Write the differences as one .patch file per script in this directory, instead of stdout. Implies --output-format patch. Paths in patches are relative to the normalized scripts directory (p-code) or the extracted scripts directory (ActionScript) of the workspace.",
+        ),
+    ] = None,
+    block_diff_algorithm: Annotated[
+        BlockDiffAlgorithm,
+        typer.Option(
+            "--block-diff",
+            help="Set how the lines of paired blocks are compared. 'lines' compares whole blocks line by line. 'cfg' first pairs the identical basic blocks of their control-flow graphs, which is much faster on large blocks with small edits, but can align changes more coarsely.",
+        ),
+    ] = BlockDiffAlgorithm.LINES,
+    debug_mode: Annotated[bool, typer.Option("--debug", help="Enable debug mode.")] = False,
+):
+    """
+    Compare scripts between two GFx files to surface meaningful changes through normalization.
+
+    With --baseline, compare any number of GFx files against a single baseline file.
+    """
+    if show_full_diff and ctx.get_parameter_source("diff_max_lines") is ParameterSource.COMMANDLINE:
+        raise typer.BadParameter("Options --head and --full are mutually exclusive.")
+
+    if show_summary_only and hide_summary:
+        raise typer.BadParameter("Options --summary-only and --no-summary are mutually exclusive.")
+
+    if watch and baseline_file is not None:
+        raise typer.BadParameter("Options --watch and --baseline are mutually exclusive.")
+
+    if output_format == DiffOutputFormat.JSON and (watch or baseline_file is not None):
+        raise typer.BadParameter(
+            "Option --output-format json produces a single document: use ndjson with --watch or --baseline."
+        )
+
+    if patch_dir is not None:
+        if baseline_file is not None:
+            raise typer.BadParameter("Options --patch-dir and --baseline are mutually exclusive.")
+
+        if ctx.get_parameter_source("output_format") is ParameterSource.COMMANDLINE and output_format not in (
+            DiffOutputFormat.RICH,
+            DiffOutputFormat.PATCH,
+        ):
+            raise typer.BadParameter(f"Option --patch-dir cannot be used with --output-format {output_format}.")
+
+        output_format = DiffOutputFormat.PATCH
+
+    if baseline_file is None and len(files) != 2:
+        raise typer.BadParameter("Exactly two files are expected, unless option --baseline is used.")
+
+    files = [file.resolve() for file in files]
+
+    if baseline_file is not None:
+        baseline_file = baseline_file.resolve()
+
+    for file in files if baseline_file is None else [baseline_file, *files]:
+        if not file.is_file():
+            print_error(f"Invalid input: {escape(str(file))} is not a file.")
+            raise typer.Exit(code=1)
+
+    if workspace_root_dir is not None:
+        workspace_root_dir = workspace_root_dir.resolve()
+
+        if not workspace_root_dir.is_dir():
+            print_error(f"Invalid input: {escape(str(workspace_root_dir))} does not exist or is not a directory.")
+            raise typer.Exit(code=1)
+
+    def _workspace_for_file(file: Path) -> Workspace:
+        if workspace_root_dir is not None:
+            return Workspace(workspace_root_dir / temp_workspace_name_for_file(file))
+        return Workspace.create_as_temporary_directory(file)
+
+    try:
+        ffdec_path = resolve_ffdec(ffdec_path)
+    except FileNotFoundError as e:
+        print_error(e)
+        raise typer.Exit(code=1)
+
+    try:
+        details_filters = parse_and_validate_details_filters(filters)
+    except ValueError as e:
+        print_error(e)
+        raise typer.Exit(code=1)
+
+    options = DiffReportOptions(
+        format=diff_format,
+        sort_order=sort_order,
+        layout=layout,
+        filters=details_filters,
+        max_lines=(None if show_full_diff else diff_max_lines),
+        show_summary_only=show_summary_only,
+        hide_summary=hide_summary,
+        debug_mode=debug_mode,
+        output_format=output_format,
+        patch_dir=patch_dir.resolve() if patch_dir is not None else None,
+        block_diff_algorithm=block_diff_algorithm,
+    )
+
+    if profile:
+        enable_profiling()
+
+    if output_format != DiffOutputFormat.RICH:
+        # Keep stdout for the records.
+        console.file = sys.stderr
+
+    try:
+        with span("diff"):
+            if baseline_file is None:
+                file_a, file_b = files
+                state = diff_pair(
+                    ffdec_path,
+                    file_a,
+                    _workspace_for_file(file_a),
+                    file_b,
+                    _workspace_for_file(file_b),
+                    use_extraction_cache,
+                    use_normalization_cache,
+                    options,
+                )
+
+                if watch:
+                    watch_pair(
+                        ffdec_path,
+                        file_a,
+                        file_b,
+                        state,
+                        _workspace_for_file,
+                        use_extraction_cache,
+                        use_normalization_cache,
+                        options,
+                    )
+            else:
+                diff_against_baseline(
+                    ffdec_path,
+                    baseline_file,
+                    _workspace_for_file(baseline_file),
+                    [(file, _workspace_for_file(file)) for file in files],
+                    use_extraction_cache,
+                    use_normalization_cache,
+                    options,
+                    jobs=min(jobs or os.cpu_count() or 1, len(files) + 1),
+                )
+    finally:
+        if profile:
+            disable_profiling()
+            print_profile()
+
+        if output_format != DiffOutputFormat.RICH:
+            console.file = None  # back to the current stdout
@@ -1,15 +1,95 @@
 #!/usr/bin/env python3
 
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from dataclasses import replace
+import os
 from pathlib import Path
 from typing import Annotated
 from rich.markup import escape
 import typer
-from .avm1.pcode_normalization import normalize_file
-from .utils import console, print_error
+from .avm1.pcode_normalization import NormalizationResult, normalize_file, normalization_is_up_to_date
+from .utils import console, ensure_empty_dir, print_error
+
+GLOB_MAGIC_CHARACTERS = ("*", "?", "[")
+
+
+def collect_input_pcode_files(inputs: list[Path]) -> list[tuple[Path, Path]]:
+    """
+    Resolve the command inputs into a sorted list of p-code files.
+
+    Each input can be a file, a directory (searched recursively for `.pcode` files) or a glob pattern, of which only
+    the `.pcode` files are kept.
+    Return pairs of (absolute file path, path relative to the input root), the latter being used to mirror
+    the input tree into the output directory.
+    Raise a `ValueError` if different files would be normalized into the same output directory, or into a directory
+    inside the output directory of another file: clearing the latter would delete the normalized blocks of the former.
+    """
+    files: dict[Path, Path] = {}
+
+    for input_path in inputs:
+        if input_path.is_file():
+            files.setdefault(input_path.resolve(), Path(input_path.name))
+            continue
+
+        if input_path.is_dir():
+            root, pattern = input_path, "**/*.pcode"
+        elif any(char in str(input_path) for char in GLOB_MAGIC_CHARACTERS):
+            # Split the pattern into a literal base directory and the glob part.
+            parts = input_path.parts
+            literal_count = next(
+                i for i, part in enumerate(parts) if any(char in part for char in GLOB_MAGIC_CHARACTERS)
+            )
+            root, pattern = Path(*parts[:literal_count]), str(Path(*parts[literal_count:]))
+        else:
+            raise FileNotFoundError(f"Invalid input: {input_path} does not exist.")
+
+        for file in root.glob(pattern):
+            if file.is_file() and file.suffix == ".pcode":
+                files.setdefault(file.resolve(), file.relative_to(root))
+
+    # Each file is normalized into the output directory named after its relative path, without its suffix.
+    output_dir_files: dict[Path, Path] = {}
+
+    for file, rel_path in files.items():
+        output_rel_dir = rel_path.with_suffix("")
+
+        if (other_file := output_dir_files.setdefault(output_rel_dir, file)) != file:
+            raise ValueError(
+                f"Inputs {other_file} and {file} would both be normalized into the output directory "
+                f"{output_rel_dir.as_posix()}."
+            )
+
+    for output_rel_dir, file in output_dir_files.items():
+        for parent_dir in output_rel_dir.parents:
+            if (other_file := output_dir_files.get(parent_dir)) is not None:
+                raise ValueError(
+                    f"Input {file} would be normalized into the output directory {output_rel_dir.as_posix()}, "
+                    f"inside the output directory {parent_dir.as_posix()} of input {other_file}."
+                )
+
+    return sorted(files.items(), key=lambda item: item[1])
+
+
+def _normalize_file_task(
+    input_file: Path, output_dir: Path, write_source_maps: bool, clear_output_dir: bool
+) -> NormalizationResult:
+    """
+    Normalize one file. Meant to run in a worker process: normalized blocks are dropped from the result
+    to keep the transfer back to the main process cheap.
+    """
+    if clear_output_dir:
+        ensure_empty_dir(output_dir)
+
+    return replace(normalize_file(input_file, output_dir, write_source_maps=write_source_maps), blocks=[])
 
 
 def command(
-    input_file: Annotated[Path, typer.Argument(help="The p-code file to normalize.")],
+    inputs: Annotated[
+        list[Path],
+        typer.Argument(
+            help="The p-code files to normalize. Directories are searched recursively for .pcode files, and glob patterns are expanded."
+        ),
+    ],
     output_dir: Annotated[Path, typer.Argument(help="The directory where to write normalized files.")],
     write_source_maps: Annotated[
         bool,
@@ -18,23 +98,95 @@ def command(
             help="Write .pcode.map source-map files alongside normalized p-code.",
         ),
     ] = True,
+    skip_up_to_date: Annotated[
+        bool,
+        typer.Option(
+            "--skip-up-to-date",
+            help="Skip the files whose normalized blocks are already present and newer than the file itself.",
+        ),
+    ] = False,
+    jobs: Annotated[
+        int | None,
+        typer.Option(
+            "--jobs", "-j", min=1, help="Number of files to normalize in parallel. Defaults to the CPU count."
+        ),
+    ] = None,
 ):
     """
-    Split a p-code file into logical blocks and normalize each of them.
+    Split p-code files into logical blocks and normalize each of them.
+
+    A single input file is written at the root of the output directory. Otherwise the input tree is mirrored
+    in the output directory, with one subdirectory of blocks per p-code file.
     """
-    input_file = input_file.resolve()
+    try:
+        input_files = collect_input_pcode_files(inputs)
+    except FileNotFoundError as e:
+        print_error(e)
+        raise typer.Exit(code=1)
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="'INPUTS...'")
 
-    if not input_file.is_file():
-        print_error(f"Invalid input: {escape(str(input_file))} does not exist or is not a file.")
+    if not input_files:
+        print_error("Invalid input: no p-code file found.")
         raise typer.Exit(code=1)
 
     output_dir = output_dir.resolve()
 
-    stats = normalize_file(input_file, output_dir, write_source_maps=write_source_maps)
+    # A single file keeps the historical flat layout: blocks are written at the root of the output directory.
+    flat_layout = len(inputs) == 1 and inputs[0].is_file()
+    tasks: list[tuple[Path, Path, Path]] = []
+
+    for input_file, rel_path in input_files:
+        file_output_dir = output_dir if flat_layout else output_dir / rel_path.with_suffix("")
 
-    console.print(
-        f"{escape(input_file.name)}: split into {stats.total_blocks} blocks",
-        f"({stats.named_blocks} named, {stats.anonymous_blocks} anonymous, {stats.toplevel_blocks} top-level)",
-    )
+        if skip_up_to_date and normalization_is_up_to_date(input_file, file_output_dir, write_source_maps):
+            console.print(f"{escape(rel_path.as_posix())}: [dim]up to date, skipped[/dim]")
+            continue
+
+        tasks.append((input_file, rel_path, file_output_dir))
+
+    failures = 0
+
+    def _print_result(rel_path: Path, stats: NormalizationResult):
+        console.print(
+            f"{escape(rel_path.as_posix())}: split into {stats.total_blocks} blocks",
+            f"({stats.named_blocks} named, {stats.anonymous_blocks} anonymous, {stats.toplevel_blocks} top-level)",
+        )
+
+    def _print_failure(rel_path: Path, e: Exception):
+        nonlocal failures
+        failures += 1
+        print_error(f"Normalization failed: {escape(rel_path.as_posix())}")
+        print_error(e)
+
+    jobs = min(jobs or os.cpu_count() or 1, len(tasks))
+
+    if jobs <= 1:
+        for input_file, rel_path, file_output_dir in tasks:
+            try:
+                _print_result(
+                    rel_path, _normalize_file_task(input_file, file_output_dir, write_source_maps, not flat_layout)
+                )
+            except Exception as e:
+                _print_failure(rel_path, e)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures: dict[Future[NormalizationResult], Path] = {
+                executor.submit(
+                    _normalize_file_task, input_file, file_output_dir, write_source_maps, not flat_layout
+                ): rel_path
+                for input_file, rel_path, file_output_dir in tasks
+            }
+
+            # Results are printed in completion order, as soon as each file is done.
+            for future in as_completed(futures):
+                try:
+                    _print_result(futures[future], future.result())
+                except Exception as e:
+                    _print_failure(futures[future], e)
+
+    if failures:
+        print_error(f"Normalization failed for {failures} of {len(tasks)} files.")
+        raise typer.Exit(code=1)
 
     console.print("[green]Normalization complete.[/green]")
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+from rich.markup import escape
+import typer
+
+from .daemon import FORWARDED_COMMANDS, NO_DAEMON_ENVIRONMENT_VARIABLE, daemon_is_supported, daemon_socket_path, serve
+from .utils import console, print_error
+
+
+def command():
+    """
+    Run a daemon that keeps the toolbox loaded and its caches warm between commands.
+
+    While it is running, the diff, extract and sourcemap commands are executed by the daemon. Stop it with Ctrl+C.
+    """
+    if not daemon_is_supported():
+        print_error("The daemon requires Unix sockets, which are not supported on this platform.")
+        raise typer.Exit(code=1)
+
+    socket_path = daemon_socket_path()
+
+    def _on_ready():
+        console.print(f"Listening on {escape(str(socket_path))}")
+        console.print(
+            f"Commands forwarded to the daemon: {', '.join(FORWARDED_COMMANDS)}. "
+            f"Set {NO_DAEMON_ENVIRONMENT_VARIABLE}=1 to bypass it."
+        )
+
+    try:
+        serve(socket_path, on_ready=_on_ready)
+    except RuntimeError as e:
+        print_error(e)
+        raise typer.Exit(code=1)
+    except KeyboardInterrupt:
+        console.print("Daemon stopped.")
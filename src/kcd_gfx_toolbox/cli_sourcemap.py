@@ -6,8 +6,8 @@ from rich.markup import escape
 from rich.rule import Rule
 from rich.text import Text
 import typer
-from .avm1.pcode_parsing import parse_pcode_file
-from .avm1.pcode_normalization import split_into_blocks, normalize_block
+from .avm1.pcode_parsing import iter_pcode_file
+from .avm1.pcode_normalization import iter_blocks, normalize_block
 from .view.split_layout import SplitLayout, SplitLayoutTextLine, SplitLayoutTextPane
 from .swd import build_pcode_to_actionscript_line_map, parse_swd_file
 from .utils import console, print_error, read_file_lines
@@ -56,8 +56,7 @@ def command(
         print_error(f"Script {script_path!r} was not found within extracted GFx files.")
         raise typer.Exit(code=1)
 
-    pcode_file = parse_pcode_file(script_file)
-    blocks = split_into_blocks(pcode_file)
+    blocks = list(iter_blocks(iter_pcode_file(script_file)))
 
     if block_name is None:
         console.print("Available blocks:")
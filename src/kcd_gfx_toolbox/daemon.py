@@ -0,0 +1,366 @@
+"""
+Long-running daemon that executes commands on behalf of short-lived `kcd-gfx` invocations.
+
+The daemon keeps the Python modules loaded and the in-memory caches warm (parsed SWD files, normalization results)
+between commands. Clients send their command line over a local Unix socket and receive the command output
+as a stream of newline-delimited JSON messages.
+"""
+
+from collections.abc import Callable
+from contextlib import redirect_stderr, redirect_stdout
+import io
+import json
+import os
+from pathlib import Path
+import signal
+import socket
+import stat
+import struct
+import sys
+import traceback
+from .utils import get_temp_dir
+
+"""Commands that are forwarded to the daemon when it is running."""
+FORWARDED_COMMANDS = ("diff", "extract", "sourcemap")
+
+"""Environment variables of the client that apply to the forwarded command."""
+FORWARDED_ENVIRONMENT_VARIABLES = ("PATH", "TERM", "COLORTERM", "NO_COLOR", "FORCE_COLOR", "COLUMNS", "LINES")
+
+"""Set this environment variable to bypass the daemon even when it is running."""
+NO_DAEMON_ENVIRONMENT_VARIABLE = "KCD_GFX_NO_DAEMON"
+
+
+def daemon_socket_path() -> Path:
+    """
+    Return the path of the daemon's Unix socket, in a directory private to the current user.
+
+    The user's runtime directory is used when there is one. Otherwise, the shared temporary directory is used, with a
+    subdirectory per user.
+    """
+    if runtime_dir := os.environ.get("XDG_RUNTIME_DIR"):
+        return Path(runtime_dir) / "kcd-mod-gfx-toolbox" / "daemon.sock"
+
+    return get_temp_dir() / f"daemon-{os.getuid()}" / "daemon.sock"
+
+
+def _is_private_directory(directory: Path) -> bool:
+    """Check whether a directory (not a symbolic link) is owned by the current user, and only accessible to them."""
+    try:
+        st = directory.lstat()
+    except OSError:
+        return False
+
+    return stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and st.st_mode & 0o077 == 0
+
+
+def _is_trusted_socket(socket_path: Path) -> bool:
+    """
+    Check whether a socket was created by the current user in a private directory, so that nobody else can listen
+    on it in their place.
+    """
+    try:
+        st = socket_path.lstat()
+    except OSError:
+        return False
+
+    return stat.S_ISSOCK(st.st_mode) and st.st_uid == os.getuid() and _is_private_directory(socket_path.parent)
+
+
+def _ensure_private_directory(directory: Path):
+    """Create a directory only accessible to the current user, or check that an existing one is."""
+    directory.parent.mkdir(parents=True, exist_ok=True)
+
+    try:
+        directory.mkdir(mode=0o700)
+    except FileExistsError:
+        pass
+
+    if not _is_private_directory(directory):
+        raise RuntimeError(f"{directory} must be a directory owned by the current user and only accessible to them.")
+
+
+def daemon_is_supported() -> bool:
+    """Check whether the platform supports Unix sockets."""
+    return hasattr(socket, "AF_UNIX")
+
+
+def _send_message(connection: socket.socket, message: dict):
+    # Unbuffered on purpose: a buffered stream would send pending data again when closed, e.g. after an interrupted
+    # flush, and the resulting error would hide the interruption.
+    connection.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+
+class _ClientOutputStream(io.TextIOBase):
+    """
+    Text stream that forwards everything written to it to one of the client's output streams.
+    """
+
+    def __init__(self, send: Callable[[dict], None], name: str, is_terminal: bool):
+        self._send = send
+        self._name = name
+        self._is_terminal = is_terminal
+
+    @property
+    def encoding(self) -> str:
+        return "utf-8"
+
+    def isatty(self) -> bool:
+        return self._is_terminal
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str | bytes) -> int:
+        # Click writes bytes to text streams without a binary buffer, e.g. for the help of commands.
+        if text:
+            self._send({self._name: text.decode("utf-8") if isinstance(text, bytes) else text})
+        return len(text)
+
+
+def _run_client_request(request: dict, app: Callable, send: Callable[[dict], None]) -> int:
+    """
+    Run a command in the context of the client (working directory, environment, output streams).
+    Return the exit code of the command.
+    """
+    from .utils import console, stderr_console
+
+    client_stdout = _ClientOutputStream(send, "stdout", request["isatty"]["stdout"])
+    client_stderr = _ClientOutputStream(send, "stderr", request["isatty"]["stderr"])
+    saved_cwd = os.getcwd()
+    saved_environ = os.environ.copy()
+    saved_consoles = [(c, c.__dict__.copy()) for c in (console, stderr_console)]
+
+    try:
+        os.chdir(request["cwd"])
+
+        for name in FORWARDED_ENVIRONMENT_VARIABLES:
+            if name in request["env"]:
+                os.environ[name] = request["env"][name]
+            else:
+                os.environ.pop(name, None)
+
+        with redirect_stdout(client_stdout), redirect_stderr(client_stderr):
+            # Shared consoles detect the terminal capabilities (color system, width) only once, when they are created.
+            # Detect them again, against the client's streams and environment.
+            console.__init__()
+            stderr_console.__init__(stderr=True)
+
+            try:
+                app(args=request["argv"], prog_name="kcd-gfx")
+            except SystemExit as e:
+                if e.code is None or isinstance(e.code, int):
+                    return e.code or 0
+                print(e.code, file=sys.stderr)
+                return 1
+            except Exception:
+                traceback.print_exc()
+                return 1
+
+            return 0
+    finally:
+        os.chdir(saved_cwd)
+        os.environ.clear()
+        os.environ.update(saved_environ)
+
+        for c, state in saved_consoles:
+            c.__dict__.clear()
+            c.__dict__.update(state)
+
+
+def _decode_request(request_line: bytes) -> dict:
+    """
+    Decode a request sent by a client (see `forward_to_daemon`). Raise a `ValueError` if it is malformed.
+    """
+    try:
+        request = json.loads(request_line)
+        is_valid = (
+            isinstance(request["argv"], list)
+            and all(isinstance(arg, str) for arg in request["argv"])
+            and isinstance(request["cwd"], str)
+            and isinstance(request["env"], dict)
+            and all(isinstance(name, str) and isinstance(value, str) for name, value in request["env"].items())
+            and all(isinstance(request["isatty"][name], bool) for name in ("stdout", "stderr"))
+        )
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Malformed request: {e}") from e
+
+    if not is_valid:
+        raise ValueError("Malformed request: unexpected value types.")
+
+    return request
+
+
+def _handle_connection(connection: socket.socket, app: Callable):
+    with connection, connection.makefile("rb") as stream:
+        request_line = stream.readline()
+
+        if not request_line:
+            return
+
+        def _send(message: dict):
+            _send_message(connection, message)
+
+        try:
+            request = _decode_request(request_line)
+        except ValueError:
+            # Whatever the client sent, the daemon keeps serving. Reply with the exit code of usage errors.
+            _send({"exit": 2})
+            return
+
+        exit_code = _run_client_request(request, app, _send)
+        _send({"exit": exit_code})
+
+
+def serve(socket_path: Path, on_ready: Callable[[], None] | None = None):
+    """
+    Listen on a Unix socket and run the commands sent by clients, one at a time, until interrupted.
+    """
+    from .cli import app, load_command
+
+    # Subcommand modules are loaded lazily: load the forwarded ones upfront, the daemon is there to run them warm.
+    for name in FORWARDED_COMMANDS:
+        load_command(name)
+
+    if socket_path.exists():
+        if daemon_is_running(socket_path):
+            raise RuntimeError(f"A daemon is already listening on {socket_path}.")
+        socket_path.unlink()  # Stale socket left by a daemon that did not exit cleanly.
+
+    _ensure_private_directory(socket_path.parent)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # The socket must only be reachable by the current user: it runs commands in their name.
+    previous_umask = os.umask(0o177)
+
+    try:
+        server.bind(str(socket_path))
+    finally:
+        os.umask(previous_umask)
+
+    # Stop on SIGTERM as on Ctrl+C, so that the socket is removed either way.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    try:
+        server.listen()
+
+        if on_ready is not None:
+            on_ready()
+
+        while True:
+            connection, _ = server.accept()
+
+            try:
+                _handle_connection(connection, app)
+            except OSError:
+                pass  # The client went away (e.g. interrupted). Keep serving the others.
+    finally:
+        server.close()
+        socket_path.unlink(missing_ok=True)
+
+
+def _terminal_size() -> os.terminal_size | None:
+    # Same lookup order as Rich: whichever standard stream is a terminal.
+    for fd in (0, 1, 2):
+        try:
+            return os.get_terminal_size(fd)
+        except OSError:
+            pass
+
+    return None
+
+
+def _peer_uid(connection: socket.socket) -> int | None:
+    """Return the user ID of the process at the other end of a Unix socket, when the platform tells it."""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+
+    credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    _, uid, _ = struct.unpack("3i", credentials)
+    return uid
+
+
+def _connect(socket_path: Path) -> socket.socket | None:
+    """
+    Connect to the daemon's socket. Only a daemon run by the current user is trusted with the command lines and
+    output: return None if there is no such daemon.
+    """
+    if not _is_trusted_socket(socket_path):
+        return None
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        client.connect(str(socket_path))
+
+        if (uid := _peer_uid(client)) is not None and uid != os.getuid():
+            raise ConnectionRefusedError(f"The daemon socket is held by another user ({uid}).")
+    except OSError:
+        client.close()
+        return None
+
+    return client
+
+
+def daemon_is_running(socket_path: Path | None = None) -> bool:
+    """Check whether a daemon accepts connections on the socket."""
+    client = _connect(socket_path or daemon_socket_path()) if daemon_is_supported() else None
+
+    if client is None:
+        return False
+
+    client.close()
+    return True
+
+
+def forward_to_daemon(argv: list[str], socket_path: Path | None = None) -> int | None:
+    """
+    Run a command in the daemon if it is running, relaying its output to the standard streams.
+
+    Return the exit code of the command, or None if the command was not forwarded: daemon not running,
+    command not forwardable, or daemon explicitly disabled.
+    """
+    if not argv or argv[0] not in FORWARDED_COMMANDS:
+        return None
+
+    # The daemon runs one command at a time: never hold it with a command that runs until interrupted.
+    if "--watch" in argv:
+        return None
+
+    if not daemon_is_supported() or os.environ.get(NO_DAEMON_ENVIRONMENT_VARIABLE):
+        return None
+
+    client = _connect(socket_path or daemon_socket_path())
+
+    if client is None:
+        return None
+
+    env = {name: os.environ[name] for name in FORWARDED_ENVIRONMENT_VARIABLES if name in os.environ}
+    terminal_size = _terminal_size()
+
+    if terminal_size is not None:
+        env.setdefault("COLUMNS", str(terminal_size.columns))
+        env.setdefault("LINES", str(terminal_size.lines))
+
+    request = {
+        "argv": argv,
+        "cwd": os.getcwd(),
+        "env": env,
+        "isatty": {"stdout": sys.stdout.isatty(), "stderr": sys.stderr.isatty()},
+    }
+
+    with client, client.makefile("rb") as stream:
+        _send_message(client, request)
+
+        for line in stream:
+            message = json.loads(line)
+
+            if "stdout" in message:
+                sys.stdout.write(message["stdout"])
+                sys.stdout.flush()
+            elif "stderr" in message:
+                sys.stderr.write(message["stderr"])
+                sys.stderr.flush()
+            elif "exit" in message:
+                return message["exit"]
+
+    print("ERROR: the daemon closed the connection before the command completed.", file=sys.stderr)
+    return 1
@@ -0,0 +1,153 @@
+"""
+Optimal pairing of items from two sides, given the similarities of a sparse set of candidate pairs.
+
+Pairing items one after the other with their best remaining candidate can lock in a poor pair early. Here, the pairs
+maximizing the total similarity are found with the Hungarian algorithm, run separately on each connected component of
+the candidate pairs graph: components are usually tiny, even when there are many items.
+"""
+
+from collections.abc import Hashable, Mapping
+from typing import TypeVar
+
+from kcd_gfx_toolbox.instrumentation import count
+
+K1 = TypeVar("K1", bound=Hashable)
+K2 = TypeVar("K2", bound=Hashable)
+
+
+def _solve_dense_assignment(costs: list[list[float]]) -> list[int]:
+    """
+    Hungarian algorithm: find the column of each row minimizing the total cost, with as many columns as rows or more.
+    """
+    row_count = len(costs)
+    column_count = len(costs[0])
+    assert row_count <= column_count
+
+    # Potentials of rows and columns, and row assigned to each column. Index 0 is a sentinel for both.
+    row_potentials = [0.0] * (row_count + 1)
+    column_potentials = [0.0] * (column_count + 1)
+    column_rows = [0] * (column_count + 1)
+    previous_columns = [0] * (column_count + 1)
+
+    for row in range(1, row_count + 1):
+        column_rows[0] = row
+        current_column = 0
+        min_reduced_costs = [float("inf")] * (column_count + 1)
+        visited = [False] * (column_count + 1)
+
+        # Grow a tree of alternating paths from the row until it reaches an unassigned column.
+        while True:
+            visited[current_column] = True
+            current_row = column_rows[current_column]
+            delta = float("inf")
+            next_column = 0
+
+            for column in range(1, column_count + 1):
+                if visited[column]:
+                    continue
+
+                reduced_cost = (
+                    costs[current_row - 1][column - 1] - row_potentials[current_row] - column_potentials[column]
+                )
+
+                if reduced_cost < min_reduced_costs[column]:
+                    min_reduced_costs[column] = reduced_cost
+                    previous_columns[column] = current_column
+
+                if min_reduced_costs[column] < delta:
+                    delta = min_reduced_costs[column]
+                    next_column = column
+
+            for column in range(column_count + 1):
+                if visited[column]:
+                    row_potentials[column_rows[column]] += delta
+                    column_potentials[column] -= delta
+                else:
+                    min_reduced_costs[column] -= delta
+
+            current_column = next_column
+
+            if column_rows[current_column] == 0:
+                break
+
+        # Flip the assignments along the augmenting path.
+        while current_column != 0:
+            previous_column = previous_columns[current_column]
+            column_rows[current_column] = column_rows[previous_column]
+            current_column = previous_column
+
+    row_columns = [-1] * row_count
+
+    for column in range(1, column_count + 1):
+        if column_rows[column] != 0:
+            row_columns[column_rows[column] - 1] = column - 1
+
+    return row_columns
+
+
+def _split_connected_components(pairs: list[tuple[K1, K2]]) -> list[list[tuple[K1, K2]]]:
+    """
+    Group candidate pairs sharing items, directly or not. Groups and pairs keep the order of the given pairs.
+    """
+    parents: dict[tuple[int, Hashable], tuple[int, Hashable]] = {}
+
+    def find(node: tuple[int, Hashable]) -> tuple[int, Hashable]:
+        root = node
+
+        while (parent := parents.setdefault(root, root)) != root:
+            root = parent
+
+        while node != root:
+            parents[node], node = root, parents[node]
+
+        return root
+
+    for key1, key2 in pairs:
+        parents[find((1, key1))] = find((2, key2))
+
+    components: dict[tuple[int, Hashable], list[tuple[K1, K2]]] = {}
+
+    for pair in pairs:
+        components.setdefault(find((1, pair[0])), []).append(pair)
+
+    return list(components.values())
+
+
+def solve_assignment(similarities: Mapping[tuple[K1, K2], float]) -> list[tuple[K1, K2]]:
+    """
+    Pair items of side 1 with items of side 2, maximizing the total similarity of the pairs.
+
+    Only the given candidate pairs can be selected, and an item is paired at most once. Pairs are returned in the order
+    of the mapping.
+    """
+    assigned_pairs: set[tuple[K1, K2]] = set()
+
+    for component in _split_connected_components(list(similarities)):
+        if len(component) == 1:
+            assigned_pairs.add(component[0])
+            continue
+
+        keys1 = list(dict.fromkeys(key1 for key1, _ in component))
+        keys2 = list(dict.fromkeys(key2 for _, key2 in component))
+        transposed = len(keys1) > len(keys2)
+        rows, columns = (keys2, keys1) if transposed else (keys1, keys2)
+
+        # Minimizing negated similarities maximizes the total similarity. Pairs that are not candidates cost nothing,
+        # and are dropped from the solution.
+        costs = [[0.0] * len(columns) for _ in rows]
+        row_indexes = {key: i for i, key in enumerate(rows)}
+        column_indexes = {key: j for j, key in enumerate(columns)}
+
+        for key1, key2 in component:
+            row_key, column_key = (key2, key1) if transposed else (key1, key2)
+            costs[row_indexes[row_key]][column_indexes[column_key]] = -similarities[(key1, key2)]
+
+        count("assignment problems solved")
+
+        for row, column in enumerate(_solve_dense_assignment(costs)):
+            pair = (columns[column], rows[row]) if transposed else (rows[row], columns[column])
+
+            if pair in similarities:
+                assigned_pairs.add(pair)  # pyright: ignore[reportArgumentType]
+
+    return [pair for pair in similarities if pair in assigned_pairs]
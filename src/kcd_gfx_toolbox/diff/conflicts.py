@@ -0,0 +1,120 @@
+"""Conflict detection between several mods diffed against a shared baseline."""
+
+from __future__ import annotations
+from collections.abc import Iterator, Mapping
+from dataclasses import dataclass
+from enum import StrEnum
+from pathlib import Path
+from .gfx import GfxDiffSet
+
+# A change location, expressed with baseline names: (script path, block name).
+# A block name of None designates the whole script (created or deleted script).
+ChangeKey = tuple[Path, str | None]
+
+
+class ChangeType(StrEnum):
+    MODIFIED = "modified"
+    DELETED = "deleted"
+    CREATED = "created"
+
+
+@dataclass(frozen=True)
+class ModChange:
+    """
+    One change made by a mod to a script or a script block of the baseline.
+    """
+
+    mod: str
+    type: ChangeType
+    lines_changed: int = 0
+
+
+@dataclass(frozen=True)
+class ModConflict:
+    """
+    A script or a script block of the baseline that is changed by more than one mod.
+    """
+
+    script_path: Path
+    block_name: str | None
+    changes: tuple[ModChange, ...]
+
+    def mods(self) -> list[str]:
+        return sorted({change.mod for change in self.changes})
+
+    def sort_key(self) -> tuple[str, str]:
+        return (self.script_path.as_posix(), self.block_name or "")
+
+
+def iter_mod_changes(mod: str, diffset: GfxDiffSet) -> Iterator[tuple[ChangeKey, ModChange]]:
+    """
+    Yield every change of a mod diffset (baseline on side A, mod on side B), keyed by its location in the baseline.
+
+    Paired blocks only count as modified if they still differ after refinement, or if they were renamed.
+    Created blocks and scripts are keyed by their own name, so that mods creating the same thing collide.
+    """
+    for script in diffset.unmatched_a_scripts:
+        yield (script.side_a_path, None), ModChange(mod, ChangeType.DELETED)
+
+    for script in diffset.unmatched_b_scripts:
+        yield (script.side_b_path, None), ModChange(mod, ChangeType.CREATED)
+
+    for script, script_diffset in diffset.paired_scripts_block_diffs.items():
+        for block in script_diffset.paired_blocks:
+            if block.refined_changed > 0 or block.was_renamed():
+                yield (
+                    (script.side_a_path, block.side_a_name),
+                    ModChange(mod, ChangeType.MODIFIED, block.refined_changed),
+                )
+
+        for block in script_diffset.unmatched_a_blocks:
+            yield (script.side_a_path, block.side_a_name), ModChange(mod, ChangeType.DELETED)
+
+        for block in script_diffset.unmatched_b_blocks:
+            yield (script.side_a_path, block.side_b_name), ModChange(mod, ChangeType.CREATED)
+
+
+def index_mod_changes(diffsets: Mapping[str, GfxDiffSet]) -> dict[ChangeKey, list[ModChange]]:
+    """
+    Build an inverted index from change locations to the changes made there by each mod.
+
+    Every diffset must have been computed against the same baseline, on side A.
+    """
+    index: dict[ChangeKey, list[ModChange]] = {}
+
+    for mod, diffset in diffsets.items():
+        for key, change in iter_mod_changes(mod, diffset):
+            index.setdefault(key, []).append(change)
+
+    return index
+
+
+def find_mod_conflicts(diffsets: Mapping[str, GfxDiffSet]) -> list[ModConflict]:
+    """
+    Find the scripts and script blocks of a shared baseline that are changed by more than one mod.
+
+    This is a single pass over an inverted index of every mod change, instead of diffing mods pairwise.
+    A whole-script change (creation or deletion) conflicts with any other mod changing the same script.
+    """
+    index = index_mod_changes(diffsets)
+    changes_by_script: dict[Path, list[ModChange]] = {}
+    conflicts: list[ModConflict] = []
+
+    for (script_path, block_name), changes in index.items():
+        changes_by_script.setdefault(script_path, []).extend(changes)
+
+        if block_name is not None and len({change.mod for change in changes}) > 1:
+            conflicts.append(ModConflict(script_path, block_name, tuple(changes)))
+
+    for (script_path, block_name), changes in index.items():
+        if block_name is not None:
+            continue
+
+        script_changes = changes_by_script[script_path]
+
+        if len({change.mod for change in script_changes}) > 1:
+            conflicts.append(ModConflict(script_path, None, tuple(script_changes)))
+
+    conflicts.sort(key=ModConflict.sort_key)
+
+    return conflicts
@@ -1,11 +1,14 @@
 """Generic text and file diff primitives, with no knowledge of GFx."""
 
+from collections.abc import Hashable
 from dataclasses import dataclass, field, replace
 import difflib
 from pathlib import Path
 from typing import Literal, NamedTuple, Self
 import itertools
+from kcd_gfx_toolbox.instrumentation import count
 from kcd_gfx_toolbox.utils import list_tree_files, read_file_lines, sha256_file
+from .assignment import solve_assignment
 
 
 class TextDiffSpan(NamedTuple):
@@ -70,6 +73,7 @@ def diff_texts(text1_lines: list[str], text2_lines: list[str]) -> TextDiff:
     Return number of touched lines (inserted, deleted or replaced),
     counting replacements as max(old_span, new_span).
     """
+    count("SequenceMatcher calls")
     seqmatch = difflib.SequenceMatcher(None, text1_lines, text2_lines, autojunk=False)
     diff_spans: list[TextDiffSpan] = []
     changed = 0
@@ -95,6 +99,55 @@ def diff_texts(text1_lines: list[str], text2_lines: list[str]) -> TextDiff:
     return TextDiff(spans=diff_spans, lines_changed=changed)
 
 
+class TextSegment(NamedTuple):
+    """
+    Lines `start` to `end` (excluded) of a text. Segments with the same key have the same content.
+    """
+
+    start: int
+    end: int
+    key: Hashable
+
+
+def diff_segmented_texts(
+    text1_lines: list[str], text1_segments: list[TextSegment], text2_lines: list[str], text2_segments: list[TextSegment]
+) -> TextDiff:
+    """
+    Compare two sets of text lines split in contiguous segments.
+
+    Identical segments are paired by key first, then only the lines between paired segments are compared line by line.
+    On long texts with few changes, this is much cheaper than `diff_texts`, at the cost of a coarser alignment.
+    """
+    count("SequenceMatcher calls")
+    seqmatch = difflib.SequenceMatcher(
+        None, [s.key for s in text1_segments], [s.key for s in text2_segments], autojunk=False
+    )
+    diff_spans: list[TextDiffSpan] = []
+    changed = 0
+
+    def segments_start(segments: list[TextSegment], index: int, text_length: int) -> int:
+        return segments[index].start if index < len(segments) else text_length
+
+    i_prev = j_prev = 0
+
+    # The last matching block is a dummy one, marking the end of both segment lists.
+    for i, j, size in seqmatch.get_matching_blocks():
+        if i > i_prev or j > j_prev:
+            i1 = segments_start(text1_segments, i_prev, len(text1_lines))
+            i2 = segments_start(text1_segments, i, len(text1_lines))
+            j1 = segments_start(text2_segments, j_prev, len(text2_lines))
+            j2 = segments_start(text2_segments, j, len(text2_lines))
+            gap_diff = diff_texts(text1_lines[i1:i2], text2_lines[j1:j2])
+            changed += gap_diff.lines_changed
+            diff_spans.extend(
+                TextDiffSpan((a1 + i1, a2 + i1), (b1 + j1, b2 + j1)) for (a1, a2), (b1, b2) in gap_diff.spans
+            )
+
+        i_prev, j_prev = i + size, j + size
+
+    return TextDiff(spans=diff_spans, lines_changed=changed)
+
+
 def diff_file_trees(
     dir1: Path, dir2: Path, include_paths: set[Path] | None = None, glob: str | None = None
 ) -> tuple[list[FileDiff], list[Path], list[Path], list[Path]]:
@@ -193,14 +246,13 @@ def diff_file_trees(
         return file_cache[full_path]
 
     MATCH_SIMILARITY_THRESHOLD = 0.9
+    similarities: dict[tuple[Path, Path], float] = {}
 
     for path_in_dir1 in sorted(unmatched_dir1):
-        if not unmatched_dir2:  # if there is no unmatched file left in dir 2
-            break
-
         # Rank candidates by path similarity first to reduce expensive content comparisons.
         # Keep only the N top candidates (value could be adjusted).
         candidates = sorted(unmatched_dir2, key=lambda p: p.name)
+        count("SequenceMatcher calls", len(candidates))
 
         candidates = sorted(
             candidates,
@@ -208,30 +260,35 @@ def diff_file_trees(
             reverse=True,
         )[:20]
 
-        file1_lines = read_file_from_dir1(path_in_dir1)
-        best_match: tuple[float, Path] | None = None
+        # SequenceMatcher indexes its second sequence, and keeps that index until it changes: the file compared with
+        # every candidate goes second, so that it is indexed only once.
+        seqmatch = difflib.SequenceMatcher(autojunk=False)
+        seqmatch.set_seq2(read_file_from_dir1(path_in_dir1))
 
         for candidate in candidates:
-            similarity = difflib.SequenceMatcher(
-                a=file1_lines, b=read_file_from_dir2(candidate), autojunk=False
-            ).ratio()
+            seqmatch.set_seq1(read_file_from_dir2(candidate))
 
-            if best_match is None or similarity > best_match[0]:
-                best_match = (similarity, candidate)
+            # Cheap upper bounds of the similarity ratio rule out most candidates without a full comparison.
+            if (
+                seqmatch.real_quick_ratio() < MATCH_SIMILARITY_THRESHOLD
+                or seqmatch.quick_ratio() < MATCH_SIMILARITY_THRESHOLD
+            ):
+                continue
 
-        similarity, best_candidate = best_match  # pyright: ignore[reportGeneralTypeIssues]
+            count("SequenceMatcher calls")
 
-        if similarity < MATCH_SIMILARITY_THRESHOLD:
-            continue
+            if (similarity := seqmatch.ratio()) >= MATCH_SIMILARITY_THRESHOLD:
+                similarities[(path_in_dir1, candidate)] = similarity
 
+    for path_in_dir1, path_in_dir2 in solve_assignment(similarities):
         unmatched_dir1.discard(path_in_dir1)
-        unmatched_dir2.discard(best_candidate)
+        unmatched_dir2.discard(path_in_dir2)
 
-        text_diff = diff_texts(file1_lines, read_file_from_dir2(best_candidate))
+        text_diff = diff_texts(read_file_from_dir1(path_in_dir1), read_file_from_dir2(path_in_dir2))
 
         changes.append(
             FileDiff(
-                path=path_in_dir1, path_new=best_candidate, lines_changed=text_diff.lines_changed, spans=text_diff.spans
+                path=path_in_dir1, path_new=path_in_dir2, lines_changed=text_diff.lines_changed, spans=text_diff.spans
             )
         )
 
@@ -469,6 +526,7 @@ def align_hunk_pair_edge_context(hunk_1: TextHunk, hunk_2: TextHunk) -> tuple[Te
 
 
 def _compute_hunk_similarity(hunk_1: TextHunk, hunk_2: TextHunk) -> float:
+    count("SequenceMatcher calls")
     return difflib.SequenceMatcher(None, hunk_1.to_str_list(), hunk_2.to_str_list(), autojunk=False).ratio()
 
 
@@ -631,6 +689,7 @@ def align_hunk_pairs(hunks_1: list[TextHunk], hunks_2: list[TextHunk]) -> list[t
     """
     hunk_pairs: list[tuple[TextHunk, TextHunk]] = []
 
+    count("SequenceMatcher calls")
     seqmatch = difflib.SequenceMatcher(
         None,
         ["\n".join((line.text for line in h)) for h in hunks_1],
@@ -679,6 +738,7 @@ def diff_text_hunks(hunk_1: TextHunk, hunk_2: TextHunk) -> tuple[DiffAnnotatedHu
 
     hunk_1_lines: list[str] = [line.text for line in hunk_1]
     hunk_2_lines: list[str] = [line.text for line in hunk_2]
+    count("SequenceMatcher calls")
     seqmatch = difflib.SequenceMatcher(None, hunk_1_lines, hunk_2_lines, autojunk=False)
 
     for tag, i1, i2, j1, j2 in seqmatch.get_opcodes():
@@ -1,13 +1,28 @@
 """Diff logic specific to GFx files: script matching, block-level pairing, and label/register realignment."""
 
 from __future__ import annotations
+from collections.abc import Callable
 from dataclasses import dataclass, field
 from enum import StrEnum
 from pathlib import Path
 from typing import cast
-from kcd_gfx_toolbox.utils import list_tree_files, read_file_lines
-from kcd_gfx_toolbox.avm1.pcode_alignment import align_labels_in_text, align_registers_in_text
-from .core import FileDiff, TextDiffSpan, diff_file_trees, diff_texts, format_path_rename_git_style
+from kcd_gfx_toolbox.instrumentation import count, traced
+from kcd_gfx_toolbox.utils import list_tree_files, sha256_file
+from kcd_gfx_toolbox.avm1.pcode_alignment import align_pcode_lines
+from kcd_gfx_toolbox.avm1.pcode_cfg import find_basic_block_starts, hash_pcode_lines
+from kcd_gfx_toolbox.avm1.pcode_parsing import PcodeBlock, PcodeLine
+from .core import (
+    FileDiff,
+    TextDiff,
+    TextDiffSpan,
+    TextSegment,
+    diff_file_trees,
+    diff_segmented_texts,
+    diff_texts,
+    format_path_rename_git_style,
+)
+from .assignment import solve_assignment
+from .minhash import MinHashLshIndex, minhash_signature
 
 
 @dataclass(frozen=True)
@@ -90,6 +105,15 @@ class GfxDiffSet:
                 GfxScriptBlock(side_a_name=None, side_b_name=path.stem)
             )
 
+    def keep_blocks(self, predicate: Callable[[GfxScriptBlock], bool]) -> None:
+        """
+        Drop the block diffs that do not satisfy the predicate, so that the next steps ignore them.
+        """
+        for details in self.paired_scripts_block_diffs.values():
+            details.paired_blocks = {block for block in details.paired_blocks if predicate(block)}
+            details.unmatched_a_blocks = {block for block in details.unmatched_a_blocks if predicate(block)}
+            details.unmatched_b_blocks = {block for block in details.unmatched_b_blocks if predicate(block)}
+
     def get_differing_scripts(self) -> set[GfxScript]:
         return self.get_scripts_with_differing_blocks() | self.unmatched_a_scripts | self.unmatched_b_scripts
 
@@ -118,6 +142,14 @@ class GfxDiffSet:
     def get_unmatched_block_side_b_count(self) -> int:
         return sum(len(det.unmatched_b_blocks) for det in self.paired_scripts_block_diffs.values())
 
+    def clear_aligned_block_diffs(self) -> None:
+        """
+        Release the aligned diffs kept by the paired blocks, once they are no longer rendered.
+        """
+        for details in self.paired_scripts_block_diffs.values():
+            for block in details.paired_blocks:
+                block.aligned_diff = None
+
     def to_tree(self) -> GfxDiffTreeNode:
         return build_diff_tree(self)
 
@@ -137,6 +169,7 @@ class GfxScriptBlock:
     changed: int = field(default=0, compare=False)
     diff_spans: list[TextDiffSpan] = field(default_factory=list, compare=False)
     refined_changed: int = field(default=0, compare=False)
+    aligned_diff: AlignedBlockDiff | None = field(default=None, compare=False, repr=False)
 
     def __post_init__(self):
         if self.side_a_name is None and self.side_b_name is None:
@@ -202,6 +235,55 @@ def _sort_match_candidates_for_script(script_path: Path, unmatched_script_paths:
     return candidates
 
 
+"""Minimum estimated Jaccard similarity of the block fingerprints of scripts in different directories to pair them."""
+CROSS_DIRECTORY_MIN_SIMILARITY = 0.5
+
+"""Maximum number of scripts from other directories fully compared with a script."""
+CROSS_DIRECTORY_MAX_CANDIDATES = 3
+
+
+def _script_block_fingerprints(script_normalized_dir: Path) -> set[str]:
+    """
+    Get the fingerprints of the blocks of a normalized script: their names and the hashes of their contents.
+    """
+    fingerprints = set()
+
+    for block_path in list_tree_files(script_normalized_dir, glob="*.pcode"):
+        fingerprints.add(f"name:{block_path.as_posix()}")
+        fingerprints.add(f"content:{sha256_file(script_normalized_dir / block_path)}")
+
+    return fingerprints
+
+
+def _index_scripts(script_paths: set[Path], normalization_dir: Path) -> MinHashLshIndex[Path]:
+    index = MinHashLshIndex[Path]()
+
+    for script_path in script_paths:
+        if (signature := minhash_signature(_script_block_fingerprints(normalization_dir / script_path))) is not None:
+            index.add(script_path, signature)
+
+    return index
+
+
+def _find_cross_directory_candidates(
+    script_path: Path, script_normalized_dir: Path, index: MinHashLshIndex[Path], unmatched_script_paths: set[Path]
+) -> list[Path]:
+    """
+    Get the unmatched scripts from other directories whose blocks are the most similar to the given script's.
+    """
+    if (signature := minhash_signature(_script_block_fingerprints(script_normalized_dir))) is None:
+        return []
+
+    candidates = [
+        candidate
+        for _, candidate in index.query(signature, min_similarity=CROSS_DIRECTORY_MIN_SIMILARITY)
+        if candidate in unmatched_script_paths and candidate.parent != script_path.parent
+    ]
+
+    return candidates[:CROSS_DIRECTORY_MAX_CANDIDATES]
+
+
+@traced("comparison")
 def diff_normalized_script_trees(
     a_side_scripts: set[Path],
     b_side_scripts: set[Path],
@@ -218,46 +300,68 @@ def diff_normalized_script_trees(
 
     MATCH_SIMILARITY_THRESHOLD = 0.9
 
-    for script_path_in_a in sorted(unmatched_side_a_scripts):
-        if not unmatched_side_b_scripts:  # if all script on side B have already been matched.
-            break
-
-        candidates = _sort_match_candidates_for_script(script_path_in_a, unmatched_side_b_scripts)
+    block_counts: dict[Path, int] = {}
+    script_pair_diffs: dict[tuple[Path, Path], tuple[float, tuple[list[FileDiff], list[Path], list[Path]]]] = {}
 
-        if not candidates:
-            continue
+    def count_blocks(script_normalized_dir: Path) -> int:
+        if script_normalized_dir not in block_counts:
+            block_counts[script_normalized_dir] = len(list_tree_files(script_normalized_dir, glob="*.pcode"))
 
-        script_normalized_dir = normalization_dir_a / script_path_in_a
-        script_blocks_on_side_a = len(list_tree_files(script_normalized_dir, glob="*.pcode"))
-        best_match: tuple[float, Path, tuple[list[FileDiff], list[Path], list[Path]]] | None = None
+        return block_counts[script_normalized_dir]
 
-        for candidate in candidates:
-            candidate_normalized_dir = normalization_dir_b / candidate
+    def diff_script_pair(script_path_in_a: Path, script_path_in_b: Path) -> float:
+        if (script_path_in_a, script_path_in_b) not in script_pair_diffs:
             paired_blocks, only_in_a, only_in_b, equal_blocks = diff_file_trees(
-                script_normalized_dir, candidate_normalized_dir, glob="*.pcode"
+                normalization_dir_a / script_path_in_a, normalization_dir_b / script_path_in_b, glob="*.pcode"
+            )
+            similarity = (len(paired_blocks) + len(equal_blocks)) / count_blocks(normalization_dir_a / script_path_in_a)
+            script_pair_diffs[(script_path_in_a, script_path_in_b)] = (
+                similarity,
+                (paired_blocks, only_in_a, only_in_b),
             )
-            similarity = (len(paired_blocks) + len(equal_blocks)) / script_blocks_on_side_a
 
-            if best_match is None or similarity > best_match[0]:
-                best_match = (similarity, candidate, (paired_blocks, only_in_a, only_in_b))
+        return script_pair_diffs[(script_path_in_a, script_path_in_b)][0]
 
-            # Give priority to path identity. If similarity is already good enough don't look any further.
-            # This relies on `_sort_match_candidates_for_script` putting the same-path candidate first.
-            if candidate == script_path_in_a and similarity >= MATCH_SIMILARITY_THRESHOLD:
-                break
+    def pair_scripts(script_path_in_a: Path, script_path_in_b: Path) -> None:
+        unmatched_side_b_scripts.discard(script_path_in_b)
+        unmatched_side_a_scripts.discard(script_path_in_a)
+        paired_script = GfxScript(side_a_path=script_path_in_a, side_b_path=script_path_in_b)
+        diffset.paired_scripts.add(paired_script)
 
-        best_match = cast(tuple, best_match)  # type narrowing for Pyright to calm down
-        similarity, best_candidate, best_candidate_diff = best_match
+        diffset.set_script_block_diff(paired_script, *script_pair_diffs[(script_path_in_a, script_path_in_b)][1])
 
-        if similarity < MATCH_SIMILARITY_THRESHOLD:
-            continue
+    # Give priority to path identity: scripts that kept their path and are similar enough are paired right away.
+    for script_path in sorted(a_side_scripts & b_side_scripts):
+        if diff_script_pair(script_path, script_path) >= MATCH_SIMILARITY_THRESHOLD:
+            pair_scripts(script_path, script_path)
 
-        unmatched_side_b_scripts.discard(best_candidate)
-        unmatched_side_a_scripts.discard(script_path_in_a)
-        paired_script = GfxScript(side_a_path=script_path_in_a, side_b_path=best_candidate)
-        diffset.paired_scripts.add(paired_script)
+    # Moved scripts are found through an index of the block fingerprints of all side B scripts, so that only the few
+    # most similar scripts from other directories are fully compared.
+    side_b_index = _index_scripts(unmatched_side_b_scripts, normalization_dir_b)
+    similarities: dict[tuple[Path, Path], float] = {}
+
+    for script_path_in_a in sorted(unmatched_side_a_scripts):
+        script_normalized_dir = normalization_dir_a / script_path_in_a
+        candidates = _sort_match_candidates_for_script(script_path_in_a, unmatched_side_b_scripts)
+        candidates += _find_cross_directory_candidates(
+            script_path_in_a, script_normalized_dir, side_b_index, unmatched_side_b_scripts
+        )
+        script_blocks_on_side_a = count_blocks(script_normalized_dir)
+
+        for candidate in candidates:
+            # Each block on side A is paired with one block on side B at most, which bounds the similarity.
+            if (
+                min(script_blocks_on_side_a, count_blocks(normalization_dir_b / candidate))
+                < MATCH_SIMILARITY_THRESHOLD * script_blocks_on_side_a
+            ):
+                continue
+
+            if (similarity := diff_script_pair(script_path_in_a, candidate)) >= MATCH_SIMILARITY_THRESHOLD:
+                similarities[(script_path_in_a, candidate)] = similarity
 
-        diffset.set_script_block_diff(paired_script, *best_candidate_diff)
+    # Pairing scripts all at once avoids an early script taking the best match of a later one.
+    for script_path_in_a, script_path_in_b in solve_assignment(similarities):
+        pair_scripts(script_path_in_a, script_path_in_b)
 
     diffset.unmatched_a_scripts = {GfxScript(side_a_path=p) for p in unmatched_side_a_scripts}
     diffset.unmatched_b_scripts = {GfxScript(side_b_path=p) for p in unmatched_side_b_scripts}
@@ -265,7 +369,134 @@ def diff_normalized_script_trees(
     return diffset
 
 
-def refine_block_diffs(diffset: GfxDiffSet, normalization_dir_a: Path, normalization_dir_b: Path) -> GfxDiffSet:
+@traced("comparison")
+def rediff_normalized_script_trees(
+    previous_diffset: GfxDiffSet,
+    a_side_scripts: set[Path],
+    b_side_scripts: set[Path],
+    changed_b_side_scripts: set[Path],
+    normalization_dir_a: Path,
+    normalization_dir_b: Path,
+) -> tuple[GfxDiffSet, set[GfxScript]]:
+    """
+    Update a diffset after side B changed, only diffing again the scripts affected by the change.
+
+    Script pairs from the previous diffset are kept as is when both scripts still differ and the side B script
+    content did not change. All the other scripts go through `diff_normalized_script_trees` again.
+    Return the updated diffset and the paired scripts that were diffed again (and still need refinement).
+    """
+    kept_scripts = {
+        script
+        for script in previous_diffset.paired_scripts
+        if script.side_a_path in a_side_scripts
+        and script.side_b_path in b_side_scripts
+        and script.side_b_path not in changed_b_side_scripts
+    }
+
+    partial_diffset = diff_normalized_script_trees(
+        a_side_scripts - {cast(Path, script.side_a_path) for script in kept_scripts},
+        b_side_scripts - {cast(Path, script.side_b_path) for script in kept_scripts},
+        normalization_dir_a,
+        normalization_dir_b,
+    )
+
+    diffset = GfxDiffSet()
+    diffset.paired_scripts = kept_scripts | partial_diffset.paired_scripts
+    diffset.unmatched_a_scripts = partial_diffset.unmatched_a_scripts
+    diffset.unmatched_b_scripts = partial_diffset.unmatched_b_scripts
+    diffset.paired_scripts_block_diffs = {
+        script: details
+        for script, details in previous_diffset.paired_scripts_block_diffs.items()
+        if script in kept_scripts
+    } | partial_diffset.paired_scripts_block_diffs
+
+    return diffset, partial_diffset.paired_scripts
+
+
+class BlockDiffAlgorithm(StrEnum):
+    """
+    How the lines of two paired blocks are compared.
+
+    LINES compares the whole blocks line by line. CFG splits both blocks into the basic blocks of their control-flow
+    graphs, pairs identical basic blocks by hash, and only compares the remaining basic blocks line by line.
+    """
+
+    LINES = "lines"
+    CFG = "cfg"
+
+
+@dataclass(frozen=True)
+class AlignedBlockDiff:
+    """
+    Rendered lines of a block pair, with side B's labels and registers aligned to side A, and their differences.
+    """
+
+    block_a_lines: list[str]
+    block_b_lines: list[str]
+    text_diff: TextDiff
+    algorithm: BlockDiffAlgorithm
+
+
+def _cfg_segments(lines: list[PcodeLine], rendered_lines: list[str]) -> list[TextSegment]:
+    # Only the basic blocks and their digests are needed to pair them: the edges of the CFG are not built.
+    starts = find_basic_block_starts(lines)
+    ends = starts[1:] + [len(lines)]
+    return [TextSegment(start, end, hash_pcode_lines(rendered_lines[start:end])) for start, end in zip(starts, ends)]
+
+
+def align_and_diff_blocks(
+    block_a: PcodeBlock, block_b: PcodeBlock, algorithm: BlockDiffAlgorithm = BlockDiffAlgorithm.LINES
+) -> AlignedBlockDiff:
+    """
+    Align side B's labels and registers to side A, render both blocks, then compute the differences.
+    """
+    aligned_lines_b = align_pcode_lines(
+        block_b.lines, anchor_lines=block_a.lines, by_basic_blocks=algorithm == BlockDiffAlgorithm.CFG
+    )
+    block_a_lines = [line.render() for line in block_a.lines]
+    block_b_lines = [line.render() for line in aligned_lines_b]
+
+    if algorithm == BlockDiffAlgorithm.CFG:
+        text_diff = diff_segmented_texts(
+            block_a_lines,
+            _cfg_segments(block_a.lines, block_a_lines),
+            block_b_lines,
+            _cfg_segments(aligned_lines_b, block_b_lines),
+        )
+    else:
+        text_diff = diff_texts(block_a_lines, block_b_lines)
+
+    return AlignedBlockDiff(block_a_lines, block_b_lines, text_diff, algorithm)
+
+
+def get_aligned_block_diff(
+    block: GfxScriptBlock,
+    block_a: PcodeBlock,
+    block_b: PcodeBlock,
+    algorithm: BlockDiffAlgorithm = BlockDiffAlgorithm.LINES,
+) -> AlignedBlockDiff:
+    """
+    Get the aligned diff of a paired block, given its normalized blocks on each side.
+
+    The aligned diff is kept by the block, so that the rendering of refined block diffs reuses the work of the
+    refinement, however large the diffset. The returned lines must not be modified.
+    """
+    if block.aligned_diff is not None and block.aligned_diff.algorithm == algorithm:
+        count("aligned block diff reuses")
+        return block.aligned_diff
+
+    block.aligned_diff = align_and_diff_blocks(block_a, block_b, algorithm)
+    return block.aligned_diff
+
+
+@traced("refinement")
+def refine_block_diffs(
+    diffset: GfxDiffSet,
+    normalized_script_blocks_a: dict[Path, list[PcodeBlock]],
+    normalized_script_blocks_b: dict[Path, list[PcodeBlock]],
+    scripts: set[GfxScript] | None = None,
+    algorithm: BlockDiffAlgorithm = BlockDiffAlgorithm.LINES,
+) -> GfxDiffSet:
     """
     Apply post-normalization refinement passes to script block diffs to reduce noise
     that per-script normalization alone cannot eliminate.
@@ -273,19 +504,24 @@ def refine_block_diffs(diffset: GfxDiffSet, normalization_dir_a: Path, normaliza
     Baseline normalization removes most disassembler noise, but any insertion or deletion in p-code
     can cause drift in label and register names, inflating line diffs.
     Re-aligning side B against side A yields more meaningful change counts.
+    The normalized blocks are taken from memory, rather than read back from the normalization directories.
+    If `scripts` is given, only refine the blocks of those scripts.
+    `algorithm` selects how the lines of paired blocks are compared (see `BlockDiffAlgorithm`).
     """
     for script in diffset.get_scripts_with_differing_blocks():
+        if scripts is not None and script not in scripts:
+            continue
+
+        assert script.side_a_path is not None and script.side_b_path is not None
+        blocks_a = {block.name: block for block in normalized_script_blocks_a[script.side_a_path]}
+        blocks_b = {block.name: block for block in normalized_script_blocks_b[script.side_b_path]}
+
         for block in diffset.paired_scripts_block_diffs[script].paired_blocks:
             if not block.is_paired():
                 continue
 
-            block_a = read_file_lines(normalization_dir_a / script.side_a_path / f"{block.side_a_name}.pcode")
-            block_b = read_file_lines(normalization_dir_b / script.side_b_path / f"{block.side_b_name}.pcode")
-
-            block_b = align_labels_in_text(block_b, anchor_lines=block_a)
-            block_b = align_registers_in_text(block_b, anchor_lines=block_a)
-            text_diff = diff_texts(block_a, block_b)
-            block.refined_changed = text_diff.lines_changed
+            aligned = get_aligned_block_diff(block, blocks_a[block.side_a_name], blocks_b[block.side_b_name], algorithm)
+            block.refined_changed = aligned.text_diff.lines_changed
 
     return diffset
 
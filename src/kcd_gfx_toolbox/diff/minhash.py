@@ -0,0 +1,81 @@
+"""
+MinHash signatures and locality-sensitive hashing, to find similar sets among many without comparing all pairs.
+
+The Jaccard similarity of two sets is estimated by the fraction of equal components of their MinHash signatures.
+Signatures are split in bands: two sets sharing at least one identical band are candidates for a closer comparison.
+"""
+
+from collections import defaultdict
+from collections.abc import Hashable, Iterable
+import hashlib
+import random
+from typing import Generic, TypeVar
+
+"""Number of hash functions, i.e. of components of a MinHash signature."""
+MINHASH_SIZE = 64
+
+"""Number of signature components per LSH band. Smaller bands find less similar candidates."""
+LSH_BAND_SIZE = 4
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+# Coefficients of the `(a * x + b) mod p` hash functions. The seed is fixed, so that signatures are reproducible.
+_rng = random.Random(0x5EED)
+_HASH_COEFFICIENTS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(MINHASH_SIZE)
+]
+del _rng
+
+K = TypeVar("K", bound=Hashable)
+
+
+def minhash_signature(features: Iterable[str]) -> tuple[int, ...] | None:
+    """
+    Compute the MinHash signature of a set of features, or None if the set is empty.
+    """
+    hashes = {int.from_bytes(hashlib.blake2b(f.encode(), digest_size=8).digest()) for f in features}
+
+    if not hashes:
+        return None
+
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _HASH_COEFFICIENTS)
+
+
+def estimate_jaccard_similarity(signature1: tuple[int, ...], signature2: tuple[int, ...]) -> float:
+    return sum(1 for h1, h2 in zip(signature1, signature2) if h1 == h2) / MINHASH_SIZE
+
+
+class MinHashLshIndex(Generic[K]):
+    """
+    Index of MinHash signatures, queried for the keys of the signatures sharing at least one band with another one.
+    """
+
+    def __init__(self):
+        self.signatures: dict[K, tuple[int, ...]] = {}
+        self._buckets: defaultdict[tuple[int, tuple[int, ...]], set[K]] = defaultdict(set)
+
+    @staticmethod
+    def _bands(signature: tuple[int, ...]) -> Iterable[tuple[int, tuple[int, ...]]]:
+        for start in range(0, MINHASH_SIZE, LSH_BAND_SIZE):
+            yield start, signature[start : start + LSH_BAND_SIZE]
+
+    def add(self, key: K, signature: tuple[int, ...]) -> None:
+        self.signatures[key] = signature
+
+        for band in self._bands(signature):
+            self._buckets[band].add(key)
+
+    def query(self, signature: tuple[int, ...], min_similarity: float = 0.0) -> list[tuple[float, K]]:
+        """
+        Return the `(estimated similarity, key)` of the candidates similar to a signature, most similar first.
+        """
+        keys: set[K] = set()
+
+        for band in self._bands(signature):
+            keys.update(self._buckets.get(band, ()))
+
+        candidates = [(estimate_jaccard_similarity(signature, self.signatures[key]), key) for key in keys]
+        candidates = [candidate for candidate in candidates if candidate[0] >= min_similarity]
+        candidates.sort(key=lambda candidate: (-candidate[0], str(candidate[1])))
+
+        return candidates
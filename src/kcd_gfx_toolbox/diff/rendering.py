@@ -3,17 +3,15 @@ Data preparation and Rich component builders for rendering a GfxDiffSet: sorting
 source, slicing differing blocks into hunks, and assembling renderable split or unified layouts.
 """
 
-from collections.abc import Iterable
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass, field
 from enum import StrEnum
 from pathlib import Path
-from typing import Literal
+from typing import TYPE_CHECKING, Literal
 from rich.markup import escape
-from pygments.lexer import Lexer
-from pygments.lexers import ActionScriptLexer
 
-from kcd_gfx_toolbox.avm1.pcode_alignment import align_labels_in_text, align_registers_in_text
 from kcd_gfx_toolbox.avm1.pcode_parsing import PcodeBlock, merge_pcode_lines_sources
+from kcd_gfx_toolbox.instrumentation import traced
 from kcd_gfx_toolbox.swd import (
     build_pcode_to_actionscript_line_map,
     parse_swd_file,
@@ -23,16 +21,21 @@ from kcd_gfx_toolbox.utils import read_file_lines
 from kcd_gfx_toolbox.workspace import Workspace
 from .core import (
     DiffAnnotatedHunk,
+    TextDiffSpan,
     TextHunk,
     align_hunk_pair_edge_context,
     cut_text_hunk_with_context,
     diff_text_hunks,
     diff_texts,
 )
-from .gfx import GfxDiffSet, GfxScript, GfxScriptBlock
+from .gfx import BlockDiffAlgorithm, GfxDiffSet, GfxScript, GfxScriptBlock, get_aligned_block_diff
+from .unified_format import iter_unidiff_patch_lines, split_patch_lines
 from kcd_gfx_toolbox.view.split_layout import SplitLayout, SplitLayoutMessagePane
 from kcd_gfx_toolbox.view.unified_layout import UnifiedLayout
 
+if TYPE_CHECKING:
+    from pygments.lexer import Lexer
+
 
 class DiffSortOrder(StrEnum):
     NATURAL = "natural"
@@ -48,6 +51,22 @@ class DiffFilter:
     def __bool__(self) -> bool:
         return self.script is not None or self.block is not None
 
+    def matches_script_path(self, path: Path) -> bool:
+        return self.script is None or self.script in path.as_posix().lower()
+
+    def matches_script(self, script: GfxScript) -> bool:
+        return self.script is None or any(
+            path is not None and self.matches_script_path(path) for path in (script.side_a_path, script.side_b_path)
+        )
+
+    def matches_block(self, block: GfxScriptBlock) -> bool:
+        return self.block is None or any(
+            name is not None and self.block in name.lower() for name in (block.side_a_name, block.side_b_name)
+        )
+
+    def filter_script_paths(self, paths: set[Path]) -> set[Path]:
+        return {path for path in paths if self.matches_script_path(path)}
+
 
 class DiffLayout(StrEnum):
     UNIFIED = "unified"
@@ -83,18 +102,7 @@ def get_sorted_and_filtered_script_block_pairs(
     List pairs of differing scripts and blocks, applying desired filters and sorting.
     """
     pairs: list[tuple[GfxScript, GfxScriptBlock]] = []
-    scripts: list[GfxScript] = []
-
-    for script in diffset.get_scripts_with_differing_blocks():
-        if filters.script is None:
-            scripts.append(script)
-            continue
-
-        if (script.side_a_path is not None and filters.script in script.side_a_path.as_posix().lower()) or (
-            script.side_b_path is not None and filters.script in script.side_b_path.as_posix().lower()
-        ):
-            scripts.append(script)
-
+    scripts = [script for script in diffset.get_scripts_with_differing_blocks() if filters.matches_script(script)]
     scripts.sort(key=lambda s: s.path_sort_key())
 
     for script in scripts:
@@ -102,14 +110,7 @@ def get_sorted_and_filtered_script_block_pairs(
             diffset.paired_scripts_block_diffs[script].get_differing_blocks(),
             key=lambda b: (b.position, b.name_sort_key()),
         )
-
-        for block in blocks:
-            if (
-                filters.block is None
-                or (block.side_a_name is not None and filters.block in block.side_a_name.lower())
-                or (block.side_b_name is not None and filters.block in block.side_b_name.lower())
-            ):
-                pairs.append((script, block))
+        pairs.extend((script, block) for block in blocks if filters.matches_block(block))
 
     if sort_order == DiffSortOrder.CHANGES_ASC:
         pairs.sort(key=lambda p: (p[1].refined_changed, p[0].path_sort_key(), p[1].name_sort_key()))
@@ -141,31 +142,35 @@ def _find_pcode_block_by_name(blocks: Iterable, name: str | None) -> PcodeBlock
 
 
 def _pcode_block_render_data(
-    block: GfxScriptBlock, block_side_a: PcodeBlock | None, block_side_b: PcodeBlock | None
+    block: GfxScriptBlock,
+    block_side_a: PcodeBlock | None,
+    block_side_b: PcodeBlock | None,
+    algorithm: BlockDiffAlgorithm = BlockDiffAlgorithm.LINES,
 ) -> tuple[list[str], list[str], list[RenderDiffSpanPair]]:
     """
     For a given block, align side B's labels and registers to side A, compute the differences,
     then return plain-text block lines and diff spans for each side.
     """
+    if block.is_paired():
+        assert block_side_a is not None and block_side_b is not None
+        # Use diff spans of aligned lines: block.diff_spans was computed on normalized but
+        # unaligned block content and would reference lines that, after label/register alignment,
+        # no longer actually differ, producing spurious hunks of unchanged content.
+        # The alignment was already done by the refinement, and is kept by the block.
+        aligned = get_aligned_block_diff(block, block_side_a, block_side_b, algorithm)
+        aligned_diff_spans = [RenderDiffSpanPair(a, b) for a, b in aligned.text_diff.spans]
+        return aligned.block_a_lines, aligned.block_b_lines, aligned_diff_spans
+
+    # For unmatched blocks there are no diff spans, so we have no choice but to display the whole block.
     block_a_lines = [ln.render() for ln in block_side_a.lines] if block_side_a else []
     block_b_lines = [ln.render() for ln in block_side_b.lines] if block_side_b else []
-    block_b_lines = align_labels_in_text(block_b_lines, anchor_lines=block_a_lines)
-    block_b_lines = align_registers_in_text(block_b_lines, anchor_lines=block_a_lines)
-
     diff_spans: list[RenderDiffSpanPair] = []
 
-    if block.is_paired():
-        # Recompute diff spans on aligned lines: block.diff_spans was computed on normalized but
-        # unaligned block content and would reference lines that, after label/register alignment,
-        # no longer actually differ, producing spurious hunks of unchanged content.
-        diff_spans = [RenderDiffSpanPair(a, b) for a, b in diff_texts(block_a_lines, block_b_lines).spans]
-    else:
-        # For unmatched blocks there are no diff spans, so we have no choice but to display the whole block.
-        if block_side_a is not None:
-            diff_spans.append(RenderDiffSpanPair(a=(0, len(block_side_a)), b=None))
+    if block_side_a is not None:
+        diff_spans.append(RenderDiffSpanPair(a=(0, len(block_side_a)), b=None))
 
-        if block_side_b is not None:
-            diff_spans.append(RenderDiffSpanPair(a=None, b=(0, len(block_side_b))))
+    if block_side_b is not None:
+        diff_spans.append(RenderDiffSpanPair(a=None, b=(0, len(block_side_b))))
 
     return block_a_lines, block_b_lines, diff_spans
 
@@ -257,17 +262,20 @@ def _assemble_block_hunk_pairs(
     return hunk_pairs
 
 
+@traced("render preparation")
 def prepare_diffset_pcode_render(
     diffset: GfxDiffSet,
     normalized_script_blocks_a: dict[Path, list[PcodeBlock]],
     normalized_script_blocks_b: dict[Path, list[PcodeBlock]],
     sort_order: DiffSortOrder,
     filters: DiffFilter,
+    algorithm: BlockDiffAlgorithm = BlockDiffAlgorithm.LINES,
 ) -> list[RenderableBlockDiff]:
     """
     Build the renderable elements for a p-code diff.
 
     Sort and filter differing script blocks, then slice each block into context-padded p-code hunk pairs.
+    `algorithm` must be the one used by the refinement, so that its block diffs are reused.
     """
     renderables: list[RenderableBlockDiff] = []
     sorted_pairs = get_sorted_and_filtered_script_block_pairs(diffset, sort_order, filters)
@@ -284,7 +292,9 @@ def prepare_diffset_pcode_render(
         block_side_a = _find_pcode_block_by_name(script_a_blocks, block.side_a_name)
         block_side_b = _find_pcode_block_by_name(script_b_blocks, block.side_b_name)
 
-        block_a_lines, block_b_lines, diff_spans = _pcode_block_render_data(block, block_side_a, block_side_b)
+        block_a_lines, block_b_lines, diff_spans = _pcode_block_render_data(
+            block, block_side_a, block_side_b, algorithm
+        )
         hunk_pairs = _assemble_block_hunk_pairs(diff_spans, block_a_lines, block_b_lines)
 
         renderables.append(
@@ -542,6 +552,7 @@ def _resolve_actionscript_block_spans(
     return _merge_overlapping_span_pairs(as_diff_spans)
 
 
+@traced("render preparation")
 def prepare_diffset_actionscript_render(
     diffset: GfxDiffSet,
     workspace_a: Workspace,
@@ -726,11 +737,27 @@ def build_split_layout_for_hunk_pair(
     syntax_lexer: Lexer | None = None
 
     if block_diff.lang == "actionscript":
+        from pygments.lexers import ActionScriptLexer
+
         syntax_lexer = ActionScriptLexer()
 
     return SplitLayout.from_pair(side_a, side_b, syntax_lexer=syntax_lexer, word_wrap=True)
 
 
+def _diff_block_hunk_pairs(block_diff: RenderableBlockDiff) -> list[tuple[DiffAnnotatedHunk, DiffAnnotatedHunk]]:
+    """
+    Classify each hunk pair of a block diff into context / deletion / insertion segments via `diff_text_hunks`.
+    """
+    diff_hunk_pairs: list[tuple[DiffAnnotatedHunk, DiffAnnotatedHunk]] = []
+
+    for hunk_a, hunk_b in block_diff.hunk_pairs:
+        hunk_a = hunk_a if hunk_a is not None else TextHunk()
+        hunk_b = hunk_b if hunk_b is not None else TextHunk()
+        diff_hunk_pairs.append(diff_text_hunks(hunk_a, hunk_b))
+
+    return diff_hunk_pairs
+
+
 def build_unified_layout_for_block_diff(block_diff: RenderableBlockDiff) -> UnifiedLayout:
     """
     Build a UnifiedLayout for a whole block diff: one `--- / +++` header pair, and one `@@` header
@@ -747,15 +774,145 @@ def build_unified_layout_for_block_diff(block_diff: RenderableBlockDiff) -> Unif
         else:
             return None
 
-    diff_hunk_pairs: list[tuple[DiffAnnotatedHunk, DiffAnnotatedHunk]] = []
-
-    for hunk_a, hunk_b in block_diff.hunk_pairs:
-        hunk_a = hunk_a if hunk_a is not None else TextHunk()
-        hunk_b = hunk_b if hunk_b is not None else TextHunk()
-        diff_hunk_pairs.append(diff_text_hunks(hunk_a, hunk_b))
-
     return UnifiedLayout(
         _side_path(script.side_a_path, block.side_a_name),
         _side_path(script.side_b_path, block.side_b_name),
-        diff_hunk_pairs,
+        _diff_block_hunk_pairs(block_diff),
+    )
+
+
+@dataclass(frozen=True)
+class FilePatch:
+    """
+    Differences between the two versions of a workspace file, to be written as a patch in unified format.
+
+    Lines keep their line feed (see `split_patch_lines`), and `spans` are all their differing spans. Only the hunks
+    holding one of `selected_spans` are part of the patch, or all of them if None.
+    """
+
+    script: GfxScript
+    side_a_path: str | None
+    side_b_path: str | None
+    side_a_lines: list[str]
+    side_b_lines: list[str]
+    spans: list[TextDiffSpan]
+    selected_spans: set[TextDiffSpan] | None = None
+
+
+@traced("render preparation")
+def prepare_diffset_pcode_patches(
+    diffset: GfxDiffSet,
+    normalized_script_blocks_a: dict[Path, list[PcodeBlock]],
+    normalized_script_blocks_b: dict[Path, list[PcodeBlock]],
+    sort_order: DiffSortOrder,
+    filters: DiffFilter,
+) -> list[FilePatch]:
+    """
+    Build the patches of the normalized block files, relative to the normalization directory: one per differing block.
+
+    Patches are computed on the normalized blocks as written on disk: unlike the rendered diffs, side B's labels and
+    registers are not aligned to side A, so that applying the patches to side A gives side B.
+    """
+    patches: list[FilePatch] = []
+    sorted_pairs = get_sorted_and_filtered_script_block_pairs(diffset, sort_order, filters)
+
+    if filters and not sorted_pairs:
+        raise RuntimeError("No script or block name matches the provided filters.")
+
+    for script, block in sorted_pairs:
+        assert script.side_a_path is not None  # type guard for static analyzers
+        assert script.side_b_path is not None
+
+        block_side_a = _find_pcode_block_by_name(
+            normalized_script_blocks_a.get(script.side_a_path, []), block.side_a_name
+        )
+        block_side_b = _find_pcode_block_by_name(
+            normalized_script_blocks_b.get(script.side_b_path, []), block.side_b_name
+        )
+
+        # Normalized block files hold the rendered lines, each one ended by a line feed.
+        block_a_lines = [ln.render() + "\n" for ln in block_side_a.lines] if block_side_a else []
+        block_b_lines = [ln.render() + "\n" for ln in block_side_b.lines] if block_side_b else []
+
+        patches.append(
+            FilePatch(
+                script=script,
+                side_a_path=f"{script.side_a_path.as_posix()}/{block.side_a_name}.pcode" if block_side_a else None,
+                side_b_path=f"{script.side_b_path.as_posix()}/{block.side_b_name}.pcode" if block_side_b else None,
+                side_a_lines=block_a_lines,
+                side_b_lines=block_b_lines,
+                spans=diff_texts(block_a_lines, block_b_lines).spans,
+            )
+        )
+
+    return patches
+
+
+@traced("render preparation")
+def prepare_actionscript_patches(
+    block_diffs: list[RenderableBlockDiff], workspace_a: Workspace, workspace_b: Workspace
+) -> list[FilePatch]:
+    """
+    Build the patches of the ActionScript files, relative to the extracted scripts directory: one per script.
+
+    Both versions of a script are diffed as a whole, so that line numbers and context are exact, and insertions are
+    anchored where they belong on side A. Only the hunks touching the differing lines of the block diffs are kept.
+    Block diffs must have been resolved to ActionScript: a p-code fallback does not apply to ActionScript files.
+    """
+    differing_lines_by_script: dict[GfxScript, tuple[set[int], set[int]]] = {}
+
+    for block_diff in block_diffs:
+        if block_diff.lang != "actionscript":
+            raise ValueError("Only block diffs resolved to ActionScript can be written as ActionScript patches.")
+
+        differing_lines_a, differing_lines_b = differing_lines_by_script.setdefault(block_diff.script, (set(), set()))
+
+        for hunk_a, hunk_b in block_diff.hunk_pairs:
+            differing_lines_a.update(ln.index for ln in hunk_a or () if not ln.is_context)
+            differing_lines_b.update(ln.index for ln in hunk_b or () if not ln.is_context)
+
+    patches: list[FilePatch] = []
+
+    for script, (differing_lines_a, differing_lines_b) in differing_lines_by_script.items():
+        assert script.side_a_path is not None  # type guard for static analyzers
+        assert script.side_b_path is not None
+
+        file_a = workspace_a.find_actionscript_file(script.side_a_path)
+        file_b = workspace_b.find_actionscript_file(script.side_b_path)
+        # Read as bytes: carriage returns must be kept for the patch to apply.
+        script_a_lines = split_patch_lines(file_a.read_bytes().decode("utf-8", errors="replace"))
+        script_b_lines = split_patch_lines(file_b.read_bytes().decode("utf-8", errors="replace"))
+        spans = diff_texts(script_a_lines, script_b_lines).spans
+
+        patches.append(
+            FilePatch(
+                script=script,
+                side_a_path=file_a.relative_to(workspace_a.extraction_path("scripts")).as_posix(),
+                side_b_path=file_b.relative_to(workspace_b.extraction_path("scripts")).as_posix(),
+                side_a_lines=script_a_lines,
+                side_b_lines=script_b_lines,
+                spans=spans,
+                selected_spans={
+                    span
+                    for span in spans
+                    if not differing_lines_a.isdisjoint(range(*span.a))
+                    or not differing_lines_b.isdisjoint(range(*span.b))
+                },
+            )
+        )
+
+    return patches
+
+
+def iter_file_patch_lines(patch: FilePatch) -> Iterator[str]:
+    """
+    Yield the lines of a file patch in unified format. No Rich object is built.
+    """
+    return iter_unidiff_patch_lines(
+        patch.side_a_path,
+        patch.side_b_path,
+        patch.side_a_lines,
+        patch.side_b_lines,
+        patch.spans,
+        span_filter=patch.selected_spans.__contains__ if patch.selected_spans is not None else None,
     )
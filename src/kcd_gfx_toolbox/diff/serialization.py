@@ -0,0 +1,121 @@
+"""
+Machine-readable serialization of a GfxDiffSet and its block diffs, as JSON-compatible records.
+
+Records are plain dicts built straight from the diff data, without any Rich component. They are written as a single
+JSON document, or streamed as NDJSON (one record per line).
+"""
+
+from collections.abc import Iterator
+from enum import StrEnum
+from pathlib import Path
+from typing import Any, Literal
+
+from .core import TextHunk, TextHunkLine, diff_text_hunks
+from .gfx import GfxDiffSet, GfxScript, GfxScriptBlock
+from .rendering import RenderableBlockDiff
+
+
+class DiffOutputFormat(StrEnum):
+    RICH = "rich"
+    JSON = "json"
+    NDJSON = "ndjson"
+    PATCH = "patch"
+
+
+def _path(path: Path | None) -> str | None:
+    return path.as_posix() if path is not None else None
+
+
+def _state(side_a: object | None, side_b: object | None) -> Literal["modified", "deleted", "created"]:
+    if side_a is not None and side_b is not None:
+        return "modified"
+    return "deleted" if side_b is None else "created"
+
+
+def serialize_script(script: GfxScript) -> dict[str, Any]:
+    return {
+        "side_a_path": _path(script.side_a_path),
+        "side_b_path": _path(script.side_b_path),
+        "state": _state(script.side_a_path, script.side_b_path),
+        "renamed": script.was_renamed(),
+    }
+
+
+def serialize_block(block: GfxScriptBlock) -> dict[str, Any]:
+    return {
+        "side_a_name": block.side_a_name,
+        "side_b_name": block.side_b_name,
+        "state": _state(block.side_a_name, block.side_b_name),
+        "renamed": block.was_renamed(),
+        "position": block.position,
+        "changed": block.changed,
+        "refined_changed": block.refined_changed,
+        "diff_spans": [{"a": list(span.a), "b": list(span.b)} for span in block.diff_spans],
+    }
+
+
+def serialize_summary(diffset: GfxDiffSet) -> dict[str, Any]:
+    return {
+        "scripts_modified": len(diffset.get_scripts_with_differing_blocks()),
+        "scripts_deleted": len(diffset.unmatched_a_scripts),
+        "scripts_created": len(diffset.unmatched_b_scripts),
+        "blocks_modified": diffset.get_modified_block_count(),
+        "blocks_deleted": diffset.get_unmatched_block_side_a_count(),
+        "blocks_created": diffset.get_unmatched_block_side_b_count(),
+        "lines_changed": diffset.get_modified_block_line_count(),
+        "refined_lines_changed": sum(
+            sum(block.refined_changed for block in details.paired_blocks)
+            for details in diffset.paired_scripts_block_diffs.values()
+        ),
+    }
+
+
+def iter_serialized_scripts(diffset: GfxDiffSet) -> Iterator[dict[str, Any]]:
+    """
+    Yield every differing script, sorted by path, with its differing blocks (for paired scripts) sorted by position.
+    """
+    for script in sorted(diffset.get_differing_scripts(), key=lambda s: s.path_sort_key()):
+        record = serialize_script(script)
+
+        if script.is_paired():
+            blocks = diffset.paired_scripts_block_diffs[script].get_differing_blocks()
+            record["blocks"] = [
+                serialize_block(block)
+                for block in sorted(blocks, key=lambda b: (b.position is None, b.position or 0, b.name_sort_key()))
+            ]
+
+        yield record
+
+
+def _line_kind(line: TextHunkLine) -> Literal["context", "deletion", "addition"]:
+    if line.is_deletion:
+        return "deletion"
+    if line.is_addition:
+        return "addition"
+    return "context"
+
+
+def serialize_block_diff(block_diff: RenderableBlockDiff) -> dict[str, Any]:
+    """
+    Serialize the hunks of a block diff. Each line is annotated as context, deletion or addition, as in the unified
+    layout.
+    """
+    hunks = []
+
+    for hunk_a, hunk_b in block_diff.hunk_pairs:
+        diffed_a, diffed_b = diff_text_hunks(hunk_a or TextHunk(), hunk_b or TextHunk())
+        hunks.append(
+            {
+                side: [{"number": line.number, "text": line.text, "kind": _line_kind(line)} for line in diffed.lines()]
+                for side, diffed in (("a", diffed_a), ("b", diffed_b))
+            }
+        )
+
+    return {
+        "script": serialize_script(block_diff.script),
+        "block": serialize_block(block_diff.block),
+        "lang": block_diff.lang,
+        "side_a_resolved": block_diff.side_a_resolved,
+        "side_b_resolved": block_diff.side_b_resolved,
+        "hunks": hunks,
+    }
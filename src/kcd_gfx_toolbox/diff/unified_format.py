@@ -4,12 +4,27 @@ A set of helpers to render diffs in the "unified format" (per GNU diffutils, Git
 See https://www.gnu.org/software/diffutils/manual/html_node/Detailed-Unified.html.
 """
 
-from collections.abc import Iterator
+from collections.abc import Callable, Iterator
 from typing import Literal
-from rich.markup import escape
-from rich.text import Text
+from rich.text import Span, Text
 
-from .core import DiffAnnotatedHunk
+from .core import DiffAnnotatedHunk, TextDiffSpan
+
+
+"""Kind of a line in "unified format"."""
+UnidiffLineKind = Literal["file_header", "hunk_header", "context", "deletion", "insertion"]
+
+"""Marker following a line without line terminator, at the end of a file."""
+NO_NEWLINE_AT_END_OF_FILE = "\\ No newline at end of file"
+
+"""Rich style of each kind of line, to appear as a git diff in the terminal."""
+UNIDIFF_LINE_STYLES: dict[UnidiffLineKind, str | None] = {
+    "file_header": "bold",
+    "hunk_header": "cyan",
+    "context": None,
+    "deletion": "red",
+    "insertion": "green",
+}
 
 
 def unidiff_file_diff(
@@ -24,11 +39,24 @@ def unidiff_file_diff(
     If the file was created, `side_a_path` should be None.
     If the file was deleted, `side_b_path` should be None.
     """
+    for kind, line in iter_unidiff_lines_with_kind(side_a_path, side_b_path, hunk_pairs):
+        style = UNIDIFF_LINE_STYLES[kind]
+        yield Text(line, spans=[Span(0, len(line), style)]) if style else Text(line)
+
+
+def iter_unidiff_lines_with_kind(
+    side_a_path: str | None,
+    side_b_path: str | None,
+    hunk_pairs: list[tuple[DiffAnnotatedHunk, DiffAnnotatedHunk]],
+) -> Iterator[tuple[UnidiffLineKind, str]]:
+    """
+    Yield diff lines in "unified format" for a single file, as plain strings along with their kind.
+    """
     if side_a_path is None and side_b_path is None:
         raise ValueError("At least one side must be defined.")
 
-    yield Text.from_markup(f"[bold]{escape(unidiff_file_header(side_a_path, 'a'))}[/bold]")
-    yield Text.from_markup(f"[bold]{escape(unidiff_file_header(side_b_path, 'b'))}[/bold]")
+    yield "file_header", unidiff_file_header(side_a_path, "a")
+    yield "file_header", unidiff_file_header(side_b_path, "b")
 
     for diffed_a, diffed_b in hunk_pairs:
         a_lines = diffed_a.lines()
@@ -40,8 +68,7 @@ def unidiff_file_diff(
         # 1-based start indices, with the unified-diff convention of 0 when the side has no lines.
         a_start = a_lines[0].number if a_lines else 0
         b_start = b_lines[0].number if b_lines else 0
-        hunk_header = unidiff_hunk_header(a_start, len(a_lines), b_start, len(b_lines))
-        yield Text.from_markup(f"[cyan]{hunk_header}[/cyan]")
+        yield "hunk_header", unidiff_hunk_header(a_start, len(a_lines), b_start, len(b_lines))
 
         # diff_text_hunks produces two DiffAnnotatedHunk of equal length whose segments are pairwise
         # aligned: either a shared-context segment (both sides equal) or a replace/insert/
@@ -52,12 +79,113 @@ def unidiff_file_diff(
             if is_context_seg:
                 # Context lines are identical on both sides; emit only once.
                 for ln in seg_a:
-                    yield Text(unidiff_context_line(ln.text))
+                    yield "context", unidiff_context_line(ln.text)
             else:
                 for ln in seg_a:
-                    yield Text.from_markup(f"[red]{escape(unidiff_deletion_line(ln.text))}[/red]")
+                    yield "deletion", unidiff_deletion_line(ln.text)
                 for ln in seg_b:
-                    yield Text.from_markup(f"[green]{escape(unidiff_insertion_line(ln.text))}[/green]")
+                    yield "insertion", unidiff_insertion_line(ln.text)
+
+
+def split_patch_lines(text: str) -> list[str]:
+    """
+    Split a text into lines, keeping their line feed. Unlike `str.splitlines`, only line feeds end a line, so that
+    joining the lines gives back the text, as expected to write patches.
+    """
+    lines = text.split("\n")
+    last_line = lines.pop()
+    lines = [line + "\n" for line in lines]
+
+    if last_line:
+        lines.append(last_line)
+
+    return lines
+
+
+def iter_unidiff_patch_lines(
+    side_a_path: str | None,
+    side_b_path: str | None,
+    side_a_lines: list[str],
+    side_b_lines: list[str],
+    spans: list[TextDiffSpan],
+    span_filter: Callable[[TextDiffSpan], bool] | None = None,
+    context_length: int = 3,
+) -> Iterator[str]:
+    """
+    Yield a Git-flavored patch in "unified format" for a single file, as plain strings without line terminator.
+
+    Lines of both sides keep their line feed (see `split_patch_lines`), and `spans` are all their differing spans, in
+    ascending order (see `diff_texts`). Spans closer than twice the context length share a hunk. If `span_filter` is
+    given, the hunks without any span satisfying it are left out. Line numbers and context lines come from the whole
+    file on each side, so that the patch applies with `git apply`.
+    No Rich object is built: this is the fast path to write patch files.
+    """
+    if side_a_path is None and side_b_path is None:
+        raise ValueError("At least one side must be defined.")
+
+    groups: list[list[TextDiffSpan]] = []
+
+    for span in spans:
+        if groups and span.a[0] - groups[-1][-1].a[1] <= 2 * context_length:
+            groups[-1].append(span)
+        else:
+            groups.append([span])
+
+    if span_filter is not None:
+        groups = [group for group in groups if any(span_filter(span) for span in group)]
+
+    # Nothing to patch when a file keeps its path and its selected contents.
+    if not groups and side_a_path == side_b_path:
+        return
+
+    # Git extended headers, to create, delete or rename files.
+    yield f"diff --git a/{side_a_path or side_b_path} b/{side_b_path or side_a_path}"
+
+    if side_a_path is None:
+        yield "new file mode 100644"
+    elif side_b_path is None:
+        yield "deleted file mode 100644"
+    elif side_a_path != side_b_path:
+        yield f"rename from {side_a_path}"
+        yield f"rename to {side_b_path}"
+
+    if not groups:
+        return
+
+    yield unidiff_file_header(side_a_path, "a")
+    yield unidiff_file_header(side_b_path, "b")
+
+    def _lines(lines: list[str], format_line: Callable[[str], str]) -> Iterator[str]:
+        for line in lines:
+            yield format_line(line.removesuffix("\n"))
+
+            if not line.endswith("\n"):
+                yield NO_NEWLINE_AT_END_OF_FILE
+
+    for group in groups:
+        # Context lines are equal on both sides, so the hunk spans as many of them on each side.
+        a_start = max(0, group[0].a[0] - context_length)
+        a_end = min(len(side_a_lines), group[-1].a[1] + context_length)
+        b_start = group[0].b[0] - (group[0].a[0] - a_start)
+        b_end = group[-1].b[1] + (a_end - group[-1].a[1])
+
+        # 1-based start indices, or the line before an empty side.
+        yield unidiff_hunk_header(
+            a_start + 1 if a_end > a_start else a_start,
+            a_end - a_start,
+            b_start + 1 if b_end > b_start else b_start,
+            b_end - b_start,
+        )
+
+        position = a_start
+
+        for span in group:
+            yield from _lines(side_a_lines[position : span.a[0]], unidiff_context_line)
+            yield from _lines(side_a_lines[span.a[0] : span.a[1]], unidiff_deletion_line)
+            yield from _lines(side_b_lines[span.b[0] : span.b[1]], unidiff_insertion_line)
+            position = span.a[1]
+
+        yield from _lines(side_a_lines[position:a_end], unidiff_context_line)
 
 
 def unidiff_file_header(path: str | None, side: Literal["a", "b"]) -> str:
@@ -2,6 +2,7 @@ from pathlib import Path
 import platform
 import shutil
 import subprocess
+from .instrumentation import count, span
 
 
 def resolve_ffdec(arg: Path | None) -> Path:
@@ -33,25 +34,28 @@ def resolve_ffdec(arg: Path | None) -> Path:
     return ffdec_path
 
 
+def _run_ffdec(args: list[str]) -> subprocess.CompletedProcess:
+    with span("ffdec", command=" ".join(args[1:])):
+        count("ffdec calls")
+        return subprocess.run(
+            args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            check=True,
+        )
+
+
 def extract_gfx_pcode(ffdec_bin_path: Path, file_path: Path, output_dir: Path):
-    return subprocess.run(
-        [str(ffdec_bin_path), "-format", "script:pcode", "-export", "script", str(output_dir), str(file_path)],
-        stdin=subprocess.DEVNULL,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.PIPE,
-        text=True,
-        check=True,
+    return _run_ffdec(
+        [str(ffdec_bin_path), "-format", "script:pcode", "-export", "script", str(output_dir), str(file_path)]
     )
 
 
 def extract_gfx_actionscript(ffdec_bin_path: Path, file_path: Path, output_dir: Path):
-    return subprocess.run(
-        [str(ffdec_bin_path), "-format", "script:as", "-export", "script", str(output_dir), str(file_path)],
-        stdin=subprocess.DEVNULL,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.PIPE,
-        text=True,
-        check=True,
+    return _run_ffdec(
+        [str(ffdec_bin_path), "-format", "script:as", "-export", "script", str(output_dir), str(file_path)]
     )
 
 
@@ -59,7 +63,7 @@ def extract_gfx_debug_swd(ffdec_bin_path: Path, file_path: Path, output_dir: Pat
     debug_file_name = f"debug_{'pcode' if pcode else 'actionscript'}"
     output_path = output_dir / debug_file_name
 
-    result = subprocess.run(
+    result = _run_ffdec(
         [
             str(ffdec_bin_path),
             "-enabledebugging",
@@ -67,12 +71,7 @@ def extract_gfx_debug_swd(ffdec_bin_path: Path, file_path: Path, output_dir: Pat
             *(["-pcode"] if pcode else []),
             str(file_path),
             str(output_path),
-        ],
-        stdin=subprocess.DEVNULL,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.PIPE,
-        text=True,
-        check=True,
+        ]
     )
 
     # A .swd file has been created along with output_path. This is the target file.
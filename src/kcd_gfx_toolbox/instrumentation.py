@@ -0,0 +1,201 @@
+"""
+Lightweight instrumentation of the pipeline: timed spans and counters.
+
+Nothing is recorded unless profiling is enabled, so instrumented code only pays a flag check.
+Recorded data can be summarized per span name, or exported as a Chrome trace (chrome://tracing, Perfetto).
+"""
+
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import functools
+import json
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Any, ParamSpec, TypeVar
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+_enabled = False
+_lock = threading.Lock()
+_thread_state = threading.local()
+_origin_ns = 0
+_spans: list["SpanRecord"] = []
+_counters: dict[str, int] = {}
+
+
+@dataclass(frozen=True)
+class SpanRecord:
+    """
+    One completed span: a named and timed section of code.
+    """
+
+    name: str
+    start_ns: int
+    duration_ns: int
+    self_duration_ns: int
+    thread_id: int
+    args: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class SpanSummary:
+    """
+    Aggregated timings of all the spans with the same name.
+    """
+
+    name: str
+    calls: int
+    total_ns: int
+    self_ns: int
+
+
+def enable_profiling():
+    """Start recording spans and counters, discarding anything recorded before."""
+    global _enabled, _origin_ns
+
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        _origin_ns = time.perf_counter_ns()
+        _enabled = True
+
+
+def disable_profiling():
+    """Stop recording spans and counters. Recorded data is kept."""
+    global _enabled
+    _enabled = False
+
+
+def profiling_enabled() -> bool:
+    return _enabled
+
+
+@contextmanager
+def span(name: str, **args: Any) -> Iterator[None]:
+    """
+    Time the enclosed code as a span. Spans can be nested: the time spent in child spans is excluded
+    from the self duration of their parent.
+    """
+    if not _enabled:
+        yield
+        return
+
+    stack: list[list[int]] | None = getattr(_thread_state, "stack", None)
+
+    if stack is None:
+        stack = _thread_state.stack = []
+
+    # [start time, accumulated duration of direct children]
+    frame = [time.perf_counter_ns(), 0]
+    stack.append(frame)
+
+    try:
+        yield
+    finally:
+        duration_ns = time.perf_counter_ns() - frame[0]
+        stack.pop()
+
+        if stack:
+            stack[-1][1] += duration_ns
+
+        record = SpanRecord(
+            name=name,
+            start_ns=frame[0] - _origin_ns,
+            duration_ns=duration_ns,
+            self_duration_ns=duration_ns - frame[1],
+            thread_id=threading.get_ident(),
+            args={key: str(value) for key, value in args.items()},
+        )
+
+        with _lock:
+            _spans.append(record)
+
+
+def traced(name: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """
+    Decorate a function so that each of its calls is recorded as a span.
+    """
+
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            if not _enabled:
+                return func(*args, **kwargs)
+
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, value: int = 1):
+    """Increment a counter."""
+    if not _enabled:
+        return
+
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def get_spans() -> list[SpanRecord]:
+    with _lock:
+        return list(_spans)
+
+
+def get_counters() -> dict[str, int]:
+    with _lock:
+        return dict(_counters)
+
+
+def summarize_spans() -> list[SpanSummary]:
+    """
+    Aggregate recorded spans by name, sorted by decreasing self time.
+    """
+    summaries: dict[str, SpanSummary] = {}
+
+    for record in get_spans():
+        previous = summaries.get(record.name, SpanSummary(record.name, 0, 0, 0))
+        summaries[record.name] = SpanSummary(
+            name=record.name,
+            calls=previous.calls + 1,
+            total_ns=previous.total_ns + record.duration_ns,
+            self_ns=previous.self_ns + record.self_duration_ns,
+        )
+
+    return sorted(summaries.values(), key=lambda s: (-s.self_ns, s.name))
+
+
+def write_chrome_trace(file: Path):
+    """
+    Write recorded spans and final counter values as a JSON trace in the Chrome trace event format.
+    """
+    pid = os.getpid()
+    spans = get_spans()
+    events: list[dict[str, Any]] = [
+        {
+            "name": record.name,
+            "cat": "kcd-gfx",
+            "ph": "X",
+            "ts": record.start_ns / 1000,
+            "dur": record.duration_ns / 1000,
+            "pid": pid,
+            "tid": record.thread_id,
+            "args": record.args,
+        }
+        for record in sorted(spans, key=lambda r: r.start_ns)
+    ]
+
+    counters = get_counters()
+
+    if counters:
+        end_us = max((r.start_ns + r.duration_ns for r in spans), default=0) / 1000
+        events.append({"name": "counters", "ph": "C", "ts": end_us, "pid": pid, "args": counters})
+
+    file.parent.mkdir(parents=True, exist_ok=True)
+    file.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}), encoding="utf-8")
@@ -8,6 +8,8 @@ import struct
 import json
 from dataclasses import dataclass
 from pathlib import Path
+from .instrumentation import count
+from .utils import LRUCache, file_signature
 
 
 @dataclass
@@ -67,11 +69,30 @@ def _read_string(data: bytes, pos: int) -> tuple[str, int]:
     return data[pos:end].decode("utf-8"), end + 1
 
 
+# Parsed SWD files, keyed by file signature. Every ActionScript render needs them, and a long-running process
+# often renders the same workspaces again.
+_parsed_swd_files: LRUCache[tuple[str, int, int], SwdFile] = LRUCache(maxsize=16)
+
+
 def parse_swd_file(path: Path) -> SwdFile:
     """
     Parse a binary SWD file into a structured SwdFile object.
+
+    Results are cached in memory as long as the file is unchanged: they must not be mutated.
     """
-    data = path.read_bytes()
+    signature = file_signature(path)
+    swd_file = _parsed_swd_files.get(signature)
+
+    if swd_file is None:
+        data = path.read_bytes()
+        count("bytes read", len(data))
+        swd_file = _parse_swd_bytes(data)
+        _parsed_swd_files.put(signature, swd_file)
+
+    return swd_file
+
+
+def _parse_swd_bytes(data: bytes) -> SwdFile:
     pos = 0
 
     # Header
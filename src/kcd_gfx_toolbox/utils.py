@@ -1,44 +1,81 @@
+from __future__ import annotations
+from collections import OrderedDict
 import re
 import shutil
 import hashlib
 from pathlib import Path
 import tempfile
-from rich.console import Console
-from rich.markup import escape
+from typing import TYPE_CHECKING, Generic, TypeVar
+from .instrumentation import count
+
+if TYPE_CHECKING:
+    from rich.console import Console
 
 
 """Shared instance of Rich console."""
-console = Console()
+console: Console
 
 """Shared instance of Rich console that outputs to stderr."""
-stderr_console = Console(stderr=True)
+stderr_console: Console
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+def _create_shared_consoles():
+    global console, stderr_console
+    from rich.console import Console
+
+    console = Console()
+    stderr_console = Console(stderr=True)
+
+
+def __getattr__(name: str):
+    # Rich is slow to import: shared consoles are only created on first use, so that the commands forwarded
+    # to the daemon never load it.
+    if name in ("console", "stderr_console"):
+        _create_shared_consoles()
+        return globals()[name]
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _get_stderr_console() -> Console:
+    if "stderr_console" not in globals():
+        _create_shared_consoles()
+
+    return stderr_console
 
 
 def print_error(message: str | BaseException):
     """
     Print an error message (or exception) in the console.
     """
+    from rich.markup import escape
+
     if isinstance(message, BaseException):
         message = escape(str(message))
 
-    stderr_console.print(f"ERROR: {message}", style="bold red", highlight=False)
+    _get_stderr_console().print(f"ERROR: {message}", style="bold red", highlight=False)
 
 
 def print_warning(message: str | BaseException):
     """
     Print a warning message (or exception) in the console.
     """
+    from rich.markup import escape
+
     if isinstance(message, BaseException):
         message = escape(str(message))
 
-    stderr_console.print(f"WARNING: {message}", style="bold yellow", highlight=False)
+    _get_stderr_console().print(f"WARNING: {message}", style="bold yellow", highlight=False)
 
 
 def print_debug(message: str):
     """
     Print a debug message in the console.
     """
-    stderr_console.print(f"DEBUG: {message}", style="bold light_steel_blue1", highlight=False)
+    _get_stderr_console().print(f"DEBUG: {message}", style="bold light_steel_blue1", highlight=False)
 
 
 def list_tree_files(path: Path, glob: str | None = None) -> set[Path]:
@@ -56,7 +93,10 @@ def sha256_file(path: Path) -> str:
     Compute the SHA 256 digest of a file.
     """
     with path.open("rb") as f:
-        return hashlib.file_digest(f, "sha256").hexdigest()
+        digest = hashlib.file_digest(f, "sha256").hexdigest()
+        count("files hashed")
+        count("bytes read", f.tell())
+        return digest
 
 
 def sha256_str(s: str) -> str:
@@ -85,7 +125,49 @@ def read_file_lines(file: Path) -> list[str]:
     """
     Read the file contents and split them into lines.
     """
-    return file.read_text(encoding="utf-8", errors="replace").splitlines()
+    data = file.read_bytes()
+    count("bytes read", len(data))
+    return data.decode("utf-8", errors="replace").splitlines()
+
+
+def file_signature(path: Path) -> tuple[str, int, int]:
+    """
+    Identify the current contents of a file cheaply: resolved path, modification time and size.
+    """
+    st = path.stat()
+    return (str(path.resolve()), st.st_mtime_ns, st.st_size)
+
+
+class LRUCache(Generic[K, V]):
+    """
+    A minimal least-recently-used cache, for in-memory data that is worth keeping across commands
+    in long-running processes (see the `serve` command).
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[K, V] = OrderedDict()
+
+    def get(self, key: K) -> V | None:
+        value = self._entries.get(key)
+
+        if value is not None:
+            self._entries.move_to_end(key)
+
+        return value
+
+    def put(self, key: K, value: V):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
 
 
 def safe_filename(name: str) -> str | None:
@@ -2,20 +2,27 @@
 
 from __future__ import annotations
 from abc import ABC, abstractmethod
+from collections.abc import Iterator
 from itertools import chain, zip_longest
 from math import ceil, floor
-from typing import Self
+from typing import TYPE_CHECKING, Self
 from rich.console import Console, ConsoleOptions, RenderResult, RenderableType
 from rich.padding import Padding, PaddingDimensions
+from rich.segment import Segment
 from rich.style import Style
 from rich.table import Table
 from rich.text import Text
-from pygments.lexer import Lexer
-from pygments.style import Style as PygmentsStyle
-from pygments.styles.material import MaterialStyle as DefaultPygmentStyle
 
 from kcd_gfx_toolbox.diff.core import DiffAnnotatedHunk, TextHunkLine
-from .syntax_highlighting import highlight_line
+from .syntax_highlighting import highlight_lines
+from .wrapping import count_wrapped_lines
+
+if TYPE_CHECKING:
+    from pygments.lexer import Lexer
+    from pygments.style import Style as PygmentsStyle
+
+"""Number of rows rendered at once when a layout is rendered line by line (see SplitLayout.iter_lines)."""
+STREAM_CHUNK_ROWS = 64
 
 
 class SplitLayoutPane(ABC):
@@ -25,6 +32,14 @@ class SplitLayoutPane(ABC):
     @abstractmethod
     def render(self, vertical_gap: int | None = None) -> RenderableType: ...
 
+    @abstractmethod
+    def iter_lines(
+        self, console: Console, options: ConsoleOptions, pane_width: int, height: int
+    ) -> Iterator[list[Segment]]:
+        """
+        Render the pane line by line, as render() with a vertical gap filling the given height would.
+        """
+
 
 class SplitLayoutPairAlignablePane(SplitLayoutPane):
     @classmethod
@@ -61,15 +76,8 @@ class SplitLayout:
         width = (total_width - self.spacing) / 2
         return ceil(width), floor(width)
 
-    def __rich_console__(self, console: Console, options: ConsoleOptions) -> RenderResult:
-        grid = Table.grid(expand=True)
-        grid.add_column("pane_a", ratio=1)
-        # Using a fixed-width column makes the layout computation more predictable than cell padding.
-        grid.add_column("gap", width=self.spacing)
-        grid.add_column("pane_b", ratio=1)
-
-        left_pane_width, right_pane_width = self._compute_pane_widths(options.max_width)
-
+    def _prerender_panes(self, console: Console, left_pane_width: int, right_pane_width: int) -> int:
+        """Prerender the rows of both panes, and return the height of the layout."""
         if (
             isinstance(self.left_pane, SplitLayoutPairAlignablePane)
             and isinstance(self.right_pane, SplitLayoutPairAlignablePane)
@@ -86,7 +94,19 @@ class SplitLayout:
 
         left_height = self.left_pane.compute_height(console, left_pane_width)
         right_height = self.right_pane.compute_height(console, right_pane_width)
-        target_height = max(left_height, right_height)
+        return max(left_height, right_height)
+
+    def __rich_console__(self, console: Console, options: ConsoleOptions) -> RenderResult:
+        grid = Table.grid(expand=True)
+        grid.add_column("pane_a", ratio=1)
+        # Using a fixed-width column makes the layout computation more predictable than cell padding.
+        grid.add_column("gap", width=self.spacing)
+        grid.add_column("pane_b", ratio=1)
+
+        left_pane_width, right_pane_width = self._compute_pane_widths(options.max_width)
+        target_height = self._prerender_panes(console, left_pane_width, right_pane_width)
+        left_height = self.left_pane.compute_height(console, left_pane_width)
+        right_height = self.right_pane.compute_height(console, right_pane_width)
         grid.add_row(
             self.left_pane.render(target_height - left_height),
             None,
@@ -97,6 +117,26 @@ class SplitLayout:
 
         yield grid
 
+    def iter_lines(self, console: Console, options: ConsoleOptions) -> Iterator[list[Segment]]:
+        """
+        Render the layout line by line, with the same output as printing it.
+
+        Printing the layout renders all its rows in a single table before anything is written. Here, rows are
+        rendered a few at a time as lines are consumed: memory use doesn't grow with the size of the panes, and the
+        first lines can be written right away.
+        """
+        left_pane_width, right_pane_width = self._compute_pane_widths(options.max_width)
+        target_height = self._prerender_panes(console, left_pane_width, right_pane_width)
+        gap = Segment(" " * self.spacing)
+
+        for left_line, right_line in zip(
+            self.left_pane.iter_lines(console, options, left_pane_width, target_height),
+            self.right_pane.iter_lines(console, options, right_pane_width, target_height),
+        ):
+            yield [*left_line, gap, *right_line]
+
+        self._last_render_height = target_height
+
     @classmethod
     def from_pair(
         cls,
@@ -139,12 +179,23 @@ class SplitLayoutTextPane(SplitLayoutPairAlignablePane):
         self.padding = padding
         self.word_wrap = word_wrap
         self.syntax_lexer = syntax_lexer
-        self.pygments_style: type[PygmentsStyle] = pygments_style or DefaultPygmentStyle
+
+        if pygments_style is None and syntax_lexer is not None:
+            # Pygments is slow to import: only load the default style when highlighting is needed.
+            from pygments.styles.material import MaterialStyle
+
+            pygments_style = MaterialStyle
+
+        self.pygments_style: type[PygmentsStyle] | None = pygments_style
         self.alignment_filler_background_color = alignment_filler_background_color
         self.gutter_min_width: int = 5
         self.gutter_text_spacing: int = 3
         self._gutter_width_cache: int | None = None
         self._rows: list[tuple[Text, Text]] | None = None
+        # Index of the line rendered in each row, in the concatenation of segments (None for alignment fillers).
+        self._row_line_indexes: list[int | None] | None = None
+        # Pane width -> height of each line once wrapped. Filled lazily: wrapping is the bulk of the layout work.
+        self._line_heights_cache: dict[int, list[int]] = {}
 
     def _compute_gutter_width(self) -> int:
         """Maximum between min width and max length of gutter text."""
@@ -160,53 +211,54 @@ class SplitLayoutTextPane(SplitLayoutPairAlignablePane):
 
     def compute_height(self, console: Console, pane_width: int) -> int:
         """Compute the component height for a given width."""
-        top_padding, right_padding, bottom_padding, left_padding = Padding.unpack(self.padding)
-        gutter_width = self._compute_gutter_width()
+        top_padding, _, bottom_padding, _ = Padding.unpack(self.padding)
 
-        assert self._rows is not None
+        assert self._rows is not None and self._row_line_indexes is not None
 
         if self.word_wrap:
-            # Approximate the width available for the text column.
-            text_width = max(1, pane_width - left_padding - right_padding - gutter_width - self.gutter_text_spacing)
-
-            content_height = 0
-            for row in self._rows:
-                # row[1] is the text cell.
-                content_height += max(1, len(row[1].wrap(console, text_width, overflow="ellipsis")))
+            line_heights = self._compute_line_heights(console, pane_width)
+            content_height = sum(1 if i is None else line_heights[i] for i in self._row_line_indexes)
         else:
             content_height = len(self._rows)
 
         return content_height + top_padding + bottom_padding
 
-    def _compute_line_height(self, line: SplitLayoutTextLine, console: Console, pane_width: int) -> int:
-        """Compute the render height of a line for a given width."""
+    def _compute_line_heights(self, console: Console, pane_width: int) -> list[int]:
+        """Compute the render height of each line for a given width. Heights are cached per width."""
         if not self.word_wrap:
-            return 1
+            return [1] * sum(len(segment) for segment in self._segments)
+
+        if (line_heights := self._line_heights_cache.get(pane_width)) is not None:
+            return line_heights
 
         _, right_padding, _, left_padding = Padding.unpack(self.padding)
         gutter_width = self._compute_gutter_width()
 
-        # Compute the width available for the text column.
+        # Approximate the width available for the text column.
         text_width = max(1, pane_width - left_padding - right_padding - gutter_width - self.gutter_text_spacing)
 
-        return max(1, len(line.text.wrap(console, text_width, overflow="ellipsis")))
+        line_heights = [
+            max(1, count_wrapped_lines(line.text, console, text_width, overflow="ellipsis"))
+            for line in chain.from_iterable(self._segments)
+        ]
+        self._line_heights_cache[pane_width] = line_heights
+
+        return line_heights
 
-    def _render_line(self, line: SplitLayoutTextLine) -> tuple[Text, Text]:
-        """Render a SplitLayoutTextLine into Rich table cells."""
+    def _render_lines(self, lines: list[SplitLayoutTextLine]) -> list[tuple[Text, Text]]:
+        """Render SplitLayoutTextLines into Rich table cells."""
         if self.syntax_lexer is not None:
-            line_text = highlight_line(line.text, self.syntax_lexer, self.pygments_style)
+            assert self.pygments_style is not None
+            # Highlighting the lines together lets Pygments tokenize all the uncached lines in a single call.
+            line_texts = highlight_lines([line.text for line in lines], self.syntax_lexer, self.pygments_style)
         else:
-            line_text = line.text.copy()
+            line_texts = [line.text.copy() for line in lines]
 
-        return (line.gutter.copy(), line_text)
+        return [(line.gutter.copy(), line_text) for line, line_text in zip(lines, line_texts)]
 
     def prerender_rows(self) -> None:
-        rows = []
-
-        for line in chain.from_iterable(self._segments):
-            rows.append(self._render_line(line))
-
-        self._rows = rows
+        self._rows = self._render_lines(list(chain.from_iterable(self._segments)))
+        self._row_line_indexes = list(range(len(self._rows)))
 
     def _alignment_filler_row(self) -> tuple[Text, Text]:
         """Return a row to fill an alignment gap on the shorter side."""
@@ -224,55 +276,106 @@ class SplitLayoutTextPane(SplitLayoutPairAlignablePane):
         assert isinstance(left, SplitLayoutTextPane) and isinstance(right, SplitLayoutTextPane)
 
         left_rows = []
+        left_row_line_indexes: list[int | None] = []
+        left_line_heights = left._compute_line_heights(console, left_pane_width)
+        left_line_index = 0
         right_rows = []
+        right_row_line_indexes: list[int | None] = []
+        right_line_heights = right._compute_line_heights(console, right_pane_width)
+        right_line_index = 0
 
         for left_segment, right_segment in zip(left._segments, right._segments):
-            for left_line, right_line in zip_longest(left_segment, right_segment):
+            left_segment_rows = left._render_lines(left_segment)
+            right_segment_rows = right._render_lines(right_segment)
+
+            for left_row, right_row in zip_longest(left_segment_rows, right_segment_rows):
                 left_height = 0
                 right_height = 0
 
-                if left_line is not None:
-                    left_rows.append(left._render_line(left_line))
-                    left_height = left._compute_line_height(left_line, console, left_pane_width)
+                if left_row is not None:
+                    left_rows.append(left_row)
+                    left_row_line_indexes.append(left_line_index)
+                    left_height = left_line_heights[left_line_index]
+                    left_line_index += 1
 
-                if right_line is not None:
-                    right_rows.append(right._render_line(right_line))
-                    right_height = right._compute_line_height(right_line, console, right_pane_width)
+                if right_row is not None:
+                    right_rows.append(right_row)
+                    right_row_line_indexes.append(right_line_index)
+                    right_height = right_line_heights[right_line_index]
+                    right_line_index += 1
 
                 if left_height < right_height:
                     left_rows.extend(left._alignment_filler_row() for _ in range(right_height - left_height))
+                    left_row_line_indexes.extend(None for _ in range(right_height - left_height))
 
                 if left_height > right_height:
                     right_rows.extend(right._alignment_filler_row() for _ in range(left_height - right_height))
+                    right_row_line_indexes.extend(None for _ in range(left_height - right_height))
 
         left._rows = left_rows
+        left._row_line_indexes = left_row_line_indexes
         right._rows = right_rows
+        right._row_line_indexes = right_row_line_indexes
 
-    def render(self, vertical_gap: int | None = None) -> RenderableType:
-        if self._rows is None:
-            self.prerender_rows()
-
-        assert self._rows is not None
+    def _background_style(self) -> Style:
+        return Style(bgcolor=self.background_color) if self.background_color is not None else Style.null()
 
+    def _build_grid(self, rows: list[tuple[Text, Text]]) -> Table:
         grid = Table.grid(expand=True, padding=(0, self.gutter_text_spacing), collapse_padding=True, pad_edge=False)
-        grid.add_column("gutter", justify="right", min_width=self.gutter_min_width, style="dim")
+        grid.add_column("gutter", justify="right", width=self._compute_gutter_width(), style="dim")
         grid.add_column("line_text", ratio=1, no_wrap=(not self.word_wrap), overflow="ellipsis")
 
         if self.background_color is not None:
-            bg_style = Style(bgcolor=self.background_color)
-            grid.row_styles = [bg_style]
-        else:
-            bg_style = Style.null()
+            grid.row_styles = [self._background_style()]
 
-        for row in self._rows:
+        for row in rows:
             grid.add_row(*row)
 
+        return grid
+
+    def render(self, vertical_gap: int | None = None) -> RenderableType:
+        if self._rows is None:
+            self.prerender_rows()
+
+        assert self._rows is not None
+
+        rows = self._rows
+
         if vertical_gap is not None:
             # If this pane is shorter than its sibling, append blank rows to align them visually.
-            for _ in range(max(0, vertical_gap)):
-                grid.add_row("", "")
+            rows = rows + [(Text(""), Text(""))] * max(0, vertical_gap)
 
-        return Padding(grid, pad=self.padding, style=bg_style)
+        return Padding(self._build_grid(rows), pad=self.padding, style=self._background_style())
+
+    def iter_lines(
+        self, console: Console, options: ConsoleOptions, pane_width: int, height: int
+    ) -> Iterator[list[Segment]]:
+        if self._rows is None:
+            self.prerender_rows()
+
+        assert self._rows is not None
+
+        top_padding, right_padding, bottom_padding, left_padding = Padding.unpack(self.padding)
+        bg_style = self._background_style()
+        render_options = options.update(width=pane_width - left_padding - right_padding, height=None)
+        left = [Segment(" " * left_padding, bg_style)] if left_padding else []
+        right = [Segment(" " * right_padding, bg_style)] if right_padding else []
+        blank_line = [Segment(" " * pane_width, bg_style)]
+        gap_rows = max(0, height - self.compute_height(console, pane_width))
+        row_count = len(self._rows) + gap_rows
+
+        yield from [blank_line] * top_padding
+
+        # Table rows are laid out independently with fixed column widths: a table of a slice of the rows renders
+        # the same lines as the table of all the rows.
+        for start in range(0, row_count, STREAM_CHUNK_ROWS):
+            stop = min(start + STREAM_CHUNK_ROWS, row_count)
+            rows = self._rows[start:stop] + [(Text(""), Text(""))] * (stop - max(start, len(self._rows)))
+
+            for line in console.render_lines(self._build_grid(rows), render_options, style=bg_style, pad=True):
+                yield [*left, *line, *right]
+
+        yield from [blank_line] * bottom_padding
 
     def __rich_console__(self, console: Console, options: ConsoleOptions) -> RenderResult:
         yield self.render()
@@ -319,22 +422,43 @@ class SplitLayoutMessagePane(SplitLayoutPane):
 
         return content_height + top_padding + bottom_padding
 
-    def render(self, vertical_gap: int | None = None) -> RenderableType:
+    def _build_grid(self, rows: list[str]) -> Table:
         grid = Table.grid(expand=True)
         grid.add_column("message", justify="center", overflow="fold")
 
+        for row in rows:
+            grid.add_row(row)
+
+        return grid
+
+    def render(self, vertical_gap: int | None = None) -> RenderableType:
         gap = max(0, vertical_gap or 0) / 2
-        before_gap = floor(gap)
-        after_gap = ceil(gap)
-        for _ in range(before_gap):
-            grid.add_row("")
-        grid.add_row(self.message)
-        for _ in range(after_gap):
-            grid.add_row("")
+        grid = self._build_grid([""] * floor(gap) + [self.message] + [""] * ceil(gap))
 
         bg_style = f"on {self.background_color}" if self.background_color is not None else ""
 
         return Padding(grid, pad=self.padding, style=bg_style)
 
+    def iter_lines(
+        self, console: Console, options: ConsoleOptions, pane_width: int, height: int
+    ) -> Iterator[list[Segment]]:
+        top_padding, right_padding, bottom_padding, left_padding = Padding.unpack(self.padding)
+        bg_style = f"on {self.background_color}" if self.background_color is not None else ""
+        render_options = options.update(width=pane_width, height=None)
+        gap = max(0, height - self.compute_height(console, pane_width)) / 2
+
+        def render_rows(rows: list[str]) -> list[list[Segment]]:
+            padded_grid = Padding(self._build_grid(rows), pad=(0, right_padding, 0, left_padding), style=bg_style)
+            return console.render_lines(padded_grid, render_options, pad=True)
+
+        blank_line = [Segment(" " * pane_width, console.get_style(bg_style))]
+        [blank_row_line] = render_rows([""])
+
+        yield from [blank_line] * top_padding
+        yield from [blank_row_line] * floor(gap)
+        yield from render_rows([self.message])
+        yield from [blank_row_line] * ceil(gap)
+        yield from [blank_line] * bottom_padding
+
     def __rich_console__(self, console: Console, options: ConsoleOptions) -> RenderResult:
         yield self.render()
@@ -1,37 +1,185 @@
-from pygments import lex as pygments_lex
-from pygments.lexer import Lexer
-from pygments.style import Style as PygmentsStyle
-from rich.text import Text
+from __future__ import annotations
+from collections.abc import Sequence
+from typing import TYPE_CHECKING
+from rich.text import Span, Text
 
+from kcd_gfx_toolbox.instrumentation import count
+from kcd_gfx_toolbox.utils import LRUCache
 
-def highlight_line(line: Text | str, lexer: Lexer, pygments_style: type[PygmentsStyle]) -> Text:
+if TYPE_CHECKING:
+    from pygments.lexer import Lexer
+    from pygments.style import Style as PygmentsStyle
+    from pygments.token import _TokenType
+
+"""Maximum number of highlighted lines kept in the cache. Least recently used lines are evicted first."""
+HIGHLIGHT_CACHE_SIZE = 8192
+
+"""Highlighted line: plain text, and style spans over it."""
+HighlightedLine = tuple[str, tuple[Span, ...]]
+
+HighlightCacheKey = tuple[tuple[type, str], type, str]
+
+_highlight_cache: LRUCache[HighlightCacheKey, HighlightedLine] = LRUCache(maxsize=HIGHLIGHT_CACHE_SIZE)
+
+
+def clear_highlight_cache():
+    _highlight_cache.clear()
+
+
+def _lexer_key(lexer: Lexer) -> tuple[type, str]:
     """
-    Tokenize a line of source code with Pygments and return a rich.Text with syntax highlighting.
-    The trailing newline appended by Pygments is stripped.
+    Identify a lexer by its class and options, so that equivalent lexer instances share cache entries.
     """
-    if isinstance(line, Text):
-        highlighted_line = line.blank_copy()  # keep original style and formatting
-    else:
-        highlighted_line = Text()
+    return type(lexer), repr(sorted(lexer.options.items()))
+
+
+def _token_style(token_type: _TokenType, pygments_style: type[PygmentsStyle]) -> str:
+    style_dict = pygments_style.style_for_token(token_type)
+    rich_styles = []
+
+    if color := style_dict.get("color"):
+        rich_styles.append(f"#{color}")
+    if style_dict.get("bold"):
+        rich_styles.append("bold")
+    if style_dict.get("italic"):
+        rich_styles.append("italic")
+    if style_dict.get("underline"):
+        rich_styles.append("underline")
 
-    for token_type, value in pygments_lex(str(line), lexer):
+    return " ".join(rich_styles)
+
+
+def _highlight_text(text: str, lexer: Lexer, pygments_style: type[PygmentsStyle]) -> HighlightedLine:
+    """
+    Tokenize a line with Pygments. The trailing newline appended by Pygments is stripped.
+    """
+    from pygments import lex as pygments_lex
+
+    plain_parts: list[str] = []
+    spans: list[Span] = []
+    offset = 0
+
+    for token_type, value in pygments_lex(text, lexer):
         value = value.rstrip("\n")
 
         if not value:
             continue
 
-        style_dict = pygments_style.style_for_token(token_type)
-        rich_styles = []
+        style = _token_style(token_type, pygments_style)
+        plain_parts.append(value)
+
+        if style:
+            spans.append(Span(offset, offset + len(value), style))
+
+        offset += len(value)
+
+    return "".join(plain_parts), tuple(spans)
+
+
+def _highlight_texts_in_batch(
+    texts: Sequence[str], lexer: Lexer, pygments_style: type[PygmentsStyle]
+) -> list[HighlightedLine | None]:
+    """
+    Tokenize lines with a single Pygments call over their concatenation, and split the tokens back into lines.
+
+    The lines spanned by a token other than whitespace (a multiline comment or an unterminated string) would be
+    highlighted differently on their own: None is returned for them, as for every line if the split goes wrong.
+    """
+    from pygments import lex as pygments_lex
+
+    lines: list[HighlightedLine | None] = []
+    plain_parts: list[str] = []
+    spans: list[Span] = []
+    offset = 0
+    unsplittable_line_indexes: set[int] = set()
 
-        if color := style_dict.get("color"):
-            rich_styles.append(f"#{color}")
-        if style_dict.get("bold"):
-            rich_styles.append("bold")
-        if style_dict.get("italic"):
-            rich_styles.append("italic")
-        if style_dict.get("underline"):
-            rich_styles.append("underline")
+    for token_type, value in pygments_lex("\n".join(texts), lexer):
+        parts = value.split("\n")
+        style = _token_style(token_type, pygments_style)
 
-        highlighted_line.append(value, style=" ".join(rich_styles))
+        if len(parts) > 1 and parts[-1] and not value.isspace():
+            unsplittable_line_indexes.update(range(len(lines), len(lines) + len(parts)))
+        elif len(parts) > 2 and not value.isspace():
+            unsplittable_line_indexes.update(range(len(lines), len(lines) + len(parts) - 1))
 
+        for i, part in enumerate(parts):
+            if i > 0:
+                lines.append(("".join(plain_parts), tuple(spans)))
+                plain_parts = []
+                spans = []
+                offset = 0
+
+            if part:
+                plain_parts.append(part)
+
+                if style:
+                    spans.append(Span(offset, offset + len(part), style))
+
+                offset += len(part)
+
+    if plain_parts:
+        lines.append(("".join(plain_parts), tuple(spans)))
+
+    if len(lines) != len(texts) or any(line is not None and line[0] != text for line, text in zip(lines, texts)):
+        return [None] * len(texts)
+
+    return [None if i in unsplittable_line_indexes else line for i, line in enumerate(lines)]
+
+
+def _make_text(line: Text | str, highlighted: HighlightedLine) -> Text:
+    plain, spans = highlighted
+
+    if isinstance(line, Text):
+        highlighted_line = line.blank_copy(plain)  # keep original style and formatting
+    else:
+        highlighted_line = Text(plain)
+
+    highlighted_line.spans = list(spans)
     return highlighted_line
+
+
+def highlight_line(line: Text | str, lexer: Lexer, pygments_style: type[PygmentsStyle]) -> Text:
+    """
+    Tokenize a line of source code with Pygments and return a rich.Text with syntax highlighting.
+    The trailing newline appended by Pygments is stripped. Highlighted lines are cached.
+    """
+    return highlight_lines([line], lexer, pygments_style)[0]
+
+
+def highlight_lines(lines: Sequence[Text | str], lexer: Lexer, pygments_style: type[PygmentsStyle]) -> list[Text]:
+    """
+    Highlight lines of source code like highlight_line, tokenizing the lines missing from the cache together.
+    Each line is highlighted on its own: the result is the same as highlighting the lines one by one.
+    """
+    lexer_key = _lexer_key(lexer)
+    keys = [(lexer_key, pygments_style, str(line)) for line in lines]
+    highlighted_by_key: dict[HighlightCacheKey, HighlightedLine] = {}
+    missing_texts: list[str] = []
+
+    for key in dict.fromkeys(keys):
+        if (cached := _highlight_cache.get(key)) is not None:
+            highlighted_by_key[key] = cached
+        else:
+            missing_texts.append(key[2])
+
+    count("highlight cache misses", len(missing_texts))
+
+    if missing_texts:
+        # Empty lines would be stripped by Pygments at the edges of the batch; multiline texts can't be split back.
+        batch_texts = [text for text in missing_texts if text and "\n" not in text]
+        highlighted_texts: dict[str, HighlightedLine | None] = {}
+
+        if len(batch_texts) > 1:
+            highlighted_texts = dict(zip(batch_texts, _highlight_texts_in_batch(batch_texts, lexer, pygments_style)))
+
+        for text in missing_texts:
+            highlighted = highlighted_texts.get(text)
+
+            if highlighted is None:
+                highlighted = _highlight_text(text, lexer, pygments_style)
+
+            key = (lexer_key, pygments_style, text)
+            highlighted_by_key[key] = highlighted
+            _highlight_cache.put(key, highlighted)
+
+    return [_make_text(line, highlighted_by_key[key]) for line, key in zip(lines, keys)]
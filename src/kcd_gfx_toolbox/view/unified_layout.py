@@ -7,6 +7,7 @@ from rich.text import Text
 
 from kcd_gfx_toolbox.diff.core import DiffAnnotatedHunk
 from kcd_gfx_toolbox.diff.unified_format import unidiff_file_diff
+from .wrapping import count_wrapped_lines
 
 
 class UnifiedLayout:
@@ -24,14 +25,28 @@ class UnifiedLayout:
         self.side_a_path = side_a_path
         self.side_b_path = side_b_path
         self.hunk_pairs = hunk_pairs
-        self._lines: list[Text] = list(self._render_lines())  # pre-compute and cache
+        self._lines: list[Text] | None = None  # computed on first use, see `lines`
         self._last_render_height: int | None = None
+        self._height_cache: dict[int, int] = {}  # width -> height
 
     @property
     def lines(self) -> list[Text]:
         """The rendered lines as a list of Rich Text objects."""
+        if self._lines is None:
+            self._lines = list(self._render_lines())
+
         return self._lines
 
+    def iter_lines(self) -> Iterator[Text]:
+        """
+        Yield the rendered lines, without keeping them if they weren't computed yet.
+        Used to stream huge diffs with a memory use that doesn't grow with their size.
+        """
+        if self._lines is not None:
+            yield from self._lines
+        else:
+            yield from self._render_lines()
+
     def _render_lines(self) -> Iterator[Text]:
         """
         Yield diff lines in "unified format" as Rich Text objects.
@@ -40,7 +55,11 @@ class UnifiedLayout:
 
     def compute_height(self, console: Console, width: int) -> int:
         """Compute the component height for a given max output width, accounting for word wrap."""
-        return sum(max(1, len(ln.wrap(console, width))) for ln in self._lines)
+        if (height := self._height_cache.get(width)) is None:
+            height = sum(max(1, count_wrapped_lines(ln, console, width)) for ln in self.lines)
+            self._height_cache[width] = height
+
+        return height
 
     def get_last_render_height(self) -> int:
         if self._last_render_height is None:
@@ -53,5 +72,4 @@ class UnifiedLayout:
     def __rich_console__(self, console: Console, options: ConsoleOptions) -> RenderResult:
         self._last_render_height = self.compute_height(console, options.max_width)
 
-        for line in self._lines:
-            yield line
+        yield from self.lines
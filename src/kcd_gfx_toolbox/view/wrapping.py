@@ -0,0 +1,19 @@
+"""Line wrapping helpers shared by the layouts."""
+
+from rich.cells import cell_len
+from rich.console import Console, OverflowMethod
+from rich.text import Text
+
+
+def count_wrapped_lines(text: Text, console: Console, width: int, overflow: OverflowMethod | None = None) -> int:
+    """
+    Return the number of lines a text takes once word-wrapped to the given width, like len(text.wrap(...)).
+    Lines fitting in the width are counted without wrapping them, which is the common case for source code.
+    """
+    if "\t" not in text.plain and not text.no_wrap:
+        lines = text.plain.split("\n")
+
+        if all(cell_len(line) <= width for line in lines):
+            return len(lines)
+
+    return len(text.wrap(console, width, overflow=overflow))
@@ -1,3 +1,7 @@
+import json
+import os
+import subprocess
+import sys
 from textwrap import dedent
 from pathlib import Path
 from kcd_gfx_toolbox.avm1.pcode_parsing import PcodeBlock, parse_pcode_text
@@ -43,3 +47,75 @@ def sample_pcode(text: str) -> PcodeBlock:
     Read and parse a pcode text.
     """
     return parse_pcode_text(text)
+
+
+_FAKE_FFDEC_SCRIPT = """#!{python}
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+args = sys.argv[1:]
+
+with open({log_path!r}, "a", encoding="utf-8") as log:
+    log.write(" ".join(args) + "\\n")
+
+if "-export" in args:
+    output_dir, gfx_file = Path(args[-2]), Path(args[-1])
+    extension = ".pcode" if "script:pcode" in args else ".as"
+
+    for script_path, pcode in json.loads(gfx_file.read_text(encoding="utf-8")).items():
+        file = output_dir / "scripts" / (script_path + extension)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        file.write_text(pcode if extension == ".pcode" else "", encoding="utf-8")
+else:
+    output_path = Path(args[-1])
+    output_path.write_bytes(b"")
+    output_path.with_name(output_path.name + ".swd").write_bytes(b"")
+"""
+
+
+def write_fake_ffdec(directory: Path) -> Path:
+    """
+    Write a stand-in for the ffdec binary in a directory, and return its path.
+
+    It extracts fake GFx files: JSON documents mapping internal script paths to their p-code. ActionScript files and
+    SWD files are written empty. Each call is logged in a `ffdec.log` file next to it.
+    """
+    script = _FAKE_FFDEC_SCRIPT.format(python=sys.executable, log_path=str(directory / "ffdec.log"))
+
+    # Windows can't run a script from its shebang: a batch file runs it with the Python interpreter instead.
+    if sys.platform == "win32":
+        script_path = directory / "ffdec.py"
+        script_path.write_text(script, encoding="utf-8")
+        ffdec_path = directory / "ffdec.cmd"
+        ffdec_path.write_text(f'@"{sys.executable}" "{script_path}" %*\r\n', encoding="utf-8")
+        return ffdec_path
+
+    ffdec_path = directory / "ffdec"
+    ffdec_path.write_text(script, encoding="utf-8")
+    ffdec_path.chmod(0o755)
+    return ffdec_path
+
+
+def write_fake_gfx_file(path: Path, scripts: dict[str, str]) -> Path:
+    """
+    Write a fake GFx file for the fake ffdec (see `write_fake_ffdec`).
+    """
+    path.write_text(json.dumps(scripts), encoding="utf-8")
+    return path
+
+
+def git_apply(patch: str, directory: Path):
+    """
+    Check a patch with `git apply --check`, then apply it to the files of a directory.
+    """
+    # Don't look for a repository above the directory: paths in the patch are relative to the directory.
+    env = {**os.environ, "GIT_CEILING_DIRECTORIES": str(directory.parent)}
+
+    for options in (["--check"], []):
+        result = subprocess.run(
+            ["git", "apply", *options, "-"], input=patch, text=True, capture_output=True, cwd=directory, env=env
+        )
+        assert result.returncode == 0, result.stderr
@@ -0,0 +1,50 @@
+from kcd_gfx_toolbox.avm1.pcode_cfg import find_basic_block_starts, hash_pcode_lines
+from tests.helpers import sample_pcode
+
+
+def test_find_basic_block_starts():
+    lines = sample_pcode("""
+        Push 1
+        If loc01
+        Push 2
+        Jump loc02
+        loc01:Push 3
+        loc02:Pop
+    """).lines
+
+    assert find_basic_block_starts(lines) == [0, 2, 4, 5]
+
+
+def test_find_basic_block_starts_after_returns():
+    lines = sample_pcode("""
+        Push 1
+        Return
+        Push 2
+        loc01:Pop
+        Return
+        Push 4
+    """).lines
+
+    assert find_basic_block_starts(lines) == [0, 2, 3, 5]
+
+
+def test_find_basic_block_starts_at_function_boundaries():
+    lines = sample_pcode("""
+        DefineFunction2 "f", 0, 2, false, false, true, false, true, false, true, false, false  {
+        Push 1
+        Return
+        }
+        Push 2
+    """).lines
+
+    assert find_basic_block_starts(lines) == [0, 1, 3, 4]
+
+
+def test_find_basic_block_starts_empty():
+    assert find_basic_block_starts([]) == []
+
+
+def test_hash_pcode_lines_identifies_identical_lines():
+    assert hash_pcode_lines(["Push 1", "Jump loc01"]) == hash_pcode_lines(["Push 1", "Jump loc01"])
+    assert hash_pcode_lines(["Push 1", "Jump loc01"]) != hash_pcode_lines(["Push 1", "Jump loc02"])
+    assert hash_pcode_lines(["Push 1", "Pop"]) != hash_pcode_lines(["Push 1Pop"])
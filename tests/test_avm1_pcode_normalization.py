@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from kcd_gfx_toolbox.avm1.pcode_normalization import (
     canonicalize_constant_pool,
@@ -11,14 +12,16 @@ from kcd_gfx_toolbox.avm1.pcode_normalization import (
     canonicalize_string_concatenation,
     find_function_end_line,
     find_function_name_and_start_line,
+    iter_blocks,
     list_label_references,
     normalize_block,
     normalize_file,
     normalize_not_not_if_patterns,
+    normalization_is_up_to_date,
     split_into_blocks,
     strip_unreferenced_label_definitions,
 )
-from kcd_gfx_toolbox.avm1.pcode_parsing import parse_pcode_file
+from kcd_gfx_toolbox.avm1.pcode_parsing import iter_pcode_file, parse_pcode_file
 from .helpers import sample_pcode, sample_text, sample_text_lines, list_data_files, read_data_file, get_test_data_dir
 from collections import Counter
 
@@ -364,6 +367,45 @@ def test_split_into_blocks_deduplicates_block_names_case_insensitive():
     assert [block.name for block in blocks] == ["SameName", "__toplevel", "sameName_2"]
 
 
+def test_iter_blocks_matches_split_into_blocks():
+    for fixture in ["pcode/StashManager_v1.pcode", "pcode/StashManager_v2.pcode"]:
+        pcode_file = parse_pcode_file(get_test_data_dir() / fixture)
+        streamed_blocks = list(iter_blocks(iter_pcode_file(get_test_data_dir() / fixture)))
+        assert streamed_blocks == split_into_blocks(pcode_file)
+
+
+def test_iter_blocks_yields_each_block_as_soon_as_it_is_complete():
+    pcode_sample = sample_pcode("""
+        Push register2, "First"
+        DefineFunction2 "", 0, 2, false, false, true, false, true, false, false, true, false {
+        Push 1
+        }
+        SetMember
+        Push register2, "Second"
+        DefineFunction2 "", 0, 2, false, false, true, false, true, false, false, true, false {
+        Push 2
+        }
+        SetMember
+    """)
+
+    consumed_lines = 0
+
+    def _line_stream():
+        nonlocal consumed_lines
+        for line in pcode_sample.lines:
+            consumed_lines += 1
+            yield line
+
+    blocks = iter_blocks(_line_stream())
+
+    # The first block is complete once its trailing SetMember has been read: nothing further is consumed.
+    assert next(blocks).name == "First"
+    assert consumed_lines == 5
+    assert next(blocks).name == "Second"
+    assert consumed_lines == len(pcode_sample.lines)
+    assert next(blocks, None) is None
+
+
 def test_canonicalize_push_lines():
     pcode_sample = sample_pcode("""
         Push register2
@@ -1488,6 +1530,36 @@ def test_canonicalize_geturl2():
     """)
 
 
+def test_normalize_block_applies_peephole_rules_in_a_single_scan():
+    pcode_sample = sample_pcode("""
+        Push "m_"
+        Push "Count"
+        StringAdd
+        GetMember
+        Push 1
+        Add2
+        SetMember
+        Push register1
+        Not
+        Not
+        If loc0632
+        Not
+        Not
+        If loc0632
+    """)
+
+    # The concatenated push is seen by the member increment rule, and consecutive `Not Not If` are all simplified.
+    assert [ln.render() for ln in normalize_block(pcode_sample).lines] == sample_text_lines("""
+        Push "m_Count"
+        GetMember
+        Increment
+        SetMember
+        Push register1
+        If L0
+        If L0
+    """)
+
+
 def test_normalize_block():
     raw_block_files = {p.name: p for p in list_data_files("pcode/blocks/StashManager_v1", glob="*.pcode")}
     normalized_block_files = {p.name: p for p in list_data_files("normalization/StashManager_v1", glob="*.pcode")}
@@ -1545,3 +1617,22 @@ def test_normalize_file_can_omit_source_maps(tmp_path: Path):
     normalize_file(get_test_data_dir() / "pcode/StashManager_v2.pcode", tmp_path, write_source_maps=False)
     sourcemaps = {p for p in tmp_path.glob("*.pcode.map") if p.is_file()}
     assert len(sourcemaps) == 0
+
+
+def test_normalization_is_up_to_date(tmp_path: Path):
+    input_file = tmp_path / "StashManager_v2.pcode"
+    input_file.write_text(read_data_file("pcode/StashManager_v2.pcode"), encoding="utf-8")
+    output_dir = tmp_path / "normalized"
+
+    assert not normalization_is_up_to_date(input_file, output_dir)
+
+    normalize_file(input_file, output_dir, write_source_maps=False)
+
+    assert normalization_is_up_to_date(input_file, output_dir, with_source_maps=False)
+    assert not normalization_is_up_to_date(input_file, output_dir, with_source_maps=True)
+
+    # Touching the input file makes the output stale.
+    order_mtime_ns = (output_dir / "order.txt").stat().st_mtime_ns
+    os.utime(input_file, ns=(order_mtime_ns + 1_000_000_000, order_mtime_ns + 1_000_000_000))
+
+    assert not normalization_is_up_to_date(input_file, output_dir, with_source_maps=False)
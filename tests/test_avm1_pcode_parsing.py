@@ -1,16 +1,21 @@
 import pytest
 from kcd_gfx_toolbox.avm1 import pcode_parsing
 from kcd_gfx_toolbox.avm1.pcode_parsing import (
+    OpcodeClass,
     PcodeBlankLineWithLabel,
     PcodeBlock,
     PcodeInstruction,
     PcodeOperand,
     PcodeStructural,
+    classify_opcodes,
     is_pcode_instruction,
+    iter_opcode_class_indexes,
+    iter_pcode_file,
+    iter_pcode_lines,
     parse_pcode_lines,
     tokenize_line,
 )
-from .helpers import get_test_data_dir, sample_text, sample_text_lines
+from .helpers import get_test_data_dir, sample_pcode, sample_text, sample_text_lines
 
 
 def test_tokenize_line():
@@ -80,7 +85,7 @@ def test_parse_pcode_lines():
                 source_lines=[0],
                 opcode="Push",
                 operands=[
-                    PcodeOperand(type="symbol", value="register1"),
+                    PcodeOperand(type="register", value=1),
                     PcodeOperand(type="string", value="m_DisplayedData"),
                     PcodeOperand(type="numeric", value="0.0"),
                     PcodeOperand(type="string", value="Array"),
@@ -95,7 +100,7 @@ def test_parse_pcode_lines():
                 source_lines=[5],
                 opcode="Push",
                 operands=[
-                    PcodeOperand(type="symbol", value="register2"),
+                    PcodeOperand(type="register", value=2),
                     PcodeOperand(type="string", value="GetMoneyForString"),
                 ],
             ),
@@ -123,7 +128,7 @@ def test_parse_pcode_lines():
                 operands=[
                     PcodeOperand(type="numeric", value="0.1"),
                     PcodeOperand(type="numeric", value="0.0"),
-                    PcodeOperand(type="symbol", value="register1"),
+                    PcodeOperand(type="register", value=1),
                     PcodeOperand(type="string", value="GetMoney"),
                 ],
                 label="loc4vs5",
@@ -149,7 +154,7 @@ def test_parse_pcode_lines():
                 source_lines=[18],
                 opcode="Push",
                 operands=[
-                    PcodeOperand(type="symbol", value="register2"),
+                    PcodeOperand(type="register", value=2),
                     PcodeOperand(type="string", value="GetMoney"),
                 ],
             ),
@@ -206,9 +211,7 @@ def test_parse_pcode_file():
                 source_lines=[0], opcode="StoreRegister", operands=[PcodeOperand(type="numeric", value="1")]
             ),
             PcodeInstruction(source_lines=[1], opcode="SetMember"),
-            PcodeInstruction(
-                source_lines=[2], opcode="Push", operands=[PcodeOperand(type="symbol", value="register1")]
-            ),
+            PcodeInstruction(source_lines=[2], opcode="Push", operands=[PcodeOperand(type="register", value=1)]),
             PcodeInstruction(
                 source_lines=[3], opcode="Push", operands=[PcodeOperand(type="string", value="prototype")]
             ),
@@ -221,6 +224,71 @@ def test_parse_pcode_file():
     )
 
 
+def test_iter_pcode_lines_ignores_line_terminators():
+    lines = ["Push register1\r\n", "\n", b'loc78j2:Push "prototype"\n', "Pop"]
+
+    assert list(iter_pcode_lines(lines)) == [
+        PcodeInstruction(source_lines=[0], opcode="Push", operands=[PcodeOperand(type="register", value=1)]),
+        PcodeInstruction(
+            source_lines=[2], opcode="Push", operands=[PcodeOperand(type="string", value="prototype")], label="loc78j2"
+        ),
+        PcodeInstruction(source_lines=[3], opcode="Pop"),
+    ]
+
+
+def test_iter_pcode_lines_types_register_and_label_operands():
+    lines = ["If loc0a1b", "Jump loc0a1b", "Push register12, register01", "StoreRegister 3", 'Push "register1"']
+
+    assert [line.operands for line in iter_pcode_lines(lines)] == [
+        [PcodeOperand(type="label", value="loc0a1b")],
+        [PcodeOperand(type="label", value="loc0a1b")],
+        [PcodeOperand(type="register", value=12), PcodeOperand(type="symbol", value="register01")],
+        [PcodeOperand(type="numeric", value="3")],
+        [PcodeOperand(type="string", value="register1")],
+    ]
+    assert [line.render() for line in iter_pcode_lines(lines)] == lines
+
+
+def test_classify_opcodes():
+    pcode_sample = sample_pcode("""
+        DefineFunction2 "", 0, 2, false, false, true, false, true, false, false, true, false {
+        Push register1
+        StoreRegister 2
+        loc0a1b:
+        If loc0a1b
+        }
+        Jump loc0a1b
+        GetURL2 false, false, 1
+    """)
+
+    classes = classify_opcodes(pcode_sample.lines)
+
+    assert list(classes) == [
+        OpcodeClass.FUNCTION_DEFINITION,
+        OpcodeClass.INSTRUCTION,
+        OpcodeClass.STORE_REGISTER,
+        OpcodeClass.NON_INSTRUCTION,
+        OpcodeClass.JUMP,
+        OpcodeClass.CLOSING_BRACE,
+        OpcodeClass.JUMP,
+        OpcodeClass.GET_URL2,
+    ]
+    assert list(iter_opcode_class_indexes(classes, OpcodeClass.JUMP)) == [4, 6]
+    assert list(iter_opcode_class_indexes(classes, OpcodeClass.CONSTANT_POOL)) == []
+
+
+def test_iter_pcode_file_normalizes_line_endings(tmp_path):
+    file_path = tmp_path / "line_endings.pcode"
+    file_path.write_bytes(b"Push 1\r\nPop\rloc1:\nReturn")
+
+    assert [(ln.source_lines, ln.render()) for ln in iter_pcode_file(file_path)] == [
+        ([0], "Push 1"),
+        ([1], "Pop"),
+        ([2], "loc1:"),
+        ([3], "Return"),
+    ]
+
+
 def test_PcodeBlock_render():
     pcode_block = PcodeBlock(
         lines=[
@@ -228,7 +296,7 @@ def test_PcodeBlock_render():
                 source_lines=[0],
                 opcode="Push",
                 operands=[
-                    PcodeOperand(type="symbol", value="register1"),
+                    PcodeOperand(type="register", value=1),
                     PcodeOperand(type="string", value="m_DisplayedData"),
                     PcodeOperand(type="numeric", value="0.0"),
                     PcodeOperand(type="string", value="Array"),
@@ -243,7 +311,7 @@ def test_PcodeBlock_render():
                 source_lines=[5],
                 opcode="Push",
                 operands=[
-                    PcodeOperand(type="symbol", value="register2"),
+                    PcodeOperand(type="register", value=2),
                     PcodeOperand(type="string", value="GetMoneyForString"),
                 ],
             ),
@@ -271,7 +339,7 @@ def test_PcodeBlock_render():
                 operands=[
                     PcodeOperand(type="numeric", value="0.1"),
                     PcodeOperand(type="numeric", value="0.0"),
-                    PcodeOperand(type="symbol", value="register1"),
+                    PcodeOperand(type="register", value=1),
                     PcodeOperand(type="string", value="GetMoney"),
                 ],
                 label="loc4vs5",
@@ -297,7 +365,7 @@ def test_PcodeBlock_render():
                 source_lines=[17],
                 opcode="Push",
                 operands=[
-                    PcodeOperand(type="symbol", value="register2"),
+                    PcodeOperand(type="register", value=2),
                     PcodeOperand(type="string", value="GetMoney"),
                 ],
             ),
@@ -396,7 +464,7 @@ def test_PcodeLine_replace():
         source_lines=[17],
         opcode="Push",
         operands=[
-            PcodeOperand(type="symbol", value="register2"),
+            PcodeOperand(type="register", value=2),
             PcodeOperand(type="string", value="GetMoney"),
         ],
     )
@@ -408,7 +476,7 @@ def test_PcodeLine_replace():
         source_lines=[6],
         opcode="SetMember",
         operands=[
-            PcodeOperand(type="symbol", value="register2"),
+            PcodeOperand(type="register", value=2),
             PcodeOperand(type="string", value="GetMoney"),
         ],
         label="yapyap",
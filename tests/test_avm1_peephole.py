@@ -0,0 +1,76 @@
+from kcd_gfx_toolbox.avm1.peephole import InstructionPattern, OperandPattern, PeepholeRule, PeepholeRuleSet
+from kcd_gfx_toolbox.avm1.pcode_parsing import PcodeInstruction
+from .helpers import sample_pcode, sample_text_lines
+
+
+def _replace_with(opcode: str):
+    return lambda lines: [PcodeInstruction(source_lines=lines[0].source_lines, opcode=opcode)]
+
+
+def test_PeepholeRuleSet_applies_first_declared_matching_rule():
+    push_1 = InstructionPattern(opcodes=("Push",), operands=(OperandPattern(type="numeric", value="1"),))
+    rule_set = PeepholeRuleSet(
+        [
+            PeepholeRule(
+                name="rejected",
+                pattern=(push_1, InstructionPattern(opcodes=("Add2",))),
+                rewrite=lambda lines: None,
+            ),
+            PeepholeRule(
+                name="shorter",
+                pattern=(push_1, InstructionPattern(opcodes=("Add2", "Subtract"))),
+                rewrite=_replace_with("Increment"),
+            ),
+            PeepholeRule(
+                name="longer",
+                pattern=(push_1, InstructionPattern(opcodes=("Add2",)), InstructionPattern(opcodes=("Pop",))),
+                rewrite=_replace_with("Pop"),
+            ),
+        ]
+    )
+    pcode_sample = sample_pcode("""
+        Push 1
+        Add2
+        Pop
+        Push 2
+        Subtract
+        Push 1
+        Subtract
+    """)
+
+    assert [ln.render() for ln in rule_set.apply(pcode_sample.lines)] == sample_text_lines("""
+        Increment
+        Pop
+        Push 2
+        Subtract
+        Increment
+    """)
+
+
+def test_PeepholeRuleSet_checks_labels_and_previous_line():
+    rule_set = PeepholeRuleSet(
+        [
+            PeepholeRule(
+                name="drop-pop",
+                pattern=(InstructionPattern(opcodes=("Pop",), labelled=False),),
+                rewrite=lambda lines: [],
+                preceded_by=lambda line: line is not None and line.render() == "Dup",
+            ),
+        ]
+    )
+    pcode_sample = sample_pcode("""
+        Pop
+        Dup
+        Pop
+        Pop
+        Dup
+        loc01:Pop
+    """)
+
+    # The previous line is the last emitted one: once the first `Pop` is dropped, the second one also follows `Dup`.
+    assert [ln.render() for ln in rule_set.apply(pcode_sample.lines)] == sample_text_lines("""
+        Pop
+        Dup
+        Dup
+        loc01:Pop
+    """)
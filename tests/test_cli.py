@@ -0,0 +1,48 @@
+import inspect
+import subprocess
+import sys
+import pytest
+from kcd_gfx_toolbox.cli import LAZY_COMMANDS, load_command
+
+HEAVY_MODULES = ("pygments", "kcd_gfx_toolbox.diff", "kcd_gfx_toolbox.view", "kcd_gfx_toolbox.cli_")
+
+
+def _import_times(module: str) -> dict[str, int]:
+    """
+    Import a module in a fresh interpreter, and return the cumulative import time (in µs) of every module it loaded.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=True
+    )
+    import_times: dict[str, int] = {}
+
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+
+        if cumulative.strip().isdigit():
+            import_times[name.strip()] = int(cumulative)
+
+    return import_times
+
+
+@pytest.mark.parametrize("name", list(LAZY_COMMANDS))
+def test_lazy_command_help_matches_command_docstring(name: str):
+    command = load_command(name)
+    first_paragraph = " ".join(inspect.cleandoc(command.help or "").split("\n\n")[0].split())
+
+    assert LAZY_COMMANDS[name][1] == first_paragraph
+
+
+def test_cli_import_does_not_load_subcommands_and_heavy_dependencies():
+    import_times = _import_times("kcd_gfx_toolbox.cli")
+
+    assert [m for m in import_times if m.startswith(HEAVY_MODULES)] == []
+
+
+def test_entry_point_import_does_not_load_the_cli():
+    import_times = _import_times("kcd_gfx_toolbox.__main__")
+
+    assert [m for m in import_times if m.startswith((*HEAVY_MODULES, "kcd_gfx_toolbox.cli", "typer", "rich"))] == []
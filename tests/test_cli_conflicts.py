@@ -0,0 +1,67 @@
+from pathlib import Path
+import pytest
+from typer.testing import CliRunner
+from kcd_gfx_toolbox.cli import app
+from tests.helpers import read_data_file, write_fake_ffdec, write_fake_gfx_file
+
+
+@pytest.fixture
+def gfx_files(tmp_path: Path) -> dict[str, Path]:
+    stash_manager = read_data_file("pcode/StashManager_v1.pcode")
+    other = "Push 1\nTrace\n"
+    (tmp_path / "ws").mkdir()
+
+    def _write(name: str, stash_manager: str, other: str) -> Path:
+        return write_fake_gfx_file(
+            tmp_path / f"{name}.gfx", {"__Packages/StashManager": stash_manager, "__Packages/Other": other}
+        )
+
+    # Mods a and b both change the separator of the Concat3 method, mod c only changes another script.
+    return {
+        "base": _write("base", stash_manager, other),
+        "a": _write("a", stash_manager.replace('Push "|"', 'Push "/"'), other),
+        "b": _write("b", stash_manager.replace('Push "|"', 'Push "-"'), other),
+        "c": _write("c", stash_manager, other.replace("Push 1", "Push 2")),
+    }
+
+
+def _conflicts(tmp_path: Path, *args: Path):
+    return CliRunner().invoke(
+        app,
+        [
+            "conflicts",
+            *map(str, args),
+            "--ffdec",
+            str(write_fake_ffdec(tmp_path)),
+            "--workspace-root",
+            str(tmp_path / "ws"),
+        ],
+        env={"COLUMNS": "200"},
+    )
+
+
+def _conflict_rows(output: str) -> list[list[str]]:
+    """
+    Read the rows of the conflict table.
+    """
+    table_lines = output[output.index("Searching for conflicting changes") :].splitlines()
+    return [line.split() for line in table_lines if ".gfx" in line]
+
+
+def test_conflicts_reports_blocks_changed_by_several_mods(tmp_path: Path, gfx_files: dict[str, Path]):
+    result = _conflicts(tmp_path, gfx_files["base"], gfx_files["a"], gfx_files["b"], gfx_files["c"])
+
+    assert result.exit_code == 0, result.output
+    assert _conflict_rows(result.output) == [
+        ["__Packages/StashManager", "❖", "Concat3", "a.gfx", "modified", "2"],
+        ["b.gfx", "modified", "2"],
+    ]
+    assert "1 conflicts between 2 mods." in result.output
+
+
+def test_conflicts_without_shared_changes(tmp_path: Path, gfx_files: dict[str, Path]):
+    result = _conflicts(tmp_path, gfx_files["base"], gfx_files["a"], gfx_files["c"])
+
+    assert result.exit_code == 0, result.output
+    assert _conflict_rows(result.output) == []
+    assert "No script or block is changed by more than one mod." in result.output
@@ -0,0 +1,132 @@
+from pathlib import Path
+import shutil
+import pytest
+from typer.testing import CliRunner
+from kcd_gfx_toolbox import cli_diff
+from kcd_gfx_toolbox.cli import app
+from kcd_gfx_toolbox.avm1.pcode_normalization import normalize_file
+from tests.helpers import git_apply, read_data_file, write_fake_ffdec, write_fake_gfx_file
+
+
+@pytest.fixture
+def gfx_files(tmp_path: Path) -> dict[str, Path]:
+    stash_manager_v1 = read_data_file("pcode/StashManager_v1.pcode")
+    stash_manager_v2 = read_data_file("pcode/StashManager_v2.pcode")
+    (tmp_path / "ws").mkdir()
+
+    return {
+        "base": write_fake_gfx_file(tmp_path / "base.gfx", {"__Packages/StashManager": stash_manager_v1}),
+        "mod": write_fake_gfx_file(tmp_path / "mod.gfx", {"__Packages/StashManager": stash_manager_v2}),
+        "same": write_fake_gfx_file(tmp_path / "same.gfx", {"__Packages/StashManager": stash_manager_v1}),
+    }
+
+
+def _diff(tmp_path: Path, *args: str | Path, summary_only: bool = True):
+    ffdec_path = write_fake_ffdec(tmp_path)
+    return CliRunner().invoke(
+        app,
+        [
+            "diff",
+            *map(str, args),
+            "--ffdec",
+            str(ffdec_path),
+            "--workspace-root",
+            str(tmp_path / "ws"),
+            "--format",
+            "pcode",
+            *(["--summary-only"] if summary_only else []),
+        ],
+        env={"COLUMNS": "200"},
+    )
+
+
+def _summary_rows(output: str) -> list[list[str]]:
+    """
+    Read the rows of the summary table against the baseline.
+    """
+    summary_lines = output[output.index("Summary against baseline") :].splitlines()[1:]
+    return [line.split() for line in summary_lines if line.split() and line.split()[0].endswith(".gfx")]
+
+
+def _ffdec_pcode_exports(tmp_path: Path) -> list[str]:
+    return [
+        Path(line.split()[-1]).name
+        for line in (tmp_path / "ffdec.log").read_text(encoding="utf-8").splitlines()
+        if "script:pcode" in line
+    ]
+
+
+def test_diff_against_baseline(tmp_path: Path, gfx_files: dict[str, Path]):
+    result = _diff(tmp_path, gfx_files["mod"], gfx_files["same"], "--baseline", gfx_files["base"])
+
+    assert result.exit_code == 0, result.output
+    assert result.output.count("Identical to the baseline.") == 1
+    assert _summary_rows(result.output) == [
+        ["mod.gfx", "1", "0", "0", "2", "0", "0", "6"],
+        ["same.gfx", "0", "0", "0", "0", "0", "0", "0"],
+    ]
+    assert sorted(_ffdec_pcode_exports(tmp_path)) == ["base.gfx", "mod.gfx", "same.gfx"]
+
+
+def test_diff_against_baseline_extracts_duplicated_files_once(tmp_path: Path, gfx_files: dict[str, Path]):
+    result = _diff(
+        tmp_path,
+        gfx_files["mod"],
+        tmp_path / "." / "mod.gfx",
+        gfx_files["base"],
+        "--baseline",
+        gfx_files["base"],
+        "--jobs",
+        "4",
+    )
+
+    assert result.exit_code == 0, result.output
+    assert sorted(_ffdec_pcode_exports(tmp_path)) == ["base.gfx", "mod.gfx"]
+    assert result.output.count("Identical to the baseline.") == 1
+    assert _summary_rows(result.output) == [
+        ["mod.gfx", "1", "0", "0", "2", "0", "0", "6"],
+        ["mod.gfx", "1", "0", "0", "2", "0", "0", "6"],
+        ["base.gfx", "0", "0", "0", "0", "0", "0", "0"],
+    ]
+
+
+def test_diff_patch_turns_side_a_into_side_b(tmp_path: Path, gfx_files: dict[str, Path]):
+    result = _diff(tmp_path, gfx_files["base"], gfx_files["mod"], "--output-format", "patch", summary_only=False)
+
+    assert result.exit_code == 0, result.output
+    assert "@@" in result.stdout
+
+    [normalization_dir_a] = (tmp_path / "ws").glob("base_*/normalized_scripts")
+    [normalization_dir_b] = (tmp_path / "ws").glob("mod_*/normalized_scripts")
+    patched_dir = tmp_path / "patched"
+    shutil.copytree(normalization_dir_a, patched_dir)
+
+    git_apply(result.stdout, patched_dir)
+
+    block_files = sorted(path.relative_to(normalization_dir_b) for path in normalization_dir_b.rglob("*.pcode"))
+    assert sorted(path.relative_to(patched_dir) for path in patched_dir.rglob("*.pcode")) == block_files
+
+    for block_file in block_files:
+        assert (patched_dir / block_file).read_text() == (normalization_dir_b / block_file).read_text(), block_file
+
+
+def test_diff_normalizes_again_without_normalization_cache(
+    tmp_path: Path, gfx_files: dict[str, Path], monkeypatch: pytest.MonkeyPatch
+):
+    normalized_files: list[Path] = []
+
+    def _normalize_file(raw_script_path: Path, normalized_script_dir: Path):
+        normalized_files.append(raw_script_path)
+        return normalize_file(raw_script_path, normalized_script_dir)
+
+    monkeypatch.setattr(cli_diff, "normalize_file", _normalize_file)
+
+    assert _diff(tmp_path, gfx_files["mod"], gfx_files["base"], "--cache-normalization").exit_code == 0
+    assert len(normalized_files) == 2
+
+    # Results kept in memory by this process are a cache too: they must not be reused either.
+    assert _diff(tmp_path, gfx_files["mod"], gfx_files["base"], "--no-normalization-cache").exit_code == 0
+    assert len(normalized_files) == 4
+
+    assert _diff(tmp_path, gfx_files["mod"], gfx_files["base"], "--cache-normalization").exit_code == 0
+    assert len(normalized_files) == 4
@@ -0,0 +1,96 @@
+from pathlib import Path
+import pytest
+from typer.testing import CliRunner
+from kcd_gfx_toolbox.cli import app
+from kcd_gfx_toolbox.cli_normalize import collect_input_pcode_files
+from tests.helpers import read_data_file
+
+
+def _write_pcode_files(root: Path, rel_paths: list[str]):
+    for rel_path in rel_paths:
+        (root / rel_path).parent.mkdir(parents=True, exist_ok=True)
+        (root / rel_path).write_text(read_data_file("pcode/StashManager_v1.pcode"), encoding="utf-8")
+
+
+def test_collect_input_pcode_files_from_several_roots_and_globs(tmp_path: Path):
+    _write_pcode_files(tmp_path, ["a/x/S.pcode", "b/y/T.pcode", "c/z/U.pcode", "c/z/V.txt"])
+
+    files = collect_input_pcode_files([tmp_path / "a", tmp_path / "b/y/T.pcode", tmp_path / "c/*/*.pcode"])
+
+    assert files == [
+        ((tmp_path / "b/y/T.pcode").resolve(), Path("T.pcode")),
+        ((tmp_path / "a/x/S.pcode").resolve(), Path("x/S.pcode")),
+        ((tmp_path / "c/z/U.pcode").resolve(), Path("z/U.pcode")),
+    ]
+
+
+def test_collect_input_pcode_files_ignores_files_given_twice(tmp_path: Path):
+    _write_pcode_files(tmp_path, ["a/x/S.pcode"])
+
+    assert collect_input_pcode_files([tmp_path / "a", tmp_path / "a/*/*.pcode"]) == [
+        ((tmp_path / "a/x/S.pcode").resolve(), Path("x/S.pcode"))
+    ]
+
+
+def test_collect_input_pcode_files_rejects_colliding_relative_paths(tmp_path: Path):
+    _write_pcode_files(tmp_path, ["a/x/S.pcode", "b/x/S.pcode"])
+
+    with pytest.raises(ValueError, match="x/S.pcode"):
+        collect_input_pcode_files([tmp_path / "a", tmp_path / "b"])
+
+    with pytest.raises(ValueError, match="x/S.pcode"):
+        collect_input_pcode_files([tmp_path / "a", tmp_path / "b/*/S.pcode"])
+
+
+def test_collect_input_pcode_files_keeps_only_pcode_files_matching_a_glob(tmp_path: Path):
+    _write_pcode_files(tmp_path, ["in/Foo.pcode", "in/Foo.txt"])
+
+    assert collect_input_pcode_files([tmp_path / "in/Foo.*"]) == [
+        ((tmp_path / "in/Foo.pcode").resolve(), Path("Foo.pcode"))
+    ]
+
+
+def test_collect_input_pcode_files_rejects_colliding_output_directories(tmp_path: Path):
+    _write_pcode_files(tmp_path, ["a/S.pcode", "b/S.txt"])
+
+    with pytest.raises(ValueError, match="both be normalized into the output directory S"):
+        collect_input_pcode_files([tmp_path / "a/S.pcode", tmp_path / "b/S.txt"])
+
+
+def test_collect_input_pcode_files_rejects_nested_output_directories(tmp_path: Path):
+    _write_pcode_files(tmp_path, ["in/Foo.pcode", "in/Foo/Bar.pcode"])
+
+    with pytest.raises(ValueError, match="Foo/Bar, inside the output directory Foo of"):
+        collect_input_pcode_files([tmp_path / "in"])
+
+
+def test_normalize_command_with_several_roots(tmp_path: Path):
+    _write_pcode_files(tmp_path, ["a/x/S.pcode", "b/y/T.pcode"])
+
+    result = CliRunner().invoke(
+        app, ["normalize", str(tmp_path / "a"), str(tmp_path / "b/*/*.pcode"), str(tmp_path / "out"), "-j", "2"]
+    )
+
+    assert result.exit_code == 0, result.output
+    assert list((tmp_path / "out/x/S").glob("*.pcode"))
+    assert list((tmp_path / "out/y/T").glob("*.pcode"))
+
+
+def test_normalize_command_rejects_colliding_relative_paths(tmp_path: Path):
+    _write_pcode_files(tmp_path, ["a/x/S.pcode", "b/x/S.pcode"])
+
+    result = CliRunner().invoke(app, ["normalize", str(tmp_path / "a"), str(tmp_path / "b"), str(tmp_path / "out")])
+
+    assert result.exit_code == 2
+    assert "Invalid value for 'INPUTS...'" in result.output
+    assert not (tmp_path / "out").exists()
+
+
+def test_normalize_command_rejects_nested_output_directories(tmp_path: Path):
+    _write_pcode_files(tmp_path, ["in/Foo.pcode", "in/Foo/Bar.pcode"])
+
+    result = CliRunner().invoke(app, ["normalize", str(tmp_path / "in"), str(tmp_path / "out")])
+
+    assert result.exit_code == 2
+    assert "Invalid value for 'INPUTS...'" in result.output
+    assert not (tmp_path / "out").exists()
@@ -0,0 +1,161 @@
+import json
+import os
+from pathlib import Path
+import signal
+import socket
+import subprocess
+import sys
+import time
+import pytest
+from kcd_gfx_toolbox import daemon
+from kcd_gfx_toolbox.daemon import (
+    _run_client_request,
+    daemon_is_running,
+    daemon_socket_path,
+    forward_to_daemon,
+)
+from kcd_gfx_toolbox.utils import console, get_temp_dir
+
+pytestmark = pytest.mark.skipif(not daemon.daemon_is_supported(), reason="Unix sockets are not supported.")
+
+
+@pytest.fixture
+def socket_path(tmp_path: Path) -> Path:
+    # Keep the path short: Unix socket paths are limited to about a hundred bytes.
+    return tmp_path / "d" / "daemon.sock"
+
+
+@pytest.fixture
+def running_daemon(socket_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.delenv(daemon.NO_DAEMON_ENVIRONMENT_VARIABLE, raising=False)
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import sys; from pathlib import Path; from kcd_gfx_toolbox.daemon import serve; serve(Path(sys.argv[1]))",
+            str(socket_path),
+        ]
+    )
+
+    try:
+        deadline = time.monotonic() + 30
+
+        while not daemon_is_running(socket_path):
+            assert process.poll() is None, "The daemon exited before listening."
+            assert time.monotonic() < deadline, "The daemon did not start listening in time."
+            time.sleep(0.05)
+
+        yield process
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=10)
+
+
+def test_daemon_socket_path_is_private_to_the_user(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert daemon_socket_path() == tmp_path / "kcd-mod-gfx-toolbox" / "daemon.sock"
+
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    assert daemon_socket_path() == get_temp_dir() / f"daemon-{os.getuid()}" / "daemon.sock"
+
+
+def test_forward_to_daemon_runs_the_command_in_the_daemon(
+    running_daemon: subprocess.Popen, socket_path: Path, capsys: pytest.CaptureFixture
+):
+    assert socket_path.parent.stat().st_mode & 0o777 == 0o700
+
+    assert forward_to_daemon(["extract", "--help"], socket_path) == 0
+    assert "Extract scripts from a GFx file" in capsys.readouterr().out
+
+    assert forward_to_daemon(["extract", "missing.gfx", "out"], socket_path) != 0
+
+
+@pytest.mark.parametrize(
+    "request_line",
+    [
+        b"not json\n",
+        b"\xff\n",
+        b"[]\n",
+        b'{"argv": ["extract", "--help"]}\n',
+        b'{"argv": "extract", "cwd": ".", "env": {}, "isatty": {"stdout": false, "stderr": false}}\n',
+    ],
+)
+def test_daemon_rejects_malformed_requests(
+    running_daemon: subprocess.Popen, socket_path: Path, capsys: pytest.CaptureFixture, request_line: bytes
+):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(str(socket_path))
+        client.sendall(request_line)
+
+        with client.makefile("rb") as stream:
+            assert [json.loads(line) for line in stream] == [{"exit": 2}]
+
+    # The daemon keeps serving.
+    assert running_daemon.poll() is None
+    assert forward_to_daemon(["extract", "--help"], socket_path) == 0
+    assert "Extract scripts from a GFx file" in capsys.readouterr().out
+
+
+def test_forward_to_daemon_skips_unforwarded_commands(running_daemon: subprocess.Popen, socket_path: Path):
+    assert forward_to_daemon(["normalize", "--help"], socket_path) is None
+    assert forward_to_daemon(["diff", "a.gfx", "b.gfx", "--watch"], socket_path) is None
+
+
+def test_forward_to_daemon_skips_sockets_in_shared_directories(running_daemon: subprocess.Popen, socket_path: Path):
+    socket_path.parent.chmod(0o755)
+
+    try:
+        assert not daemon_is_running(socket_path)
+        assert forward_to_daemon(["extract", "--help"], socket_path) is None
+    finally:
+        socket_path.parent.chmod(0o700)
+
+
+def test_daemon_stops_and_removes_its_socket(running_daemon: subprocess.Popen, socket_path: Path):
+    running_daemon.send_signal(signal.SIGTERM)
+    running_daemon.wait(timeout=10)
+
+    assert not socket_path.exists()
+
+
+def test_serve_refuses_a_shared_socket_directory(socket_path: Path):
+    socket_path.parent.mkdir(mode=0o755)
+    socket_path.parent.chmod(0o755)
+
+    with pytest.raises(RuntimeError, match="only accessible"):
+        daemon.serve(socket_path)
+
+
+def test_run_client_request_runs_in_the_client_context(tmp_path: Path):
+    messages: list[dict] = []
+    seen: dict[str, str | None] = {}
+
+    def fake_app(args: list[str], prog_name: str):
+        seen["cwd"] = os.getcwd()
+        seen["columns"] = os.environ.get("COLUMNS")
+        seen["no_color"] = os.environ.get("NO_COLOR")
+        print("out")
+        print("err", file=sys.stderr)
+        console.print("console out")
+        raise SystemExit(3)
+
+    cwd = os.getcwd()
+    environ = os.environ.copy()
+    console_width = console.width
+    request = {
+        "argv": ["diff"],
+        "cwd": str(tmp_path),
+        "env": {"COLUMNS": "123"},
+        "isatty": {"stdout": False, "stderr": False},
+    }
+
+    assert _run_client_request(request, fake_app, messages.append) == 3
+
+    assert seen == {"cwd": str(tmp_path), "columns": "123", "no_color": None}
+    assert "".join(m.get("stdout", "") for m in messages) == "out\nconsole out\n"
+    assert "".join(m.get("stderr", "") for m in messages) == "err\n"
+
+    # The state of the daemon process is restored.
+    assert os.getcwd() == cwd
+    assert os.environ == environ
+    assert console.width == console_width
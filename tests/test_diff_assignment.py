@@ -0,0 +1,30 @@
+from kcd_gfx_toolbox.diff.assignment import solve_assignment
+
+
+def test_solve_assignment_with_nothing():
+    assert solve_assignment({}) == []
+
+
+def test_solve_assignment_with_independent_pairs():
+    assert solve_assignment({("a1", "b1"): 0.95, ("a2", "b2"): 0.92}) == [("a1", "b1"), ("a2", "b2")]
+
+
+def test_solve_assignment_maximizes_total_similarity():
+    # Pairing "a1" with its best candidate first would leave "a2" unpaired.
+    similarities = {("a1", "b1"): 0.99, ("a1", "b2"): 0.95, ("a2", "b1"): 0.95}
+
+    assert solve_assignment(similarities) == [("a1", "b2"), ("a2", "b1")]
+
+
+def test_solve_assignment_with_more_items_on_side_1():
+    similarities = {("a1", "b1"): 0.91, ("a2", "b1"): 0.97, ("a3", "b1"): 0.93}
+
+    assert solve_assignment(similarities) == [("a2", "b1")]
+
+
+def test_solve_assignment_pairs_items_at_most_once():
+    similarities = {(f"a{i}", f"b{j}"): 0.9 + (i * j % 7) / 100 for i in range(6) for j in range(4)}
+    pairs = solve_assignment(similarities)
+
+    assert len(pairs) == 4
+    assert len({key1 for key1, _ in pairs}) == len({key2 for _, key2 in pairs}) == 4
@@ -0,0 +1,133 @@
+from pathlib import Path
+from kcd_gfx_toolbox.diff.conflicts import (
+    ChangeType,
+    ModChange,
+    find_mod_conflicts,
+    index_mod_changes,
+    iter_mod_changes,
+)
+from kcd_gfx_toolbox.diff.gfx import GfxDiffSet, GfxScript, GfxScriptBlock, ScriptDiffSet
+
+
+def _make_diffset(
+    paired_blocks: dict[str, list[GfxScriptBlock]] | None = None,
+    unmatched_a_blocks: dict[str, list[str]] | None = None,
+    unmatched_b_blocks: dict[str, list[str]] | None = None,
+    deleted_scripts: list[str] | None = None,
+    created_scripts: list[str] | None = None,
+) -> GfxDiffSet:
+    diffset = GfxDiffSet()
+
+    def _script_diffset(path: str) -> ScriptDiffSet:
+        script = GfxScript(side_a_path=Path(path), side_b_path=Path(path))
+        diffset.paired_scripts.add(script)
+        return diffset.paired_scripts_block_diffs.setdefault(script, ScriptDiffSet())
+
+    for path, blocks in (paired_blocks or {}).items():
+        _script_diffset(path).paired_blocks.update(blocks)
+
+    for path, names in (unmatched_a_blocks or {}).items():
+        _script_diffset(path).unmatched_a_blocks.update(GfxScriptBlock(side_a_name=name) for name in names)
+
+    for path, names in (unmatched_b_blocks or {}).items():
+        _script_diffset(path).unmatched_b_blocks.update(GfxScriptBlock(side_b_name=name) for name in names)
+
+    diffset.unmatched_a_scripts = {GfxScript(side_a_path=Path(p)) for p in deleted_scripts or []}
+    diffset.unmatched_b_scripts = {GfxScript(side_b_path=Path(p)) for p in created_scripts or []}
+
+    return diffset
+
+
+def _modified(name: str, refined_changed: int, rename: str | None = None) -> GfxScriptBlock:
+    return GfxScriptBlock(
+        side_a_name=name, side_b_name=rename or name, changed=refined_changed, refined_changed=refined_changed
+    )
+
+
+def test_iter_mod_changes_keys_changes_by_baseline_location():
+    diffset = _make_diffset(
+        paired_blocks={"Inventory": [_modified("Open", 3), _modified("Close", 0), _modified("Sort", 0, "SortAll")]},
+        unmatched_a_blocks={"Inventory": ["Drop"]},
+        unmatched_b_blocks={"Inventory": ["Stack"]},
+        deleted_scripts=["Old"],
+        created_scripts=["New"],
+    )
+
+    changes = dict(iter_mod_changes("mod", diffset))
+
+    assert changes == {
+        (Path("Inventory"), "Open"): ModChange("mod", ChangeType.MODIFIED, 3),
+        (Path("Inventory"), "Sort"): ModChange("mod", ChangeType.MODIFIED, 0),
+        (Path("Inventory"), "Drop"): ModChange("mod", ChangeType.DELETED),
+        (Path("Inventory"), "Stack"): ModChange("mod", ChangeType.CREATED),
+        (Path("Old"), None): ModChange("mod", ChangeType.DELETED),
+        (Path("New"), None): ModChange("mod", ChangeType.CREATED),
+    }
+
+
+def test_index_mod_changes_groups_changes_of_all_mods():
+    index = index_mod_changes(
+        {
+            "mod1": _make_diffset(paired_blocks={"Inventory": [_modified("Open", 3)]}),
+            "mod2": _make_diffset(paired_blocks={"Inventory": [_modified("Open", 5), _modified("Close", 1)]}),
+        }
+    )
+
+    assert index == {
+        (Path("Inventory"), "Open"): [
+            ModChange("mod1", ChangeType.MODIFIED, 3),
+            ModChange("mod2", ChangeType.MODIFIED, 5),
+        ],
+        (Path("Inventory"), "Close"): [ModChange("mod2", ChangeType.MODIFIED, 1)],
+    }
+
+
+def test_find_mod_conflicts_reports_blocks_changed_by_several_mods():
+    conflicts = find_mod_conflicts(
+        {
+            "mod1": _make_diffset(paired_blocks={"Inventory": [_modified("Open", 3), _modified("Close", 1)]}),
+            "mod2": _make_diffset(
+                paired_blocks={"Inventory": [_modified("Open", 5)]}, unmatched_a_blocks={"Hud": ["Show"]}
+            ),
+            "mod3": _make_diffset(unmatched_a_blocks={"Inventory": ["Open"]}, unmatched_b_blocks={"Hud": ["Blink"]}),
+        }
+    )
+
+    assert len(conflicts) == 1
+    assert conflicts[0].script_path == Path("Inventory")
+    assert conflicts[0].block_name == "Open"
+    assert conflicts[0].mods() == ["mod1", "mod2", "mod3"]
+
+
+def test_find_mod_conflicts_reports_mods_creating_the_same_block():
+    conflicts = find_mod_conflicts(
+        {
+            "mod1": _make_diffset(unmatched_b_blocks={"Hud": ["Blink"]}),
+            "mod2": _make_diffset(unmatched_b_blocks={"Hud": ["Blink"]}),
+        }
+    )
+
+    assert [(c.script_path, c.block_name, c.mods()) for c in conflicts] == [(Path("Hud"), "Blink", ["mod1", "mod2"])]
+
+
+def test_find_mod_conflicts_reports_whole_script_changes_against_any_change_in_the_script():
+    conflicts = find_mod_conflicts(
+        {
+            "mod1": _make_diffset(deleted_scripts=["Inventory"]),
+            "mod2": _make_diffset(paired_blocks={"Inventory": [_modified("Open", 2)]}),
+            "mod3": _make_diffset(paired_blocks={"Hud": [_modified("Show", 2)]}),
+        }
+    )
+
+    assert [(c.script_path, c.block_name, c.mods()) for c in conflicts] == [(Path("Inventory"), None, ["mod1", "mod2"])]
+
+
+def test_find_mod_conflicts_ignores_blocks_identical_after_refinement():
+    conflicts = find_mod_conflicts(
+        {
+            "mod1": _make_diffset(paired_blocks={"Inventory": [_modified("Open", 0)]}),
+            "mod2": _make_diffset(paired_blocks={"Inventory": [_modified("Open", 4)]}),
+        }
+    )
+
+    assert conflicts == []
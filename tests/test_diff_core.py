@@ -1,3 +1,4 @@
+import difflib
 import re
 import pytest
 from pathlib import Path
@@ -8,12 +9,14 @@ from kcd_gfx_toolbox.diff.core import (
     TextHunkLine,
     TextDiff,
     TextDiffSpan,
+    TextSegment,
     _pair_hunks_by_similarity_dp,
     align_hunk_pair_edge_context,
     align_hunk_pairs,
     cut_text_hunk_with_context,
     diff_file_trees,
     diff_file_trees_basic,
+    diff_segmented_texts,
     diff_text_hunks,
     diff_texts,
     format_path_rename_git_style,
@@ -368,6 +371,46 @@ def test_diff_texts_with_nothing():
     assert diff_texts([], []).lines_changed == 0
 
 
+def test_diff_segmented_texts_only_diffs_lines_between_paired_segments():
+    text_sample_1 = sample_text_lines("""
+        Push 1
+        Pop
+        Push 2
+        Pop
+        Push 3
+        Pop
+    """)
+
+    text_sample_2 = sample_text_lines("""
+        Push 1
+        Pop
+        Push 4
+        Push 5
+        Pop
+        Push 3
+        Pop
+    """)
+
+    def segments(lines: list[str]) -> list[TextSegment]:
+        return [TextSegment(i, i + 2, tuple(lines[i : i + 2])) for i in range(0, len(lines), 2)]
+
+    segments_1 = segments(text_sample_1)
+    segments_2 = [
+        TextSegment(0, 2, tuple(text_sample_2[0:2])),
+        TextSegment(2, 5, tuple(text_sample_2[2:5])),
+        TextSegment(5, 7, tuple(text_sample_2[5:7])),
+    ]
+
+    diff = diff_segmented_texts(text_sample_1, segments_1, text_sample_2, segments_2)
+
+    assert diff == diff_texts(text_sample_1, text_sample_2)
+    assert diff == TextDiff(spans=[TextDiffSpan((2, 3), (2, 4))], lines_changed=2)
+
+
+def test_diff_segmented_texts_with_nothing():
+    assert diff_segmented_texts([], [], [], []) == TextDiff(spans=[], lines_changed=0)
+
+
 def test_diff_file_trees_with_no_differences(tmp_path: Path):
     _create_fake_file_tree(
         tmp_path,
@@ -693,6 +736,65 @@ def test_diff_file_trees_pairs_best_similar_rename_candidate(tmp_path: Path):
     assert set(only_in_b) == {Path("scripts/renamed_other_candidate.pcode")}
 
 
+def test_diff_file_trees_pairs_renamed_files_maximizing_total_similarity(tmp_path: Path):
+    base_lines = [f"Push {i}" for i in range(40)]
+
+    def modified(changes: dict[int, str]) -> str:
+        return "\n".join(changes.get(i, line) for i, line in enumerate(base_lines))
+
+    _create_fake_file_tree(
+        tmp_path,
+        {
+            "A/": None,
+            "A/block1.pcode": modified({}),
+            "A/block2.pcode": modified({1: "Pop", 2: "Pop"}),
+            "B/": None,
+            "B/renamed1.pcode": modified({0: "Trace"}),
+            "B/renamed2.pcode": modified({20: "Trace", 21: "Trace", 22: "Trace"}),
+        },
+    )
+
+    changes, only_in_a, only_in_b, _ = diff_file_trees(tmp_path / "A", tmp_path / "B")
+
+    # "block1.pcode" is closer to "renamed1.pcode", but pairing them would leave "block2.pcode" unpaired.
+    assert [(change.path, change.path_new) for change in sorted(changes, key=lambda c: c.path)] == [
+        (Path("block1.pcode"), Path("renamed2.pcode")),
+        (Path("block2.pcode"), Path("renamed1.pcode")),
+    ]
+    assert not only_in_a
+    assert not only_in_b
+
+
+def test_diff_file_trees_indexes_each_unmatched_file_once(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    base_lines = [f"Push {i}" for i in range(40)]
+    _create_fake_file_tree(
+        tmp_path,
+        {
+            "A/": None,
+            "A/block.pcode": "\n".join(base_lines),
+            "B/": None,
+            **{f"B/renamed{i}.pcode": "\n".join(base_lines[:i] + ["Trace"] + base_lines[i:]) for i in range(5)},
+        },
+    )
+    indexed_contents: list[list[str]] = []
+    set_seq2 = difflib.SequenceMatcher.set_seq2
+
+    def record_set_seq2(self: difflib.SequenceMatcher, b):
+        if isinstance(b, list):
+            indexed_contents.append(b)
+
+        set_seq2(self, b)
+
+    monkeypatch.setattr(difflib.SequenceMatcher, "set_seq2", record_set_seq2)
+    changes, only_in_a, only_in_b, _ = diff_file_trees(tmp_path / "A", tmp_path / "B")
+
+    # The content of "block.pcode" is indexed once and compared with every candidate, then the pair found is diffed.
+    assert indexed_contents == [base_lines, ["Trace", *base_lines]]
+    assert [(change.path, change.path_new) for change in changes] == [(Path("block.pcode"), Path("renamed0.pcode"))]
+    assert not only_in_a
+    assert len(only_in_b) == 4
+
+
 def test_diff_file_trees_does_not_pair_renamed_files_below_similarity_threshold(tmp_path: Path):
     _create_fake_file_tree(
         tmp_path,
@@ -0,0 +1,201 @@
+from dataclasses import replace
+from pathlib import Path
+import shutil
+import pytest
+
+from kcd_gfx_toolbox.avm1.pcode_cfg import hash_pcode_lines
+from kcd_gfx_toolbox.avm1.pcode_parsing import PcodeBlock, parse_pcode_text
+from kcd_gfx_toolbox.diff.core import FileDiff
+from kcd_gfx_toolbox.diff import gfx
+from kcd_gfx_toolbox.diff.gfx import (
+    GfxDiffSet,
+    GfxScript,
+    GfxScriptBlock,
+    ScriptDiffSet,
+    diff_normalized_script_trees,
+    rediff_normalized_script_trees,
+    refine_block_diffs,
+)
+from kcd_gfx_toolbox.diff.rendering import DiffFilter, DiffSortOrder, prepare_diffset_pcode_render
+
+BLOCK_A = """Push register1
+If L1
+Push "a"
+Trace
+L1:Push register2
+Return"""
+
+# Same as side A with shifted labels and registers, and one more instruction.
+BLOCK_B = """Push register2
+If L2
+Push "a"
+Trace
+Push "b"
+Trace
+L2:Push register3
+Return"""
+
+
+def test_pcode_rendering_reuses_the_alignment_of_the_refinement(monkeypatch: pytest.MonkeyPatch):
+    script = GfxScript(Path("__Packages/Manager"), Path("__Packages/Manager"))
+    block = GfxScriptBlock(position=0, side_a_name="Update", side_b_name="Update", changed=6)
+    diffset = GfxDiffSet()
+    diffset.paired_scripts = {script}
+    diffset.paired_scripts_block_diffs = {script: ScriptDiffSet()}
+    diffset.paired_scripts_block_diffs[script].paired_blocks = {block}
+
+    blocks_a = {script.side_a_path: [replace(parse_pcode_text(BLOCK_A), name="Update")]}
+    blocks_b = {script.side_b_path: [replace(parse_pcode_text(BLOCK_B), name="Update")]}
+
+    refine_block_diffs(diffset, blocks_a, blocks_b)
+    assert block.refined_changed == 2
+
+    def fail_to_align(*args, **kwargs):
+        raise AssertionError("Blocks were aligned again.")
+
+    monkeypatch.setattr(gfx, "align_pcode_lines", fail_to_align)
+    [renderable] = prepare_diffset_pcode_render(diffset, blocks_a, blocks_b, DiffSortOrder.NATURAL, DiffFilter())
+
+    [(hunk_a, hunk_b)] = renderable.hunk_pairs
+    assert hunk_a is not None and hunk_b is not None
+    assert hunk_b.to_str_list()[0] == "Push register1"
+    assert hunk_b.to_str_list()[-2] == "L1:Push register2"
+
+    diffset.clear_aligned_block_diffs()
+    assert block.aligned_diff is None
+
+
+def test_cfg_segments_are_the_hashed_basic_blocks():
+    lines = parse_pcode_text(BLOCK_B).lines
+    rendered_lines = [line.render() for line in lines]
+
+    assert gfx._cfg_segments(lines, rendered_lines) == [
+        (0, 2, hash_pcode_lines(rendered_lines[0:2])),
+        (2, 6, hash_pcode_lines(rendered_lines[2:6])),
+        (6, 8, hash_pcode_lines(rendered_lines[6:8])),
+    ]
+
+
+def test_diff_normalized_script_trees_pairs_scripts_moved_to_another_directory(tmp_path: Path):
+    blocks = {f"Method{i}.pcode": f"Push {i}\nReturn\n" for i in range(10)}
+
+    for side, script_path in (("a", "__Packages/Manager"), ("b", "__Packages/ui/Manager")):
+        script_dir = tmp_path / side / script_path
+        script_dir.mkdir(parents=True)
+
+        for name, content in blocks.items():
+            (script_dir / name).write_text(content.replace("Push 9", "Push 10") if side == "b" else content)
+
+    # Unrelated script in the same directory as the script on side A.
+    (tmp_path / "b/__Packages/Other").mkdir()
+    (tmp_path / "b/__Packages/Other/Method0.pcode").write_text("Push 0\nReturn\n")
+
+    diffset = diff_normalized_script_trees(
+        {Path("__Packages/Manager")},
+        {Path("__Packages/ui/Manager"), Path("__Packages/Other")},
+        tmp_path / "a",
+        tmp_path / "b",
+    )
+
+    script = GfxScript(Path("__Packages/Manager"), Path("__Packages/ui/Manager"))
+    assert diffset.paired_scripts == {script}
+    assert diffset.unmatched_b_scripts == {GfxScript(side_b_path=Path("__Packages/Other"))}
+    assert [block.side_a_name for block in diffset.paired_scripts_block_diffs[script].get_differing_blocks()] == [
+        "Method9"
+    ]
+
+
+def _write_normalized_scripts(
+    normalization_dir: Path, scripts: dict[str, dict[str, str]]
+) -> dict[Path, list[PcodeBlock]]:
+    """
+    Write normalized scripts, given as block texts by block name, and return their blocks.
+    """
+    shutil.rmtree(normalization_dir, ignore_errors=True)
+    script_blocks = {}
+
+    for script_path, blocks in scripts.items():
+        (normalization_dir / script_path).mkdir(parents=True)
+        script_blocks[Path(script_path)] = []
+
+        for name, text in blocks.items():
+            (normalization_dir / script_path / f"{name}.pcode").write_text(text + "\n")
+            script_blocks[Path(script_path)].append(replace(parse_pcode_text(text), name=name))
+
+    return script_blocks
+
+
+def _diffset_summary(diffset: GfxDiffSet) -> tuple:
+    return (
+        diffset.unmatched_a_scripts,
+        diffset.unmatched_b_scripts,
+        {
+            script: sorted(
+                (block.name_sort_key(), block.changed, block.refined_changed)
+                for block in diffset.paired_scripts_block_diffs.get(script, ScriptDiffSet()).get_blocks()
+            )
+            for script in diffset.paired_scripts
+        },
+    )
+
+
+def test_rediff_normalized_script_trees_matches_a_full_diff(tmp_path: Path):
+    scripts_a = {
+        "__Packages/Manager": {"Update": BLOCK_A, "Init": "Push 1\nReturn"},
+        "__Packages/Inventory": {"Open": "Push 1\nTrace", "Close": "Push 2\nTrace"},
+        "__Packages/Stash": {"Run": "Push 3\nTrace"},
+    }
+    scripts_b = {
+        "__Packages/Manager": {"Update": BLOCK_B, "Init": "Push 1\nReturn"},
+        "__Packages/Inventory": {"Open": "Push 1\nPush 4\nTrace", "Close": "Push 2\nTrace"},
+        "__Packages/Stash": {"Run": "Push 3\nPush 5\nTrace"},
+    }
+    blocks_a = _write_normalized_scripts(tmp_path / "a", scripts_a)
+    blocks_b = _write_normalized_scripts(tmp_path / "b", scripts_b)
+    previous_diffset = refine_block_diffs(
+        diff_normalized_script_trees(set(blocks_a), set(blocks_b), tmp_path / "a", tmp_path / "b"),
+        blocks_a,
+        blocks_b,
+    )
+
+    # Side B is rebuilt: one script changed, one removed, and one added. The manager did not change.
+    scripts_b["__Packages/Inventory"]["Close"] = "Push 2\nPush 6\nTrace"
+    del scripts_b["__Packages/Stash"]
+    scripts_b["__Packages/Shop"] = {"Buy": "Push 7\nTrace"}
+    blocks_b = _write_normalized_scripts(tmp_path / "b", scripts_b)
+    changed_b_side_scripts = {Path("__Packages/Inventory"), Path("__Packages/Shop")}
+
+    diffset, rediffed_scripts = rediff_normalized_script_trees(
+        previous_diffset, set(blocks_a), set(blocks_b), changed_b_side_scripts, tmp_path / "a", tmp_path / "b"
+    )
+    refine_block_diffs(diffset, blocks_a, blocks_b, scripts=rediffed_scripts)
+
+    assert rediffed_scripts == {GfxScript(Path("__Packages/Inventory"), Path("__Packages/Inventory"))}
+    full_diffset = refine_block_diffs(
+        diff_normalized_script_trees(set(blocks_a), set(blocks_b), tmp_path / "a", tmp_path / "b"),
+        blocks_a,
+        blocks_b,
+    )
+    assert _diffset_summary(diffset) == _diffset_summary(full_diffset)
+    assert full_diffset.unmatched_a_scripts == {GfxScript(side_a_path=Path("__Packages/Stash"))}
+    assert full_diffset.unmatched_b_scripts == {GfxScript(side_b_path=Path("__Packages/Shop"))}
+
+
+def test_gfx_diffset_keep_blocks():
+    script = GfxScript(Path("__Packages/Manager"), Path("__Packages/Manager"))
+    diffset = GfxDiffSet()
+    diffset.paired_scripts = {script}
+    diffset.set_script_block_diff(
+        script, [FileDiff(path=Path("Update.pcode"), lines_changed=2)], [Path("Init.pcode")], [Path("UpdateAll.pcode")]
+    )
+
+    diffset.keep_blocks(lambda block: "update" in (block.side_a_name or block.side_b_name or "").lower())
+
+    assert diffset.paired_scripts_block_diffs[script].get_differing_blocks() == {
+        GfxScriptBlock(side_a_name="Update", side_b_name="Update"),
+        GfxScriptBlock(side_a_name=None, side_b_name="UpdateAll"),
+    }
+
+    diffset.keep_blocks(lambda block: False)
+
+    assert diffset.get_scripts_with_differing_blocks() == set()
@@ -0,0 +1,44 @@
+from kcd_gfx_toolbox.diff.minhash import MinHashLshIndex, estimate_jaccard_similarity, minhash_signature
+
+
+def test_minhash_signature_of_empty_set():
+    assert minhash_signature([]) is None
+
+
+def test_minhash_signature_estimates_jaccard_similarity():
+    features = [f"block{i}" for i in range(100)]
+    signature = minhash_signature(features)
+    assert signature is not None
+
+    assert minhash_signature(reversed(features)) == signature
+    assert estimate_jaccard_similarity(signature, signature) == 1.0
+
+    # Actual Jaccard similarity is 80 / 120.
+    other_signature = minhash_signature(features[20:] + [f"other{i}" for i in range(20)])
+    assert other_signature is not None
+    assert 0.5 <= estimate_jaccard_similarity(signature, other_signature) <= 0.8
+
+    unrelated_signature = minhash_signature([f"unrelated{i}" for i in range(100)])
+    assert unrelated_signature is not None
+    assert estimate_jaccard_similarity(signature, unrelated_signature) <= 0.1
+
+
+def test_minhash_lsh_index_query():
+    index = MinHashLshIndex[str]()
+    features = [f"block{i}" for i in range(50)]
+
+    for key, key_features in {
+        "same": features,
+        "close": features[:45] + ["other"],
+        "unrelated": [f"unrelated{i}" for i in range(50)],
+    }.items():
+        signature = minhash_signature(key_features)
+        assert signature is not None
+        index.add(key, signature)
+
+    signature = minhash_signature(features)
+    assert signature is not None
+    candidates = index.query(signature, min_similarity=0.5)
+
+    assert [key for _, key in candidates] == ["same", "close"]
+    assert candidates[0][0] == 1.0
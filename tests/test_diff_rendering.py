@@ -1,14 +1,23 @@
 from dataclasses import dataclass
+from pathlib import Path
 import pytest
 from kcd_gfx_toolbox.avm1.pcode_parsing import PcodeBlock, PcodeLine
-from kcd_gfx_toolbox.diff.core import TextHunk, TextHunkLine
+from kcd_gfx_toolbox.diff.core import TextHunk, TextHunkLine, cut_text_hunk_with_context
+from kcd_gfx_toolbox.diff.gfx import GfxScript, GfxScriptBlock
 from kcd_gfx_toolbox.diff.rendering import (
+    DiffFilter,
+    RenderableBlockDiff,
     RenderDiffSpanPair,
     _convert_span_from_normalized_pcode_to_raw,
     _convert_span_from_pcode_to_actionscript,
     _merge_overlapping_span_pairs,
     _merge_overlapping_hunk_pairs,
+    iter_file_patch_lines,
+    prepare_actionscript_patches,
 )
+from kcd_gfx_toolbox.utils import read_file_lines
+from kcd_gfx_toolbox.workspace import Workspace
+from tests.helpers import git_apply
 
 
 @dataclass(frozen=True, kw_only=True)
@@ -1718,3 +1727,90 @@ def test_merge_overlapping_hunk_pairs_handles_empty_hunks_without_crashing():
             ),
         ),
     ]
+
+
+def _write_actionscript_file(workspace: Workspace, script_path: str, lines: list[str]) -> list[str]:
+    file = workspace.extraction_path("scripts") / f"{script_path}.as"
+    file.parent.mkdir(parents=True, exist_ok=True)
+    file.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+    return lines
+
+
+def test_prepare_actionscript_patches_applies_to_side_a(tmp_path: Path):
+    script = GfxScript(Path("__Packages/Manager"), Path("__Packages/Manager"))
+    filler = [f"   var field{i};" for i in range(10)]
+    update_a = ["   function Update()", "   {", '      trace("a");', "   }"]
+    update_b = ["   function Update()", "   {", '      trace("b");', "   }"]
+    added_b = ["   function Added()", "   {", "      return 1;", "   }"]
+    workspace_a = Workspace(tmp_path / "a")
+    workspace_b = Workspace(tmp_path / "b")
+    lines_a = _write_actionscript_file(
+        workspace_a, "__Packages/Manager", ["class Manager", "{", *filler, *update_a, *filler, "}"]
+    )
+    # The first field is decompiled differently, but no differing block maps to it.
+    lines_b = _write_actionscript_file(
+        workspace_b,
+        "__Packages/Manager",
+        ["class Manager", "{", "   var field0 = 0;", *filler[1:], *update_b, *filler, *added_b, "}"],
+    )
+
+    def _block_diff(block: GfxScriptBlock, span_a: tuple[int, int] | None, span_b: tuple[int, int] | None):
+        return RenderableBlockDiff(
+            script=script,
+            block=block,
+            hunk_pairs=[
+                (
+                    cut_text_hunk_with_context(lines_a, span_a, context_length=5) if span_a else None,
+                    cut_text_hunk_with_context(lines_b, span_b, context_length=5) if span_b else None,
+                )
+            ],
+            lang="actionscript",
+            side_a_resolved=True,
+            side_b_resolved=True,
+        )
+
+    # The block added on side B is inside an existing script: its patch must be anchored in side A's script.
+    block_diffs = [
+        _block_diff(GfxScriptBlock(side_a_name="Update", side_b_name="Update"), (12, 16), (12, 16)),
+        _block_diff(GfxScriptBlock(side_b_name="Added"), None, (26, 30)),
+    ]
+    [patch] = prepare_actionscript_patches(block_diffs, workspace_a, workspace_b)
+    assert (patch.side_a_path, patch.side_b_path) == ("__Packages/Manager.as", "__Packages/Manager.as")
+
+    git_apply("".join(line + "\n" for line in iter_file_patch_lines(patch)), workspace_a.extraction_path("scripts"))
+
+    assert read_file_lines(workspace_a.find_actionscript_file(script.side_a_path)) == [
+        *lines_a[:2],
+        *filler,
+        *update_b,
+        *filler,
+        *added_b,
+        "}",
+    ]
+
+
+def test_prepare_actionscript_patches_rejects_pcode_fallbacks():
+    block_diff = RenderableBlockDiff(
+        script=GfxScript(Path("__Packages/Manager"), Path("__Packages/Manager")),
+        block=GfxScriptBlock(side_b_name="Added"),
+        hunk_pairs=[(None, TextHunk([_hunk_ln(0, "Push 1")]))],
+        lang="pcode",
+        side_a_resolved=True,
+        side_b_resolved=True,
+    )
+
+    with pytest.raises(ValueError):
+        prepare_actionscript_patches([block_diff], Workspace(Path("a")), Workspace(Path("b")))
+
+
+def test_diff_filter_matches_scripts_and_blocks_case_insensitively():
+    filters = DiffFilter(script="inventory", block="character")
+
+    assert filters.filter_script_paths({Path("__Packages/Inventory"), Path("__Packages/Stash")}) == {
+        Path("__Packages/Inventory")
+    }
+    assert filters.matches_script(GfxScript(side_a_path=None, side_b_path=Path("ui/InventoryGrid")))
+    assert not filters.matches_script(GfxScript(side_a_path=Path("ui/Stash"), side_b_path=Path("ui/Stash")))
+    assert filters.matches_block(GfxScriptBlock(side_a_name="getCharacter", side_b_name=None))
+    assert not filters.matches_block(GfxScriptBlock(side_a_name="update", side_b_name="update2"))
+    assert DiffFilter().matches_block(GfxScriptBlock(side_a_name="update", side_b_name="update2"))
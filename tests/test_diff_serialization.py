@@ -0,0 +1,100 @@
+import json
+from pathlib import Path
+
+from kcd_gfx_toolbox.diff.core import TextDiffSpan, TextHunk, TextHunkLine
+from kcd_gfx_toolbox.diff.gfx import GfxDiffSet, GfxScript, GfxScriptBlock, ScriptDiffSet
+from kcd_gfx_toolbox.diff.rendering import RenderableBlockDiff
+from kcd_gfx_toolbox.diff.serialization import iter_serialized_scripts, serialize_block_diff, serialize_summary
+
+
+def _build_diffset() -> tuple[GfxDiffSet, GfxScript, GfxScriptBlock]:
+    script = GfxScript(Path("__Packages/Manager"), Path("__Packages/Manager"))
+    block = GfxScriptBlock(
+        position=2,
+        side_a_name="Update",
+        side_b_name="Update",
+        changed=2,
+        refined_changed=1,
+        diff_spans=[TextDiffSpan((1, 2), (1, 2))],
+    )
+    script_diffset = ScriptDiffSet()
+    script_diffset.paired_blocks = {block, GfxScriptBlock(position=0, side_a_name="Same", side_b_name="Same")}
+    script_diffset.unmatched_b_blocks = {GfxScriptBlock(position=5, side_b_name="Added")}
+
+    diffset = GfxDiffSet()
+    diffset.paired_scripts = {script}
+    diffset.paired_scripts_block_diffs = {script: script_diffset}
+    diffset.unmatched_a_scripts = {GfxScript(side_a_path=Path("__Packages/Old"))}
+    return diffset, script, block
+
+
+def test_serialized_diffset_lists_differing_scripts_and_blocks():
+    diffset, _, _ = _build_diffset()
+    scripts = list(iter_serialized_scripts(diffset))
+
+    assert [(s["side_a_path"], s["side_b_path"], s["state"]) for s in scripts] == [
+        ("__Packages/Manager", "__Packages/Manager", "modified"),
+        ("__Packages/Old", None, "deleted"),
+    ]
+    assert scripts[0]["blocks"] == [
+        {
+            "side_a_name": "Update",
+            "side_b_name": "Update",
+            "state": "modified",
+            "renamed": False,
+            "position": 2,
+            "changed": 2,
+            "refined_changed": 1,
+            "diff_spans": [{"a": [1, 2], "b": [1, 2]}],
+        },
+        {
+            "side_a_name": None,
+            "side_b_name": "Added",
+            "state": "created",
+            "renamed": False,
+            "position": 5,
+            "changed": 0,
+            "refined_changed": 0,
+            "diff_spans": [],
+        },
+    ]
+    assert "blocks" not in scripts[1]
+    assert serialize_summary(diffset) == {
+        "scripts_modified": 1,
+        "scripts_deleted": 1,
+        "scripts_created": 0,
+        "blocks_modified": 1,
+        "blocks_deleted": 0,
+        "blocks_created": 1,
+        "lines_changed": 2,
+        "refined_lines_changed": 1,
+    }
+
+
+def test_serialized_block_diff_annotates_hunk_lines():
+    _, script, block = _build_diffset()
+    hunk_a = TextHunk([TextHunkLine(0, "push 1"), TextHunkLine(1, "pop")])
+    hunk_b = TextHunk([TextHunkLine(0, "push 1"), TextHunkLine(1, "push 2")])
+    block_diff = RenderableBlockDiff(
+        script=script,
+        block=block,
+        hunk_pairs=[(hunk_a, hunk_b), (None, TextHunk([TextHunkLine(4, "trace")]))],
+        lang="pcode",
+        side_a_resolved=True,
+        side_b_resolved=True,
+    )
+
+    record = serialize_block_diff(block_diff)
+
+    assert record["block"]["side_a_name"] == "Update"
+    assert record["hunks"] == [
+        {
+            "a": [{"number": 1, "text": "push 1", "kind": "context"}, {"number": 2, "text": "pop", "kind": "deletion"}],
+            "b": [
+                {"number": 1, "text": "push 1", "kind": "context"},
+                {"number": 2, "text": "push 2", "kind": "addition"},
+            ],
+        },
+        {"a": [], "b": [{"number": 5, "text": "trace", "kind": "addition"}]},
+    ]
+    json.dumps(record)
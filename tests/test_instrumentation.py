@@ -0,0 +1,78 @@
+import json
+from pathlib import Path
+import time
+import pytest
+from kcd_gfx_toolbox import instrumentation
+from kcd_gfx_toolbox.instrumentation import (
+    count,
+    disable_profiling,
+    enable_profiling,
+    get_counters,
+    get_spans,
+    span,
+    summarize_spans,
+    traced,
+    write_chrome_trace,
+)
+
+
+@pytest.fixture
+def profiling():
+    enable_profiling()
+    yield
+    disable_profiling()
+
+
+def test_span_records_nothing_when_profiling_is_disabled():
+    disable_profiling()
+    instrumentation._spans.clear()
+    instrumentation._counters.clear()
+
+    with span("stage"):
+        count("items")
+
+    assert get_spans() == []
+    assert get_counters() == {}
+
+
+def test_span_excludes_nested_spans_from_self_duration(profiling):
+    with span("outer"):
+        with span("inner"):
+            time.sleep(0.01)
+
+    inner, outer = get_spans()
+
+    assert (inner.name, outer.name) == ("inner", "outer")
+    assert outer.duration_ns >= inner.duration_ns
+    assert outer.self_duration_ns == outer.duration_ns - inner.duration_ns
+    assert inner.self_duration_ns == inner.duration_ns
+
+
+def test_traced_records_each_call_as_a_span(profiling):
+    @traced("stage")
+    def stage(value: int) -> int:
+        return value * 2
+
+    assert stage(1) + stage(2) == 6
+    assert [(s.name, s.calls) for s in summarize_spans()] == [("stage", 2)]
+
+
+def test_count_accumulates_values(profiling):
+    count("items")
+    count("items")
+    count("bytes read", 100)
+
+    assert get_counters() == {"items": 2, "bytes read": 100}
+
+
+def test_write_chrome_trace_writes_spans_and_counters(profiling, tmp_path: Path):
+    with span("stage", script="Inventory"):
+        count("items", 3)
+
+    trace_file = tmp_path / "profile.trace.json"
+    write_chrome_trace(trace_file)
+    events = json.loads(trace_file.read_text(encoding="utf-8"))["traceEvents"]
+
+    assert [(e["name"], e["ph"]) for e in events] == [("stage", "X"), ("counters", "C")]
+    assert events[0]["args"] == {"script": "Inventory"}
+    assert events[1]["args"] == {"items": 3}
@@ -0,0 +1,99 @@
+import io
+import pytest
+from rich.console import Console
+from rich.segment import Segment, Segments
+from rich.text import Text
+
+from kcd_gfx_toolbox.view.split_layout import (
+    SplitLayout,
+    SplitLayoutMessagePane,
+    SplitLayoutTextLine,
+    SplitLayoutTextPane,
+)
+from kcd_gfx_toolbox.view.wrapping import count_wrapped_lines
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "short",
+        "exactly 10",
+        "a line longer than the width",
+        "averyveryverylongwordwithoutspaces",
+        "two\nlines",
+        "trailing newline\n",
+        "tab\tseparated",
+        "wide characters: 漢字漢字漢字",
+    ],
+)
+@pytest.mark.parametrize("overflow", [None, "ellipsis"])
+def test_count_wrapped_lines_matches_rich_wrap(text: str, overflow):
+    console = Console(width=80)
+    assert count_wrapped_lines(Text(text), console, 10, overflow) == len(
+        Text(text).wrap(console, 10, overflow=overflow)
+    )
+
+
+def test_SplitLayout_aligns_wrapped_lines_and_reports_their_height():
+    long_line = "x = " + " + ".join(f"value{i}" for i in range(20)) + ";"
+    left = SplitLayoutTextPane(
+        [SplitLayoutTextLine("1", "a();"), SplitLayoutTextLine("2", long_line)], padding=0, word_wrap=True
+    )
+    right = SplitLayoutTextPane(
+        [SplitLayoutTextLine("1", long_line), SplitLayoutTextLine("2", "b();")], padding=0, word_wrap=True
+    )
+    layout = SplitLayout(left, right)
+    console = Console(file=io.StringIO(), width=81)
+    console.print(layout)
+
+    pane_width = 40
+    text_width = pane_width - left._compute_gutter_width() - left.gutter_text_spacing
+    wrapped_height = len(Text(long_line).wrap(console, text_width, overflow="ellipsis"))
+    assert wrapped_height > 1
+
+    # Each long line is aligned with a short line followed by fillers, on both sides.
+    assert left._row_line_indexes == [0] + [None] * (wrapped_height - 1) + [1]
+    assert right._row_line_indexes == [0, 1] + [None] * (wrapped_height - 1)
+    assert layout.get_last_render_height() == 2 * wrapped_height
+    assert len(console.file.getvalue().splitlines()) == 2 * wrapped_height
+    assert list(left._line_heights_cache) == [pane_width]
+    assert list(right._line_heights_cache) == [pane_width]
+
+
+def _render_printed(layout: SplitLayout, width: int) -> str:
+    console = Console(file=io.StringIO(), width=width, force_terminal=True, color_system="truecolor")
+    console.print(layout)
+    return console.file.getvalue()
+
+
+def _render_streamed(layout: SplitLayout, width: int) -> str:
+    console = Console(file=io.StringIO(), width=width, force_terminal=True, color_system="truecolor")
+
+    for line in layout.iter_lines(console, console.options):
+        console.print(Segments([*line, Segment.line()]))
+
+    return console.file.getvalue()
+
+
+@pytest.mark.parametrize("width", [41, 120])
+@pytest.mark.parametrize("right_side", ["text", "short_text", "message"])
+def test_SplitLayout_iter_lines_renders_like_print(width: int, right_side: str):
+    def build() -> SplitLayout:
+        lines = [f"value{i} = compute({', '.join(f'arg{j}' for j in range(i % 9))});" for i in range(100)]
+        left = SplitLayoutTextPane([SplitLayoutTextLine(str(i), line) for i, line in enumerate(lines)], word_wrap=True)
+
+        if right_side == "text":
+            right = SplitLayoutTextPane([SplitLayoutTextLine(str(i), line) for i, line in enumerate(lines[::-1])])
+        elif right_side == "short_text":
+            right = SplitLayoutTextPane([SplitLayoutTextLine("1", "x();")], background_color=None, padding=(0, 2))
+        else:
+            right = SplitLayoutMessagePane("This block does [bold]not[/bold] exist on this side.")
+
+        return SplitLayout(left, right)
+
+    layout = build()
+    streamed = _render_streamed(layout, width)
+
+    assert streamed == _render_printed(build(), width)
+    assert len(streamed.splitlines()) == layout.get_last_render_height()
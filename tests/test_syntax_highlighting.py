@@ -0,0 +1,57 @@
+import pytest
+from pygments.lexers.actionscript import ActionScriptLexer
+from pygments.styles.material import MaterialStyle
+from rich.text import Text
+
+from kcd_gfx_toolbox.view import syntax_highlighting
+from kcd_gfx_toolbox.view.syntax_highlighting import clear_highlight_cache, highlight_line, highlight_lines
+from .helpers import read_data_file
+
+
+@pytest.fixture(autouse=True)
+def empty_highlight_cache():
+    clear_highlight_cache()
+    yield
+    clear_highlight_cache()
+
+
+def _highlight_line_uncached(line: Text | str) -> Text:
+    clear_highlight_cache()
+    return highlight_line(line, ActionScriptLexer(), MaterialStyle)
+
+
+def test_highlight_lines_matches_highlighting_each_line_on_its_own():
+    lines = read_data_file("actionscript2/StashManager_v1.as").splitlines()
+    # Multiline tokens and edge cases, which can't be split back from a batch.
+    lines += ["/* open", "still comment */ x = 1;", "", "  ", "// comment", 'var s = "unterminated', "y();"]
+    texts = [Text(line, style="on #112233") for line in lines]
+
+    expected = [_highlight_line_uncached(text) for text in texts]
+    clear_highlight_cache()
+    highlighted = highlight_lines(texts, ActionScriptLexer(), MaterialStyle)
+
+    assert highlighted == expected
+    assert [text.style for text in highlighted] == [text.style for text in texts]
+
+
+def test_highlight_lines_reuses_cached_lines():
+    highlight_lines(["return;", "}"], ActionScriptLexer(), MaterialStyle)
+
+    # Equivalent lexer instances share the cache entries.
+    cached = dict(syntax_highlighting._highlight_cache._entries)
+    highlighted = highlight_lines(["}", "return;"], ActionScriptLexer(), MaterialStyle)
+
+    assert dict(syntax_highlighting._highlight_cache._entries) == cached
+    assert [text.plain for text in highlighted] == ["}", "return;"]
+    assert highlighted[1].spans
+
+
+def test_highlight_cache_evicts_least_recently_used_lines(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(syntax_highlighting._highlight_cache, "maxsize", 2)
+    lexer = ActionScriptLexer()
+
+    highlight_lines(["a();", "b();"], lexer, MaterialStyle)
+    highlight_line("a();", lexer, MaterialStyle)
+    highlight_line("c();", lexer, MaterialStyle)
+
+    assert [key[2] for key in syntax_highlighting._highlight_cache._entries] == ["a();", "c();"]
@@ -1,12 +1,18 @@
+from pathlib import Path
 import pytest
 
+from kcd_gfx_toolbox.diff.core import TextHunk, TextHunkLine, diff_text_hunks, diff_texts
 from kcd_gfx_toolbox.diff.unified_format import (
+    iter_unidiff_patch_lines,
+    split_patch_lines,
     unidiff_context_line,
+    unidiff_file_diff,
     unidiff_deletion_line,
     unidiff_file_header,
     unidiff_hunk_header,
     unidiff_insertion_line,
 )
+from tests.helpers import git_apply
 
 
 def test_unidiff_file_header_renders_side_a_with_a_prefix():
@@ -56,3 +62,166 @@ def test_unidiff_context_line_prepends_space():
 
 def test_unidiff_context_line_handles_empty_line():
     assert unidiff_context_line("") == " "
+
+
+def test_unidiff_file_diff_renders_hunk_pairs():
+    hunk_a = TextHunk([TextHunkLine(4, "Push 1"), TextHunkLine(5, "Pop"), TextHunkLine(6, "[Return]")])
+    hunk_b = TextHunk([TextHunkLine(4, "Push 1"), TextHunkLine(5, "Push 2"), TextHunkLine(6, "[Return]")])
+    hunk_pairs = [diff_text_hunks(hunk_a, hunk_b), diff_text_hunks(TextHunk(), TextHunk())]
+
+    assert [text.plain for text in unidiff_file_diff("foo.pcode", "foo.pcode", hunk_pairs)] == [
+        "--- a/foo.pcode",
+        "+++ b/foo.pcode",
+        "@@ -5,3 +5,3 @@",
+        " Push 1",
+        "-Pop",
+        "+Push 2",
+        " [Return]",
+    ]
+
+
+@pytest.mark.parametrize(
+    "text, expected_lines",
+    [
+        ("", []),
+        ("a\nb\n", ["a\n", "b\n"]),
+        ("a\r\nb", ["a\r\n", "b"]),
+        ("a\x0bb\n\n", ["a\x0bb\n", "\n"]),
+    ],
+)
+def test_split_patch_lines_keeps_line_feeds(text, expected_lines):
+    assert split_patch_lines(text) == expected_lines
+    assert "".join(split_patch_lines(text)) == text
+
+
+def _patch_lines(lines_a: list[str], lines_b: list[str], **kwargs) -> list[str]:
+    spans = diff_texts(lines_a, lines_b).spans
+    return list(iter_unidiff_patch_lines("foo.as", "foo.as", lines_a, lines_b, spans, **kwargs))
+
+
+def test_iter_unidiff_patch_lines_anchors_insertions_with_context():
+    lines_a = [f"{i}\n" for i in range(10)]
+    lines_b = lines_a[:5] + ["new\n"] + lines_a[5:]
+
+    assert _patch_lines(lines_a, lines_b) == [
+        "diff --git a/foo.as b/foo.as",
+        "--- a/foo.as",
+        "+++ b/foo.as",
+        "@@ -3,6 +3,7 @@",
+        " 2",
+        " 3",
+        " 4",
+        "+new",
+        " 5",
+        " 6",
+        " 7",
+    ]
+
+
+def test_iter_unidiff_patch_lines_gathers_close_changes_and_filters_hunks():
+    lines_a = [f"{i}\n" for i in range(20)]
+    lines_b = ["0 changed\n", *lines_a[1:5], "5 changed\n", *lines_a[6:18], *lines_a[19:]]
+
+    assert _patch_lines(lines_a, lines_b) == [
+        "diff --git a/foo.as b/foo.as",
+        "--- a/foo.as",
+        "+++ b/foo.as",
+        "@@ -1,9 +1,9 @@",
+        "-0",
+        "+0 changed",
+        " 1",
+        " 2",
+        " 3",
+        " 4",
+        "-5",
+        "+5 changed",
+        " 6",
+        " 7",
+        " 8",
+        "@@ -16,5 +16,4 @@",
+        " 15",
+        " 16",
+        " 17",
+        "-18",
+        " 19",
+    ]
+    assert _patch_lines(lines_a, lines_b, span_filter=lambda span: span.a == (18, 19))[3:] == [
+        "@@ -16,5 +16,4 @@",
+        " 15",
+        " 16",
+        " 17",
+        "-18",
+        " 19",
+    ]
+    assert _patch_lines(lines_a, lines_b, span_filter=lambda span: False) == []
+
+
+def test_iter_unidiff_patch_lines_marks_missing_newlines_at_end_of_file():
+    assert _patch_lines(["a\n", "b"], ["a\n", "b\n"]) == [
+        "diff --git a/foo.as b/foo.as",
+        "--- a/foo.as",
+        "+++ b/foo.as",
+        "@@ -1,2 +1,2 @@",
+        " a",
+        "-b",
+        "\\ No newline at end of file",
+        "+b",
+    ]
+
+
+@pytest.mark.parametrize(
+    "side_a_path, side_b_path, lines_a, lines_b, expected_lines",
+    [
+        (
+            None,
+            "Added.pcode",
+            [],
+            ["Push 1\n"],
+            [
+                "diff --git a/Added.pcode b/Added.pcode",
+                "new file mode 100644",
+                "--- /dev/null",
+                "+++ b/Added.pcode",
+                "@@ -0,0 +1,1 @@",
+                "+Push 1",
+            ],
+        ),
+        (
+            "Removed.pcode",
+            None,
+            ["Push 1\n"],
+            [],
+            [
+                "diff --git a/Removed.pcode b/Removed.pcode",
+                "deleted file mode 100644",
+                "--- a/Removed.pcode",
+                "+++ /dev/null",
+                "@@ -1,1 +0,0 @@",
+                "-Push 1",
+            ],
+        ),
+        (
+            "Old.pcode",
+            "New.pcode",
+            ["Push 1\n"],
+            ["Push 1\n"],
+            ["diff --git a/Old.pcode b/New.pcode", "rename from Old.pcode", "rename to New.pcode"],
+        ),
+    ],
+)
+def test_iter_unidiff_patch_lines_creates_deletes_and_renames_files(
+    tmp_path: Path, side_a_path, side_b_path, lines_a, lines_b, expected_lines
+):
+    spans = diff_texts(lines_a, lines_b).spans
+    patch_lines = list(iter_unidiff_patch_lines(side_a_path, side_b_path, lines_a, lines_b, spans))
+    assert patch_lines == expected_lines
+
+    if side_a_path is not None:
+        (tmp_path / side_a_path).write_text("".join(lines_a))
+
+    git_apply("".join(line + "\n" for line in patch_lines), tmp_path)
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ([side_b_path] if side_b_path is not None else [])
+
+    if side_b_path is not None:
+        assert (tmp_path / side_b_path).read_text() == "".join(lines_b)
@@ -173,3 +173,15 @@ def test_UnifiedLayout_prevents_calling_last_render_height_before_render():
 
     with pytest.raises(RuntimeError, match="Cannot call UnifiedLayout.get_last_render_height"):
         layout.get_last_render_height()
+
+
+def test_UnifiedLayout_iter_lines_yields_the_lines_without_keeping_them():
+    diffed_a = DiffAnnotatedHunk([TextHunk([_hunk_ctx(0, "ctx"), _hunk_del(1, "old")])])
+    diffed_b = DiffAnnotatedHunk([TextHunk([_hunk_ctx(0, "ctx"), _hunk_add(1, "new")])])
+    layout = UnifiedLayout("x:y", "x:y", [(diffed_a, diffed_b)])
+
+    streamed = [str(line) for line in layout.iter_lines()]
+
+    assert layout._lines is None
+    assert streamed == _plain_lines(layout)
+    assert [str(line) for line in layout.iter_lines()] == streamed